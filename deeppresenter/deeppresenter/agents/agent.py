@@ -15,6 +15,7 @@ from openai.types.chat.chat_completion_message import ChatCompletionMessage
 from openai.types.chat.chat_completion_message_tool_call import (
     ChatCompletionMessageFunctionToolCall as ToolCall,
 )
+from pptagent import tracing
 from pydantic import BaseModel
 
 from deeppresenter.agents.env import AgentEnv
@@ -155,7 +156,10 @@ class Agent:
             self.log_message(self.chat_history[-1])
         self.chat_history.append(message)
         self.log_message(self.chat_history[-1])
-        with timer(f"{self.name} Agent LLM chat"):
+        with (
+            timer(f"{self.name} Agent LLM chat"),
+            tracing.span("agent.turn", **{"agent.name": self.name}),
+        ):
             response = await self.llm.run(
                 messages=self.chat_history,
                 response_format=response_format,
@@ -191,7 +195,12 @@ class Agent:
             )
             self.log_message(self.chat_history[-1])
 
-        with timer(f"{self.name} Agent LLM call"):
+        with (
+            timer(f"{self.name} Agent LLM call"),
+            tracing.span(
+                "agent.turn", **{"agent.name": self.name, "agent.tools": True}
+            ),
+        ):
             response = await self.llm.run(
                 messages=self.chat_history,
                 tools=self.tools,
@@ -17,6 +17,7 @@ from mcp.types import CallToolResult, TextContent
 from openai.types.chat.chat_completion_message_tool_call import (
     ChatCompletionMessageFunctionToolCall as ToolCall,
 )
+from pptagent import tracing
 from pydantic import BaseModel
 
 import docker
@@ -86,6 +87,8 @@ class AgentEnv:
         }
         if config.offline_mode:
             envs["OFFLINE_MODE"] = "1"
+        # the mcp servers export their spans to the trace file of this run
+        envs.update(tracing.trace_env())
         self.client = MCPClient(envs=envs)
         # caching overlong content
         self.timing_dict = defaultdict(ToolTiming)
@@ -106,13 +109,19 @@ class AgentEnv:
                 arguments = None
             else:
                 arguments = json.loads(tool_call.function.arguments)
-            if tool_call.function.name in self._local_tools:
-                result = await self._call_local_tool(tool_call.function.name, arguments)
-            else:
-                server_id = self._tool_to_server[tool_call.function.name]
-                result = await self.client.tool_execute(
-                    server_id, tool_call.function.name, arguments
-                )
+            with tracing.span(
+                f"tool {tool_call.function.name}",
+                **{"tool.name": tool_call.function.name},
+            ):
+                if tool_call.function.name in self._local_tools:
+                    result = await self._call_local_tool(
+                        tool_call.function.name, arguments
+                    )
+                else:
+                    server_id = self._tool_to_server[tool_call.function.name]
+                    result = await self.client.tool_execute(
+                        server_id, tool_call.function.name, arguments
+                    )
         except KeyError:
             result = CallToolResult(
                 type="text",
@@ -6,6 +6,8 @@ DeepPresenter API Server
 import asyncio
 import json
 import logging
+import os
+import time
 import uuid
 from datetime import datetime
 from pathlib import Path
@@ -14,6 +16,7 @@ from typing import Any, Dict, Optional
 from fastapi import BackgroundTasks, FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
+from pptagent.memory import current_rss, deep_sizeof, shared_ids, top_allocations
 from pydantic import BaseModel
 from sse_starlette.sse import EventSourceResponse
 
@@ -46,6 +49,8 @@ app.add_middleware(
 
 # 存储活跃的任务
 active_tasks: dict[str, dict[str, Any]] = {}
+# 已结束的任务保留时长（秒），超时后从内存中移除
+TASK_TTL = float(os.getenv("DEEPPRESENTER_TASK_TTL", 24 * 3600))
 
 
 # ============ Request/Response Models ============
@@ -83,6 +88,17 @@ class TemplatesResponse(BaseModel):
 # ============ Helper Functions ============
 
 
+def prune_tasks():
+    """移除超过 TASK_TTL 的已结束任务"""
+    now = time.time()
+    for task_id in [
+        task_id
+        for task_id, task in active_tasks.items()
+        if now - task.get("finished_at", now) > TASK_TTL
+    ]:
+        active_tasks.pop(task_id)
+
+
 def get_convert_type(convert_type_str: str) -> ConvertType:
     """转换类型字符串到枚举"""
     if convert_type_str == "templates":
@@ -92,6 +108,7 @@ def get_convert_type(convert_type_str: str) -> ConvertType:
 
 async def generate_ppt_stream(task_id: str, request: GenerateRequest):
     """流式生成 PPT 并通过 SSE 返回进度"""
+    prune_tasks()
     try:
         # 更新任务状态
         active_tasks[task_id] = {
@@ -133,6 +150,7 @@ async def generate_ppt_stream(task_id: str, request: GenerateRequest):
                         "status": "completed",
                         "progress": 100,
                         "file_path": file_path,
+                        "finished_at": time.time(),
                     }
                 )
 
@@ -288,6 +306,8 @@ async def generate_ppt_stream(task_id: str, request: GenerateRequest):
         # 收集 token 统计
         logger.info(f"[SSE] Collecting token stats, file_path={file_path}")
         token_stats = collect_token_stats(loop)
+        # 估算本次任务占用的内存（不含共享配置），供 /api/memory 排查泄漏
+        active_tasks[task_id]["memory"] = deep_sizeof(loop, shared_ids(loop.config))
         yield {
             "event": "stats",
             "data": json.dumps(
@@ -334,6 +354,7 @@ async def generate_ppt_stream(task_id: str, request: GenerateRequest):
             {
                 "status": "failed",
                 "error": str(e),
+                "finished_at": time.time(),
             }
         )
         yield {
@@ -479,6 +500,22 @@ async def get_task_status(task_id: str) -> TaskStatusResponse:
     )
 
 
+@app.get("/api/memory")
+async def memory_stats():
+    """
+    内存统计：进程 RSS、各任务的内存估算，以及 tracemalloc 开启时（PYTHONTRACEMALLOC=1）占用最多的分配位置
+    """
+    prune_tasks()
+    return {
+        "rss": current_rss(),
+        "tasks": {
+            task_id: {"status": task.get("status"), "memory": task.get("memory")}
+            for task_id, task in active_tasks.items()
+        },
+        "top_allocations": top_allocations(10),
+    }
+
+
 @app.get("/api/templates")
 async def list_templates() -> TemplatesResponse:
     """获取可用的模板列表"""
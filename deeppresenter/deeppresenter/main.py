@@ -5,6 +5,8 @@ from collections.abc import AsyncGenerator
 from pathlib import Path
 from typing import Literal
 
+from pptagent import tracing
+
 from deeppresenter.agents.design import Design
 from deeppresenter.agents.env import AgentEnv
 from deeppresenter.agents.pptagent import PPTAgent
@@ -62,126 +64,132 @@ class AgentLoop:
         request.copy_to_workspace(self.workspace)
         with open(self.workspace / ".input_request.json", "w") as f:
             json.dump(request.model_dump(), f, ensure_ascii=False, indent=2)
-        async with AgentEnv(self.workspace, self.config) as agent_env:
-            self.agent_env = agent_env
-            hello_message = f"DeepPresenter running in {self.workspace}, with {len(request.attachments)} attachments, prompt={request.instruction}"
-            if self.config.offline_mode:
-                hello_message += " [Offline Mode]"
-            info(hello_message)
-            yield ChatMessage(role=Role.SYSTEM, content=hello_message)
-            self.research_agent = Research(
-                self.config,
-                agent_env,
-                self.workspace,
-                self.language,
-            )
-            self.agent = self.research_agent
-            try:
-                async for msg in self.research_agent.loop(request):
-                    if isinstance(msg, str):
-                        md_file = Path(msg)
-                        if not md_file.is_absolute():
-                            md_file = self.workspace / md_file
-                        self.intermediate_output["manuscript"] = md_file
-                        msg = str(md_file)
-                        break
-                    yield msg
-            except Exception as e:
-                error_message = (
-                    f"Research agent failed with error: {e}\n{traceback.format_exc()}"
-                )
-                error(error_message)
-                yield ChatMessage(role=Role.SYSTEM, content=error_message)
-                raise e
-            finally:
-                self.research_agent.save_history()
-                self.save_results()
-            if request.convert_type == ConvertType.PPTAGENT:
-                self.pptagent = PPTAgent(
+        # the root of the trace tree of this run, the spans of the mcp servers included
+        with tracing.span(
+            "deeppresenter.run",
+            **{
+                "workspace": str(self.workspace),
+                "convert_type": str(request.convert_type),
+            },
+        ):
+            async with AgentEnv(self.workspace, self.config) as agent_env:
+                self.agent_env = agent_env
+                hello_message = f"DeepPresenter running in {self.workspace}, with {len(request.attachments)} attachments, prompt={request.instruction}"
+                if self.config.offline_mode:
+                    hello_message += " [Offline Mode]"
+                info(hello_message)
+                yield ChatMessage(role=Role.SYSTEM, content=hello_message)
+                self.research_agent = Research(
                     self.config,
                     agent_env,
                     self.workspace,
                     self.language,
                 )
-                self.agent = self.pptagent
+                self.agent = self.research_agent
                 try:
-                    async for msg in self.pptagent.loop(request, md_file):
+                    async for msg in self.research_agent.loop(request):
                         if isinstance(msg, str):
-                            pptx_file = Path(msg)
-                            if not pptx_file.is_absolute():
-                                pptx_file = self.workspace / pptx_file
-                            self.intermediate_output["pptx"] = pptx_file
-                            self.intermediate_output["final"] = pptx_file
-                            msg = str(pptx_file)
+                            md_file = Path(msg)
+                            if not md_file.is_absolute():
+                                md_file = self.workspace / md_file
+                            self.intermediate_output["manuscript"] = md_file
+                            msg = str(md_file)
                             break
                         yield msg
                 except Exception as e:
-                    error_message = (
-                        f"PPTAgent failed with error: {e}\n{traceback.format_exc()}"
-                    )
+                    error_message = f"Research agent failed with error: {e}\n{traceback.format_exc()}"
                     error(error_message)
                     yield ChatMessage(role=Role.SYSTEM, content=error_message)
                     raise e
                 finally:
-                    self.pptagent.save_history()
+                    self.research_agent.save_history()
                     self.save_results()
-            else:
-                self.designagent = Design(
-                    self.config,
-                    agent_env,
-                    self.workspace,
-                    self.language,
-                )
-                self.agent = self.designagent
-                try:
-                    async for msg in self.designagent.loop(request, md_file):
-                        if isinstance(msg, str):
-                            slide_html_dir = Path(msg)
-                            if not slide_html_dir.is_absolute():
-                                slide_html_dir = self.workspace / slide_html_dir
-                            self.intermediate_output["slide_html_dir"] = slide_html_dir
-                            break
-                        yield msg
-                except Exception as e:
-                    error_message = (
-                        f"Design agent failed with error: {e}\n{traceback.format_exc()}"
+                if request.convert_type == ConvertType.PPTAGENT:
+                    self.pptagent = PPTAgent(
+                        self.config,
+                        agent_env,
+                        self.workspace,
+                        self.language,
                     )
-                    error(error_message)
-                    yield ChatMessage(role=Role.SYSTEM, content=error_message)
-                    raise e
-                finally:
-                    self.designagent.save_history()
-                    self.save_results()
-                pptx_path = self.workspace / f"{md_file.stem}.pptx"
-                try:
-                    # ? this feature is in experimental stage
-                    await convert_html_to_pptx(
-                        slide_html_dir,
-                        pptx_path,
-                        aspect_ratio=request.powerpoint_type,
-                        soft_parsing=soft_parsing,
-                    )
-                except Exception as e:
-                    warning(
-                        f"html2pptx conversion failed, falling back to pdf conversion\n{e}"
-                    )
-                    pptx_path = pptx_path.with_suffix(".pdf")
-                    (self.workspace / ".html2pptx-error.txt").write_text(
-                        str(e) + "\n" + traceback.format_exc()
+                    self.agent = self.pptagent
+                    try:
+                        async for msg in self.pptagent.loop(request, md_file):
+                            if isinstance(msg, str):
+                                pptx_file = Path(msg)
+                                if not pptx_file.is_absolute():
+                                    pptx_file = self.workspace / pptx_file
+                                self.intermediate_output["pptx"] = pptx_file
+                                self.intermediate_output["final"] = pptx_file
+                                msg = str(pptx_file)
+                                break
+                            yield msg
+                    except Exception as e:
+                        error_message = (
+                            f"PPTAgent failed with error: {e}\n{traceback.format_exc()}"
+                        )
+                        error(error_message)
+                        yield ChatMessage(role=Role.SYSTEM, content=error_message)
+                        raise e
+                    finally:
+                        self.pptagent.save_history()
+                        self.save_results()
+                else:
+                    self.designagent = Design(
+                        self.config,
+                        agent_env,
+                        self.workspace,
+                        self.language,
                     )
-                finally:
-                    async with PlaywrightConverter() as pc:
-                        await pc.convert_to_pdf(
-                            list(slide_html_dir.glob("*.html")),
-                            pptx_path.with_suffix(".pdf"),
+                    self.agent = self.designagent
+                    try:
+                        async for msg in self.designagent.loop(request, md_file):
+                            if isinstance(msg, str):
+                                slide_html_dir = Path(msg)
+                                if not slide_html_dir.is_absolute():
+                                    slide_html_dir = self.workspace / slide_html_dir
+                                self.intermediate_output["slide_html_dir"] = (
+                                    slide_html_dir
+                                )
+                                break
+                            yield msg
+                    except Exception as e:
+                        error_message = f"Design agent failed with error: {e}\n{traceback.format_exc()}"
+                        error(error_message)
+                        yield ChatMessage(role=Role.SYSTEM, content=error_message)
+                        raise e
+                    finally:
+                        self.designagent.save_history()
+                        self.save_results()
+                    pptx_path = self.workspace / f"{md_file.stem}.pptx"
+                    try:
+                        # ? this feature is in experimental stage
+                        await convert_html_to_pptx(
+                            slide_html_dir,
+                            pptx_path,
                             aspect_ratio=request.powerpoint_type,
+                            soft_parsing=soft_parsing,
                         )
+                    except Exception as e:
+                        warning(
+                            f"html2pptx conversion failed, falling back to pdf conversion\n{e}"
+                        )
+                        pptx_path = pptx_path.with_suffix(".pdf")
+                        (self.workspace / ".html2pptx-error.txt").write_text(
+                            str(e) + "\n" + traceback.format_exc()
+                        )
+                    finally:
+                        async with PlaywrightConverter() as pc:
+                            await pc.convert_to_pdf(
+                                list(slide_html_dir.glob("*.html")),
+                                pptx_path.with_suffix(".pdf"),
+                                aspect_ratio=request.powerpoint_type,
+                            )
 
-                self.intermediate_output["final"] = str(pptx_path)
-                msg = pptx_path
-            self.save_results()
-            info(f"DeepPresenter finished, final output at: {msg}")
-            yield msg
+                    self.intermediate_output["final"] = str(pptx_path)
+                    msg = pptx_path
+                self.save_results()
+                info(f"DeepPresenter finished, final output at: {msg}")
+                yield msg
 
     def save_results(self):
         with open(self.workspace / "intermediate_output.json", "w") as f:
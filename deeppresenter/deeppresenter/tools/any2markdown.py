@@ -7,12 +7,13 @@ from pathlib import Path
 
 from fastmcp import FastMCP
 from markitdown import MarkItDown
-from PIL import Image
+from pptagent.image_index import image_meta
+from pptagent.tracing import trace_tools
 
 from deeppresenter.utils.log import set_logger, warning
 from deeppresenter.utils.mineru_api import parse_pdf_offline, parse_pdf_online
 
-mcp = FastMCP(name="Any2Markdown")
+mcp = trace_tools(FastMCP(name="Any2Markdown"))
 
 IMAGE_EXTENSIONS = [
     "bmp",
@@ -81,8 +82,7 @@ async def convert_to_markdown(file_path: str, output_folder: str) -> dict:
     images_with_info = []
     for img_path in images:
         try:
-            with Image.open(img_path) as img:
-                images_with_info.append((img_path, *img.size))
+            images_with_info.append((img_path, *image_meta(img_path).size))
         except Exception:
             continue
 
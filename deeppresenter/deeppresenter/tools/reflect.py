@@ -10,12 +10,13 @@ from typing import Literal
 from fastmcp import FastMCP
 from mcp.types import ImageContent
 from pptagent.model_utils import _get_lid_model
+from pptagent.tracing import trace_tools
 
 from deeppresenter.utils.config import DeepPresenterConfig
 from deeppresenter.utils.log import info, set_logger
 from deeppresenter.utils.webview import PlaywrightConverter, convert_html_to_pptx
 
-mcp = FastMCP("DeepPresenter")
+mcp = trace_tools(FastMCP("DeepPresenter"))
 CONFIG = DeepPresenterConfig.load_from_file(os.getenv("CONFIG_FILE"))
 LID_MODEL = _get_lid_model()
 REFLECTIVE_DESIGN = CONFIG.design_agent.is_multimodal and CONFIG.heavy_reflect
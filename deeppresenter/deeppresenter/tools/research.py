@@ -6,12 +6,13 @@ from typing import Any, Literal
 
 import arxiv
 from fastmcp import FastMCP
+from pptagent.tracing import trace_tools
 from semanticscholar import SemanticScholar
 from semanticscholar.Author import Author
 
 from deeppresenter.utils.log import set_logger
 
-mcp = FastMCP(name="Research")
+mcp = trace_tools(FastMCP(name="Research"))
 PAGE_SIZE = int(os.getenv("ARXIV_PAGE_SIZE", "5"))
 client = arxiv.Client(page_size=PAGE_SIZE)
 sch = SemanticScholar()
@@ -13,6 +13,7 @@ from fake_useragent import UserAgent
 from fastmcp import FastMCP
 from PIL import Image
 from playwright.async_api import TimeoutError
+from pptagent.tracing import trace_tools
 from trafilatura import extract
 
 from deeppresenter.utils.constants import (
@@ -23,7 +24,7 @@ from deeppresenter.utils.constants import (
 from deeppresenter.utils.log import debug, set_logger, warning
 from deeppresenter.utils.webview import PlaywrightConverter
 
-mcp = FastMCP(name="Search")
+mcp = trace_tools(FastMCP(name="Search"))
 
 TAVILY_KEYS = [
     i.strip() for i in os.getenv("TAVILY_API_KEY").split(",") if i.startswith("tvly")
@@ -10,6 +10,8 @@ from typing import Literal
 from fastmcp import FastMCP
 from filelock import FileLock
 from PIL import Image
+from pptagent.image_index import image_meta
+from pptagent.tracing import trace_tools
 from pptagent_pptx import Presentation
 from pydantic import BaseModel
 
@@ -18,7 +20,7 @@ from deeppresenter.utils.log import info, set_logger, warning
 
 Image.MAX_IMAGE_PIXELS = None  # only reading metadata, no actual decompression
 
-mcp = FastMCP(name="Task")
+mcp = trace_tools(FastMCP(name="Task"))
 
 CONFIG = DeepPresenterConfig.load_from_file(os.getenv("CONFIG_FILE"))
 
@@ -41,8 +43,7 @@ def _rewrite_image_link(match: re.Match[str], md_dir: Path, task_id: str = None)
 
     updated_alt = alt_text
     try:
-        with Image.open(p) as img:
-            width, height = img.size
+        width, height = image_meta(p).size
         if width > 0 and height > 0 and not re.search(r"\b\d+:\d+\b", updated_alt):
             factor = math.gcd(width, height)
             ratio = f"{width // factor}:{height // factor}"
@@ -6,13 +6,15 @@ from pathlib import Path
 import httpx
 from binaryornot.check import is_binary
 from fastmcp import FastMCP
-from PIL import Image
+from pptagent.caption_store import default_store, prompt_version
+from pptagent.image_index import file_digest, image_meta
+from pptagent.tracing import trace_tools
 
 from deeppresenter.utils.config import DeepPresenterConfig
 from deeppresenter.utils.constants import PIXEL_MULTIPLE
 from deeppresenter.utils.log import debug, info, set_logger
 
-mcp = FastMCP(name="ToolAgents")
+mcp = trace_tools(FastMCP(name="ToolAgents"))
 
 LLM_CONFIG = DeepPresenterConfig.load_from_file(os.getenv("CONFIG_FILE"))
 
@@ -82,9 +84,14 @@ async def image_caption(image_path: str) -> dict:
         The caption and size for the image
     """
     assert Path(image_path).is_file(), f"Image path {image_path} does not exist"
-    with Image.open(image_path) as img:
-        img.verify()
-        size = img.size
+    size = image_meta(image_path).size
+    store = default_store()
+    model = LLM_CONFIG.vision_model.model_name
+    key = (file_digest(image_path), prompt_version(_CAPTION_SYSTEM))
+    caption = store.get(*key, model) if store is not None else None
+    if caption is not None:
+        debug(f"Image caption from the caption store: path='{image_path}'")
+        return {"size": size, "caption": caption}
     with open(image_path, "rb") as f:
         image_b64 = (
             f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}"
@@ -99,12 +106,13 @@ async def image_caption(image_path: str) -> dict:
         ],
     )
 
-    info(
-        f"Image captioned: path='{image_path}', caption='{response.choices[0].message.content}'"
-    )
+    caption = response.choices[0].message.content
+    info(f"Image captioned: path='{image_path}', caption='{caption}'")
+    if store is not None:
+        store.put(*key, model, caption)
     return {
         "size": size,
-        "caption": response.choices[0].message.content,
+        "caption": caption,
     }
 
 
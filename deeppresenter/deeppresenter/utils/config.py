@@ -11,6 +11,7 @@ import yaml
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion
 from openai.types.images_response import ImagesResponse
+from pptagent import tracing
 from pydantic import BaseModel, Field, PrivateAttr, ValidationError
 
 from deeppresenter.utils.constants import (
@@ -233,12 +234,24 @@ class LLM(BaseModel):
             for _ in range(retry_times):
                 endpoint = next(iter_endpoints)
                 try:
-                    return await endpoint.call(
-                        messages,
-                        self.soft_response_parsing,
-                        response_format,
-                        tools,
-                    )
+                    with tracing.span(
+                        "llm.request",
+                        **{"llm.model": endpoint.model, "llm.tools": tools is not None},
+                    ) as span:
+                        response = await endpoint.call(
+                            messages,
+                            self.soft_response_parsing,
+                            response_format,
+                            tools,
+                        )
+                        if response.usage is not None:
+                            span.set_attributes(
+                                {
+                                    "llm.prompt_tokens": response.usage.prompt_tokens,
+                                    "llm.completion_tokens": response.usage.completion_tokens,
+                                }
+                            )
+                    return response
                 except (AssertionError, ValidationError) as e:
                     errors.append(f"[{endpoint.model}] {e}")
                 except Exception as e:
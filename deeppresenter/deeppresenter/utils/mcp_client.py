@@ -1,17 +1,21 @@
 import asyncio
 import copy
+import inspect
 from contextlib import AsyncExitStack
 from typing import Any
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.sse import sse_client
 from mcp.client.stdio import logger, stdio_client
+from pptagent import tracing
 
 from deeppresenter.utils.constants import MCP_CALL_TIMEOUT, MCP_CONNECT_TIMEOUT
 from deeppresenter.utils.log import error, exception, info, warning
 from deeppresenter.utils.typings import MCPServer
 
 logger.setLevel("WARNING")
+# the trace context is sent in the request metadata by the mcp versions supporting it
+CALL_TOOL_META = "meta" in inspect.signature(ClientSession.call_tool).parameters
 
 
 class MCPClient:
@@ -29,9 +33,16 @@ class MCPClient:
         if server_id not in self.sessions:
             raise ValueError(f"Server {server_id} is not connected.")
         session = self.sessions[server_id]
-        result = await asyncio.wait_for(
-            session.call_tool(tool_name, tool_params), MCP_CALL_TIMEOUT
-        )
+        with tracing.span(
+            f"mcp.call_tool {tool_name}",
+            **{"mcp.server": server_id, "mcp.tool": tool_name},
+        ):
+            kwargs = {}
+            if CALL_TOOL_META and (meta := tracing.inject()):
+                kwargs["meta"] = meta
+            result = await asyncio.wait_for(
+                session.call_tool(tool_name, tool_params, **kwargs), MCP_CALL_TIMEOUT
+            )
         return result
 
     async def connect_server(self, server_id: str, config: MCPServer):
@@ -8,6 +8,7 @@ from typing import Literal
 from fake_useragent import UserAgent
 from pdf2image import convert_from_path
 from playwright.async_api import async_playwright
+from pptagent import tracing
 from pypdf import PdfWriter
 
 from deeppresenter.utils.constants import PACKAGE_DIR, PDF_OPTIONS
@@ -76,6 +77,7 @@ class PlaywrightConverter:
         if self.context:
             await self.context.close()
 
+    @tracing.traced("render.html2pdf")
     async def convert_to_pdf(
         self,
         html_files: list[str | Path],
@@ -126,6 +128,7 @@ class PlaywrightConverter:
         return folder
 
 
+@tracing.traced("render.html2pptx")
 async def convert_html_to_pptx(
     html_inputs: Path | str | Iterable[Path | str],
     output_pptx: Path | str | None = None,
@@ -0,0 +1,95 @@
+"""
+Count the vision calls saved by lazy captioning on a synthetic sample paper.
+
+Usage: python benchmark/caption_calls.py [--num-figures 12] [--num-referenced 4]
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from os.path import join
+from unittest.mock import patch
+
+from func_argparse import single_main
+from mock_llm import MockLLM, document_responder
+from PIL import Image
+
+from pptagent.document import Document
+from pptagent.utils import Language
+
+
+def build_sample_paper(image_dir: str, num_figures: int) -> str:
+    sections = ["# Sample Paper\n\nAuthors: Alice, Bob.\n\n" + "Abstract text. " * 40]
+    for fig_idx in range(num_figures):
+        # every third image is a small icon, the others are figures
+        size = (64, 64) if fig_idx % 3 == 2 else (800, 600)
+        Image.new("RGB", size, (fig_idx * 20 % 255, 120, 200)).save(
+            join(image_dir, f"fig_{fig_idx}.png")
+        )
+        if fig_idx % 2 == 0:
+            sections.append(f"# Section {fig_idx // 2 + 1}\n\n" + "Body text. " * 60)
+        sections.append(
+            f"As shown in Figure {fig_idx + 1}, the method works well. "
+            + "More details follow. " * 30
+            + f"\n\n![](fig_{fig_idx}.png)\n\nFigure {fig_idx + 1}: result number {fig_idx + 1}."
+        )
+    return "\n\n".join(sections)
+
+
+async def parse(markdown: str, image_dir: str, lazy_caption: bool):
+    language_model = MockLLM("mock-language", document_responder)
+    vision_model = MockLLM("mock-vision", document_responder)
+    # language identification is not what we measure here
+    with patch(
+        "pptagent.document.document.language_id", return_value=Language.english()
+    ):
+        document = await Document.from_markdown(
+            markdown, language_model, vision_model, image_dir, lazy_caption=lazy_caption
+        )
+    return document, vision_model
+
+
+async def benchmark(num_figures: int = 12, num_referenced: int = 4):
+    image_dir = tempfile.mkdtemp()
+    try:
+        markdown = build_sample_paper(image_dir, num_figures)
+
+        # a caption store of the run, the eager captions are not reused by the lazy parse
+        os.environ["CAPTION_STORE"] = join(image_dir, "eager.sqlite")
+        _, eager_vision = await parse(markdown, image_dir, False)
+        os.environ["CAPTION_STORE"] = join(image_dir, "lazy.sqlite")
+
+        document, lazy_vision = await parse(markdown, image_dir, True)
+        referenced = [m.path for m in document.iter_medias_by_priority()]
+        await document.caption_medias(
+            lazy_vision, paths=set(referenced[:num_referenced])
+        )
+
+        # a later read of the same document reuses the persisted captions
+        document, reread_vision = await parse(markdown, image_dir, True)
+        await document.caption_medias(
+            reread_vision, paths=set(referenced[:num_referenced])
+        )
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+    eager, lazy, reread = (
+        eager_vision.calls["vision"],
+        lazy_vision.calls["vision"],
+        reread_vision.calls["vision"],
+    )
+    print(f"medias in document:          {num_figures}")
+    print(f"medias referenced by outline: {num_referenced}")
+    print(f"vision calls (eager):        {eager}")
+    print(f"vision calls (lazy):         {lazy}")
+    print(f"vision calls (lazy, reread): {reread}")
+    print(f"vision calls saved:          {eager - lazy} ({1 - lazy / eager:.0%})")
+
+
+def run(num_figures: int = 12, num_referenced: int = 4):
+    asyncio.run(benchmark(num_figures, num_referenced))
+
+
+if __name__ == "__main__":
+    single_main(run)
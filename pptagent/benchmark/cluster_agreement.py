@@ -0,0 +1,130 @@
+"""
+Cluster the content slides of the bundled templates with `SlideInducter.layout_split` on the
+torch-free perceptual features, and compare with the clusters of the image model recorded in
+their `slide_induction.json`, as the fraction of slide pairs both put in the same cluster or
+both in different ones (the Rand index), and the templates clustered identically.
+
+Slides are rendered with LibreOffice, or sketched from their shape boxes without it.
+
+Usage: python benchmark/cluster_agreement.py [--templates beamer,cip,default,hit,thu,ucas]
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from itertools import combinations
+from os.path import basename, join
+from shutil import which
+
+from func_argparse import single_main
+from PIL import Image, ImageDraw
+
+from pptagent.induct import SlideInducter
+from pptagent.llms import AsyncLLM
+from pptagent.model_utils import PerceptualImageModel
+from pptagent.presentation import Picture, Presentation
+from pptagent.utils import Config, package_join, ppt_to_images
+
+
+async def name_by_image(prompt: str, image: str) -> str:
+    return basename(image)
+
+
+def sketch_slides(prs: Presentation, image_dir: str):
+    os.makedirs(image_dir, exist_ok=True)
+    for slide in prs.slides:
+        scale = 640 / slide.slide_width
+        image = Image.new("RGB", (640, round(slide.slide_height * scale)), "white")
+        draw = ImageDraw.Draw(image)
+        for shape in slide:
+            box = [
+                shape.left * scale,
+                shape.top * scale,
+                (shape.left + shape.width) * scale,
+                (shape.top + shape.height) * scale,
+            ]
+            if box[2] <= box[0] or box[3] <= box[1]:
+                continue
+            if isinstance(shape, Picture):
+                draw.rectangle(box, fill="steelblue")
+            else:
+                draw.rectangle(box, outline="black", width=2)
+        image.save(join(image_dir, f"slide_{slide.slide_idx:04d}.jpg"))
+
+
+def rand_index(reference: dict[int, str], predicted: dict[int, str]) -> tuple[int, int]:
+    pairs = list(combinations(sorted(reference), 2))
+    agree = sum(
+        (reference[a] == reference[b]) == (predicted[a] == predicted[b])
+        for a, b in pairs
+    )
+    return agree, len(pairs)
+
+
+async def cluster_template(template: str, render: bool) -> tuple[dict, dict, float]:
+    template_dir = package_join("templates", template)
+    run_dir = tempfile.mkdtemp()
+    config = Config(run_dir)
+    prs = Presentation.from_file(join(template_dir, "source.pptx"), config)
+    image_dir = join(run_dir, "template_images")
+    if render:
+        prs.save(join(run_dir, "template.pptx"), layout_only=True)
+        await ppt_to_images(join(run_dir, "template.pptx"), image_dir)
+    else:
+        sketch_slides(prs, image_dir)
+
+    with open(join(template_dir, "slide_induction.json"), encoding="utf-8") as f:
+        induction = json.load(f)
+    reference = {
+        idx: name
+        for name, layout in induction.items()
+        if name not in induction["functional_keys"] and "slides" in layout
+        for idx in layout["slides"]
+    }
+    inducter = SlideInducter(
+        prs,
+        image_dir,
+        image_dir,
+        config,
+        (None, PerceptualImageModel()),
+        AsyncLLM("unused", api_key="offline"),
+        name_by_image,
+        use_assert=False,
+    )
+    layout_induction = defaultdict(dict)
+    start = time.perf_counter()
+    await inducter.layout_split(set(reference), layout_induction)
+    elapsed = time.perf_counter() - start
+    predicted = {
+        idx: name
+        for name, layout in layout_induction.items()
+        for idx in layout["slides"]
+    }
+    return reference, predicted, elapsed
+
+
+def run(templates: str = "beamer,cip,default,hit,thu,ucas"):
+    render = which("soffice") is not None
+    print(f"slides {'rendered with LibreOffice' if render else 'sketched from shapes'}")
+    total_agree = total_pairs = identical = 0
+    names = templates.split(",")
+    for template in names:
+        reference, predicted, elapsed = asyncio.run(cluster_template(template, render))
+        agree, pairs = rand_index(reference, predicted)
+        total_agree, total_pairs = total_agree + agree, total_pairs + pairs
+        identical += agree == pairs
+        print(
+            f"{template:>8}: {len(reference):2d} content slides, "
+            f"{agree}/{pairs} pairs agree, layout_split {elapsed * 1000:6.1f} ms"
+        )
+    print(
+        f"Rand index {total_agree / total_pairs:.3f}, "
+        f"{identical}/{len(names)} templates clustered identically"
+    )
+
+
+if __name__ == "__main__":
+    single_main(run)
@@ -0,0 +1,130 @@
+"""
+Count the coder calls avoided by synthesizing slide edits, on every layout of the bundled templates.
+
+For each layout, editor outputs are drawn with fewer, as many and more items than the template
+slide, the synthesized edit is executed and the text of the edited slide is compared with the
+editor output: an element differs if its paragraphs are not exactly the new content.
+
+Usage: python benchmark/coder_fast_path.py [--templates default,thu] [--seed 0]
+"""
+
+import json
+import random
+import tempfile
+from copy import deepcopy
+from pathlib import Path
+
+from func_argparse import single_main
+from PIL import Image
+
+from pptagent.apis import CodeExecutor, SlideEditError, synthesize_actions
+from pptagent.multimodal import ImageLabler
+from pptagent.presentation import Presentation
+from pptagent.presentation.layout import Layout
+from pptagent.response import EditorOutput
+from pptagent.response.pptgen import SlideElement
+from pptagent.utils import Config, package_join
+
+WORDS = "model data results method training accuracy latency slide figure table".split()
+
+
+def load_template(name: str) -> tuple[Presentation, dict[str, Layout]]:
+    template_dir = Path(package_join("templates", name))
+    config = Config(tempfile.mkdtemp())
+    prs = Presentation.from_file(str(template_dir / "source.pptx"), config)
+    ImageLabler(prs, config).apply_stats(
+        json.loads((template_dir / "image_stats.json").read_text())
+    )
+    slide_induction = json.loads((template_dir / "slide_induction.json").read_text())
+    slide_induction.pop("language")
+    slide_induction.pop("functional_keys")
+    return prs, {
+        title: Layout(title=title, **layout)
+        for title, layout in slide_induction.items()
+    }
+
+
+def editor_output(layout: Layout, image: str, delta: int, rng: random.Random):
+    elements = []
+    for el in layout.elements:
+        if el.type == "image":
+            data = [image] * max(len(el.data) + min(delta, 0), 1)
+        else:
+            low, high = el.variable_length or (1, max(len(el.data) + 1, 2))
+            count = min(max(len(el.data) + delta, low), high)
+            data = [
+                " ".join(rng.choices(WORDS, k=rng.randint(2, 8))) for _ in range(count)
+            ]
+        elements.append(SlideElement(name=el.name, data=data))
+    return EditorOutput(elements=elements)
+
+
+def text_matches(slide, command_list) -> bool:
+    texts = [
+        para.text
+        for shape in slide
+        if shape.text_frame.is_textframe
+        for para in shape.text_frame.paragraphs
+    ]
+    return all(
+        all(text in texts for text in new_content)
+        for _, el_type, _, _, new_content in command_list
+        if el_type == "text"
+    )
+
+
+def run(templates: str = "", seed: int = 0):
+    rng = random.Random(seed)
+    image = str(Path(tempfile.mkdtemp()) / "figure.png")
+    Image.new("RGB", (800, 600)).save(image)
+    if templates:
+        names = templates.split(",")
+    else:
+        names = [
+            p.name for p in Path(package_join("templates")).iterdir() if p.is_dir()
+        ]
+    print(
+        f"{'template':<10}{'edits':>8}{'synthesized':>14}{'failed exec':>13}{'text diff':>11}"
+    )
+    total, total_synth = 0, 0
+    for name in sorted(names):
+        prs, layouts = load_template(name)
+        edits, synthesized, failed, differs = 0, 0, 0, 0
+        for layout in layouts.values():
+            for delta in (-1, 0, 1):
+                try:
+                    output = editor_output(layout, image, delta, rng)
+                    template_id, old_data = layout.index_template_slide(output)
+                except ValueError:
+                    continue
+                command_list = [
+                    (
+                        el_name,
+                        layout[el_name].type,
+                        f"quantity_change: {len(output[el_name].data) - len(old)}",
+                        old,
+                        output[el_name].data,
+                    )
+                    for el_name, old in old_data.items()
+                ]
+                edits += 1
+                try:
+                    actions = synthesize_actions(
+                        prs.slides[template_id - 1], command_list
+                    )
+                except SlideEditError:
+                    continue
+                slide = deepcopy(prs.slides[template_id - 1])
+                if CodeExecutor(3).execute_actions(actions, slide, None, True):
+                    failed += 1
+                    continue
+                synthesized += 1
+                differs += not text_matches(slide, command_list)
+        total += edits
+        total_synth += synthesized
+        print(f"{name:<10}{edits:>8}{synthesized:>14}{failed:>13}{differs:>11}")
+    print(f"coder calls avoided: {total_synth}/{total} ({total_synth / total:.1%})")
+
+
+if __name__ == "__main__":
+    single_main(run)
@@ -0,0 +1,24 @@
+import os
+from os.path import dirname, join
+
+DEFAULT_STORAGE = "file://./.benchmarks"
+
+
+def pytest_configure(config):
+    """
+    Keep the microbenchmark results next to the suite, and fail a comparison with the
+    stored baseline on a median regression above `PPTAGENT_BENCH_THRESHOLD` (15% by default).
+    """
+    if not hasattr(config.option, "benchmark_storage"):
+        return
+    from pytest_benchmark.utils import parse_compare_fail
+
+    if config.option.benchmark_storage == DEFAULT_STORAGE:
+        config.option.benchmark_storage = "file://" + join(
+            dirname(__file__), ".benchmarks"
+        )
+    if config.option.benchmark_compare and not config.option.benchmark_compare_fail:
+        threshold = os.getenv("PPTAGENT_BENCH_THRESHOLD", "15%")
+        config.option.benchmark_compare_fail = [
+            parse_compare_fail(f"median:{threshold}")
+        ]
@@ -0,0 +1,457 @@
+"""
+Run full pipelines against the replay server and report the latency distribution of
+their stages, CPU time, peak RSS and LLM calls by role, to compare runs across commits.
+
+Pipelines:
+    pptagent:      `PPTAgent.generate_pres` on synthetic documents over a bundled template.
+    induct:        `SlideInducter` on a prepared template folder (`--induct-dir`, with
+                   `source.pptx`, `slide_images/` and `template_images/`), loads the image model.
+    deeppresenter: `AgentLoop.run` with the models of `--deeppresenter-config` redirected to
+                   the replay server, its MCP servers must be available.
+
+Without a recording, the planner replays an outline of the synthetic documents and the
+other structured responses are synthesized from their schema. The coder has no schema,
+slides whose edit cannot be synthesized fail unless it is recorded. Record one
+against a real endpoint with `python -m pptagent.replay --upstream-base-url ...`.
+
+Usage: python benchmark/e2e.py --pipelines pptagent,induct --repeat 5 --profiles latency.yaml \
+    [--recording recording.jsonl] [--output runs/bench/e2e.json] [--baseline previous.json]
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import asdict
+from os.path import dirname, join
+
+import numpy as np
+import yaml
+from func_argparse import single_main
+
+from pptagent.document import Document, Section, SubSection
+from pptagent.llms import AsyncLLM
+from pptagent.replay import (
+    BackgroundServer,
+    Recording,
+    RoleMatcher,
+    create_replay_app,
+    load_profiles,
+)
+from pptagent.scheduler import BatchScheduler
+from pptagent.utils import Language
+
+PPTAGENT_STAGES = [
+    "generate_outline",
+    "_stream_outline",
+    "generate_slide",
+    "_select_layout",
+    "_generate_content",
+    "_edit_slide",
+]
+INDUCT_STAGES = ["category_split", "layout_split", "content_induct"]
+
+
+class StageTimer:
+    """Collects the wall time of the calls of instrumented methods, by stage."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, obj, *names: str):
+        """Time the calls of the methods `names` of `obj`, by wrapping them on the instance."""
+        for name in names:
+            method = getattr(obj, name, None)
+            if method is None:
+                continue
+            setattr(obj, name, self._timed(name, method))
+        return obj
+
+    def _timed(self, stage: str, method):
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self.samples[stage].append(time.perf_counter() - start)
+
+        else:
+
+            @functools.wraps(method)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.samples[stage].append(time.perf_counter() - start)
+
+        return timed
+
+    def record(self, stage: str, start: float):
+        self.samples[stage].append(time.perf_counter() - start)
+
+
+def summarize(samples: list[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def build_document(image_dir: str, num_sections: int, seed: int) -> Document:
+    words = ["model", "result", "method", "dataset", "metric", "training", "layer"]
+
+    def text(idx: int, length: int) -> str:
+        return " ".join(words[(seed + idx + i) % len(words)] for i in range(length))
+
+    return Document(
+        image_dir=image_dir,
+        language=Language.english(),
+        metadata={"title": f"Synthetic document {seed}"},
+        sections=[
+            Section(
+                title=f"Section {idx}",
+                summary=text(idx, 20),
+                content=[
+                    SubSection(title=f"Part {idx}.{sub}", content=text(idx + sub, 120))
+                    for sub in range(2)
+                ],
+            )
+            for idx in range(num_sections)
+        ],
+    )
+
+
+def synthetic_recording(path: str, num_sections: int, num_slides: int):
+    """
+    Record an outline of the synthetic documents for the planner, whose indexes must
+    refer to existing subsections, and key points for the content organizer, which has
+    no response schema. The other roles are answered from their schemas.
+    """
+    outline = [
+        {
+            "purpose": f"Present section {idx % num_sections}",
+            "topic": f"Section {idx % num_sections}",
+            "indexes": [
+                {
+                    "section": f"Section {idx % num_sections}",
+                    "subsections": [f"Part {idx % num_sections}.{idx % 2}"],
+                }
+            ],
+            "images": [],
+        }
+        for idx in range(num_slides)
+    ]
+    key_points = [{"paragraph": "a key point of the section"}]
+    with open(path, "w", encoding="utf-8") as f:
+        for role, content in (
+            ("planner", {"outline": outline}),
+            ("content_organizer", key_points),
+        ):
+            f.write(json.dumps({"role": role, "content": json.dumps(content)}) + "\n")
+
+
+async def run_pptagent(
+    llm: AsyncLLM,
+    timer: StageTimer,
+    workdir: str,
+    repeat: int,
+    template: str,
+    num_sections: int,
+    num_slides: int,
+    max_at_once: int,
+) -> dict:
+    start = time.perf_counter()
+    scheduler = BatchScheduler(llm, llm, workdir, max_at_once)
+    reference = scheduler.reference(template)
+    timer.record("set_reference", start)
+    failures, failed_slides = 0, 0
+    edit_stats = defaultdict(int)
+    for idx in range(repeat):
+        generator = timer.wrap(reference.fork(), *PPTAGENT_STAGES)
+        document = build_document(workdir, num_sections, idx)
+        start = time.perf_counter()
+        prs, history = await generator.generate_pres(
+            document, num_slides=num_slides, max_at_once=max_at_once
+        )
+        timer.record("generate_pres", start)
+        for key, value in history["edit_stats"].items():
+            edit_stats[key] += value
+        if prs is None:
+            failures += 1
+            continue
+        failed_slides += len(generator.outline) - len(prs.slides)
+        start = time.perf_counter()
+        prs.save(join(workdir, f"pptagent-{idx}.pptx"))
+        timer.record("save", start)
+    return {
+        "failures": failures,
+        "failed_slides": failed_slides,
+        "edit_stats": dict(edit_stats),
+    }
+
+
+async def run_induct(
+    llm: AsyncLLM, timer: StageTimer, induct_dir: str, repeat: int
+) -> dict:
+    from pptagent.induct import SlideInducter
+    from pptagent.model_utils import ModelManager
+    from pptagent.multimodal import ImageLabler
+    from pptagent.presentation import Presentation
+    from pptagent.utils import Config
+
+    image_model = ModelManager().image_model
+    for _ in range(repeat):
+        start = time.perf_counter()
+        config = Config(induct_dir)
+        prs = Presentation.from_file(join(induct_dir, "source.pptx"), config)
+        with open(join(induct_dir, "image_stats.json"), encoding="utf-8") as f:
+            ImageLabler(prs, config).apply_stats(json.load(f))
+        timer.record("load", start)
+        inducter = SlideInducter(
+            prs,
+            join(induct_dir, "slide_images"),
+            join(induct_dir, "template_images"),
+            config,
+            image_model,
+            llm,
+            llm,
+        )
+        timer.wrap(inducter, *INDUCT_STAGES)
+        start = time.perf_counter()
+        await inducter.content_induct(await inducter.layout_induct())
+        timer.record("induct", start)
+    return {"failures": 0}
+
+
+def redirect_config(config_path: str, base_url: str, workdir: str) -> str:
+    """Write a copy of a DeepPresenter config with every model served by `base_url`."""
+    with open(config_path, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    for key in ("research_agent", "design_agent", "long_context_model", "vision_model"):
+        config[key] = {
+            **config[key],
+            "base_url": base_url,
+            "api_key": "replay",
+            "endpoints": [],
+        }
+    config.pop("t2i_model", None)
+    path = join(workdir, "deeppresenter.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+
+async def run_deeppresenter(
+    base_url: str,
+    timer: StageTimer,
+    workdir: str,
+    repeat: int,
+    config_path: str,
+    instruction: str,
+) -> dict:
+    from pathlib import Path
+
+    from deeppresenter.main import AgentLoop
+    from deeppresenter.utils.config import DeepPresenterConfig
+    from deeppresenter.utils.typings import InputRequest
+
+    config = DeepPresenterConfig.load_from_file(
+        redirect_config(config_path, base_url, workdir)
+    )
+    failures = 0
+    tool_time = defaultdict(float)
+    for idx in range(repeat):
+        loop = AgentLoop(config, workspace=Path(workdir) / f"deeppresenter-{idx}")
+        start = stage_start = time.perf_counter()
+        researched = False
+        try:
+            async for _ in loop.run(InputRequest(instruction=instruction)):
+                if not researched and "manuscript" in loop.intermediate_output:
+                    researched = True
+                    timer.record("research", stage_start)
+                    stage_start = time.perf_counter()
+        except Exception:
+            failures += 1
+            continue
+        timer.record("design", stage_start)
+        timer.record("run", start)
+        for name, timing in loop.agent_env.timing_dict.items():
+            tool_time[name] += timing.total_time
+    return {"failures": failures, "tool_time_s": dict(tool_time)}
+
+
+async def bench_pipeline(name: str, server: BackgroundServer, app, workdir: str, args):
+    llm = AsyncLLM("replay", base_url=server.base_url, api_key="replay")
+    timer = StageTimer()
+    app.state.stats.clear()
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    if name == "pptagent":
+        extra = await run_pptagent(
+            llm,
+            timer,
+            workdir,
+            args["repeat"],
+            args["template"],
+            args["num_sections"],
+            args["num_slides"],
+            args["max_at_once"],
+        )
+    elif name == "induct":
+        assert args["induct_dir"], "--induct-dir is required by the induct pipeline"
+        extra = await run_induct(llm, timer, args["induct_dir"], args["repeat"])
+    elif name == "deeppresenter":
+        assert args["deeppresenter_config"], (
+            "--deeppresenter-config is required by the deeppresenter pipeline"
+        )
+        extra = await run_deeppresenter(
+            server.base_url,
+            timer,
+            workdir,
+            args["repeat"],
+            args["deeppresenter_config"],
+            args["instruction"],
+        )
+    else:
+        raise ValueError(f"Unknown pipeline {name}")
+    stats = {role: asdict(s) for role, s in app.state.stats.items()}
+    return {
+        "wall_time_s": round(time.perf_counter() - wall_start, 3),
+        "cpu_time_s": round(time.process_time() - cpu_start, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": {stage: summarize(s) for stage, s in timer.samples.items() if s},
+        "llm_calls": {role: s["calls"] for role, s in stats.items()},
+        "llm_injected_latency_s": round(sum(s["latency"] for s in stats.values()), 3),
+        "llm": stats,
+        **extra,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=dirname(__file__),
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except Exception:
+        return None
+
+
+def compare(result: dict, baseline: dict):
+    print(f"\ncompared with {baseline['meta'].get('commit')}:")
+    for name, pipeline in result["pipelines"].items():
+        previous = baseline["pipelines"].get(name)
+        if previous is None:
+            continue
+        for stage, stats in pipeline["stages"].items():
+            if stage not in previous["stages"]:
+                continue
+            ratios = [
+                stats[key] / max(previous["stages"][stage][key], 1e-9)
+                for key in ("p50_ms", "p95_ms")
+            ]
+            print(f"  {name}/{stage:<20} p50 x{ratios[0]:.2f}  p95 x{ratios[1]:.2f}")
+        cpu = pipeline["cpu_time_s"] / max(previous["cpu_time_s"], 1e-9)
+        print(f"  {name}/cpu_time            x{cpu:.2f}")
+
+
+def run(
+    pipelines: str = "pptagent",
+    repeat: int = 3,
+    recording: str = "",
+    profiles: str = "",
+    role_dirs: str = "",
+    seed: int = 0,
+    template: str = "default",
+    num_sections: int = 4,
+    num_slides: int = 6,
+    max_at_once: int = 4,
+    induct_dir: str = "",
+    deeppresenter_config: str = "",
+    instruction: str = "Make a short presentation about attention mechanisms",
+    output: str = "runs/bench/e2e.json",
+    baseline: str = "",
+):
+    """
+    Args:
+        pipelines (str): Comma separated pipelines to run.
+        role_dirs (str): Comma separated folders of extra role files, e.g. deeppresenter/roles.
+    """
+    args = locals()
+    profiles_by_role = load_profiles(profiles)
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": args,
+            "profiles": {role: asdict(p) for role, p in profiles_by_role.items()},
+        },
+        "pipelines": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        if not recording:
+            recording = join(workdir, "recording.jsonl")
+            synthetic_recording(recording, num_sections, num_slides)
+        app = create_replay_app(
+            Recording(recording),
+            profiles_by_role,
+            RoleMatcher.default(*filter(None, role_dirs.split(","))),
+            seed=seed,
+        )
+        with BackgroundServer(app) as server:
+            for name in pipelines.split(","):
+                os.makedirs(join(workdir, name))
+                result["pipelines"][name] = asyncio.run(
+                    bench_pipeline(name, server, app, join(workdir, name), args)
+                )
+
+    for name, pipeline in result["pipelines"].items():
+        print(
+            f"{name}: wall {pipeline['wall_time_s']}s, cpu {pipeline['cpu_time_s']}s, "
+            f"peak rss {pipeline['peak_rss_mb']} MB, failures {pipeline['failures']}"
+        )
+        for stage, s in pipeline["stages"].items():
+            print(
+                f"  {stage:<20} n={s['count']:<4} p50 {s['p50_ms']:9.1f} ms  "
+                f"p95 {s['p95_ms']:9.1f} ms  p99 {s['p99_ms']:9.1f} ms"
+            )
+        print("  llm calls: " + json.dumps(pipeline["llm_calls"]))
+
+    os.makedirs(dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"results written to {output}")
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    single_main(run)
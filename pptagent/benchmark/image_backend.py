@@ -0,0 +1,53 @@
+"""
+Embed the rendered slides of a bundled template with the image model in PyTorch on CPU
+versus the int8 model in ONNX Runtime, reporting the throughput of each backend.
+
+Needs torch, onnxruntime and LibreOffice.
+
+Usage: python benchmark/image_backend.py [--template default] [--repeat 3] [--threads 4]
+"""
+
+import asyncio
+import tempfile
+import time
+from os.path import join
+
+from func_argparse import single_main
+
+from pptagent.model_utils import (
+    get_image_embedding,
+    get_image_model,
+    get_onnx_image_model,
+)
+from pptagent.presentation import Presentation
+from pptagent.utils import Config, package_join, ppt_to_images
+
+
+def run(template: str = "default", repeat: int = 3, threads: int = 0):
+    run_dir = tempfile.mkdtemp()
+    prs = Presentation.from_file(
+        package_join("templates", template, "source.pptx"), Config(run_dir)
+    )
+    prs.save(join(run_dir, "template.pptx"), layout_only=True)
+    image_dir = join(run_dir, "template_images")
+    asyncio.run(ppt_to_images(join(run_dir, "template.pptx"), image_dir))
+
+    backends = {
+        "torch": get_image_model("cpu"),
+        "onnx int8": get_onnx_image_model(intra_op_threads=threads or None),
+    }
+    print(f"template: {template}, {len(prs)} slides, {repeat} repeats")
+    baseline = None
+    for name, (extractor, model) in backends.items():
+        # the first batch pays for the lazy initialization of the runtime
+        get_image_embedding(image_dir, extractor, model)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            get_image_embedding(image_dir, extractor, model)
+        throughput = len(prs) * repeat / (time.perf_counter() - start)
+        baseline = baseline or throughput
+        print(f"{name:>10}: {throughput:7.2f} slides/s, {throughput / baseline:4.1f}x")
+
+
+if __name__ == "__main__":
+    single_main(run)
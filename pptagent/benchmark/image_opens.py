@@ -0,0 +1,109 @@
+"""
+Count the images opened with PIL per deck, with the image index disabled (every lookup opens
+the image, as before the index) versus enabled.
+
+Each deck goes through the image lookups of a generation over a bundled template: labelling
+the template images, ordering the medias of a document with figures by priority, profiling
+the images of every slide for the layout scorer, replacing a template picture with each
+image and counting the image tokens of the turns that see it.
+
+Usage: python benchmark/image_opens.py [--template default] [--decks 5] [--figures 8]
+"""
+
+import tempfile
+import time
+from copy import deepcopy
+from os.path import join
+
+import PIL.Image
+from func_argparse import single_main
+
+from pptagent.agent import calc_image_tokens
+from pptagent.apis import replace_image
+from pptagent.document import Document, Media, Section, SubSection
+from pptagent.image_index import IMAGE_INDEX
+from pptagent.multimodal import ImageLabler
+from pptagent.presentation import Picture, Presentation
+from pptagent.utils import Config, Language, package_join
+
+opens = 0
+pil_open = PIL.Image.open
+
+
+def counting_open(*args, **kwargs):
+    global opens
+    opens += 1
+    return pil_open(*args, **kwargs)
+
+
+def build_document(image_dir: str, figures: int) -> Document:
+    paths = []
+    for idx in range(figures):
+        path = join(image_dir, f"figure_{idx}.png")
+        PIL.Image.new("RGB", (640 + 40 * idx, 480), "white").save(path)
+        paths.append(path)
+    return Document(
+        image_dir=image_dir,
+        language=Language.english(),
+        metadata={"title": "Synthetic document"},
+        sections=[
+            Section(
+                title=f"Section {idx}",
+                summary="summary",
+                content=[
+                    SubSection(title=f"Part {idx}", content=f"Figure {idx} shows it."),
+                    Media(
+                        markdown_content=f"![]({path})",
+                        near_chunks=("", ""),
+                        path=path,
+                        caption=f"Figure {idx}",
+                    ),
+                ],
+            )
+            for idx, path in enumerate(paths)
+        ],
+    )
+
+
+def generate_deck(prs: Presentation, config: Config, document: Document):
+    ImageLabler(prs, config)
+    medias = list(document.iter_medias_by_priority())
+    slide = next(s for s in prs.slides if any(isinstance(sh, Picture) for sh in s))
+    img_id = next(sh.shape_idx for sh in slide if isinstance(sh, Picture))
+    for media in medias:
+        # the layout scorer profiles the images of the slide
+        document.find_media(path=media.path).size
+        replace_image(deepcopy(slide), document, img_id, media.path)
+        # the layout selector and the coder see the image
+        calc_image_tokens([media.path, media.path])
+
+
+def run(template: str = "default", decks: int = 5, figures: int = 8):
+    run_dir = tempfile.mkdtemp()
+    config = Config(run_dir)
+    prs = Presentation.from_file(
+        package_join("templates", template, "source.pptx"), config
+    )
+    document = build_document(run_dir, figures)
+    PIL.Image.open = counting_open
+    global opens
+    print(f"template: {template}, {decks} decks of {figures} figures")
+    for name, max_entries in (
+        ("without index", 0),
+        ("with index", IMAGE_INDEX.max_entries),
+    ):
+        IMAGE_INDEX.max_entries = max_entries
+        IMAGE_INDEX.clear()
+        opens = 0
+        start = time.perf_counter()
+        for _ in range(decks):
+            generate_deck(prs, config, document)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>14}: {opens / decks:6.1f} PIL opens per deck, "
+            f"{elapsed / decks * 1000:7.1f} ms per deck, index {IMAGE_INDEX.report()}"
+        )
+
+
+if __name__ == "__main__":
+    single_main(run)
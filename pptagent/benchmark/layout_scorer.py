@@ -0,0 +1,112 @@
+"""
+Report how many layout selections the speculative layout scorer skips and how often it agrees
+with the recorded choice, on a corpus recorded with `LayoutScorer(corpus_path=...)`.
+
+Without a corpus, slides are synthesized from the layouts of a template with noisy content
+shapes and purposes unrelated to the layout titles, labelled with the layout they were drawn from.
+
+Usage: python benchmark/layout_scorer.py [--corpus runs/layout_corpus.jsonl] [--template default]
+"""
+
+import json
+import random
+import tempfile
+
+from func_argparse import single_main
+
+from pptagent.layout_scorer import LayoutScorer, SlideProfile, hashed_embedding
+from pptagent.multimodal import ImageLabler
+from pptagent.presentation import Presentation
+from pptagent.presentation.layout import Layout
+from pptagent.utils import Config, package_join
+
+PURPOSES = [
+    "Present the experimental results",
+    "Explain the proposed method",
+    "Introduce the background of the problem",
+    "Summarize the main findings",
+    "Discuss limitations and future work",
+]
+
+
+def synthesize(template: str, num_slides: int, seed: int) -> list[dict]:
+    template_dir = package_join("templates", template)
+    config = Config(tempfile.mkdtemp())
+    prs = Presentation.from_file(f"{template_dir}/source.pptx", config)
+    with open(f"{template_dir}/image_stats.json") as f:
+        ImageLabler(prs, config).apply_stats(json.load(f))
+    with open(f"{template_dir}/slide_induction.json") as f:
+        slide_induction = json.load(f)
+    functional = slide_induction.pop("functional_keys")
+    slide_induction.pop("language")
+
+    layouts = {
+        title: Layout(title=title, **layout)
+        for title, layout in slide_induction.items()
+        if title not in functional
+    }
+    scorer = LayoutScorer()
+    scorer.profile_layouts(layouts, prs.slides)
+    text_layouts = [t for t in layouts if t.endswith("text")]
+    image_layouts = [t for t in layouts if not t.endswith("text")]
+
+    rng = random.Random(seed)
+    records = []
+    for _ in range(num_slides):
+        title = rng.choice(list(layouts))
+        profile = scorer.profiles[title]
+        candidates = image_layouts if profile.num_images else text_layouts
+        num_images = max(profile.num_images + rng.choice([-1, 0, 0, 1]), 0)
+        if profile.num_images:
+            num_images = max(num_images, 1)
+        aspects = profile.aspects or [4 / 3]
+        slide = SlideProfile(
+            num_images=num_images,
+            num_items=max(round(profile.num_items * rng.uniform(0.5, 1.5)), 1),
+            text_length=round(profile.capacity * rng.uniform(0.5, 1.5)),
+            aspects=[
+                rng.choice(aspects) * rng.uniform(0.8, 1.25) for _ in range(num_images)
+            ],
+            embedding=hashed_embedding(rng.choice(PURPOSES)),
+        )
+        records.append(
+            {
+                "candidates": candidates,
+                "features": scorer.features(slide, candidates).tolist(),
+                "choice": candidates.index(title),
+            }
+        )
+    return records
+
+
+def run(
+    corpus: str = "",
+    template: str = "default",
+    num_slides: int = 400,
+    seed: int = 0,
+):
+    if corpus:
+        records = LayoutScorer.read_corpus(corpus)
+    else:
+        records = synthesize(template, num_slides, seed)
+    random.Random(seed).shuffle(records)
+    train, test = records[: len(records) // 2], records[len(records) // 2 :]
+    print(f"records: {len(records)} ({len(train)} train / {len(test)} test)")
+    print(
+        f"{'weights':<10}{'threshold':>10}{'skip rate':>12}{'agreement':>12}{'top-1':>8}"
+    )
+    for name, scorer in [
+        ("prior", LayoutScorer()),
+        ("fitted", LayoutScorer().fit(train)),
+    ]:
+        for threshold in (0.6, 0.8, 0.9, 0.95):
+            scorer.threshold = threshold
+            report = scorer.evaluate(test)
+            print(
+                f"{name:<10}{threshold:>10.2f}{report['skip_rate']:>12.1%}"
+                f"{report['agreement']:>12.1%}{report['accuracy']:>8.1%}"
+            )
+
+
+if __name__ == "__main__":
+    single_main(run)
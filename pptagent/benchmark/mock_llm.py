@@ -0,0 +1,72 @@
+import json
+import re
+from collections import Counter
+from collections.abc import Callable
+
+from pptagent.utils import get_json_from_response
+
+
+class MockLLM:
+    """
+    An offline stand-in of `AsyncLLM` that answers with a responder function and counts the calls.
+    """
+
+    def __init__(self, model: str, responder: Callable[[str, list[str]], str]):
+        self.model = model
+        self.responder = responder
+        self.calls = Counter()
+
+    async def __call__(
+        self,
+        content: str,
+        images: str | list[str] | None = None,
+        system_message: str | None = None,
+        history: list | None = None,
+        return_json: bool = False,
+        return_message: bool = False,
+        response_format=None,
+        **client_kwargs,
+    ):
+        if isinstance(images, str):
+            images = [images]
+        images = images or []
+        self.calls["vision" if images else "text"] += 1
+        response = self.responder(content, images)
+        message = [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": response},
+        ]
+        if return_json:
+            response = get_json_from_response(response)
+        if return_message:
+            return response, message
+        return response
+
+
+def document_responder(content: str, images: list[str]) -> str:
+    """Answer the prompts used by `Document.from_markdown`."""
+    if images:
+        return "Picture: a figure of the sample paper"
+    if "Markdown Document:" in content:
+        markdown = content.split("Markdown Document:", 1)[1]
+        titles = re.findall(r"^#+\s+(.*)$", markdown, re.MULTILINE) or ["Untitled"]
+        paragraphs = [
+            p.strip()
+            for p in markdown.split("\n\n")
+            if p.strip() and not p.strip().startswith(("#", "Output:"))
+        ]
+        return json.dumps(
+            {
+                "title": titles[0],
+                "summary": paragraphs[0][:100] if paragraphs else "",
+                "subsections": [
+                    {"title": f"{titles[0]} part {i + 1}", "content": p}
+                    for i, p in enumerate(paragraphs)
+                ],
+                "metadata": [],
+            }
+        )
+    if "heading list to process" in content:
+        headings = re.findall(r"^■ <title>(.*?)</title>", content, re.MULTILINE)
+        return json.dumps({"headings": ["# " + h for h in headings]})
+    return json.dumps({"metadata": [{"name": "title", "value": "Sample Paper"}]})
@@ -0,0 +1,77 @@
+"""
+Save many presentations concurrently from one event loop, in the loop as a single process
+does versus offloaded to worker pools of growing size, reporting the throughput and how long
+the event loop was stalled, i.e. the latency every other session of a server would suffer.
+
+Usage: python benchmark/offload.py [--template default] [--decks 32] [--workers 1,2,4,8]
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from os.path import join
+
+from func_argparse import single_main
+
+from pptagent.offload import WorkerPool
+from pptagent.presentation import Presentation
+from pptagent.utils import Config, package_join
+
+TICK = 0.005
+
+
+async def max_lag(stop: asyncio.Event) -> float:
+    """
+    The longest stall of the event loop, as the overshoot of a periodic sleep.
+    """
+    lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lag = max(lag, time.perf_counter() - start - TICK)
+    return lag
+
+
+async def save_all(prs: Presentation, decks: int, workers: int) -> tuple[float, float]:
+    output_dir = tempfile.mkdtemp()
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(max_lag(stop))
+    with WorkerPool(output_dir, workers) as pool:
+        # spawning the workers is a one-off cost, not part of the steady state
+        await asyncio.gather(
+            *(
+                pool.save(prs, join(output_dir, f"warmup-{idx}.pptx"))
+                for idx in range(workers)
+            )
+        )
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(pool.save(prs, join(output_dir, f"{idx}.pptx")) for idx in range(decks))
+        )
+        elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await monitor
+
+
+def run(template: str = "default", decks: int = 32, workers: str = "1,2,4,8"):
+    template_dir = package_join("templates", template)
+    prs = Presentation.from_file(
+        join(template_dir, "source.pptx"), Config(tempfile.mkdtemp())
+    )
+    print(
+        f"template: {template}, {len(prs)} slides, {decks} decks, {os.cpu_count()} CPUs"
+    )
+    baseline = None
+    for num_workers in [0, *map(int, workers.split(","))]:
+        elapsed, lag = asyncio.run(save_all(prs, decks, num_workers))
+        baseline = baseline or elapsed
+        label = "in the event loop" if num_workers == 0 else f"{num_workers} workers"
+        print(
+            f"{label:>18}: {decks / elapsed:6.2f} decks/s, "
+            f"{baseline / elapsed:4.1f}x, max loop stall {lag * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    single_main(run)
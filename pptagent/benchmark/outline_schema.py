@@ -0,0 +1,101 @@
+"""
+Measure the planner request built for a figure-heavy document: the response schema bytes,
+the overview bytes and the time to build them, with and without the compact outline mode.
+
+The planner latency itself depends on the provider; the CPU time spent on the request and
+the bytes sent are what the memoized and compact response models change.
+
+Usage: python benchmark/outline_schema.py [--num-sections 12] [--num-images 80]
+"""
+
+import json
+import time
+
+from func_argparse import single_main
+from openai.lib._parsing._completions import type_to_response_format_param
+
+from pptagent.document import Document, Media, Section, SubSection
+from pptagent.response import Outline
+from pptagent.response import outline as outline_module
+from pptagent.utils import Language
+
+
+def build_document(num_sections: int, num_images: int) -> Document:
+    sections = []
+    for sec_idx in range(num_sections):
+        content = [
+            SubSection(
+                title=f"{sec_idx + 1}.{i + 1} Experimental analysis of component {i}",
+                content="text",
+            )
+            for i in range(6)
+        ]
+        content += [
+            Media(
+                markdown_content="",
+                near_chunks=("", ""),
+                path=f"/data/papers/sample_paper/images/section_{sec_idx:02d}_figure_{i:03d}.png",
+                caption=f"Picture: figure {i} of section {sec_idx}",
+            )
+            for i in range(num_images // num_sections)
+        ]
+        sections.append(
+            Section(
+                title=f"{sec_idx + 1} Section about topic {sec_idx}",
+                summary="summary",
+                content=content,
+            )
+        )
+    return Document(
+        image_dir="/data/papers/sample_paper/images",
+        language=Language.english(),
+        metadata={},
+        sections=sections,
+    )
+
+
+def build_request(document: Document, compact: bool) -> tuple[int, int]:
+    overview = document.get_overview(compact=compact)
+    schema = json.dumps(
+        type_to_response_format_param(Outline.response_model(document, compact))
+    )
+    return len(overview.encode()), len(schema.encode())
+
+
+def timed(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def clear_cache():
+    outline_module._item_model.cache_clear()
+    outline_module._compact_item_model.cache_clear()
+    outline_module._outline_model.cache_clear()
+
+
+def run(num_sections: int = 12, num_images: int = 80, repeat: int = 20):
+    document = build_document(num_sections, num_images)
+    print(f"sections: {num_sections}, images: {num_images}")
+    print(
+        f"{'mode':<10}{'overview B':>12}{'schema B':>12}{'total B':>10}{'cold ms':>10}{'warm ms':>10}"
+    )
+    for compact in (False, True):
+        overview_bytes, schema_bytes = build_request(document, compact)
+
+        def cold():
+            clear_cache()
+            Outline.response_model(document, compact)
+
+        cold_ms = timed(cold, repeat)
+        warm_ms = timed(lambda: Outline.response_model(document, compact), repeat)
+        mode = "compact" if compact else "full"
+        print(
+            f"{mode:<10}{overview_bytes:>12}{schema_bytes:>12}{overview_bytes + schema_bytes:>10}"
+            f"{cold_ms:>10.2f}{warm_ms:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    single_main(run)
@@ -0,0 +1,63 @@
+"""
+Time repeated `set_reference` calls on a bundled template, preparing the reference every time
+versus reusing the cached prepared reference, then the first use of the generator.
+
+Usage: python benchmark/reference_cache.py [--template default] [--repeat 20]
+"""
+
+import json
+import tempfile
+import time
+from copy import deepcopy
+from os.path import exists, join
+
+from func_argparse import single_main
+from mock_llm import MockLLM
+
+from pptagent.multimodal import ImageLabler
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Presentation
+from pptagent.utils import Config, package_join
+
+
+def timed(func, inputs: list) -> float:
+    start = time.perf_counter()
+    for item in inputs:
+        func(item)
+    return (time.perf_counter() - start) / len(inputs) * 1000
+
+
+def run(template: str = "default", repeat: int = 20):
+    template_dir = package_join("templates", template)
+    config = Config(tempfile.mkdtemp())
+    prs = Presentation.from_file(join(template_dir, "source.pptx"), config)
+    if exists(join(template_dir, "image_stats.json")):
+        with open(join(template_dir, "image_stats.json")) as f:
+            ImageLabler(prs, config).apply_stats(json.load(f))
+    with open(join(template_dir, "slide_induction.json")) as f:
+        slide_induction = json.load(f)
+    llm = MockLLM("mock", lambda content, images: "")
+
+    def set_reference(presentation: Presentation, use_cache: bool) -> PPTAgent:
+        return PPTAgent(llm, llm).set_reference(
+            slide_induction, presentation, use_cache=use_cache
+        )
+
+    # preparing a reference hides the small pictures of its presentation, so each call gets a copy
+    copies = [deepcopy(prs) for _ in range(3 * repeat + 1)]
+    uncached_ms = timed(lambda p: set_reference(p, False), copies[:repeat])
+    set_reference(copies[-1], True)
+    cached_ms = timed(lambda p: set_reference(p, True), copies[repeat : 2 * repeat])
+    first_use_ms = timed(
+        lambda p: set_reference(p, True).empty_prs, copies[2 * repeat : 3 * repeat]
+    )
+
+    print(f"template: {template}, {repeat} repeats")
+    print(f"set_reference, prepared every time: {uncached_ms:8.2f} ms")
+    print(f"set_reference, cached reference:    {cached_ms:8.2f} ms")
+    print(f"  and loading the output presentation: {first_use_ms:5.2f} ms")
+    print(f"speedup of set_reference: {uncached_ms / cached_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    single_main(run)
@@ -0,0 +1,193 @@
+"""
+Microbenchmarks of pptagent hot paths over the bundled templates and synthetic inputs
+with fixed seeds, offline and on CPU.
+
+Usage:
+    pytest benchmark/test_hot_paths.py --benchmark-save=baseline
+    pytest benchmark/test_hot_paths.py --benchmark-compare
+The comparison fails on a median regression above $PPTAGENT_BENCH_THRESHOLD (15% by default),
+results are stored in benchmark/.benchmarks.
+"""
+
+import asyncio
+import json
+import os
+import random
+import tempfile
+from copy import deepcopy
+from os.path import join
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from mock_llm import MockLLM, document_responder  # noqa: E402
+
+from pptagent.document.doc_utils import (  # noqa: E402
+    get_tree_structure,
+    split_markdown_by_headings,
+)
+from pptagent.multimodal import ImageLabler  # noqa: E402
+from pptagent.presentation import Presentation  # noqa: E402
+from pptagent.presentation.layout import Layout  # noqa: E402
+from pptagent.response import EditorOutput  # noqa: E402
+from pptagent.response.pptgen import SlideElement  # noqa: E402
+from pptagent.utils import Config, get_json_from_response, package_join  # noqa: E402
+
+TEMPLATES = sorted(os.listdir(package_join("templates")))
+SEED = 0
+WORDS = ["model", "result", "method", "dataset", "metric", "training", "layer", "slide"]
+
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def template_file(template: str) -> str:
+    return package_join("templates", template, "source.pptx")
+
+
+@pytest.fixture(scope="module", params=TEMPLATES)
+def template(request) -> str:
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def presentation(template) -> Presentation:
+    config = Config(tempfile.mkdtemp())
+    prs = Presentation.from_file(template_file(template), config)
+    image_stats = package_join("templates", template, "image_stats.json")
+    if os.path.exists(image_stats):
+        with open(image_stats, encoding="utf-8") as f:
+            ImageLabler(prs, config).apply_stats(json.load(f))
+    return prs
+
+
+def test_presentation_from_file(benchmark, template):
+    config = Config(tempfile.mkdtemp())
+    prs = benchmark(Presentation.from_file, template_file(template), config)
+    assert len(prs.slides) > 0
+
+
+def test_slide_to_html(benchmark, presentation):
+    def to_html():
+        return [slide.to_html() for slide in presentation.slides]
+
+    assert all(benchmark(to_html))
+
+
+def test_shape_build(benchmark, presentation):
+    prs = deepcopy(presentation)
+    slide = max(prs.slides, key=lambda s: len(s.shapes))
+    layout = prs.layout_mapping[slide.slide_layout_name]
+
+    def setup():
+        prs.clear_slides()
+        return (prs.prs.slides.add_slide(layout),), {}
+
+    def build(pptx_slide):
+        return [shape.build(pptx_slide) for shape in slide.shapes]
+
+    benchmark.pedantic(build, setup=setup, rounds=50)
+
+
+def test_slide_build(benchmark, presentation):
+    prs = deepcopy(presentation)
+    benchmark.pedantic(
+        lambda: [prs.build_slide(slide) for slide in prs.slides],
+        setup=prs.clear_slides,
+        rounds=20,
+    )
+
+
+@pytest.mark.parametrize("size", [10, 200])
+@pytest.mark.parametrize("wrapping", ["plain", "fenced", "prose"])
+def test_get_json_from_response(benchmark, size, wrapping):
+    rng = random.Random(SEED)
+    payload = json.dumps(
+        {
+            "elements": [
+                {"name": f"element {i}", "data": [words(rng, 12) for _ in range(3)]}
+                for i in range(size)
+            ]
+        },
+        indent=2,
+    )
+    response = {
+        "plain": payload,
+        "fenced": f"Here is the result:\n```json\n{payload}\n```\n",
+        # a brace in the prose forces the search for the matching braces
+        "prose": f"Sure {{as requested}}, the output is {payload} hope it helps.",
+    }[wrapping]
+    assert benchmark(get_json_from_response, response)["elements"]
+
+
+@pytest.mark.parametrize("num_sections", [8, 64, 512])
+def test_split_markdown_by_headings(benchmark, num_sections):
+    rng = random.Random(SEED)
+    markdown = "\n\n".join(
+        f"# Section {idx}\n\n{words(rng, 150)}\n\n## Section {idx}.1\n\n{words(rng, 150)}"
+        for idx in range(num_sections)
+    )
+    headings = [line for line in markdown.splitlines() if line.startswith("#")]
+    tree = get_tree_structure(markdown)
+    language_model = MockLLM("mock", document_responder)
+    loop = asyncio.new_event_loop()
+
+    def split():
+        return loop.run_until_complete(
+            split_markdown_by_headings(markdown, headings, tree, language_model)
+        )
+
+    try:
+        assert benchmark(split)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("num_images", [8, 64])
+def test_layout_validate(benchmark, tmp_path, num_images):
+    rng = random.Random(SEED)
+    allowed_images = []
+    for idx in range(num_images):
+        path = join(tmp_path, f"figure_{idx:03d}_{words(rng, 2).replace(' ', '_')}.png")
+        open(path, "wb").close()
+        allowed_images.append(path)
+    layout = Layout(
+        title="benchmark",
+        template_id=1,
+        slides=[1],
+        elements=[
+            {"name": "title", "type": "text", "data": ["A title"]},
+            {"name": "figures", "type": "image", "data": ["a figure"] * 4},
+        ],
+    )
+
+    def setup():
+        # a slightly mistyped path, as given by the editor
+        figures = [rng.choice(allowed_images)[:-5] + ".png" for _ in range(4)]
+        output = EditorOutput(
+            elements=[
+                SlideElement(name="title", data=["A generated title"]),
+                SlideElement(name="figures", data=figures),
+            ]
+        )
+        return (output, allowed_images), {}
+
+    benchmark.pedantic(layout.validate, setup=setup, rounds=50)
+
+
+@pytest.mark.parametrize("num_slides", [8, 32])
+def test_images_cosine_similarity(benchmark, num_slides):
+    pytest.importorskip("torch")
+    import numpy as np
+
+    from pptagent.model_utils import images_cosine_similarity
+
+    # the size of a flattened ViT-base last hidden state
+    rng = np.random.default_rng(SEED)
+    embeddings = rng.standard_normal((num_slides, 197 * 768)).tolist()
+    similarity = benchmark.pedantic(
+        images_cosine_similarity, args=(embeddings,), rounds=3
+    )
+    assert len(similarity) == num_slides
@@ -1,14 +1,28 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections.abc import AsyncIterator, Hashable
+from contextvars import ContextVar
 from dataclasses import asdict, dataclass
-from functools import partial
 from math import ceil
+from types import MappingProxyType
 
 import yaml
-from jinja2 import Environment, StrictUndefined, Template
-from PIL import Image
+from jinja2 import Environment, StrictUndefined, Template, meta
 from pydantic import BaseModel
 
-from pptagent.llms import AsyncLLM
-from pptagent.utils import get_json_from_response, package_join
+from pptagent import tracing
+from pptagent.image_index import image_meta
+from pptagent.llms import AsyncLLM, TokenUsage
+from pptagent.utils import get_json_from_response, get_logger, package_join
+
+logger = get_logger(__name__)
+
+ROLE_ENV = Environment(undefined=StrictUndefined)
+# the scope (e.g. slide index) of the turns made in the current task
+HISTORY_SCOPE: ContextVar[Hashable | None] = ContextVar("history_scope", default=None)
 
 RETRY_TEMPLATE = Template(
     """The previous output is invalid, please carefully analyze the traceback and feedback information, correct errors happened before.
@@ -35,6 +49,7 @@ class Turn:
     images: list[str] = None
     input_chars: int = 0
     output_chars: int = 0
+    system_message: str | None = None
 
     def to_dict(self):
         return {k: v for k, v in asdict(self).items() if k != "embedding"}
@@ -52,9 +67,211 @@ class Turn:
         return self is other
 
 
+class TurnHistory:
+    """
+    The turns of an agent, grouped by turn id in allocation order.
+
+    Turn ids are allocated in O(1), a turn and its retries are looked up by id in O(1),
+    and iterating the history needs no sorting. When `max_turns` is set, the oldest turn
+    ids are evicted beyond it: spilled to `spill_file` if given, otherwise dropped.
+    """
+
+    def __init__(self, max_turns: int | None = None, spill_file: str | None = None):
+        self.max_turns = max_turns
+        self.spill_file = spill_file
+        self._groups: dict[int, list[int]] = {}
+        self._log: dict[int, Turn] = {}
+        self._scopes: dict[int, Hashable | None] = {}
+        self._spilled: set[int] = set()
+        self._next_id = 0
+        self._next_seq = 0
+
+    @property
+    def next_id(self) -> int:
+        return self._next_id
+
+    def allocate(self) -> int:
+        """Allocate the id of a new turn."""
+        self._next_id += 1
+        return self._next_id - 1
+
+    def append(self, turn: Turn, scope: Hashable | None = None):
+        """Append a turn, or a retry of a turn, evicting the oldest turns if needed."""
+        if turn.id not in self._groups:
+            self._groups[turn.id] = []
+            self._scopes[turn.id] = scope
+        self._groups[turn.id].append(self._next_seq)
+        self._log[self._next_seq] = turn
+        self._next_seq += 1
+        if self.max_turns is not None:
+            while len(self._groups) > self.max_turns:
+                self._evict(next(iter(self._groups)))
+
+    def turns_of(self, turn_id: int) -> list[Turn]:
+        """Get a turn and its retries."""
+        turns = []
+        if turn_id in self._spilled:
+            turns = [turn for turn in self._load_spilled() if turn.id == turn_id]
+        for seq in self._groups.get(turn_id, []):
+            turns.append(self._log[seq])
+        return turns
+
+    def recent(self, n: int, scope: Hashable | None = None) -> list[Turn]:
+        """Get the latest `n` turns in memory, within `scope` if given, ordered by turn id."""
+        turns = []
+        for turn in reversed(self._log.values()):
+            if len(turns) == n:
+                break
+            if scope is None or self._scopes[turn.id] == scope:
+                turns.append(turn)
+        turns.reverse()
+        turns.sort(key=lambda x: x.id)
+        return turns
+
+    def all(self) -> list[Turn]:
+        """Get all turns ordered by turn id and retry, including spilled turns."""
+        groups: dict[int, list[Turn]] = {}
+        if self._spilled:
+            for turn in self._load_spilled():
+                groups.setdefault(turn.id, []).append(turn)
+        for turn_id, seqs in self._groups.items():
+            groups.setdefault(turn_id, []).extend(self._log[seq] for seq in seqs)
+        # groups are created in id order, unless a spilled turn was retried
+        return [turn for turn_id in sorted(groups) for turn in groups[turn_id]]
+
+    def clear(self):
+        self._groups.clear()
+        self._log.clear()
+        self._scopes.clear()
+        self._next_id = 0
+        if self._spilled and os.path.exists(self.spill_file):
+            os.remove(self.spill_file)
+        self._spilled.clear()
+
+    def spill(self, keep: int = 0) -> int:
+        """
+        Evict all but the latest `keep` turn ids, e.g. to bring a session under its memory budget.
+
+        Returns:
+            int: The number of turns evicted.
+        """
+        evicted = 0
+        while len(self._groups) > keep:
+            turn_id = next(iter(self._groups))
+            evicted += len(self._groups[turn_id])
+            self._evict(turn_id)
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._log)
+
+    def _evict(self, turn_id: int):
+        turns = [self._log.pop(seq) for seq in self._groups.pop(turn_id)]
+        self._scopes.pop(turn_id)
+        if self.spill_file is None:
+            return
+        with open(self.spill_file, "a", encoding="utf-8") as f:
+            for turn in turns:
+                f.write(json.dumps(asdict(turn), ensure_ascii=False) + "\n")
+        self._spilled.add(turn_id)
+
+    def _load_spilled(self) -> list[Turn]:
+        with open(self.spill_file, encoding="utf-8") as f:
+            return [Turn(**json.loads(line)) for line in f]
+
+
+@dataclass(frozen=True)
+class Role:
+    """
+    A role loaded from its YAML config, with the templates compiled and validated.
+    """
+
+    name: str
+    config: MappingProxyType
+    system_message: str
+    prefix: Template
+    template: Template
+    prompt_args: frozenset[str]
+    prefix_args: frozenset[str]
+
+    @classmethod
+    def from_config(cls, name: str, config: dict, env: Environment = ROLE_ENV):
+        """
+        Compile a role config, checking that the declared `jinja_args` are exactly
+        the variables used by its prefix and template.
+
+        Args:
+            name (str): The name of the role.
+            config (dict): The role config.
+            env (Environment): The Jinja2 environment to compile templates with.
+
+        Returns:
+            Role: The compiled role.
+
+        Raises:
+            ValueError: If the config is invalid.
+        """
+        if not isinstance(config, dict):
+            raise ValueError(f"Config of role {name} must be a dict")
+        prefix = config.get("prefix", "")
+        prefix_args = meta.find_undeclared_variables(env.parse(prefix))
+        template_args = meta.find_undeclared_variables(env.parse(config["template"]))
+        declared = set(config["jinja_args"])
+        if declared != prefix_args | template_args:
+            raise ValueError(
+                f"jinja_args of role {name} do not match its templates, "
+                f"undeclared: {(prefix_args | template_args) - declared}, "
+                f"unused: {declared - prefix_args - template_args}"
+            )
+        return cls(
+            name=name,
+            config=MappingProxyType(config),
+            system_message=config["system_prompt"],
+            prefix=env.from_string(prefix),
+            template=env.from_string(config["template"]),
+            prompt_args=frozenset(declared),
+            prefix_args=frozenset(prefix_args),
+        )
+
+
+_role_registry: dict[str, tuple[float, Role]] = {}
+_role_registry_lock = threading.Lock()
+
+
+def load_role(name: str, path: str | None = None) -> Role:
+    """
+    Load a compiled role from the process-wide registry,
+    which reloads the role only when its file is modified.
+
+    Args:
+        name (str): The name of the role.
+        path (str): The path of the role config, defaults to `roles/<name>.yaml`.
+
+    Returns:
+        Role: The compiled role.
+    """
+    if path is None:
+        path = package_join("roles", f"{name}.yaml")
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime
+    with _role_registry_lock:
+        cached = _role_registry.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            role = Role.from_config(name, yaml.safe_load(f))
+        _role_registry[path] = (mtime, role)
+        return role
+
+
 class Agent:
     """
     An agent, defined by its instruction template and model.
+
+    The template of a role is split into a static `prefix` and a dynamic `template`.
+    The prefix only renders the arguments that stay the same across calls (e.g. api docs,
+    outline, layout options) and is sent along with the system prompt ahead of the history,
+    so consecutive calls share a byte-identical prefix that the provider can cache.
     """
 
     def __init__(
@@ -64,6 +281,8 @@ class Agent:
         record_cost: bool = False,
         config: dict | None = None,
         env: Environment | None = None,
+        max_turns: int | None = None,
+        spill_dir: str | None = None,
     ):
         """
         Initialize the Agent.
@@ -73,31 +292,45 @@ class Agent:
         llm_mapping (dict): The mapping of the language model.
             record_cost (bool): Whether to record the token cost.
             llm (LLM): The language model.
-            config (dict): The configuration.
+            config (dict): The configuration, defaults to the registered `roles/<name>.yaml`.
             env (Environment): The Jinja2 environment.
+            max_turns (int): The number of turns kept in memory, defaults to `$PPTAGENT_HISTORY_MAX_TURNS` or unbounded.
+            spill_dir (str): Spill evicted turns to this directory instead of dropping them,
+                defaults to `$PPTAGENT_HISTORY_SPILL_DIR`.
         """
         self.name = name
-        self.config = config
-        if self.config is None:
-            with open(package_join("roles", f"{name}.yaml"), encoding="utf-8") as f:
-                self.config = yaml.safe_load(f)
-                assert isinstance(self.config, dict), "Agent config must be a dict"
+        if config is None and env is None:
+            self.role = load_role(name)
+        else:
+            if config is None:
+                with open(package_join("roles", f"{name}.yaml"), encoding="utf-8") as f:
+                    config = yaml.safe_load(f)
+            self.role = Role.from_config(name, config, env or ROLE_ENV)
+        self.config = self.role.config
         self.llm_mapping = llm_mapping
         self.llm = self.llm_mapping[self.config["use_model"]]
         self.model = self.llm.model
         self.record_cost = record_cost
         self.return_json = self.config.get("return_json", False)
-        self.system_message = self.config["system_prompt"]
-        self.prompt_args = set(self.config["jinja_args"])
-        self.env = env
-        if self.env is None:
-            self.env = Environment(undefined=StrictUndefined)
-        self.template = self.env.from_string(self.config["template"])
+        self.run_args = self.config.get("run_args", {})
+        self.system_message = self.role.system_message
+        self.prompt_args = self.role.prompt_args
+        self.prefix_args = self.role.prefix_args
+        self.prefix = self.role.prefix
+        self.template = self.role.template
+        self.prefix_variants = self.config.get("prefix_variants", 1)
+        self._prefix_digests: set[str] = set()
+        self.usage = TokenUsage()
         self.input_tokens = 0
         self.output_tokens = 0
-        self._history: list[Turn] = []
-        run_args = self.config.get("run_args", {})
-        self.llm.__call__ = partial(self.llm.__call__, **run_args)
+        if max_turns is None and os.getenv("PPTAGENT_HISTORY_MAX_TURNS"):
+            max_turns = int(os.getenv("PPTAGENT_HISTORY_MAX_TURNS"))
+        spill_dir = spill_dir or os.getenv("PPTAGENT_HISTORY_SPILL_DIR")
+        spill_file = None
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            spill_file = os.path.join(spill_dir, f"{name}-{uuid.uuid4().hex[:8]}.jsonl")
+        self._history = TurnHistory(max_turns, spill_file)
         self.system_tokens = len(self.system_message)
 
     def calc_cost(self, turns: list[Turn]):
@@ -113,13 +346,11 @@ class Agent:
 
     @property
     def next_turn_id(self):
-        if len(self._history) == 0:
-            return 0
-        return max(t.id for t in self._history) + 1
+        return self._history.next_id
 
     @property
     def history(self):
-        return sorted(self._history, key=lambda x: (x.id, x.retry))
+        return self._history.all()
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(name={self.name}, model={self.model})"
@@ -138,25 +369,39 @@ class Agent:
         """
         assert error_idx > 0, "error_idx must be greater than 0"
         prompt = RETRY_TEMPLATE.render(feedback=feedback, traceback=traceback)
-        history = [t for t in self._history if t.id == turn_id]
+        history = self._history.turns_of(turn_id)
+        if not history:
+            raise KeyError(f"Turn {turn_id} of {self.name} is not found or evicted")
         history_msg = []
         for turn in history:
             history_msg.extend(turn.message)
-        response, message = await self.llm(
-            prompt,
-            history=history_msg,
-            return_message=True,
-            response_format=response_format,
-            **client_kwargs,
-        )
-        turn = Turn(
-            id=turn_id,
-            prompt=prompt,
-            response=response,
-            message=message,
-            retry=error_idx,
-        )
-        return await self.__post_process__(response, history, turn)
+        with tracing.span(
+            "agent.retry",
+            **{
+                "agent.role": self.name,
+                "agent.turn": turn_id,
+                "agent.retry": error_idx,
+            },
+        ):
+            # reuse the system message of the failed turn to hit its cached prefix
+            response, message = await self.llm(
+                prompt,
+                system_message=history[0].system_message,
+                history=history_msg,
+                return_message=True,
+                response_format=response_format,
+                usage=self.usage,
+                **(self.run_args | client_kwargs),
+            )
+            turn = Turn(
+                id=turn_id,
+                prompt=prompt,
+                response=response,
+                message=message,
+                retry=error_idx,
+                system_message=history[0].system_message,
+            )
+            return await self.__post_process__(response, history, turn)
 
     async def __call__(
         self,
@@ -183,6 +428,7 @@ class Agent:
         assert self.prompt_args == set(jinja_args.keys()), (
             f"Invalid arguments, expected: {self.prompt_args}, got: {jinja_args.keys()}"
         )
+        system_message = self.render_system_message(**jinja_args)
         prompt = self.template.render(**jinja_args)
         history = await self.get_history(recent)
         history_msg = []
@@ -191,31 +437,122 @@ class Agent:
 
         if client_kwargs is None:
             client_kwargs = {}
-        response, message = await self.llm(
+        with tracing.span("agent.turn", **{"agent.role": self.name}) as span:
+            response, message = await self.llm(
+                prompt,
+                system_message=system_message,
+                history=history_msg,
+                images=images,
+                return_message=True,
+                response_format=response_format,
+                usage=self.usage,
+                **(self.run_args | client_kwargs),
+            )
+            turn = Turn(
+                id=self._history.allocate(),
+                prompt=prompt,
+                response=response,
+                message=message,
+                images=images,
+                system_message=system_message,
+            )
+            span.set_attribute("agent.turn", turn.id)
+            return turn.id, await self.__post_process__(response, history, turn)
+
+    async def stream(
+        self,
+        images: list[str] = None,
+        recent: int = 0,
+        response_format: BaseModel | None = None,
+        client_kwargs: dict | None = None,
+        **jinja_args,
+    ) -> AsyncIterator[str]:
+        """
+        Call the agent like `__call__`, yielding the response content as it is generated.
+        The turn is recorded in the history once the response is complete.
+        """
+        if isinstance(images, str):
+            images = [images]
+        assert self.prompt_args == set(jinja_args.keys()), (
+            f"Invalid arguments, expected: {self.prompt_args}, got: {jinja_args.keys()}"
+        )
+        system_message = self.render_system_message(**jinja_args)
+        prompt = self.template.render(**jinja_args)
+        history = await self.get_history(recent)
+        history_msg = []
+        for turn in history:
+            history_msg.extend(turn.message)
+
+        if client_kwargs is None:
+            client_kwargs = {}
+        response = ""
+        async for delta in self.llm.stream(
             prompt,
-            system_message=self.system_message,
+            system_message=system_message,
             history=history_msg,
             images=images,
-            return_message=True,
             response_format=response_format,
-            **client_kwargs,
-        )
+            usage=self.usage,
+            **(self.run_args | client_kwargs),
+        ):
+            response += delta
+            yield delta
+        _, message = self.llm.format_message(prompt, images, system_message)
+        message.append({"role": "assistant", "content": response})
         turn = Turn(
-            id=self.next_turn_id,
+            id=self._history.allocate(),
             prompt=prompt,
             response=response,
             message=message,
             images=images,
+            system_message=system_message,
         )
-        return turn.id, await self.__post_process__(response, history, turn)
+        self._history.append(turn, HISTORY_SCOPE.get())
+        if self.record_cost:
+            turn.calc_token()
+            self.calc_cost(history + [turn])
+
+    def render_system_message(self, **jinja_args) -> str:
+        """
+        Render the system prompt followed by the static prefix of the template,
+        warn if the prefix varies more than expected so it would miss the provider's prefix cache.
+        """
+        prefix = self.prefix.render(**{k: jinja_args[k] for k in self.prefix_args})
+        system_message = self.system_message
+        if prefix:
+            system_message = system_message.rstrip("\n") + "\n\n" + prefix
+        digest = hashlib.sha1(system_message.encode("utf-8")).hexdigest()
+        if digest not in self._prefix_digests:
+            self._prefix_digests.add(digest)
+            if len(self._prefix_digests) > self.prefix_variants:
+                logger.warning(
+                    "Prefix of %s varies across calls (%d variants, expected at most %d), prompt caching will miss",
+                    self.name,
+                    len(self._prefix_digests),
+                    self.prefix_variants,
+                )
+        return system_message
+
+    @property
+    def prefix_stable(self) -> bool:
+        """Whether the prefix stayed within the expected variants since the last reset."""
+        return len(self._prefix_digests) <= self.prefix_variants
+
+    def reset(self):
+        """
+        Clear the history, token usage and prefix tracking, e.g. before generating another presentation.
+        """
+        self._history.clear()
+        self._prefix_digests.clear()
+        self.usage = TokenUsage()
 
     async def get_history(self, recent: int):
         """
-        Get the conversation history.
+        Get the recent turns of the conversation, within the current `HISTORY_SCOPE` if set.
         """
-        history = self._history[-recent:] if recent > 0 else []
-        history.sort(key=lambda x: x.id)
-        return history
+        if recent <= 0:
+            return []
+        return self._history.recent(recent, HISTORY_SCOPE.get())
 
     async def __post_process__(
         self, response: str, history: list[Turn], turn: Turn
@@ -223,7 +560,7 @@ class Agent:
         """
         Post-process the response from the agent.
         """
-        self._history.append(turn)
+        self._history.append(turn, HISTORY_SCOPE.get())
         if self.record_cost:
             turn.calc_token()
             self.calc_cost(history + [turn])
@@ -238,8 +575,7 @@ def calc_image_tokens(images: list[str]):
     """
     tokens = 0
     for image in images:
-        with open(image, "rb") as f:
-            width, height = Image.open(f).size
+        width, height = image_meta(image).size
         if width > 1024 or height > 1024:
             if width > height:
                 height = int(height * 1024 / width)
@@ -1,15 +1,17 @@
+import ast
 import inspect
+import io
 import re
+import tokenize
 import traceback
 from copy import deepcopy
 from dataclasses import dataclass
 from enum import Enum
-from functools import partial
+from functools import lru_cache, partial
 from typing import Any
 
 from bs4 import BeautifulSoup
 from mistune import HTMLRenderer, create_markdown
-from PIL import Image
 from pptagent_pptx.enum.text import PP_ALIGN
 from pptagent_pptx.oxml import parse_xml
 from pptagent_pptx.shapes.base import BaseShape
@@ -18,6 +20,7 @@ from pptagent_pptx.text.text import _Run
 from pptagent_pptx.util import Pt
 
 from pptagent.document import Document
+from pptagent.image_index import image_meta
 from pptagent.presentation import Closure, ClosureType, Picture, ShapeElement, SlidePage
 from pptagent.utils import get_logger, runs_merge
 
@@ -60,6 +63,196 @@ class HistoryMark:
     CODE_RUN_CORRECT = "code_run_correct"
 
 
+@dataclass(frozen=True)
+class ActionError:
+    """
+    An error of an action, located by its line and column in the coder output.
+    """
+
+    line: int
+    col: int
+    source: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"Line {self.line}, column {self.col}: {self.message}\n    {self.source}"
+
+
+@dataclass(frozen=True)
+class APICall:
+    """
+    A validated call of an API function with literal arguments.
+    """
+
+    func: str
+    args: tuple
+    kwargs: tuple[tuple[str, Any], ...]
+    line: int
+    col: int
+    source: str
+
+
+@dataclass(frozen=True)
+class Comment:
+    line: int
+    source: str
+
+
+FENCE_REGEX = re.compile(r"^\s*```")
+CALL_REGEX = re.compile(r"^\s*[A-Za-z_][\w.]*\s*\(")
+API_IGNORE_PARAMS = {"slide", "doc"}
+
+
+def _code_lines(actions: str) -> list[str]:
+    """
+    Keep the lines of the code blocks, or of the whole output if there are none,
+    blanking the others to preserve line numbers. Outside code blocks, lines that
+    neither parse as Python nor look like a call are considered prose.
+    """
+    lines = actions.split("\n")
+    if any(FENCE_REGEX.match(line) for line in lines):
+        code, in_block = [], False
+        for line in lines:
+            if FENCE_REGEX.match(line):
+                in_block = not in_block
+                code.append("")
+            else:
+                code.append(line if in_block else "")
+        return code
+    code = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("#") or CALL_REGEX.match(line):
+            code.append(stripped)
+            continue
+        try:
+            ast.parse(stripped)
+            code.append(stripped)
+        except SyntaxError:
+            code.append("")
+    return code
+
+
+def _validate_call(
+    node: ast.stmt, lines: list[str], functions: dict[str, callable]
+) -> APICall | ActionError:
+    source = lines[node.lineno - 1].strip()
+
+    def error(at: ast.AST, message: str) -> ActionError:
+        return ActionError(at.lineno, at.col_offset + 1, source, message)
+
+    if not isinstance(node, ast.Expr) or not isinstance(node.value, ast.Call):
+        return error(
+            node,
+            f"Unsupported statement `{type(node).__name__}`, only calls to the API functions are allowed.",
+        )
+    call = node.value
+    if not isinstance(call.func, ast.Name):
+        return error(call, "Only calls to the API functions by name are allowed.")
+    if call.func.id not in functions:
+        return error(
+            call,
+            f"The function {call.func.id} is not defined, available functions: {', '.join(functions)}.",
+        )
+    args = []
+    for idx, arg in enumerate(call.args):
+        if isinstance(arg, ast.Starred):
+            return error(arg, "Unpacking arguments is not allowed.")
+        try:
+            args.append(ast.literal_eval(arg))
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            return error(
+                arg, f"Argument {idx + 1} of {call.func.id} must be a literal value."
+            )
+    kwargs = []
+    for keyword in call.keywords:
+        if keyword.arg is None:
+            return error(keyword.value, "Unpacking arguments is not allowed.")
+        try:
+            kwargs.append((keyword.arg, ast.literal_eval(keyword.value)))
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            return error(
+                keyword.value,
+                f"Argument {keyword.arg} of {call.func.id} must be a literal value.",
+            )
+    signature = inspect.signature(functions[call.func.id])
+    signature = signature.replace(
+        parameters=[
+            p for p in signature.parameters.values() if p.name not in API_IGNORE_PARAMS
+        ]
+    )
+    try:
+        signature.bind(*args, **dict(kwargs))
+    except TypeError as e:
+        return error(call, f"Invalid arguments of {call.func.id}: {e}.")
+    return APICall(
+        call.func.id,
+        tuple(args),
+        tuple(kwargs),
+        call.lineno,
+        call.col_offset + 1,
+        source,
+    )
+
+
+@lru_cache(maxsize=256)
+def parse_actions(
+    actions: str, functions: tuple[tuple[str, callable], ...]
+) -> tuple[tuple[APICall | Comment, ...], tuple[ActionError, ...]]:
+    """
+    Parse the coder output into API calls and comments, in order, without executing anything.
+    Every statement must be a call of one of `functions` by name with literal arguments.
+
+    Args:
+        actions (str): The coder output.
+        functions (tuple): The (name, function) pairs of the registered API functions.
+
+    Returns:
+        tuple: The program, and the errors found; the program must not run if there are errors.
+    """
+    functions = dict(functions)
+    lines = _code_lines(actions)
+    code = "\n".join(lines)
+    try:
+        module = ast.parse(code)
+    except (SyntaxError, ValueError, MemoryError, RecursionError) as e:
+        errors = []
+        for line_idx, line in enumerate(lines):
+            if not line.strip() or line.strip().startswith("#"):
+                continue
+            try:
+                ast.parse(line.strip())
+            except (SyntaxError, ValueError, MemoryError, RecursionError) as line_e:
+                col = getattr(line_e, "offset", None) or 1
+                message = getattr(line_e, "msg", None) or str(line_e)
+                errors.append(
+                    ActionError(
+                        line_idx + 1, col, line.strip(), f"SyntaxError: {message}"
+                    )
+                )
+        if not errors:
+            line = getattr(e, "lineno", None) or 1
+            errors.append(
+                ActionError(
+                    line,
+                    getattr(e, "offset", None) or 1,
+                    lines[line - 1].strip() if line <= len(lines) else "",
+                    f"SyntaxError: {getattr(e, 'msg', None) or e}",
+                )
+            )
+        return (), tuple(errors)
+
+    program, errors = [], []
+    for node in module.body:
+        item = _validate_call(node, lines, functions)
+        (errors if isinstance(item, ActionError) else program).append(item)
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type == tokenize.COMMENT and token.line.strip() == token.string:
+            program.append(Comment(token.start[0], token.string))
+    program.sort(key=lambda item: item.line)
+    return tuple(program), tuple(errors)
+
+
 class CodeExecutor:
     """
     Execute code actions and manage API call history, and providing error feedback.
@@ -77,7 +270,7 @@ class CodeExecutor:
         self.code_history = []
         self.retry_times = retry_times
         self.registered_functions = API_TYPES.all_funcs()
-        self.function_regex = re.compile(r"^[a-z]+_[a-z_]+\(.+\)")
+        self.errors: tuple[ActionError, ...] = ()
 
     @classmethod
     def get_apis_docs(
@@ -132,6 +325,7 @@ class CodeExecutor:
     ) -> tuple[str, str] | None:
         """
         Execute a series of actions on a slide.
+        The actions are parsed and validated by `parse_actions` as a whole before any call is made.
 
         Args:
             actions (str): The actions to execute.
@@ -142,32 +336,42 @@ class CodeExecutor:
             tuple: The API lines and traceback if an error occurs.
             None: If no error occurs.
         """
-        api_calls = actions.strip().split("\n")
         self.api_history.append(
             [HistoryMark.API_CALL_ERROR, edit_slide.slide_idx, actions]
         )
-        for line_idx, line in enumerate(api_calls):
+        program, self.errors = parse_actions(
+            actions, tuple(self.registered_functions.items())
+        )
+        if (
+            not self.errors
+            and not found_code
+            and not any(isinstance(item, APICall) for item in program)
+        ):
+            self.errors = (
+                ActionError(
+                    len(actions.split("\n")),
+                    0,
+                    "",
+                    "No code block found in the output, please output the api calls without any prefix.",
+                ),
+            )
+        if self.errors:
+            return self._feedback(actions, "\n".join(map(str, self.errors)))
+
+        for item in program:
+            if isinstance(item, Comment):
+                if len(self.command_history) != 0:
+                    self.command_history[-1][0] = HistoryMark.COMMENT_CORRECT
+                self.command_history.append(
+                    [HistoryMark.COMMENT_ERROR, item.source, None]
+                )
+                continue
             try:
-                if line_idx == len(api_calls) - 1 and not found_code:
-                    raise SlideEditError(
-                        "No code block found in the output, please output the api calls without any prefix."
-                    )
-                if line.startswith("def"):
-                    raise SlideEditError("The function definition were not allowed.")
-                if line.startswith("#"):
-                    if len(self.command_history) != 0:
-                        self.command_history[-1][0] = HistoryMark.COMMENT_CORRECT
-                    self.command_history.append([HistoryMark.COMMENT_ERROR, line, None])
-                    continue
-                if not self.function_regex.match(line):
-                    continue
-                found_code = True
-                func = line.split("(")[0]
-                if func not in self.registered_functions:
-                    raise SlideEditError(f"The function {func} is not defined.")
                 # only one of clone and del can be used in a row
-                if func.startswith("clone") or func.startswith("del"):
-                    tag = func.split("_")[0]
+                if self.command_history and (
+                    item.func.startswith("clone") or item.func.startswith("del")
+                ):
+                    tag = item.func.split("_")[0]
                     if (
                         self.command_history[-1][-1] is None
                         or self.command_history[-1][-1] == tag
@@ -178,11 +382,15 @@ class CodeExecutor:
                             "Invalid command: Both 'clone_paragraph' and 'del_paragraph'/'del_image' are used within a single command. "
                             "Each command must only perform one of these operations based on the quantity_change."
                         )
-                self.code_history.append([HistoryMark.CODE_RUN_ERROR, line, None])
-                partial_func = partial(self.registered_functions[func], edit_slide)
-                if func == "replace_image":
-                    partial_func = partial(partial_func, doc)
-                eval(line, {}, {func: partial_func})
+                self.code_history.append(
+                    [HistoryMark.CODE_RUN_ERROR, item.source, None]
+                )
+                func = self.registered_functions[item.func]
+                if item.func == "replace_image":
+                    func = partial(func, edit_slide, doc)
+                else:
+                    func = partial(func, edit_slide)
+                func(*item.args, **dict(item.kwargs))
                 self.code_history[-1][0] = HistoryMark.CODE_RUN_CORRECT
             except Exception as e:
                 if not isinstance(e, SlideEditError):
@@ -191,16 +399,27 @@ class CodeExecutor:
                 trace_msg = traceback.format_exc()
                 if len(self.code_history) != 0:
                     self.code_history[-1][-1] = trace_msg
-                api_lines = (
-                    "\n".join(api_calls[: line_idx - 1])
-                    + f"\n--> Error Line: {line}\n"
-                    + "\n".join(api_calls[line_idx + 1 :])
+                self.errors = (
+                    ActionError(
+                        item.line, item.col, item.source, f"{type(e).__name__}: {e}"
+                    ),
                 )
-                return api_lines, trace_msg
+                return self._feedback(actions, f"{self.errors[0]}\n{trace_msg}")
         if len(self.command_history) != 0:
             self.command_history[-1][0] = HistoryMark.COMMENT_CORRECT
         self.api_history[-1][0] = HistoryMark.API_CALL_CORRECT
 
+    def _feedback(self, actions: str, trace_msg: str) -> tuple[str, str]:
+        """
+        Mark the error lines in the actions, the feedback given to the coder.
+        """
+        error_lines = {error.line for error in self.errors}
+        api_lines = "\n".join(
+            f"--> Error Line: {line}" if line_idx + 1 in error_lines else line
+            for line_idx, line in enumerate(actions.split("\n"))
+        )
+        return api_lines, trace_msg
+
     def __add__(self, other):
         self.api_history.append(other.api_history)
         self.command_history.extend(other.command_history)
@@ -462,7 +681,7 @@ def replace_image(slide: SlidePage, doc: Document | None, img_id: int, image_pat
                 f"Failed to replace image with table element: {e}, fallback to use image directly."
             )
 
-    img_size = Image.open(image_path).size
+    img_size = image_meta(image_path).size
     r = min(shape.width / img_size[0], shape.height / img_size[1])
     new_width = img_size[0] * r
     new_height = img_size[1] * r
@@ -541,3 +760,88 @@ class API_TYPES(Enum):
                 continue
             funcs |= {func.__name__: func for func in getattr(cls, attr).value}
         return funcs
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def synthesize_actions(slide: SlidePage, command_list: list[tuple]) -> str:
+    """
+    Synthesize the API calls of a slide edit without the coder, when every element of the
+    command list can be located on the template slide and its quantity change is mechanical:
+    paragraphs are cloned or deleted at the end of their element, images can only be deleted.
+
+    Args:
+        slide (SlidePage): The template slide to edit.
+        command_list (list[tuple]): The commands of `PPTGen._generate_commands`,
+            (element name, element type, quantity change, old content, new content).
+
+    Returns:
+        str: The API calls, in the format of the coder output.
+
+    Raises:
+        SlideEditError: If the edit cannot be synthesized.
+    """
+    paragraphs = [
+        (shape, para)
+        for shape in slide
+        if shape.text_frame.is_textframe
+        for para in shape.text_frame.paragraphs
+        if para.idx != -1
+    ]
+    pictures = list(slide.shape_filter(Picture))
+    max_idx = {
+        shape.shape_idx: max(para.idx for para in shape.text_frame.paragraphs)
+        for shape, _ in paragraphs
+    }
+    used = set()
+    actions = []
+    for el_name, el_type, quantity_change, old_content, new_content in command_list:
+        actions.append(f"# {el_name}: {quantity_change}")
+        targets = []
+        for old in old_content:
+            if el_type == "image":
+                candidates = [
+                    (pic.shape_idx, None)
+                    for pic in pictures
+                    if pic.caption is not None
+                    and _normalize(pic.caption) == _normalize(old)
+                ]
+            else:
+                candidates = [
+                    (shape.shape_idx, para.idx)
+                    for shape, para in paragraphs
+                    if _normalize(para.text) == _normalize(old)
+                ]
+            candidates = [c for c in candidates if c not in used]
+            if not candidates:
+                raise SlideEditError(f"Cannot locate {old!r} of element {el_name}")
+            used.add(candidates[0])
+            targets.append(candidates[0])
+        if not targets:
+            raise SlideEditError(f"Element {el_name} has no content to edit")
+
+        if el_type == "image":
+            if len(new_content) > len(targets):
+                raise SlideEditError(f"Cannot add images to element {el_name}")
+            for (img_id, _), path in zip(targets, new_content):
+                actions.append(f"replace_image({img_id}, {path!r})")
+            for img_id, _ in targets[len(new_content) :]:
+                actions.append(f"del_image({img_id})")
+            continue
+
+        if len(new_content) != len(targets) and len({t[0] for t in targets}) != 1:
+            raise SlideEditError(
+                f"Element {el_name} spans several shapes, cannot change its quantity"
+            )
+        div_id, last_para = targets[-1]
+        for _ in range(len(new_content) - len(targets)):
+            actions.append(f"clone_paragraph({div_id}, {last_para})")
+            max_idx[div_id] += 1
+            targets.append((div_id, max_idx[div_id]))
+        for (div_id, para_id), text in zip(targets, new_content):
+            actions.append(f"replace_paragraph({div_id}, {para_id}, {text!r})")
+        for div_id, para_id in targets[len(new_content) :]:
+            actions.append(f"del_paragraph({div_id}, {para_id})")
+    return "\n".join(actions)
@@ -0,0 +1,530 @@
+"""
+Offline batch execution of chat completions through the OpenAI Batch API.
+
+Requests are collected into a JSONL file, submitted as a batch and polled until
+completion; results are mapped back to the awaiting futures by `custom_id`.
+The `custom_id` is derived from the request body, so re-issuing the same
+requests after a process restart attaches to the batches already submitted
+instead of paying for them twice.
+
+A file-based stand-in of the Batch API (`create_local_batch_app`) is provided
+for testing the whole flow offline.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from os.path import exists, join
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import Response
+from openai import AsyncOpenAI
+from openai.lib._parsing._completions import type_to_response_format_param
+from openai.types.chat import ChatCompletion
+from pydantic import BaseModel
+
+from pptagent.utils import get_logger
+
+logger = get_logger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINISHED_STATUS = {"completed", "failed", "expired", "cancelled"}
+
+Responder = Callable[[dict], Awaitable[str]]
+
+
+class BatchRequestError(Exception):
+    """Raised for a request that failed inside a batch."""
+
+
+def get_custom_id(body: dict) -> str:
+    """
+    Derive a stable identifier of a request from its body.
+
+    Args:
+        body (dict): The chat completion request body.
+
+    Returns:
+        str: The sha1 hex digest of the canonical JSON body.
+    """
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class BatchExecutor:
+    """
+    Submit chat completions as batches and resolve them as they complete.
+
+    State lives in `batch_dir`:
+        - `batches.json`: submitted batches that are not finished, with their `custom_id`s.
+        - `results.jsonl`: output lines of succeeded requests, reused on restart, the latest
+          `max_results` are kept.
+        - `input_*.jsonl`: the submitted request files.
+    """
+
+    _shared: dict[tuple, "BatchExecutor"] = {}
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        batch_dir: str,
+        max_batch_size: int = 1024,
+        flush_interval: float = 5.0,
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+        max_results: int = 16384,
+    ):
+        """
+        Initialize the BatchExecutor.
+
+        Args:
+            client (AsyncOpenAI): The client used to upload files and manage batches.
+            batch_dir (str): The directory holding the state of the executor.
+            max_batch_size (int): Submit a batch once this many requests are queued.
+            flush_interval (float): Seconds to wait for more requests before submitting.
+            poll_interval (float): Seconds between two polls of a batch.
+            completion_window (str): The completion window of submitted batches.
+            max_results (int): The number of results kept for reuse, the oldest are dropped.
+        """
+        self.client = client
+        self.batch_dir = batch_dir
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_results = max_results
+        self.state_file = join(batch_dir, "batches.json")
+        self.result_file = join(batch_dir, "results.jsonl")
+        os.makedirs(batch_dir, exist_ok=True)
+
+        self.batches: dict[str, list[str]] = {}
+        if exists(self.state_file):
+            with open(self.state_file, encoding="utf-8") as f:
+                self.batches = json.load(f)
+        self.results: dict[str, dict] = {}
+        self._result_lines = 0
+        if exists(self.result_file):
+            with open(self.result_file, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._remember(json.loads(line))
+                        self._result_lines += 1
+        if self._result_lines > len(self.results):
+            self._compact_results()
+        self._loop = None
+
+    @classmethod
+    def shared(cls, client: AsyncOpenAI, batch_dir: str, **kwargs) -> "BatchExecutor":
+        """
+        Get the executor of a batch directory, so that models sharing an endpoint
+        and a directory do not overwrite each other's state.
+        """
+        key = (str(client.base_url), client.api_key, os.path.abspath(batch_dir))
+        if key not in cls._shared:
+            cls._shared[key] = cls(client, batch_dir, **kwargs)
+        return cls._shared[key]
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._queue: dict[str, dict] = {}
+        self._futures: dict[str, asyncio.Future] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._poller: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def create(self, **body) -> ChatCompletion:
+        """
+        Submit a chat completion request and wait for its batch to complete.
+
+        Args:
+            **body: The keyword arguments of `chat.completions.create`,
+                `response_format` may also be a pydantic model.
+
+        Returns:
+            ChatCompletion: The completion of the request.
+        """
+        if body.get("response_format") is not None:
+            body["response_format"] = type_to_response_format_param(
+                body["response_format"]
+            )
+        else:
+            body.pop("response_format", None)
+        custom_id = get_custom_id(body)
+        if custom_id in self.results:
+            return self._to_completion(self.results[custom_id])
+
+        self._bind_loop()
+        future = self._futures.get(custom_id)
+        if future is None:
+            future = self._futures[custom_id] = self._loop.create_future()
+            if any(custom_id in ids for ids in self.batches.values()):
+                self._ensure_poller()
+            else:
+                self._queue[custom_id] = body
+                self._schedule_flush()
+        return self._to_completion(await asyncio.shield(future))
+
+    async def flush(self):
+        """
+        Submit the queued requests as a batch.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._queue:
+            return
+        queue, self._queue = self._queue, {}
+        input_file = join(self.batch_dir, f"input_{uuid.uuid4().hex[:8]}.jsonl")
+        with open(input_file, "w", encoding="utf-8") as f:
+            for custom_id, body in queue.items():
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body,
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        try:
+            with open(input_file, "rb") as f:
+                file = await self.client.files.create(file=f, purpose="batch")
+            batch = await self.client.batches.create(
+                input_file_id=file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=self.completion_window,
+            )
+        except Exception as e:
+            logger.error("Failed to submit batch of %d requests: %s", len(queue), e)
+            self._fail(queue, e)
+            return
+        logger.info("Submitted batch %s with %d requests", batch.id, len(queue))
+        self.batches[batch.id] = list(queue)
+        self._save_state()
+        self._ensure_poller()
+
+    async def wait(self):
+        """
+        Wait for all submitted batches to finish, including those submitted by
+        a previous process.
+        """
+        self._bind_loop()
+        await self.flush()
+        self._ensure_poller()
+        if self._poller is not None:
+            await asyncio.shield(self._poller)
+
+    def _schedule_flush(self):
+        if len(self._queue) >= self.max_batch_size:
+            self._spawn_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(
+                self.flush_interval, self._spawn_flush
+            )
+
+    def _spawn_flush(self):
+        task = self._loop.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def _ensure_poller(self):
+        if self._poller is None or self._poller.done():
+            self._poller = self._loop.create_task(self._poll())
+
+    async def _poll(self):
+        while self.batches:
+            for batch_id in list(self.batches):
+                try:
+                    batch = await self.client.batches.retrieve(batch_id)
+                except Exception as e:
+                    logger.warning("Failed to retrieve batch %s: %s", batch_id, e)
+                    continue
+                if batch.status in FINISHED_STATUS:
+                    await self._collect(batch)
+            if self.batches:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _collect(self, batch):
+        custom_ids = self.batches[batch.id]
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            content = await self.client.files.content(file_id)
+            lines.extend(json.loads(line) for line in content.text.splitlines() if line)
+
+        succeeded = set()
+        with open(self.result_file, "a", encoding="utf-8") as f:
+            for line in lines:
+                custom_id = line["custom_id"]
+                future = self._futures.pop(custom_id, None)
+                response = line.get("response") or {}
+                if line.get("error") is None and response.get("status_code") == 200:
+                    self._remember(line)
+                    succeeded.add(custom_id)
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                    self._result_lines += 1
+                    if future is not None and not future.done():
+                        future.set_result(line)
+                elif future is not None and not future.done():
+                    error = line.get("error") or response.get("body")
+                    future.set_exception(BatchRequestError(f"{custom_id}: {error}"))
+
+        missing = {i: None for i in custom_ids if i not in succeeded}
+        if self._result_lines > 2 * self.max_results:
+            self._compact_results()
+        self._fail(
+            missing,
+            BatchRequestError(f"Batch {batch.id} {batch.status} without a result"),
+        )
+        logger.info(
+            "Batch %s %s: %d/%d succeeded",
+            batch.id,
+            batch.status,
+            len(custom_ids) - len(missing),
+            len(custom_ids),
+        )
+        self.batches.pop(batch.id)
+        self._save_state()
+
+    def _remember(self, result: dict):
+        # the latest result of a request is the most recent one
+        self.results.pop(result["custom_id"], None)
+        self.results[result["custom_id"]] = result
+        while len(self.results) > self.max_results:
+            self.results.pop(next(iter(self.results)))
+
+    def _compact_results(self):
+        tmp_file = self.result_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for result in self.results.values():
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        os.replace(tmp_file, self.result_file)
+        self._result_lines = len(self.results)
+
+    def _fail(self, custom_ids, error: Exception):
+        for custom_id in custom_ids:
+            future = self._futures.pop(custom_id, None)
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def _save_state(self):
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.batches, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    @staticmethod
+    def _to_completion(result: dict) -> ChatCompletion:
+        return ChatCompletion(**result["response"]["body"])
+
+
+async def echo_responder(body: dict) -> str:
+    """Reply with the text of the last message, for offline testing."""
+    content = body["messages"][-1]["content"]
+    if isinstance(content, list):
+        content = "\n".join(i["text"] for i in content if i.get("type") == "text")
+    return content
+
+
+def forward_responder(client: AsyncOpenAI) -> Responder:
+    """Reply by forwarding each request to a real-time endpoint."""
+
+    async def responder(body: dict) -> str:
+        completion = await client.chat.completions.create(**body)
+        return completion.choices[0].message.content
+
+    return responder
+
+
+def create_local_batch_app(
+    root: str,
+    responder: Responder = echo_responder,
+    completion_delay: float = 0,
+) -> FastAPI:
+    """
+    Create a file-based stand-in of the OpenAI files and batches API.
+
+    Batches are processed lazily when retrieved, after `completion_delay` seconds.
+
+    Args:
+        root (str): The directory storing uploaded files and batches.
+        responder (Responder): Produces the reply of a request body.
+        completion_delay (float): Seconds before a batch is processed.
+
+    Returns:
+        FastAPI: The application, serve it or mount it with `httpx.ASGITransport`.
+    """
+    app = FastAPI()
+    file_dir = join(root, "files")
+    batch_dir = join(root, "batches")
+    os.makedirs(file_dir, exist_ok=True)
+    os.makedirs(batch_dir, exist_ok=True)
+
+    def save_file(content: bytes, filename: str, purpose: str) -> dict:
+        file = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with open(join(file_dir, file["id"]), "wb") as f:
+            f.write(content)
+        with open(join(file_dir, file["id"] + ".json"), "w") as f:
+            json.dump(file, f)
+        return file
+
+    def load_batch(batch_id: str) -> dict:
+        path = join(batch_dir, batch_id + ".json")
+        if not exists(path):
+            raise HTTPException(404, f"Batch {batch_id} not found")
+        with open(path) as f:
+            return json.load(f)
+
+    def save_batch(batch: dict):
+        with open(join(batch_dir, batch["id"] + ".json"), "w") as f:
+            json.dump(batch, f)
+
+    async def reply(request: dict) -> dict:
+        body = request["body"]
+        line = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+        }
+        try:
+            content = await responder(body)
+        except Exception as e:
+            line["response"] = None
+            line["error"] = {"code": "responder_error", "message": str(e)}
+            return line
+        line["error"] = None
+        line["response"] = {
+            "status_code": 200,
+            "request_id": uuid.uuid4().hex,
+            "body": {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+            },
+        }
+        return line
+
+    async def process(batch: dict):
+        with open(join(file_dir, batch["input_file_id"]), encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        lines = await asyncio.gather(*[reply(request) for request in requests])
+        outputs = [line for line in lines if line["error"] is None]
+        errors = [line for line in lines if line["error"] is not None]
+        for key, part in (("output_file_id", outputs), ("error_file_id", errors)):
+            if part:
+                content = "".join(json.dumps(line) + "\n" for line in part)
+                file = save_file(
+                    content.encode(), f"{batch['id']}_{key}.jsonl", "batch_output"
+                )
+                batch[key] = file["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {
+            "total": len(lines),
+            "completed": len(outputs),
+            "failed": len(errors),
+        }
+
+    @app.post("/v1/files")
+    async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return save_file(await file.read(), file.filename, purpose)
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        path = join(file_dir, file_id)
+        if not exists(path):
+            raise HTTPException(404, f"File {file_id} not found")
+        with open(path, "rb") as f:
+            return Response(f.read(), media_type="application/octet-stream")
+
+    class BatchRequest(BaseModel):
+        input_file_id: str
+        endpoint: str
+        completion_window: str
+        metadata: dict | None = None
+
+    @app.post("/v1/batches")
+    async def create_batch(request: BatchRequest):
+        if not exists(join(file_dir, request.input_file_id)):
+            raise HTTPException(400, f"File {request.input_file_id} not found")
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            **request.model_dump(),
+        }
+        save_batch(batch)
+        return batch
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        batch = load_batch(batch_id)
+        ready = time.time() - batch["created_at"] >= completion_delay
+        if batch["status"] == "in_progress" and ready:
+            await process(batch)
+            save_batch(batch)
+        return batch
+
+    @app.post("/v1/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str):
+        batch = load_batch(batch_id)
+        if batch["status"] not in FINISHED_STATUS:
+            batch["status"] = "cancelled"
+            batch["cancelled_at"] = int(time.time())
+            save_batch(batch)
+        return batch
+
+    return app
+
+
+def serve(
+    root: str = "runs/batch_server",
+    host: str = "127.0.0.1",
+    port: int = 8002,
+    upstream_base_url: str = "",
+    upstream_api_key: str = "",
+    completion_delay: float = 0,
+):
+    """
+    Serve the local batch server, replies are echoed unless an upstream
+    real-time endpoint is given.
+    """
+    import uvicorn
+
+    responder = echo_responder
+    if upstream_base_url:
+        responder = forward_responder(
+            AsyncOpenAI(base_url=upstream_base_url, api_key=upstream_api_key or None)
+        )
+    app = create_local_batch_app(root, responder, completion_delay)
+    uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    from func_argparse import single_main
+
+    single_main(serve)
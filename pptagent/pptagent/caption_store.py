@@ -0,0 +1,204 @@
+"""
+A caption store shared by every run, session and package captioning images.
+
+Captions are keyed by the SHA-1 of the image content, the version of the caption prompt and the
+model, so the same image is captioned once wherever it appears: in templates, in documents or
+through the deeppresenter `image_caption` tool. The store is a SQLite database in WAL mode,
+safe to write from many threads and processes at once, at `CAPTION_STORE`, or
+`~/.cache/pptagent/captions.sqlite` by default. Setting `CAPTION_STORE` to an empty string
+disables it.
+
+Existing captions are imported from the `image_stats.json` of templates with:
+
+    python -m pptagent.caption_store --image_stats "templates/*/image_stats.json" --model gpt-4.1
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from glob import glob
+from os.path import dirname, exists, join
+
+from pptagent.image_index import file_digest
+from pptagent.utils import Config, get_logger, package_join
+
+logger = get_logger(__name__)
+
+DEFAULT_PATH = join(os.path.expanduser("~"), ".cache", "pptagent", "captions.sqlite")
+TEMPLATE_PROMPT = open(package_join("prompts", "caption.txt"), encoding="utf-8").read()
+# the largest number of bound parameters of a query in old SQLite builds
+BATCH_SIZE = 900
+
+_stores: dict[str, "CaptionStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def content_digest(content: bytes | str) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha1(content).hexdigest()
+
+
+def prompt_version(prompt: str) -> str:
+    """
+    The version of a caption prompt, changing the prompt invalidates its captions.
+    """
+    return content_digest(prompt)[:16]
+
+
+class CaptionStore:
+    """
+    A SQLite store of image captions keyed by (image SHA-1, prompt version, model).
+
+    Args:
+        path (str): The path of the database.
+        timeout (float): The seconds to wait for a lock held by another writer.
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        os.makedirs(dirname(path) or ".", exist_ok=True)
+        # shared by the threads of the process, queries are serialized by the lock
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS captions (
+                    digest TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    caption TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (digest, prompt, model)
+                );
+                """
+            )
+
+    def get(self, digest: str, prompt: str, model: str | None = None) -> str | None:
+        """
+        Get the caption of an image, by any model if `model` is None, the latest first.
+        """
+        return self.get_many([digest], prompt, model).get(digest)
+
+    def get_many(
+        self, digests: Iterable[str], prompt: str, model: str | None = None
+    ) -> dict[str, str]:
+        """
+        Get the captions of many images at once, by any model if `model` is None.
+
+        Returns:
+            dict[str, str]: The captions by digest, of the images captioned.
+        """
+        digests = list(dict.fromkeys(digests))
+        captions = {}
+        for start in range(0, len(digests), BATCH_SIZE):
+            batch = digests[start : start + BATCH_SIZE]
+            query = (
+                "SELECT digest, caption FROM captions WHERE prompt = ?"
+                f" AND digest IN ({', '.join('?' * len(batch))})"
+            )
+            params = [prompt, *batch]
+            if model is not None:
+                query += " AND model = ?"
+                params.append(model)
+            # the latest caption of a digest is read last and wins
+            with self.lock:
+                rows = self.conn.execute(query + " ORDER BY created", params).fetchall()
+            captions.update(rows)
+        return captions
+
+    def put(self, digest: str, prompt: str, model: str, caption: str):
+        self.put_many([(digest, prompt, model, caption)])
+
+    def put_many(self, entries: Iterable[tuple[str, str, str, str]]):
+        """
+        Store many (digest, prompt, model, caption) entries in one transaction.
+        """
+        now = time.time()
+        rows = [(*entry, now) for entry in entries]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+
+    def import_image_stats(
+        self, image_stats_path: str, model: str, prompt: str = TEMPLATE_PROMPT
+    ) -> int:
+        """
+        Import the captions of a template's `image_stats.json`, the images of the template are
+        extracted from its `source.pptx` to `images/` if missing.
+
+        Returns:
+            int: The number of captions imported.
+        """
+        from pptagent.presentation import Presentation
+
+        template_dir = dirname(image_stats_path)
+        config = Config(template_dir)
+        with open(image_stats_path, encoding="utf-8") as f:
+            image_stats = json.load(f)
+        if not all(exists(join(config.IMAGE_DIR, image)) for image in image_stats):
+            Presentation.from_file(join(template_dir, "source.pptx"), config)
+        version = prompt_version(prompt)
+        entries = []
+        for image, stats in image_stats.items():
+            path = join(config.IMAGE_DIR, image)
+            if "caption" not in stats or not exists(path):
+                logger.warning("Skipped %s of %s", image, image_stats_path)
+                continue
+            entries.append((file_digest(path), version, model, stats["caption"]))
+        self.put_many(entries)
+        return len(entries)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def default_store() -> CaptionStore | None:
+    """
+    The caption store at `CAPTION_STORE`, shared by the process, None if disabled.
+    """
+    path = os.environ.get("CAPTION_STORE", DEFAULT_PATH)
+    if not path:
+        return None
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = CaptionStore(path)
+        return _stores[path]
+
+
+def main(image_stats: str, model: str = "image_stats", db_path: str = ""):
+    """
+    Import the captions of the `image_stats.json` files matching a glob pattern.
+
+    Args:
+        image_stats (str): The glob pattern of the `image_stats.json` files.
+        model (str): The model that captioned them.
+        db_path (str): The caption store, defaults to `CAPTION_STORE`.
+    """
+    store = CaptionStore(db_path) if db_path else default_store()
+    assert store is not None, "the caption store is disabled"
+    total = 0
+    for path in sorted(glob(image_stats)):
+        imported = store.import_image_stats(path, model)
+        print(f"{path}: {imported} captions")
+        total += imported
+    print(f"Imported {total} captions, {len(store)} in {store.path}")
+
+
+if __name__ == "__main__":
+    from func_argparse import single_main
+
+    single_main(main)
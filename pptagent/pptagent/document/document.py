@@ -5,8 +5,9 @@ from contextlib import AsyncExitStack
 from os.path import basename, exists, join
 
 from jinja2 import Environment, StrictUndefined
-from pydantic import BaseModel, Field, create_model
+from pydantic import BaseModel, Field, PrivateAttr, create_model
 
+from pptagent import tracing
 from pptagent.agent import Agent
 from pptagent.llms import AsyncLLM
 from pptagent.model_utils import language_id
@@ -21,7 +22,15 @@ from .doc_utils import (
     process_markdown_content,
     split_markdown_by_headings,
 )
-from .element import Media, Metadata, Section, SubSection, Table, link_medias
+from .element import (
+    CaptionCache,
+    Media,
+    Metadata,
+    Section,
+    SubSection,
+    Table,
+    link_medias,
+)
 
 logger = get_logger(__name__)
 
@@ -33,6 +42,10 @@ MERGE_METADATA_PROMPT = env.from_string(
     ).read()
 )
 LITERAL_CONSTRAINT = os.getenv("LITERAL_CONSTRAINT", "false").lower() == "true"
+# off by default, as generation then waits on the vision captions of the medias it selects
+LAZY_CAPTION = os.getenv("LAZY_CAPTION", "false").lower() == "true"
+# images smaller than this (in pixels) are likely icons or logos, caption them last
+MIN_PRIORITY_AREA = 160 * 160
 
 
 class Document(BaseModel):
@@ -40,6 +53,7 @@ class Document(BaseModel):
     language: Language
     metadata: dict[str, str]
     sections: list[Section]
+    _caption_tasks: dict[str, asyncio.Future] = PrivateAttr(default_factory=dict)
 
     def validate_medias(self, image_dir: str | None = None):
         """Validate and fix media file paths"""
@@ -55,20 +69,44 @@ class Document(BaseModel):
             else:
                 raise FileNotFoundError(f"image file not found: {media.path}")
 
-    def get_overview(self, include_summary: bool = False, include_image: bool = True):
-        """Get document overview with sections and subsections"""
+    def get_overview(
+        self,
+        include_summary: bool = False,
+        include_image: bool = True,
+        compact: bool = False,
+    ):
+        """
+        Get document overview with sections and subsections
+
+        Args:
+            include_summary (bool): Whether to include the summary of sections.
+            include_image (bool): Whether to include the images and their captions.
+            compact (bool): Whether to number sections, subsections and images with ids,
+                to be referred to by a compact response model instead of titles and paths.
+        """
+        ids = {"section": 0, "subsection": 0, "image": 0}
+
+        def tag(name: str, text: str) -> str:
+            if not compact:
+                return f"<{name}>{text}</{name}>"
+            ids[name] += 1
+            return f"<{name} id={ids[name] - 1}>{text}</{name}>"
+
         overview = ""
+        if compact:
+            overview += "Refer to sections, subsections and images by their `id`.\n\n"
         for section in self.sections:
-            overview += f"<section>{section.title}</section>\n"
+            overview += tag("section", section.title) + "\n"
             if include_summary:
                 overview += f"\tSummary: {section.summary}\n"
             for subsection in section.content:
                 if isinstance(subsection, SubSection):
-                    overview += f"\t<subsection>{subsection.title}</subsection>\n"
-                elif include_image and isinstance(subsection, Media):
-                    overview += (
-                        f"\t<image>{subsection.path}</image>: {subsection.caption}\n"
-                    )
+                    overview += f"\t{tag('subsection', subsection.title)}\n"
+                elif isinstance(subsection, Media):
+                    # ids follow `iter_medias`, so they are counted even if not shown
+                    image = tag("image", subsection.path)
+                    if include_image:
+                        overview += f"\t{image}: {subsection.caption}\n"
             overview += "\n"
         return overview
 
@@ -77,6 +115,74 @@ class Document(BaseModel):
         for section in self.sections:
             yield from section.iter_medias()
 
+    def iter_medias_by_priority(self):
+        """
+        Iterate over medias ordered by their likely use in the presentation:
+        larger images first, then the ones referenced more often in the text, then document order.
+        """
+        full_text = "\n".join(sec.markdown_content or "" for sec in self.sections)
+
+        def priority(item: tuple[int, Media]):
+            order, media = item
+            label = media.label
+            mentions = full_text.count(label) if label is not None else 0
+            width, height = media.size
+            return (width * height < MIN_PRIORITY_AREA, -mentions, order)
+
+        for _, media in sorted(enumerate(self.iter_medias()), key=priority):
+            yield media
+
+    async def caption_medias(
+        self,
+        vision_model: AsyncLLM,
+        paths: list[str] | set[str] | None = None,
+        max_at_once: int | None = None,
+    ):
+        """
+        Replace provisional captions with vision captions, captions are persisted to the caption store,
+        or merged into `captions.json` of the image directory when the store is disabled.
+
+        Args:
+            vision_model (AsyncLLM): The vision model used for captioning.
+            paths (list[str] | set[str] | None): Only caption medias of these paths, all medias if None.
+            max_at_once (int | None): The maximum number of concurrent vision calls.
+        """
+        cache = CaptionCache(self.image_dir)
+        limiter = (
+            asyncio.Semaphore(max_at_once)
+            if max_at_once is not None
+            else AsyncExitStack()
+        )
+
+        async def caption(media: Media):
+            async with limiter:
+                await media.get_caption(vision_model, cache)
+
+        tasks = []
+        for media in self.iter_medias_by_priority():
+            if isinstance(media, Table) or not media.provisional:
+                continue
+            if paths is not None and media.path not in paths:
+                continue
+            task = self._caption_tasks.get(media.path)
+            if task is None or task.done():
+                task = self._caption_tasks[media.path] = asyncio.ensure_future(
+                    caption(media)
+                )
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+
+    def prefetch_captions(
+        self, vision_model: AsyncLLM, max_at_once: int | None = None
+    ) -> asyncio.Task:
+        """
+        Caption all provisional medias in background, ordered by their priority.
+        Medias requested later by `caption_medias` reuse the running calls.
+        """
+        return asyncio.create_task(
+            self.caption_medias(vision_model, max_at_once=max_at_once)
+        )
+
     def find_media(self, caption: str | None = None, path: str | None = None):
         """Find media by caption or path"""
         for media in self.iter_medias():
@@ -95,6 +201,7 @@ class Document(BaseModel):
         language_model: AsyncLLM,
         vision_model: AsyncLLM,
         limiter: asyncio.Semaphore | AsyncExitStack,
+        lazy_caption: bool = False,
     ):
         markdown, medias = process_markdown_content(
             markdown_chunk,
@@ -108,16 +215,20 @@ class Document(BaseModel):
             section["content"] = section.pop("subsections")
             section = Section(**section, markdown_content=markdown_chunk)
             link_medias(medias, section)
+            cache = CaptionCache(image_dir)
             async with asyncio.TaskGroup() as tg:
                 for media in section.iter_medias():
                     media.parse(image_dir)
                     if isinstance(media, Table):
-                        tg.create_task(media.get_caption(language_model))
+                        tg.create_task(media.get_caption(language_model, cache))
+                    elif lazy_caption:
+                        media.load_caption(cache)
                     else:
-                        tg.create_task(media.get_caption(vision_model))
+                        tg.create_task(media.get_caption(vision_model, cache))
         return metadata, section
 
     @classmethod
+    @tracing.traced("parse.document")
     async def from_markdown(
         cls,
         markdown_content: str,
@@ -125,7 +236,29 @@ class Document(BaseModel):
         vision_model: AsyncLLM,
         image_dir: str,
         max_at_once: int | None = None,
+        lazy_caption: bool = LAZY_CAPTION,
+        use_batch: bool = False,
     ):
+        """
+        Parse a markdown document into a structured document.
+
+        Args:
+            markdown_content (str): The markdown content.
+            language_model (AsyncLLM): The language model.
+            vision_model (AsyncLLM): The vision model.
+            image_dir (str): The directory of the images.
+            max_at_once (int | None): The maximum number of chunks parsed at once.
+            lazy_caption (bool): Whether to give images a provisional caption from the surrounding text,
+                and leave vision captioning to `caption_medias` or `prefetch_captions`,
+                defaults to the `LAZY_CAPTION` environment variable.
+            use_batch (bool): Whether to submit the requests of parsing through the Batch API.
+
+        Returns:
+            Document: The parsed document.
+        """
+        if use_batch:
+            language_model = language_model.batched()
+            vision_model = vision_model.batched()
         doc_extractor = Agent(
             "doc_extractor",
             llm_mapping={"language": language_model, "vision": vision_model},
@@ -156,6 +289,7 @@ class Document(BaseModel):
                             language_model,
                             vision_model,
                             limiter,
+                            lazy_caption,
                         )
                     )
                 )
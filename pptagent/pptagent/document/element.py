@@ -1,11 +1,21 @@
 import hashlib
+import json
+import os
 import re
-from os.path import exists, join
+import threading
+from collections import defaultdict
+from os.path import basename, exists, join
 
 from jinja2 import Environment, StrictUndefined
-from PIL import Image
 from pydantic import BaseModel, Field, create_model
 
+from pptagent.caption_store import (
+    CaptionStore,
+    content_digest,
+    default_store,
+    prompt_version,
+)
+from pptagent.image_index import file_digest, image_meta
 from pptagent.llms import AsyncLLM
 from pptagent.utils import (
     edit_distance,
@@ -19,6 +29,10 @@ from .doc_utils import parse_table_with_merges
 env = Environment(undefined=StrictUndefined)
 
 IMAGE_PARSING_REGEX = re.compile(r"\((.*?)\)")
+IMAGE_ALT_REGEX = re.compile(r"!\[(.*?)\]")
+FIGURE_LABEL_REGEX = re.compile(r"\b(?:Fig(?:ure)?\.?|Table)\s*\d+", re.IGNORECASE)
+CAPTION_CACHE_FILE = "captions.json"
+PROVISIONAL_CAPTION_WORDS = 50
 TABLE_CAPTION_PROMPT = env.from_string(
     open(
         package_join("prompts", "document", "markdown_table_caption.txt"),
@@ -33,6 +47,56 @@ IMAGE_CAPTION_PROMPT = env.from_string(
 )
 
 logger = get_logger(__name__)
+_cache_locks: defaultdict[str, threading.Lock] = defaultdict(threading.Lock)
+
+
+class CaptionCache:
+    """
+    Captions persisted so that a media is captioned only once: in the shared caption store,
+    keyed by the content of the media and its caption prompt, or without a store in the
+    image directory. The captions of the image directory are read in both cases.
+    """
+
+    def __init__(self, image_dir: str, store: CaptionStore | None = None):
+        self.path = join(image_dir, CAPTION_CACHE_FILE)
+        self.store = store if store is not None else default_store()
+        self.captions = self._load()
+
+    def _load(self) -> dict[str, str]:
+        if not exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def get(self, media: "Media", model: str | None = None) -> str | None:
+        """
+        Get the caption of a media, by any model if `model` is None.
+        """
+        if self.store is not None:
+            caption = self.store.get(
+                media.content_digest(), prompt_version(media.caption_prompt()), model
+            )
+            if caption is not None:
+                return caption
+        return self.captions.get(basename(media.path))
+
+    def set(self, media: "Media", model: str, caption: str):
+        if self.store is not None:
+            self.store.put(
+                media.content_digest(),
+                prompt_version(media.caption_prompt()),
+                model,
+                caption,
+            )
+            return
+        # other caches of the image directory may have written since this one was loaded
+        with _cache_locks[self.path]:
+            self.captions = self._load()
+            self.captions[basename(media.path)] = caption
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.captions, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
 
 
 class Media(BaseModel):
@@ -40,11 +104,51 @@ class Media(BaseModel):
     near_chunks: tuple[str, str]
     path: str | None = None
     caption: str | None = None
+    provisional: bool = False
 
     @property
     def size(self):
         assert self.path is not None, "Path is required to get size"
-        return Image.open(self.path).size
+        return image_meta(self.path).size
+
+    @property
+    def label(self) -> str | None:
+        """The figure label (e.g. `Figure 2`) found near the media, if any"""
+        for chunk in (self.markdown_content, self.near_chunks[1], self.near_chunks[0]):
+            match = FIGURE_LABEL_REGEX.search(chunk)
+            if match is not None:
+                return match.group(0)
+        return None
+
+    def provisional_caption(self) -> str:
+        """
+        Build a cheap caption from the alt text and the surrounding markdown,
+        used until a vision caption is requested.
+        """
+        alt_match = IMAGE_ALT_REGEX.search(self.markdown_content)
+        description = alt_match.group(1).strip() if alt_match else ""
+        if not description:
+            sentences = re.split(r"(?<=[.!?])\s+|\n+", " ".join(self.near_chunks))
+            labeled = [s for s in sentences if FIGURE_LABEL_REGEX.search(s)]
+            candidates = labeled or [s for s in sentences if s.strip()]
+            description = candidates[0].strip() if candidates else ""
+        words = description.split()[:PROVISIONAL_CAPTION_WORDS]
+        return "Picture: " + (" ".join(words) or "an image of the document")
+
+    def content_digest(self) -> str:
+        return file_digest(self.path)
+
+    def caption_prompt(self) -> str:
+        return IMAGE_CAPTION_PROMPT.render(markdown_caption=self.near_chunks)
+
+    def load_caption(self, cache: CaptionCache | None = None):
+        """Use the persisted caption if exists, otherwise a provisional one."""
+        if cache is not None and (self.caption is None or self.provisional):
+            cached = cache.get(self)
+            if cached is not None:
+                self.caption, self.provisional = cached, False
+        if self.caption is None:
+            self.caption, self.provisional = self.provisional_caption(), True
 
     def parse(self, image_dir: str):
         """
@@ -60,15 +164,17 @@ class Media(BaseModel):
         assert exists(image_path), f"image file not found: {image_path}"
         self.path = image_path
 
-    async def get_caption(self, vision_model: AsyncLLM):
+    async def get_caption(
+        self, vision_model: AsyncLLM, cache: CaptionCache | None = None
+    ):
         assert self.path is not None, "Path is required to get caption"
-        if self.caption is None:
-            self.caption = await vision_model(
-                IMAGE_CAPTION_PROMPT.render(
-                    markdown_caption=self.near_chunks,
-                ),
-                self.path,
-            )
+        if cache is not None and (self.caption is None or self.provisional):
+            self.load_caption(cache)
+        if self.caption is None or self.provisional:
+            self.caption = await vision_model(self.caption_prompt(), self.path)
+            self.provisional = False
+            if cache is not None:
+                cache.set(self, vision_model.model, self.caption)
             logger.debug(f"Caption: {self.caption}")
 
 
@@ -88,14 +194,25 @@ class Table(Media):
             )
         get_html_table_image(self.markdown_content, self.path)
 
-    async def get_caption(self, language_model: AsyncLLM):
+    def content_digest(self) -> str:
+        # captioned from its markdown, the rendering of a table is not part of the key
+        return content_digest(self.markdown_content)
+
+    def caption_prompt(self) -> str:
+        return TABLE_CAPTION_PROMPT.render(
+            markdown_content=self.markdown_content,
+            markdown_caption=self.near_chunks,
+        )
+
+    async def get_caption(
+        self, language_model: AsyncLLM, cache: CaptionCache | None = None
+    ):
+        if cache is not None and self.caption is None:
+            self.caption = cache.get(self)
         if self.caption is None:
-            self.caption = await language_model(
-                TABLE_CAPTION_PROMPT.render(
-                    markdown_content=self.markdown_content,
-                    markdown_caption=self.near_chunks,
-                )
-            )
+            self.caption = await language_model(self.caption_prompt())
+            if cache is not None:
+                cache.set(self, language_model.model, self.caption)
             logger.debug(f"Caption: {self.caption}")
 
 
@@ -0,0 +1,131 @@
+"""
+A process-wide index of image metadata, so an image is opened once however often its size is needed.
+
+Entries are keyed by path and invalidated when the modification time or the size of the file
+changes. PIL parses only the header of an image to get its size and format, the pixels are
+never decoded. The content hash of an image is computed on first request and kept with its entry.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from PIL import Image
+
+MAX_ENTRIES = int(os.environ.get("IMAGE_INDEX_SIZE", 4096))
+
+
+@dataclass
+class ImageMeta:
+    path: str
+    width: int
+    height: int
+    format: str | None
+    mime: str | None
+    digest: str | None = field(default=None, repr=False)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def aspect_ratio(self) -> float:
+        return self.width / self.height if self.height else 0.0
+
+
+class ImageIndex:
+    """
+    A thread-safe LRU index of image metadata, keyed by path, modification time and file size.
+
+    Args:
+        max_entries (int): The maximum number of images indexed, 0 opens the image on every lookup.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[tuple[int, int], ImageMeta]] = (
+            OrderedDict()
+        )
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "opens": 0, "hashes": 0}
+
+    def get(self, path: str | os.PathLike) -> ImageMeta:
+        """
+        Get the metadata of an image, raises as `PIL.Image.open` for a file that is not an image.
+        """
+        path = os.fspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(path)
+                self.stats["hits"] += 1
+                return entry[1]
+        with Image.open(path) as image:
+            meta = ImageMeta(
+                path,
+                *image.size,
+                image.format,
+                Image.MIME.get(image.format) if image.format else None,
+            )
+        with self.lock:
+            self.stats["opens"] += 1
+            self._insert(path, version, meta)
+        return meta
+
+    def digest(self, path: str | os.PathLike) -> str:
+        """
+        Get the SHA-1 of a file, kept with its metadata while the file is unchanged.
+        Files PIL cannot open are hashed every time.
+        """
+        try:
+            meta = self.get(path)
+        except (OSError, ValueError):
+            meta = None
+        if meta is not None and meta.digest is not None:
+            return meta.digest
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha1").hexdigest()
+        with self.lock:
+            self.stats["hashes"] += 1
+        if meta is not None:
+            meta.digest = digest
+        return digest
+
+    def _insert(self, path: str, version: tuple[int, int], meta: ImageMeta):
+        if self.max_entries <= 0:
+            return
+        self.entries[path] = (version, meta)
+        self.entries.move_to_end(path)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def report(self) -> dict[str, Any]:
+        with self.lock:
+            return {"entries": len(self.entries), **self.stats}
+
+
+IMAGE_INDEX = ImageIndex()
+
+
+def image_meta(path: str | os.PathLike) -> ImageMeta:
+    """
+    Get the metadata of an image from the process-wide index.
+    """
+    return IMAGE_INDEX.get(path)
+
+
+def file_digest(path: str | os.PathLike) -> str:
+    """
+    Get the SHA-1 of a file from the process-wide index.
+    """
+    return IMAGE_INDEX.digest(path)
@@ -4,12 +4,14 @@ from collections import defaultdict
 from functools import partial
 from os.path import join
 
+import numpy as np
 from aiometer import run_all
 from jinja2 import Template
 
 from pptagent.agent import Agent
 from pptagent.llms import AsyncLLM
 from pptagent.model_utils import (
+    PerceptualImageModel,
     get_cluster,
     get_image_embedding,
     images_cosine_similarity,
@@ -50,6 +52,7 @@ class SlideInducter:
         language_model: AsyncLLM,
         vision_model: AsyncLLM,
         use_assert: bool = True,
+        use_batch: bool = False,
     ):
         """
         Initialize the SlideInducter.
@@ -60,6 +63,7 @@ class SlideInducter:
             template_image_folder (str): The folder containing normalized slide images.
             config (Config): The configuration object.
             image_models (list): A list of image models.
+            use_batch (bool): Whether to extract the content schemas through the Batch API.
         """
         self.prs = prs
         self.config = config
@@ -71,7 +75,7 @@ class SlideInducter:
         self.schema_extractor = Agent(
             "schema_extractor",
             {
-                "language": language_model,
+                "language": language_model.batched() if use_batch else language_model,
             },
         )
         if not use_assert:
@@ -116,6 +120,8 @@ class SlideInducter:
         Async version: Cluster slides into different layouts.
         """
         embeddings = get_image_embedding(self.template_image_folder, *self.image_models)
+        image_model = self.image_models[1]
+        sim_bound = getattr(image_model, "sim_bound", 0.65)
         assert len(embeddings) == len(self.prs)
         content_split = defaultdict(list)
         for slide_idx in content_slides_index:
@@ -129,8 +135,16 @@ class SlideInducter:
                 sub_embeddings = [
                     embeddings[f"slide_{slide_idx:04d}.jpg"] for slide_idx in slides
                 ]
+                if isinstance(image_model, PerceptualImageModel):
+                    # the perceptual features see the rendering, the signature sees the shapes
+                    sub_embeddings = [
+                        np.concatenate(
+                            [embedding, self.prs.slides[idx - 1].layout_signature()]
+                        )
+                        for idx, embedding in zip(slides, sub_embeddings)
+                    ]
                 similarity = images_cosine_similarity(sub_embeddings)
-                for cluster in get_cluster(similarity):
+                for cluster in get_cluster(similarity, sim_bound):
                     slide_indexs = [slides[i] for i in cluster]
                     template_id = max(
                         slide_indexs,
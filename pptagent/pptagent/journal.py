@@ -0,0 +1,100 @@
+"""
+Resumable presentation generation.
+
+`Journal` durably records the result of each stage of `PPTGen.generate_pres`: the outline,
+then per slide the layout selection, the editor output, the edit actions and the validation.
+A journal is keyed by the document, the template and the generation config, so a rerun with
+the same inputs replays the completed stages without LLM calls and continues the unfinished
+slides, while a change of any input starts a new journal.
+"""
+
+import hashlib
+import json
+import os
+from os.path import exists, join
+from typing import Any
+
+from pptagent.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def journal_key(**parts: Any) -> str:
+    """
+    Derive the key of a journal from its inputs.
+
+    Returns:
+        str: The sha1 hex digest of the canonical JSON of the parts.
+    """
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class Journal:
+    """
+    An append-only JSON lines journal at `<journal_dir>/<key>.jsonl`.
+
+    Each line is a `{"slide": int | None, "stage": str, "data": ...}` record, flushed and
+    fsynced before the stage result is used, a record torn by a crash is dropped on load.
+    """
+
+    def __init__(self, journal_dir: str, key: str):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.path = join(journal_dir, f"{key}.jsonl")
+        self.records: dict[tuple[int | None, str], Any] = {}
+        self.replayed = 0
+        if exists(self.path):
+            self._load()
+        self._file = open(self.path, "a", encoding="utf-8")  # noqa: SIM115
+
+    def _load(self):
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self.records[record["slide"], record["stage"]] = record["data"]
+                valid_size += len(line)
+        if valid_size != os.path.getsize(self.path):
+            logger.warning("Dropping the torn tail of journal %s", self.path)
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+        logger.info("Loaded %d records from journal %s", len(self.records), self.path)
+
+    def completed(self, stage: str, slide: int | None = None) -> bool:
+        """
+        Check whether the result of a stage has been recorded, without replaying it.
+        """
+        return (slide, stage) in self.records
+
+    def get(self, stage: str, slide: int | None = None) -> Any | None:
+        """
+        Get the recorded result of a stage, counting it as replayed.
+        """
+        data = self.records.get((slide, stage))
+        if data is not None:
+            self.replayed += 1
+        return data
+
+    def record(self, stage: str, data: Any, slide: int | None = None):
+        """
+        Durably record the result of a stage, unless it is already recorded.
+        """
+        if self.records.get((slide, stage)) == data:
+            return
+        self.records[slide, stage] = data
+        self._file.write(
+            json.dumps(
+                {"slide": slide, "stage": stage, "data": data}, ensure_ascii=False
+            )
+            + "\n"
+        )
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
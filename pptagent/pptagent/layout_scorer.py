@@ -0,0 +1,297 @@
+import json
+import os
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from math import log
+
+import numpy as np
+
+from pptagent.presentation import Picture, SlidePage
+from pptagent.presentation.layout import Layout
+from pptagent.utils import get_logger
+
+logger = get_logger(__name__)
+
+FEATURES = (
+    "image_count",
+    "missing_image",
+    "item_count",
+    "text_length",
+    "aspect_ratio",
+    "similarity",
+)
+# prior weights, used until the scorer is fitted on a recorded corpus
+DEFAULT_WEIGHTS = (-2.0, -4.0, -1.0, -1.0, -1.5, 3.0)
+
+
+def hashed_embedding(text: str, dim: int = 256) -> np.ndarray:
+    """
+    Embed a text as the normalized counts of its hashed character trigrams.
+    Cheap and dependency-free, pass a model-based `embed` to `LayoutScorer` for semantic similarity.
+    """
+    vector = np.zeros(dim)
+    text = f"  {text.lower()} "
+    for i in range(len(text) - 2):
+        vector[zlib.crc32(text[i : i + 3].encode("utf-8")) % dim] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@dataclass
+class LayoutProfile:
+    """
+    The shape of a layout: image elements, text items and their capacity, picture aspect ratios.
+    """
+
+    title: str
+    num_images: int
+    num_items: int
+    capacity: int
+    aspects: list[float]
+    embedding: np.ndarray
+
+    @classmethod
+    def from_layout(
+        cls, layout: Layout, template_slide: SlidePage, embed: Callable
+    ) -> "LayoutProfile":
+        text_elements = [el for el in layout.elements if el.type == "text"]
+        return cls(
+            title=layout.title,
+            num_images=sum(
+                len(el.data) for el in layout.elements if el.type == "image"
+            ),
+            num_items=sum(len(el.data) for el in text_elements),
+            capacity=sum(
+                el.suggested_characters * len(el.data) for el in text_elements
+            ),
+            aspects=[
+                pic.width / pic.height
+                for pic in template_slide.shape_filter(Picture)
+                if pic.height
+            ],
+            embedding=embed(layout.title.rsplit(":", 1)[0]),
+        )
+
+
+@dataclass
+class SlideProfile:
+    """
+    The shape of the content of a slide: images, key points and their length.
+    """
+
+    num_images: int
+    num_items: int
+    text_length: int
+    aspects: list[float]
+    embedding: np.ndarray
+
+    @classmethod
+    def from_content(
+        cls,
+        description: str,
+        key_points: list,
+        image_sizes: list[tuple[int, int]],
+        embed: Callable,
+    ) -> "SlideProfile":
+        num_items, text_length = 0, 0
+        for point in key_points if isinstance(key_points, list) else [key_points]:
+            if isinstance(point, dict) and isinstance(point.get("bulletForm"), list):
+                num_items += len(point["bulletForm"])
+                text_length += sum(len(str(i)) for i in point["bulletForm"])
+            else:
+                num_items += 1
+                text_length += len(json.dumps(point, ensure_ascii=False))
+        return cls(
+            num_images=len(image_sizes),
+            num_items=num_items,
+            text_length=text_length,
+            aspects=[w / h for w, h in image_sizes if h],
+            embedding=embed(description),
+        )
+
+
+def pair_features(slide: SlideProfile, layout: LayoutProfile) -> list[float]:
+    """
+    Compute the features of placing the content of a slide in a layout, in the order of `FEATURES`.
+    """
+    if slide.aspects and layout.aspects:
+        aspect_ratio = float(
+            np.mean(
+                [
+                    min(abs(log(a) - log(b)) for b in layout.aspects)
+                    for a in slide.aspects
+                ]
+            )
+        )
+    else:
+        aspect_ratio = 0.0
+    return [
+        float(abs(slide.num_images - layout.num_images)),
+        float(slide.num_images > 0 and layout.num_images == 0),
+        abs(log((slide.num_items + 1) / (layout.num_items + 1))),
+        abs(log((slide.text_length + 1) / (layout.capacity + 1))),
+        aspect_ratio,
+        float(np.dot(slide.embedding, layout.embedding)),
+    ]
+
+
+@dataclass
+class LayoutScorer:
+    """
+    Speculative layout selection: rank the candidate layouts of a slide with a linear model over
+    `FEATURES` and use the top layout without asking the layout selector when its probability
+    reaches `threshold`.
+
+    Selections left to the layout selector are appended to `corpus_path` if set,
+    the corpus is used to `fit` the weights and to `evaluate` skip rate and agreement.
+    """
+
+    weights: list[float] = field(default_factory=lambda: list(DEFAULT_WEIGHTS))
+    threshold: float = 0.8
+    corpus_path: str | None = None
+    embed: Callable[[str], np.ndarray] = hashed_embedding
+
+    def __post_init__(self):
+        self.profiles: dict[str, LayoutProfile] = {}
+        # over the lifetime of the scorer, shared by the generators forked from a reference
+        self.stats = {"speculated": 0, "selected": 0, "agreed": 0}
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "LayoutScorer":
+        """
+        Load a scorer from the weights and threshold saved by `save`.
+        """
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        assert tuple(state["features"]) == FEATURES, (
+            f"Scorer {path} was fitted on features {state['features']}"
+        )
+        return cls(weights=state["weights"], threshold=state["threshold"], **kwargs)
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "features": FEATURES,
+                    "weights": list(self.weights),
+                    "threshold": self.threshold,
+                },
+                f,
+                indent=2,
+            )
+
+    def profile_layouts(self, layouts: dict[str, Layout], slides: list[SlidePage]):
+        """
+        Profile the layouts of a reference presentation, once per `set_reference`.
+        """
+        self.profiles = {
+            title: LayoutProfile.from_layout(
+                layout, slides[layout.template_id - 1], self.embed
+            )
+            for title, layout in layouts.items()
+        }
+
+    def profile_slide(
+        self, description: str, key_points: list, image_sizes: list[tuple[int, int]]
+    ) -> SlideProfile:
+        return SlideProfile.from_content(
+            description, key_points, image_sizes, self.embed
+        )
+
+    def features(self, slide: SlideProfile, candidates: list[str]) -> np.ndarray:
+        return np.array(
+            [pair_features(slide, self.profiles[title]) for title in candidates]
+        )
+
+    def probabilities(self, features: np.ndarray) -> np.ndarray:
+        logits = np.asarray(features) @ np.asarray(self.weights)
+        logits = np.exp(logits - logits.max())
+        return logits / logits.sum()
+
+    def select(self, slide: SlideProfile, candidates: list[str]) -> tuple[str, float]:
+        """
+        Rank the candidate layouts of a slide.
+
+        Returns:
+            tuple[str, float]: The top layout and its probability.
+        """
+        probs = self.probabilities(self.features(slide, candidates))
+        best = int(np.argmax(probs))
+        return candidates[best], float(probs[best])
+
+    def record(
+        self,
+        slide: SlideProfile,
+        candidates: list[str],
+        choice: str,
+        speculation: str | None = None,
+        stats: dict[str, int] | None = None,
+    ):
+        """
+        Record a selection made by the layout selector, and whether the scorer agreed with it,
+        counted in the stats of the scorer and in `stats` if given, e.g. those of a generator.
+        """
+        for counter in [self.stats] if stats is None else [self.stats, stats]:
+            counter["selected"] += 1
+            if speculation == choice:
+                counter["agreed"] += 1
+        if self.corpus_path is None:
+            return
+        record = {
+            "candidates": candidates,
+            "features": self.features(slide, candidates).tolist(),
+            "choice": candidates.index(choice),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.corpus_path)), exist_ok=True)
+        with open(self.corpus_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def read_corpus(path: str) -> list[dict]:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def fit(
+        self,
+        records: list[dict],
+        epochs: int = 300,
+        learning_rate: float = 0.5,
+        l2: float = 1e-3,
+    ) -> "LayoutScorer":
+        """
+        Fit the weights as a conditional logit model of the recorded choices.
+        """
+        weights = np.asarray(self.weights, dtype=float)
+        for _ in range(epochs):
+            grad = -l2 * weights
+            for record in records:
+                features = np.asarray(record["features"])
+                self.weights = weights
+                probs = self.probabilities(features)
+                grad += (features[record["choice"]] - probs @ features) / len(records)
+            weights = weights + learning_rate * grad
+        self.weights = weights.tolist()
+        return self
+
+    def evaluate(self, records: list[dict]) -> dict[str, float]:
+        """
+        Replay recorded choices.
+
+        Returns:
+            dict[str, float]: The fraction of selections the scorer would skip, its agreement with
+                the recorded choice on those, and its top-1 accuracy on all selections.
+        """
+        skipped, agreed, correct = 0, 0, 0
+        for record in records:
+            probs = self.probabilities(record["features"])
+            best = int(np.argmax(probs))
+            correct += best == record["choice"]
+            if probs[best] >= self.threshold:
+                skipped += 1
+                agreed += best == record["choice"]
+        return {
+            "skip_rate": skipped / max(len(records), 1),
+            "agreement": agreed / max(skipped, 1),
+            "accuracy": correct / max(len(records), 1),
+        }
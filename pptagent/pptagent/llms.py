@@ -1,19 +1,73 @@
 import base64
+import os
 import re
-import threading
-from dataclasses import dataclass
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING
 
-from oaib import Auto
 from openai import AsyncOpenAI, OpenAI
+from openai.types import CompletionUsage
 from openai.types.chat import ChatCompletion
 from pydantic import BaseModel
 
+from pptagent import tracing
 from pptagent.utils import get_json_from_response, get_logger, tenacity_decorator
 
+if TYPE_CHECKING:
+    from pptagent.batch import BatchExecutor
+
 logger = get_logger(__name__)
 MAX_CONTEXT_SIZE = 32768
 
 
+@dataclass
+class TokenUsage:
+    """
+    Token usage accumulated over calls, including the prompt tokens served from the provider's prefix cache.
+    """
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+    def add(self, usage: CompletionUsage | None):
+        self.requests += 1
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        details = usage.prompt_tokens_details
+        if details is not None and details.cached_tokens:
+            self.cached_tokens += details.cached_tokens
+
+    @property
+    def cached_ratio(self) -> float:
+        """The ratio of prompt tokens that hit the prefix cache."""
+        if self.prompt_tokens == 0:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_ratio": round(self.cached_ratio, 4),
+        }
+
+
+def usage_attributes(usage: CompletionUsage | None) -> dict:
+    """The token usage of a completion as span attributes."""
+    if usage is None:
+        return {}
+    return {
+        "llm.prompt_tokens": usage.prompt_tokens,
+        "llm.completion_tokens": usage.completion_tokens,
+    }
+
+
 @dataclass
 class LLM:
     """
@@ -24,6 +78,7 @@ class LLM:
     base_url: str | None = None
     api_key: str | None = None
     timeout: int = 360
+    usage: TokenUsage = field(default_factory=TokenUsage, init=False, repr=False)
 
     def __post_init__(self):
         self.client = OpenAI(
@@ -40,6 +95,7 @@ class LLM:
         return_json: bool = False,
         return_message: bool = False,
         response_format: BaseModel | None = None,
+        usage: TokenUsage | None = None,
         **client_kwargs,
     ) -> str | dict | list | tuple:
         """
@@ -52,6 +108,7 @@ class LLM:
             history (list): The conversation history.
             return_json (bool): Whether to return the response as JSON.
             return_message (bool): Whether to return the message.
+            usage (TokenUsage): Also accumulate the token usage of this call into it.
             **client_kwargs: Additional keyword arguments to pass to the client.
 
         Returns:
@@ -78,6 +135,7 @@ class LLM:
         except Exception as e:
             logger.warning("Error in LLM (%s) service: %s", self.model, e)
             raise e
+        self.record_usage(completion, usage)
         response = completion.choices[0].message.content
         message.append({"role": "assistant", "content": response})
         return self.__post_process__(response, message, return_json, return_message)
@@ -108,6 +166,18 @@ class LLM:
             response = (response, message)
         return response
 
+    def record_usage(self, completion: ChatCompletion, usage: TokenUsage | None = None):
+        """
+        Accumulate the token usage of a completion.
+
+        Args:
+            completion (ChatCompletion): The completion returned by the service.
+            usage (TokenUsage): An additional accumulator, e.g. of the calling agent.
+        """
+        self.usage.add(completion.usage)
+        if usage is not None:
+            usage.add(completion.usage)
+
     def __repr__(self) -> str:
         repr_str = f"{self.__class__.__name__}(model={self.model}"
         if self.base_url is not None:
@@ -214,8 +284,12 @@ class LLM:
 @dataclass
 class AsyncLLM(LLM):
     use_batch: bool = False
+    batch_dir: str | None = None
     """
     Asynchronous wrapper class for language model interaction.
+
+    With `use_batch`, requests are submitted through the Batch API and their
+    state is kept in `batch_dir` (default: `$PPTAGENT_BATCH_DIR` or `runs/batch`).
     """
 
     def __post_init__(self):
@@ -232,13 +306,33 @@ class AsyncLLM(LLM):
             api_key=self.api_key,
             timeout=self.timeout,
         )
+        self.batch = None
         if self.use_batch:
-            self.batch = Auto(
-                base_url=self.base_url,
-                api_key=self.api_key,
-                timeout=self.timeout,
-                loglevel=0,
-            )
+            self.get_batch_executor()
+
+    def get_batch_executor(self) -> "BatchExecutor":
+        """
+        Get the batch executor, created on first use so `use_batch` can be toggled later.
+        """
+        if self.batch is None:
+            # the batch module pulls in the local batch server
+            from pptagent.batch import BatchExecutor
+
+            if self.batch_dir is None:
+                self.batch_dir = os.getenv("PPTAGENT_BATCH_DIR", "runs/batch")
+            self.batch = BatchExecutor.shared(self.client, self.batch_dir)
+        return self.batch
+
+    def batched(self) -> "AsyncLLM":
+        """
+        Get a copy of the model submitting its requests through the Batch API, for the offline
+        stages that can wait for it. The copy accumulates its usage into this model's.
+        """
+        if self.use_batch:
+            return self
+        batched = replace(self, use_batch=True)
+        batched.usage = self.usage
+        return batched
 
     @tenacity_decorator
     async def __call__(
@@ -250,6 +344,7 @@ class AsyncLLM(LLM):
         return_json: bool = False,
         return_message: bool = False,
         response_format: BaseModel | None = None,
+        usage: TokenUsage | None = None,
         **client_kwargs,
     ) -> str | dict | tuple:
         """
@@ -262,62 +357,117 @@ class AsyncLLM(LLM):
             history (list): The conversation history.
             return_json (bool): Whether to return the response as JSON.
             return_message (bool): Whether to return the message.
+            usage (TokenUsage): Also accumulate the token usage of this call into it.
             **client_kwargs: Additional keyword arguments to pass to the client.
 
         Returns:
             Union[str, Dict, List, Tuple]: The response from the model.
         """
-        if self.use_batch and threading.current_thread() is threading.main_thread():
-            self.batch = Auto(
-                base_url=self.base_url,
-                api_key=self.api_key,
-                timeout=self.timeout,
-                loglevel=0,
-            )
-        elif self.use_batch:
-            logger.warning(
-                "Warning: AsyncLLM is not running in the main thread, may cause race condition."
-            )
         if history is None:
             history = []
         system, message = self.format_message(content, images, system_message)
-        try:
-            if self.use_batch:
-                await self.batch.add(
-                    "chat.completions.create",
-                    model=self.model,
-                    messages=system + history + message,
-                    response_format=response_format,
-                    **client_kwargs,
-                )
-                completion = await self.batch.run()
-                if "result" not in completion or len(completion["result"]) != 1:
-                    raise ValueError(
-                        f"The length of completion result should be 1, but got {completion}.\nRace condition may have occurred if multiple values are returned.\nOr, there was an error in the LLM call, use the synchronous version to check."
-                    )
-                completion = ChatCompletion(**completion["result"][0])
-            else:
-                if response_format is None:
-                    completion = await self.client.chat.completions.create(
-                        model=self.model,
-                        messages=system + history + message,
-                        **client_kwargs,
-                    )
-                else:
-                    completion = await self.client.chat.completions.parse(
+        with tracing.span(
+            "llm.request", **{"llm.model": self.model, "llm.batch": self.use_batch}
+        ) as span:
+            try:
+                if self.use_batch:
+                    completion = await self.get_batch_executor().create(
                         model=self.model,
                         messages=system + history + message,
                         response_format=response_format,
                         **client_kwargs,
                     )
+                else:
+                    if response_format is None:
+                        completion = await self.client.chat.completions.create(
+                            model=self.model,
+                            messages=system + history + message,
+                            **client_kwargs,
+                        )
+                    else:
+                        completion = await self.client.chat.completions.parse(
+                            model=self.model,
+                            messages=system + history + message,
+                            response_format=response_format,
+                            **client_kwargs,
+                        )
 
-        except Exception as e:
-            logger.error("Error in AsyncLLM call: %s", e)
-            raise e
+            except Exception as e:
+                logger.error("Error in AsyncLLM call: %s", e)
+                raise e
+            self.record_usage(completion, usage)
+            span.set_attributes(usage_attributes(completion.usage))
         response = completion.choices[0].message.content
         message.append({"role": "assistant", "content": response})
         return self.__post_process__(response, message, return_json, return_message)
 
+    async def stream(
+        self,
+        content: str,
+        images: str | list[str] | None = None,
+        system_message: str | None = None,
+        history: list | None = None,
+        response_format: BaseModel | None = None,
+        usage: TokenUsage | None = None,
+        **client_kwargs,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the response of the language model, yielding the content as it is generated.
+        Requests submitted through the Batch API are not streamed, their response is yielded at once.
+
+        Args:
+            content (str): The prompt content.
+            images (str or list[str]): An image file path or list of image file paths.
+            system_message (str): The system message.
+            history (list): The conversation history.
+            response_format (BaseModel): The structured output format.
+            usage (TokenUsage): Also accumulate the token usage of this call into it.
+            **client_kwargs: Additional keyword arguments to pass to the client.
+
+        Yields:
+            str: The content deltas of the response.
+        """
+        if self.use_batch:
+            yield await self(
+                content,
+                images,
+                system_message,
+                history,
+                response_format=response_format,
+                usage=usage,
+                **client_kwargs,
+            )
+            return
+        if history is None:
+            history = []
+        system, message = self.format_message(content, images, system_message)
+        if response_format is not None:
+            client_kwargs["response_format"] = response_format
+        # not made current, the context of an async generator is shared with its consumer
+        span = tracing.start_span(
+            "llm.stream", **{"llm.model": self.model, "llm.batch": False}
+        )
+        try:
+            async with self.client.chat.completions.stream(
+                model=self.model,
+                messages=system + history + message,
+                stream_options={"include_usage": True},
+                **client_kwargs,
+            ) as stream:
+                async for event in stream:
+                    if event.type == "content.delta":
+                        yield event.delta
+                completion = await stream.get_final_completion()
+            span.set_attributes(usage_attributes(completion.usage))
+        except BaseException as e:
+            span.record_exception(e)
+            if isinstance(e, Exception):
+                logger.error("Error in AsyncLLM stream: %s", e)
+            raise e
+        finally:
+            span.end()
+        self.record_usage(completion, usage)
+
     def __getstate__(self):
         state = self.__dict__.copy()
         state["client"] = None
@@ -331,12 +481,7 @@ class AsyncLLM(LLM):
             api_key=self.api_key,
             timeout=self.timeout,
         )
-        self.batch = Auto(
-            base_url=self.base_url,
-            api_key=self.api_key,
-            timeout=self.timeout,
-            loglevel=0,
-        )
+        self.batch = None
 
     async def test_connection(self) -> bool:
         """
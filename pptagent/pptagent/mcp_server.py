@@ -1,17 +1,31 @@
+import asyncio
 import json
 import os
+import re
+import time
+from copy import deepcopy
+from dataclasses import dataclass, field
 from math import ceil
 from os.path import exists
 from pathlib import Path
 from random import shuffle
 
-from fastmcp import FastMCP
+from fastmcp import Context, FastMCP
 from mistune import html as markdown_to_html
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
+from pptagent import tracing
 from pptagent.llms import AsyncLLM
+from pptagent.memory import (
+    format_size,
+    shared_ids,
+    size_breakdown,
+    top_allocations,
+)
 from pptagent.multimodal import ImageLabler
 from pptagent.pptgen import PPTAgent, get_length_factor
-from pptagent.presentation import Presentation
+from pptagent.presentation import Presentation, SlidePage
 from pptagent.presentation.layout import Layout
 from pptagent.response.pptgen import (
     EditorOutput,
@@ -26,6 +40,8 @@ from pptagent.utils import (
 )
 
 logger = get_logger(__name__)
+# session ids name the output directory of their session
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
 
 
 def mcp_slide_validate(editor_output: EditorOutput, layout: Layout, prs_lang: Language):
@@ -53,37 +69,113 @@ def mcp_slide_validate(editor_output: EditorOutput, layout: Layout, prs_lang: La
     return warnings, errors
 
 
+class TemplateAgent(PPTAgent):
+    """
+    A slide generator bound to a parsed template.
+    The reference state set by `set_reference` is shared read-only by every session,
+    `fork` gives a session its own agents and its own presentation to build slides into.
+    """
+
+    roles = ["coder"]
+    source_doc = None
+
+
+@dataclass
+class Session:
+    """
+    The state of a client session, keyed by the MCP session id or an explicit session id.
+    """
+
+    session_id: str
+    output_dir: Path
+    # whether paths are confined to the output directory, when sessions are isolated
+    confined: bool = False
+    template_name: str | None = None
+    generator: TemplateAgent | None = None
+    layout: Layout | None = None
+    editor_output: EditorOutput | None = None
+    slides: list[SlidePage] = field(default_factory=list)
+    last_active: float = field(default_factory=time.monotonic)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # the estimated bytes retained by the session, updated by `PPTAgentServer.account`
+    memory: int = 0
+
+    def resolve(self, path: str) -> Path:
+        """Resolve a relative path against the output directory of the session."""
+        path = Path(path)
+        if not self.confined:
+            return path if path.is_absolute() else self.output_dir / path
+        output_dir = self.output_dir.resolve()
+        resolved = (output_dir / path).resolve()
+        assert resolved.is_relative_to(output_dir), (
+            f"Path {str(path)!r} is outside the output directory of the session"
+        )
+        return resolved
+
+
 class PPTAgentServer(PPTAgent):
     roles = ["coder"]
 
-    def __init__(self):
+    def __init__(
+        self,
+        model: AsyncLLM | None = None,
+        templates: list[str] | None = None,
+        session_ttl: float | None = None,
+        session_dir: str | None = None,
+        session_memory_budget: float | None = None,
+        memory_budget: float | None = None,
+    ):
+        """
+        Args:
+            model (AsyncLLM, optional): The model used by the coder, read from the PPTAGENT_* environment variables if not given.
+            templates (list[str], optional): Names of the templates to load, all templates by default.
+            session_ttl (float, optional): Seconds after which an idle session is dropped, defaults to $PPTAGENT_SESSION_TTL or 3600.
+            session_dir (str, optional): Relative paths of a session resolve to `session_dir/<session_id>`, defaults to $PPTAGENT_SESSION_DIR or the working directory.
+            session_memory_budget (float, optional): MB a session may retain before its agent histories are spilled and its caches released, defaults to $PPTAGENT_SESSION_MEMORY_BUDGET or unlimited.
+            memory_budget (float, optional): MB all sessions may retain before the least recently active ones are evicted, defaults to $PPTAGENT_MEMORY_BUDGET or unlimited.
+        """
         self.source_doc = None
-        self.mcp = FastMCP("PPTAgent")
-        self.slides = []
-        self.layout: Layout | None = None
-        self.editor_output: EditorOutput | None = None
-        model = AsyncLLM(
-            os.getenv("PPTAGENT_MODEL"),
-            os.getenv("PPTAGENT_API_BASE"),
-            os.getenv("PPTAGENT_API_KEY"),
+        self.mcp = tracing.trace_tools(FastMCP("PPTAgent"))
+        self.sessions: dict[str, Session] = {}
+        self.session_ttl = session_ttl or float(os.getenv("PPTAGENT_SESSION_TTL", 3600))
+        self.session_dir = session_dir or os.getenv("PPTAGENT_SESSION_DIR", None)
+        session_memory_budget = session_memory_budget or os.getenv(
+            "PPTAGENT_SESSION_MEMORY_BUDGET"
+        )
+        memory_budget = memory_budget or os.getenv("PPTAGENT_MEMORY_BUDGET")
+        self.session_memory_budget = (
+            int(float(session_memory_budget) * 2**20) if session_memory_budget else None
+        )
+        self.memory_budget = (
+            int(float(memory_budget) * 2**20) if memory_budget else None
         )
         workspace = os.getenv("WORKSPACE", None)
         if workspace is not None:
             os.chdir(workspace)
 
-        if not model.to_sync().test_connection():
-            msg = "Unable to connect to the model, please set the PPTAGENT_MODEL, PPTAGENT_API_BASE, and PPTAGENT_API_KEY environment variables correctly"
-            logger.error(msg)
-            raise Exception(msg)
+        if model is None:
+            model = AsyncLLM(
+                os.getenv("PPTAGENT_MODEL"),
+                os.getenv("PPTAGENT_API_BASE"),
+                os.getenv("PPTAGENT_API_KEY"),
+            )
+            if not model.to_sync().test_connection():
+                msg = "Unable to connect to the model, please set the PPTAGENT_MODEL, PPTAGENT_API_BASE, and PPTAGENT_API_KEY environment variables correctly"
+                logger.error(msg)
+                raise Exception(msg)
         super().__init__(language_model=model, vision_model=model)
 
         # load templates, a directory containing pptx, json, and description for each template
         templates_dir = Path(package_join("templates"))
-        templates = [p for p in templates_dir.iterdir() if p.is_dir()]
+        template_dirs = [
+            p
+            for p in templates_dir.iterdir()
+            if p.is_dir() and (templates is None or p.name in templates)
+        ]
         self.template_description = {}
         self.templates = {}
 
-        for template in templates:
+        for template in template_dirs:
             try:
                 desc_path = template / "description.txt"
                 self.template_description[template.name] = desc_path.read_text()
@@ -96,16 +188,30 @@ class PPTAgentServer(PPTAgent):
                 )
                 image_labler = ImageLabler(prs, prs_config)
                 image_stats_path = template_folder / "image_stats.json"
-                image_labler.apply_stats(json.loads(image_stats_path.read_text()))
+                # the captions missing from image_stats.json are read from the caption store
+                image_labler.apply_stats(
+                    json.loads(image_stats_path.read_text())
+                    if image_stats_path.exists()
+                    else {}
+                )
 
                 slide_induction = json.loads(
                     (template_folder / "slide_induction.json").read_text()
                 )
 
+                # parsed once and shared read-only across sessions
+                reference = TemplateAgent(
+                    language_model=model,
+                    vision_model=model,
+                    retry_times=self.retry_times,
+                ).set_reference(
+                    slide_induction=deepcopy(slide_induction), presentation=prs
+                )
                 self.templates[template.name] = {
                     "presentation": prs,
                     "slide_induction": slide_induction,
                     "config": prs_config,
+                    "reference": reference,
                 }
 
             except Exception as e:
@@ -116,15 +222,152 @@ class PPTAgentServer(PPTAgent):
             f"{len(self.templates)} templates loaded successfully: "
             + ", ".join(self.templates.keys())
         )
+        # sessions are only charged for what they do not share with each other
+        self._shared_ids = shared_ids(self.templates, model)
+        self.mcp.custom_route("/memory", methods=["GET"])(self._memory_route)
 
     @classmethod
     def list_templates(cls) -> str:
         templates_dir = Path(package_join("templates"))
         return [p.name for p in templates_dir.iterdir() if p.is_dir()]
 
+    def get_session(self, session_id: str | None, ctx: Context | None = None):
+        """
+        Get or create the session of a tool call, expiring idle sessions.
+
+        The explicit `session_id` takes precedence over the MCP session of `ctx`,
+        calls without either share the "default" session.
+        """
+        if session_id is None and ctx is not None:
+            try:
+                session_id = ctx.session_id
+            except RuntimeError:
+                pass
+        session_id = session_id or "default"
+        assert SESSION_ID_PATTERN.fullmatch(session_id), (
+            f"Invalid session id {session_id!r}, only letters, digits, '_' and '-' are allowed"
+        )
+
+        now = time.monotonic()
+        for expired in [
+            sid
+            for sid, session in self.sessions.items()
+            if now - session.last_active > self.session_ttl and sid != session_id
+        ]:
+            self.drop_session(expired, "expired")
+
+        if session_id not in self.sessions:
+            if self.session_dir is not None:
+                output_dir = Path(self.session_dir) / session_id
+            else:
+                output_dir = Path(".")
+            self.sessions[session_id] = Session(
+                session_id, output_dir, confined=self.session_dir is not None
+            )
+        session = self.sessions[session_id]
+        session.last_active = now
+        return session
+
+    def drop_session(self, session_id: str, reason: str):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        logger.info(
+            "Session %s %s with %d unsaved slides, %s released",
+            session_id,
+            reason,
+            len(session.slides),
+            format_size(session.memory),
+        )
+
+    def account(self, session: Session) -> dict[str, int]:
+        """
+        Estimate the memory retained by a session, by attribute.
+        """
+        breakdown = size_breakdown(session, set(self._shared_ids))
+        session.memory = sum(breakdown.values())
+        return breakdown
+
+    def enforce_memory_budget(self, session: Session):
+        """
+        Bring a session under `session_memory_budget`: spill the histories of its agents, then
+        release its caches, which are rebuilt on demand. Then bring all sessions under
+        `memory_budget` by evicting the least recently active ones, other than this one.
+        """
+        if self.session_memory_budget is not None:
+            self.account(session)
+            generator = session.generator
+            if session.memory > self.session_memory_budget and generator is not None:
+                for agent in generator.staffs.values():
+                    if agent._history.spill_file is None and self.session_dir:
+                        history_dir = session.output_dir / ".history"
+                        history_dir.mkdir(parents=True, exist_ok=True)
+                        agent._history.spill_file = str(
+                            history_dir / f"{agent.name}.jsonl"
+                        )
+                    agent._history.spill()
+                generator.empty_prs = None
+                breakdown = self.account(session)
+                if session.memory > self.session_memory_budget:
+                    logger.warning(
+                        "Session %s retains %s over its budget of %s, largest: %s",
+                        session.session_id,
+                        format_size(session.memory),
+                        format_size(self.session_memory_budget),
+                        ", ".join(
+                            f"{name}={format_size(size)}"
+                            for name, size in list(breakdown.items())[:3]
+                        ),
+                    )
+
+        if self.memory_budget is not None:
+            # sync tools may run in worker threads, iterate over a snapshot
+            sessions = sorted(self.sessions.values(), key=lambda s: s.last_active)
+            for other in sessions:
+                self.account(other)
+            total = sum(s.memory for s in sessions)
+            for other in sessions:
+                if total <= self.memory_budget:
+                    break
+                if other is not session:
+                    total -= other.memory
+                    self.drop_session(
+                        other.session_id, "evicted over the memory budget"
+                    )
+
+    def memory_report(self, top: int = 5) -> dict:
+        """
+        Report the memory retained by each session and its largest attributes,
+        with the top allocation sites of the process when `tracemalloc` is tracing.
+        """
+        sessions = {}
+        for session_id, session in list(self.sessions.items()):
+            breakdown = self.account(session)
+            sessions[session_id] = {
+                "memory": session.memory,
+                "slides": len(session.slides),
+                "top": dict(list(breakdown.items())[:top]),
+            }
+        return {
+            "sessions": sessions,
+            "total": sum(s["memory"] for s in sessions.values()),
+            "session_memory_budget": self.session_memory_budget,
+            "memory_budget": self.memory_budget,
+            "top_allocations": top_allocations(top),
+        }
+
+    async def _memory_route(self, request: Request) -> JSONResponse:
+        return JSONResponse(self.memory_report())
+
     def register_tools(self):
         @self.mcp.tool()
-        def markdown_table_to_image(markdown_table: str, path: str, css: str) -> str:
+        def markdown_table_to_image(
+            markdown_table: str,
+            path: str,
+            css: str,
+            session_id: str | None = None,
+            ctx: Context | None = None,
+        ) -> str:
             """
             Convert a markdown table to an image and save it to the specified path.
 
@@ -134,12 +377,16 @@ class PPTAgentServer(PPTAgent):
                 css (str): Custom CSS styles for the table. Use class selectors
                                     (table, thead, th, td) to style the table elements. Avoid
                                     changing background colors outside the table area.
+                session_id (str, optional): The session to work in, defaults to the MCP session
 
             Returns:
                 str: Confirmation message with the path to the saved image
             """
+            session = self.get_session(session_id, ctx)
+            path = session.resolve(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
             html = markdown_to_html(markdown_table)
-            get_html_table_image(html, path, css)
+            get_html_table_image(html, str(path), css)
             return f"Markdown table converted to image and saved to {path}"
 
         @self.mcp.tool()
@@ -157,11 +404,16 @@ class PPTAgentServer(PPTAgent):
             }
 
         @self.mcp.tool()
-        def set_template(template_name: str = "default"):
+        def set_template(
+            template_name: str = "default",
+            session_id: str | None = None,
+            ctx: Context | None = None,
+        ):
             """Select a PowerPoint template by name.
 
             Args:
                 template_name: The name of the template to select
+                session_id: The session to work in, defaults to the MCP session
 
             Returns:
                 dict: Success message and list of available layouts
@@ -169,49 +421,59 @@ class PPTAgentServer(PPTAgent):
             assert template_name in self.templates, (
                 f"Template {template_name} not available, please choose from {', '.join(self.templates.keys())}"
             )
-
-            template_data = self.templates[template_name]
-            self.set_reference(
-                slide_induction=template_data["slide_induction"],
-                presentation=template_data["presentation"],
-            )
+            session = self.get_session(session_id, ctx)
+            session.generator = self.templates[template_name]["reference"].fork()
+            session.template_name = template_name
+            session.layout = None
+            session.editor_output = None
+            session.slides = []
+            self.enforce_memory_budget(session)
 
             return {
                 "message": "Template set successfully, please select layout from given layouts later",
                 "template_description": self.template_description[template_name],
-                "available_layouts": list(self.layouts.keys()),
+                "available_layouts": list(session.generator.layouts.keys()),
             }
 
         @self.mcp.tool()
-        async def create_slide(layout: str):
+        async def create_slide(
+            layout: str, session_id: str | None = None, ctx: Context | None = None
+        ):
             """Create a slide with a given layout.
 
             Args:
                 layout: Name of the layout to use. Must be one of the available layouts given by set_template.
+                session_id: The session to work in, defaults to the MCP session
 
             Returns:
                 dict: Success message, instructions, and content schema for the selected layout.
             """
-            assert self._initialized, (
+            session = self.get_session(session_id, ctx)
+            assert session.generator is not None, (
                 "PPTAgent not initialized, please call `set_template` first"
             )
-            assert layout in self.layouts, (
-                "Given layout was not in available layouts: " + ", ".join(self.layouts)
+            layouts = session.generator.layouts
+            assert layout in layouts, (
+                "Given layout was not in available layouts: " + ", ".join(layouts)
             )
-            if self.layout is not None:
-                message = "Layout update from " + self.layout.title + " to " + layout
+            if session.layout is not None:
+                message = "Layout update from " + session.layout.title + " to " + layout
                 message += "\nDid you forget to call `generate_slide` after setting slide content?"
             else:
                 message = "Layout " + layout + " selected successfully"
-            self.layout = self.layouts[layout]
+            session.layout = layouts[layout]
             return {
                 "message": message,
                 "instructions": "Generate slide content strictly following the schema below",
-                "schema": self.layout.content_schema,
+                "schema": session.layout.content_schema,
             }
 
         @self.mcp.tool()
-        async def write_slide(structured_slide_elements: list[dict]):
+        async def write_slide(
+            structured_slide_elements: list[dict],
+            session_id: str | None = None,
+            ctx: Context | None = None,
+        ):
             """Write the slide elements for generating a PowerPoint slide.
             Note that this function will not generate a slide, you should call `generate_slide`.
 
@@ -226,23 +488,24 @@ class PPTAgentServer(PPTAgent):
                         // OR array of image paths for image elements: ["/path/to/image1.jpg", "/path/to/image2.png"]
                     }
                 ]
+                session_id: The session to work in, defaults to the MCP session
             Returns:
                 dict: Success message, warnings, and errors
             """
-            self.structured_slide_elements = structured_slide_elements
-            assert self.layout is not None, (
+            session = self.get_session(session_id, ctx)
+            assert session.layout is not None, (
                 "Layout is not selected, please call `create_slide` before writing slide"
             )
             editor_output = EditorOutput(
                 elements=[SlideElement(**e) for e in structured_slide_elements]
             )
             warnings, errors = mcp_slide_validate(
-                editor_output, self.layout, self.reference_lang
+                editor_output, session.layout, session.generator.reference_lang
             )
             if errors:
                 raise ValueError("Errors:\n" + "\n".join(errors))
 
-            self.editor_output = editor_output
+            session.editor_output = editor_output
             if warnings:
                 return {
                     "message": "Slide elements set with warnings, please try your best to fix the. You should only proceed after fixing all warnings or 5 retries.",
@@ -253,29 +516,38 @@ class PPTAgentServer(PPTAgent):
             }
 
         @self.mcp.tool()
-        async def generate_slide():
+        async def generate_slide(
+            session_id: str | None = None, ctx: Context | None = None
+        ):
             """Generate a PowerPoint slide after layout and slide elements are set.
 
+            Args:
+                session_id: The session to work in, defaults to the MCP session
+
             Returns:
                 dict: Success message with slide number and next steps
             """
-            if self.editor_output is None:
+            session = self.get_session(session_id, ctx)
+            if session.editor_output is None:
                 raise ValueError(
                     "Slide elements are not set, please call `write_slide` before generating slide"
                 )
 
-            command_list, template_id = self._generate_commands(
-                self.editor_output, self.layout
-            )
-            slide, _ = await self._edit_slide(command_list, template_id)
+            async with session.lock:
+                generator = session.generator
+                command_list, template_id = generator._generate_commands(
+                    session.editor_output, session.layout
+                )
+                slide, _ = await generator._edit_slide(command_list, template_id)
 
-            # Reset state after successful generation
-            self.layout = None
-            self.editor_output = None
-            self.slides.append(slide)
+                # Reset state after successful generation
+                session.layout = None
+                session.editor_output = None
+                session.slides.append(slide)
+                slide_number = len(session.slides)
+                self.enforce_memory_budget(session)
 
-            slide_number = len(self.slides)
-            available_layouts = list(self.layouts.keys())
+            available_layouts = list(generator.layouts.keys())
             shuffle(available_layouts)
 
             return {
@@ -285,22 +557,30 @@ class PPTAgentServer(PPTAgent):
             }
 
         @self.mcp.tool()
-        async def save_generated_slides(pptx_path: str):
+        async def save_generated_slides(
+            pptx_path: str, session_id: str | None = None, ctx: Context | None = None
+        ):
             """Save the generated slides to a PowerPoint file.
 
             Args:
                 pptx_path: The path to save the PowerPoint file
+                session_id: The session to work in, defaults to the MCP session
             """
-            pptx = Path(pptx_path)
-            assert len(self.slides), (
+            session = self.get_session(session_id, ctx)
+            assert len(session.slides), (
                 "No slides generated, please call `generate_slide` first"
             )
+            pptx = session.resolve(pptx_path)
             pptx.parent.mkdir(parents=True, exist_ok=True)
-            self.empty_prs.slides = self.slides
-            self.empty_prs.save(pptx_path)
-            self.slides = []
-            self._initialized = False
-            return f"total {len(self.empty_prs.slides)} slides saved to {pptx}"
+            async with session.lock:
+                num_slides = len(session.slides)
+                empty_prs = session.generator.empty_prs
+                empty_prs.slides = session.slides
+                empty_prs.save(str(pptx))
+                session.slides = []
+                session.generator = None
+                session.memory = 0
+            return f"total {num_slides} slides saved to {pptx}"
 
 
 def main():
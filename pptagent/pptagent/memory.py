@@ -0,0 +1,180 @@
+"""
+Memory accounting of the state a long-running server keeps per session.
+
+`deep_sizeof` estimates the memory retained by an object graph: the `sys.getsizeof` of every
+reachable Python object, plus the serialized size of the XML trees behind python-pptx objects,
+which live outside the Python heap. Objects reachable from state shared by all sessions
+(templates, models) are excluded with `shared_ids`, so a session is charged only for what
+it owns and what is released with it.
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+import weakref
+from collections.abc import Iterable
+from dataclasses import fields, is_dataclass
+from types import (
+    BuiltinFunctionType,
+    CodeType,
+    FrameType,
+    FunctionType,
+    MethodType,
+    ModuleType,
+)
+from typing import Any
+
+from lxml import etree
+
+# shared process-wide state, never charged to a session
+OPAQUE_TYPES = (
+    type,
+    ModuleType,
+    FunctionType,
+    BuiltinFunctionType,
+    MethodType,
+    CodeType,
+    FrameType,
+    asyncio.AbstractEventLoop,
+    threading.Thread,
+    logging.Logger,
+    weakref.ref,
+    type(threading.Lock()),
+)
+LEAF_TYPES = (str, bytes, bytearray, int, float, complex, bool, type(None), range)
+
+
+def _referents(obj: Any) -> Iterable[Any]:
+    if isinstance(obj, dict):
+        yield from obj.keys()
+        yield from obj.values()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        yield from obj
+    else:
+        try:
+            if hasattr(obj, "__dict__"):
+                yield vars(obj)
+            for slot in getattr(type(obj), "__slots__", ()):
+                if slot != "__dict__" and hasattr(obj, slot):
+                    yield getattr(obj, slot)
+        except Exception:
+            # proxies and extension types with attributes failing outside their context
+            return
+
+
+def _walk(roots: Iterable[Any], seen: set) -> Iterable[Any]:
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, OPAQUE_TYPES):
+            continue
+        seen.add(id(obj))
+        yield obj
+        if isinstance(obj, etree._Element):
+            continue
+        if not isinstance(obj, LEAF_TYPES):
+            stack.extend(_referents(obj))
+
+
+def _xml_size(element: etree._Element, seen: set) -> int:
+    # lxml proxies are transient, the root itself is kept in `seen` rather than its id,
+    # so the proxy stays alive and its id is neither changed nor reused by another tree
+    root = element.getroottree().getroot()
+    if root in seen:
+        return 0
+    seen.add(root)
+    return len(etree.tostring(root))
+
+
+def shared_ids(*roots: Any) -> set:
+    """
+    The ids of the objects reachable from shared state, and the roots of their XML trees,
+    to exclude from `deep_sizeof`.
+    """
+    seen = set()
+    for obj in _walk(roots, seen):
+        if isinstance(obj, etree._Element):
+            seen.add(obj.getroottree().getroot())
+    return seen
+
+
+def deep_sizeof(obj: Any, exclude: set | None = None) -> int:
+    """
+    Estimate the bytes retained by an object graph.
+
+    Args:
+        obj (Any): The root object.
+        exclude (set): Ids of shared objects not to count nor traverse, as returned by
+            `shared_ids`, updated with the ids visited, so consecutive calls with the same
+            set do not double count.
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    seen = exclude if exclude is not None else set()
+    size = 0
+    for o in _walk([obj], seen):
+        if isinstance(o, etree._Element):
+            size += _xml_size(o, seen)
+        else:
+            size += sys.getsizeof(o, 0)
+    return size
+
+
+def size_breakdown(obj: Any, exclude: set | None = None) -> dict[str, int]:
+    """
+    Estimate the bytes retained by each attribute of an object, largest first.
+    An object reachable from several attributes is charged to the first one.
+    """
+    if is_dataclass(obj):
+        names = [f.name for f in fields(obj)]
+    else:
+        names = list(vars(obj))
+    seen = set(exclude) if exclude is not None else set()
+    seen.add(id(obj))
+    sizes = {name: deep_sizeof(getattr(obj, name), seen) for name in names}
+    return dict(sorted(sizes.items(), key=lambda x: x[1], reverse=True))
+
+
+def top_allocations(limit: int = 10) -> list[dict]:
+    """
+    The source lines holding the most memory, when `tracemalloc` is tracing.
+    """
+    if not tracemalloc.is_tracing():
+        return []
+    gc.collect()
+    stats = tracemalloc.take_snapshot().statistics("lineno")
+    return [
+        {
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size": stat.size,
+            "count": stat.count,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def current_rss() -> int:
+    """
+    The resident set size of the process in bytes, the peak where the current one is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macos
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
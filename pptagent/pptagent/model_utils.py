@@ -1,13 +1,17 @@
+import importlib.util
 import os
 import tempfile
 import zipfile
+from functools import partial
 from glob import glob
-from os.path import join
+from os.path import exists, join
 
 import aiofiles
 import aiohttp
+import numpy as np
 from PIL import Image
 
+from pptagent import tracing
 from pptagent.llms import AsyncLLM
 from pptagent.utils import (
     Language,
@@ -52,6 +56,12 @@ MINERU_API = os.environ.get("MINERU_API", None)
 if MINERU_API is None:
     logger.debug("MINERU_API is not set, PDF parsing is not available")
 
+IMAGE_MODEL_BASE = "google/vit-base-patch16-224-in21k"
+IMAGE_BACKENDS = ("torch", "onnx", "perceptual")
+ONNX_CACHE_DIR = os.environ.get(
+    "ONNX_CACHE_DIR", join(os.path.expanduser("~"), ".cache", "pptagent", "onnx")
+)
+
 
 class ModelManager:
     """
@@ -63,6 +73,8 @@ class ModelManager:
         api_base: str | None = None,
         language_model_name: str | None = None,
         vision_model_name: str | None = None,
+        use_batch: bool | None = None,
+        image_backend: str | None = None,
     ):
         """Initialize models from environment variables after instance creation"""
         if api_base is None:
@@ -71,16 +83,37 @@ class ModelManager:
             language_model_name = os.environ.get("LANGUAGE_MODEL", "gpt-4.1")
         if vision_model_name is None:
             vision_model_name = os.environ.get("VISION_MODEL", "gpt-4.1")
+        if use_batch is None:
+            use_batch = os.environ.get("USE_BATCH", "0").lower() in ("1", "true")
+        if image_backend is None:
+            image_backend = os.environ.get("IMAGE_BACKEND", None)
+        if image_backend is None:
+            # slim deployments without torch cluster slides by their perceptual features
+            has_torch = importlib.util.find_spec("torch") is not None
+            image_backend = "torch" if has_torch else "perceptual"
+        assert image_backend in IMAGE_BACKENDS, (
+            f"image backend must be one of {IMAGE_BACKENDS}, got {image_backend}"
+        )
+        self.image_backend = image_backend
         self._image_model = None
 
+        # only the offline stages given `use_batch` go through the Batch API
+        self.use_batch = use_batch
         self.language_model = AsyncLLM(language_model_name, api_base)
         self.vision_model = AsyncLLM(vision_model_name, api_base)
 
     @property
     def image_model(self):
-        import torch
+        if self._image_model is None and self.image_backend == "perceptual":
+            self._image_model = (None, PerceptualImageModel())
+        elif self._image_model is None and self.image_backend == "onnx":
+            threads = os.environ.get("ONNX_THREADS", None)
+            self._image_model = get_onnx_image_model(
+                intra_op_threads=int(threads) if threads else None
+            )
+        elif self._image_model is None:
+            import torch
 
-        if self._image_model is None:
             self._image_model = get_image_model(
                 device="cuda" if torch.cuda.is_available() else "cpu"
             )
@@ -120,7 +153,7 @@ def get_image_model(device: str = None):
     Returns:
         tuple: A tuple containing the feature extractor and the image model.
     """
-    model_base = "google/vit-base-patch16-224-in21k"
+    model_base = IMAGE_MODEL_BASE
     return (
         AutoProcessor.from_pretrained(
             model_base,
@@ -136,6 +169,183 @@ def get_image_model(device: str = None):
     )
 
 
+class OnnxImageModel:
+    """
+    The image model exported to ONNX, run by ONNX Runtime on CPU.
+    """
+
+    device = "cpu"
+
+    def __init__(self, model_path: str, intra_op_threads: int | None = None):
+        """
+        Args:
+            model_path (str): The path of the exported model.
+            intra_op_threads (int | None): The threads of an operator, defaults to the physical cores.
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.model_path = model_path
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, pixel_values: np.ndarray) -> np.ndarray:
+        """
+        Get the last hidden state of a batch of preprocessed images.
+        """
+        return self.session.run(
+            ["last_hidden_state"], {"pixel_values": pixel_values.astype(np.float32)}
+        )[0]
+
+
+def export_onnx_image_model(output: str, quantize: bool = True) -> str:
+    """
+    Export the image model to ONNX, with its weights dynamically quantized to int8.
+    The export needs torch, running the exported model only needs onnxruntime.
+
+    Args:
+        output (str): The path of the exported model.
+        quantize (bool): Whether to quantize the weights of the linear layers to int8.
+
+    Returns:
+        str: The path of the exported model.
+    """
+    import torch
+    from transformers import AutoModel
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, model: torch.nn.Module):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+            return self.model(pixel_values=pixel_values).last_hidden_state
+
+    model = AutoModel.from_pretrained(IMAGE_MODEL_BASE).eval()
+    size = model.config.image_size
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    # exported under a temporary name, concurrent processes never load a partial model
+    exported = f"{output}.{os.getpid()}.fp32"
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(model),
+            (torch.randn(1, 3, size, size),),
+            exported,
+            input_names=["pixel_values"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "pixel_values": {0: "batch"},
+                "last_hidden_state": {0: "batch"},
+            },
+            opset_version=17,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized = f"{output}.{os.getpid()}.int8"
+        quantize_dynamic(exported, quantized, weight_type=QuantType.QInt8)
+        os.remove(exported)
+        exported = quantized
+    os.replace(exported, output)
+    return output
+
+
+def get_onnx_image_model(
+    model_path: str | None = None,
+    intra_op_threads: int | None = None,
+    quantize: bool = True,
+):
+    """
+    Initialize the ONNX Runtime image model and its feature extractor, exporting the model on first use.
+
+    Args:
+        model_path (str | None): The path of the exported model, defaults to one in `ONNX_CACHE_DIR`.
+        intra_op_threads (int | None): The threads of an operator, defaults to the physical cores.
+        quantize (bool): Whether the model is quantized to int8.
+
+    Returns:
+        tuple: A tuple containing the feature extractor and the image model.
+    """
+    from transformers import AutoProcessor
+
+    if model_path is None:
+        name = IMAGE_MODEL_BASE.split("/")[-1] + ("-int8" if quantize else "")
+        model_path = join(ONNX_CACHE_DIR, f"{name}.onnx")
+    if not exists(model_path):
+        logger.info("Exporting the image model to %s", model_path)
+        export_onnx_image_model(model_path, quantize)
+    return (
+        AutoProcessor.from_pretrained(IMAGE_MODEL_BASE, use_fast=False),
+        OnnxImageModel(model_path, intra_op_threads),
+    )
+
+
+def onnx_preprocess(image: Image.Image, extractor) -> np.ndarray:
+    """
+    Resize, center crop and normalize an image as the torchvision transform of `get_image_embedding`.
+    """
+    crop = extractor.size["height"]
+    resize = int((256 / 224) * crop)
+    width, height = image.size
+    if width <= height:
+        size = (resize, int(resize * height / width))
+    else:
+        size = (int(resize * width / height), resize)
+    image = image.resize(size, Image.BILINEAR)
+    left = int(round((size[0] - crop) / 2.0))
+    top = int(round((size[1] - crop) / 2.0))
+    image = image.crop((left, top, left + crop, top + crop))
+    pixels = np.asarray(image, dtype=np.float32) / 255.0
+    pixels = (pixels - np.array(extractor.image_mean, dtype=np.float32)) / np.array(
+        extractor.image_std, dtype=np.float32
+    )
+    return pixels.transpose(2, 0, 1)
+
+
+class PerceptualImageModel:
+    """
+    Torch-free features of a slide image, compared by cosine similarity as the embeddings of the image model:
+    a difference hash of its edges and a coarse histogram of its colors, each of unit norm.
+    Enough to group the renderings of visually identical layouts, and combined with
+    `SlidePage.layout_signature` in `SlideInducter.layout_split`.
+    """
+
+    device = "cpu"
+    # features of unrelated slides are less orthogonal than the embeddings of the image model
+    sim_bound = 0.8
+
+    def __init__(self, hash_size: int = 16, color_levels: int = 4):
+        self.hash_size = hash_size
+        self.color_levels = color_levels
+
+    def __call__(self, image: Image.Image) -> np.ndarray:
+        gray = image.convert("L").resize(
+            (self.hash_size + 1, self.hash_size), Image.BILINEAR
+        )
+        gray = np.asarray(gray, dtype=np.float32)
+        # flat regions hash to zero, slides agree by their edges rather than their blank space
+        dhash = np.sign(gray[:, 1:] - gray[:, :-1]).flatten()
+
+        levels = self.color_levels
+        colors = np.asarray(image.convert("RGB").resize((64, 64), Image.BILINEAR))
+        colors = colors.astype(np.int64) * levels // 256
+        bins = (colors[..., 0] * levels + colors[..., 1]) * levels + colors[..., 2]
+        histogram = np.bincount(bins.flatten(), minlength=levels**3)
+        # the square root turns the cosine similarity into the Bhattacharyya coefficient
+        histogram = np.sqrt(histogram / histogram.sum())
+        return np.concatenate([unit_vector(dhash), unit_vector(histogram)])
+
+
+def unit_vector(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+@tracing.traced("parse.pdf")
 async def parse_pdf(pdf_path: str, output_folder: str):
     """
     Parse a PDF file and extract text and images.
@@ -209,17 +419,34 @@ def get_image_embedding(
     Returns:
         dict: A dictionary mapping image filenames to their embeddings.
     """
-    import torch
-    import torchvision.transforms as T
-
-    transform = T.Compose(
-        [
-            T.Resize(int((256 / 224) * extractor.size["height"])),
-            T.CenterCrop(extractor.size["height"]),
-            T.ToTensor(),
-            T.Normalize(mean=extractor.image_mean, std=extractor.image_std),
-        ]
-    )
+    if isinstance(model, PerceptualImageModel):
+        transform = model
+
+        def embed(inputs: list) -> list:
+            return list(inputs)
+
+    elif isinstance(model, OnnxImageModel):
+        transform = partial(onnx_preprocess, extractor=extractor)
+
+        def embed(inputs: list) -> list:
+            return list(model(np.stack(inputs)))
+
+    else:
+        import torch
+        import torchvision.transforms as T
+
+        transform = T.Compose(
+            [
+                T.Resize(int((256 / 224) * extractor.size["height"])),
+                T.CenterCrop(extractor.size["height"]),
+                T.ToTensor(),
+                T.Normalize(mean=extractor.image_mean, std=extractor.image_std),
+            ]
+        )
+
+        def embed(inputs: list) -> list:
+            batch = {"pixel_values": torch.stack(inputs).to(model.device)}
+            return list(model(**batch).last_hidden_state.detach())
 
     inputs = []
     embeddings = []
@@ -228,8 +455,7 @@ def get_image_embedding(
         image = Image.open(join(image_dir, file)).convert("RGB")
         inputs.append(transform(image))
         if len(inputs) % batchsize == 0 or file == images[-1]:
-            batch = {"pixel_values": torch.stack(inputs).to(model.device)}
-            embeddings.extend(model(**batch).last_hidden_state.detach())
+            embeddings.extend(embed(inputs))
             inputs.clear()
     return {
         image: embedding.flatten().tolist()
@@ -237,24 +463,20 @@ def get_image_embedding(
     }
 
 
-def images_cosine_similarity(embeddings: list[list[float]]) -> list[float]:
+def images_cosine_similarity(embeddings: list[list[float]]) -> list[list[float]]:
     """
     Calculate the cosine similarity matrix for a list of embeddings.
     Args:
-        embeddings (list[torch.Tensor]): A list of image embeddings.
+        embeddings (list[list[float]]): A list of image embeddings.
 
     Returns:
-        torch.Tensor: A NxN similarity matrix.
+        list[list[float]]: A NxN similarity matrix, with zeros on the diagonal.
     """
-    import torch
-
-    embeddings = [torch.tensor(embedding) for embedding in embeddings]
-    sim_matrix = torch.zeros((len(embeddings), len(embeddings)))
-    for i in range(len(embeddings)):
-        for j in range(i + 1, len(embeddings)):
-            sim_matrix[i, j] = sim_matrix[j, i] = torch.nn.functional.cosine_similarity(
-                embeddings[i], embeddings[j], -1
-            )
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    embeddings = embeddings / np.maximum(norms, 1e-8)
+    sim_matrix = embeddings @ embeddings.T
+    np.fill_diagonal(sim_matrix, 0)
     return sim_matrix.tolist()
 
 
@@ -276,15 +498,10 @@ def average_distance(
     Returns:
         float: The average distance.
     """
-    import torch
-
-    similarity = torch.tensor(similarity)
     if idx in cluster_idx:
         return 0
-    total_similarity = 0
-    for idx_in_cluster in cluster_idx:
-        total_similarity += similarity[idx, idx_in_cluster]
-    return total_similarity / len(cluster_idx)
+    similarity = np.asarray(similarity)
+    return float(similarity[idx, cluster_idx].mean())
 
 
 def get_cluster(similarity: list[list[float]], sim_bound: float = 0.65):
@@ -298,10 +515,7 @@ def get_cluster(similarity: list[list[float]], sim_bound: float = 0.65):
     Returns:
         list: A list of clusters.
     """
-    import torch
-
-    similarity = torch.tensor(similarity)
-    sim_copy = similarity.clone()
+    sim_copy = np.array(similarity, dtype=np.float32)
     num_points = sim_copy.shape[0]
     clusters = []
     added = [False] * num_points
@@ -333,8 +547,8 @@ def get_cluster(similarity: list[list[float]], sim_bound: float = 0.65):
                     if not added[i]:
                         clusters.append([i])
                 break
-            i, j = torch.unravel_index(torch.argmax(sim_copy), sim_copy.shape)
-            clusters.append([int(i), int(j)])
+            i, j = map(int, np.unravel_index(np.argmax(sim_copy), sim_copy.shape))
+            clusters.append([i, j])
             added[i] = True
             added[j] = True
             sim_copy[i, :] = 0
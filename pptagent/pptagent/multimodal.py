@@ -1,11 +1,17 @@
 import asyncio
+from collections.abc import Iterable
 from os.path import basename, join
 
-import PIL.Image
-
+from pptagent.caption_store import (
+    TEMPLATE_PROMPT,
+    CaptionStore,
+    default_store,
+    prompt_version,
+)
+from pptagent.image_index import file_digest, image_meta
 from pptagent.llms import LLM, AsyncLLM
 from pptagent.presentation import Picture, Presentation
-from pptagent.utils import Config, get_logger, package_join
+from pptagent.utils import Config, get_logger
 
 logger = get_logger(__name__)
 
@@ -15,33 +21,92 @@ class ImageLabler:
     A class to extract images information, including caption, size, and appearance times in a presentation.
     """
 
-    def __init__(self, presentation: Presentation, config: Config):
+    def __init__(
+        self,
+        presentation: Presentation,
+        config: Config,
+        store: CaptionStore | None = None,
+    ):
         """
         Initialize the ImageLabler.
 
         Args:
             presentation (Presentation): The presentation object.
             config (Config): The configuration object.
+            store (CaptionStore | None): The caption store, defaults to the shared one.
         """
         self.presentation = presentation
         self.slide_area = presentation.slide_width.pt * presentation.slide_height.pt
         self.image_stats = {}
         self.config = config
+        self.store = store if store is not None else default_store()
         self.collect_images()
 
     def apply_stats(self, image_stats: dict[str, dict] | None = None):
         """
-        Apply image captions to the presentation.
+        Apply image captions to the presentation, the images without one in `image_stats`
+        take theirs from the caption store.
         """
         if image_stats is None:
             image_stats = self.image_stats
+        stored = self.stored_captions(
+            image
+            for image in self.image_stats
+            if "caption" not in image_stats.get(image, {})
+        )
 
         for slide in self.presentation.slides:
             for shape in slide.shape_filter(Picture):
                 if shape.caption is None:
-                    caption = image_stats[basename(shape.img_path)]["caption"]
+                    stats = image_stats.get(basename(shape.img_path), {})
+                    if "caption" in stats:
+                        caption = stats["caption"]
+                    else:
+                        caption = stored[basename(shape.img_path)]
                     shape.caption = max(caption.split("\n"), key=len)
 
+    def stored_captions(
+        self, images: Iterable[str], model: str | None = None
+    ) -> dict[str, str]:
+        """
+        Look the captions of images up in the caption store, by any model if `model` is None.
+
+        Returns:
+            dict[str, str]: The captions by image, of the images found.
+        """
+        if self.store is None:
+            return {}
+        digests = {
+            image: file_digest(join(self.config.IMAGE_DIR, image)) for image in images
+        }
+        captions = self.store.get_many(
+            digests.values(), prompt_version(TEMPLATE_PROMPT), model
+        )
+        return {
+            image: captions[digest]
+            for image, digest in digests.items()
+            if digest in captions
+        }
+
+    def store_caption(self, image: str, model: str, caption: str):
+        if self.store is not None:
+            self.store.put(
+                file_digest(join(self.config.IMAGE_DIR, image)),
+                prompt_version(TEMPLATE_PROMPT),
+                model,
+                caption,
+            )
+
+    def load_stored_captions(self, model: str):
+        """
+        Fill the image stats with the captions by `model` in the caption store.
+        """
+        uncaptioned = [
+            image for image, stats in self.image_stats.items() if "caption" not in stats
+        ]
+        for image, caption in self.stored_captions(uncaptioned, model).items():
+            self.image_stats[image]["caption"] = caption
+
     async def caption_images_async(self, vision_model: AsyncLLM):
         """
         Generate captions for images in the presentation asynchronously.
@@ -55,9 +120,8 @@ class ImageLabler:
         assert isinstance(vision_model, AsyncLLM), (
             "vision_model must be an AsyncLLM instance"
         )
-        caption_prompt = open(
-            package_join("prompts", "caption.txt"), encoding="utf-8"
-        ).read()
+        caption_prompt = TEMPLATE_PROMPT
+        self.load_stored_captions(vision_model.model)
 
         async with asyncio.TaskGroup() as tg:
             for image, stats in self.image_stats.items():
@@ -71,6 +135,7 @@ class ImageLabler:
                     task.add_done_callback(
                         lambda t, image=image: (
                             self.image_stats[image].update({"caption": t.result()}),
+                            self.store_caption(image, vision_model.model, t.result()),
                             logger.debug("captioned %s: %s", image, t.result()),
                         )
                     )
@@ -89,14 +154,14 @@ class ImageLabler:
             dict: Dictionary containing image stats with captions.
         """
         assert isinstance(vision_model, LLM), "vision_model must be an LLM instance"
-        caption_prompt = open(
-            package_join("prompts", "caption.txt"), encoding="utf-8"
-        ).read()
+        caption_prompt = TEMPLATE_PROMPT
+        self.load_stored_captions(vision_model.model)
         for image, stats in self.image_stats.items():
             if "caption" not in stats:
                 stats["caption"] = vision_model(
                     caption_prompt, join(self.config.IMAGE_DIR, image)
                 )
+                self.store_caption(image, vision_model.model, stats["caption"])
                 logger.debug("captioned %s: %s", image, stats["caption"])
         self.apply_stats()
         return self.image_stats
@@ -111,7 +176,7 @@ class ImageLabler:
                 if image_path == "pic_placeholder.png":
                     continue
                 if image_path not in self.image_stats:
-                    size = PIL.Image.open(join(self.config.IMAGE_DIR, image_path)).size
+                    size = image_meta(join(self.config.IMAGE_DIR, image_path)).size
                     self.image_stats[image_path] = {
                         "size": size,
                         "appear_times": 0,
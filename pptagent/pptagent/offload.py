@@ -0,0 +1,209 @@
+"""
+Offload of the CPU-bound steps of a run to a pool of worker processes.
+
+Building and saving the slides of a presentation, parsing a template and rasterizing the
+rendered slides hold the GIL for seconds, stalling every other session of the event loop.
+`WorkerPool` runs them as picklable tasks in worker processes instead. Large inputs are
+handed off through files in the run directory rather than through the pipe of the pool,
+a task carries only their paths, and results are written next to them by the worker.
+At most `max_pending` tasks are in flight at once, callers beyond that wait for a slot
+before staging their inputs, which bounds the disk and the memory a burst of work takes.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import pickle
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from os.path import join
+from typing import Any
+
+from pptagent import tracing
+from pptagent.presentation import Presentation
+from pptagent.utils import Config, get_logger, rasterize_pdf
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class OffloadTask(ABC):
+    """
+    A picklable unit of CPU-bound work, `run` is called in the worker process.
+    """
+
+    @abstractmethod
+    def run(self) -> Any:
+        raise NotImplementedError
+
+
+@dataclass
+class SavePresentation(OffloadTask):
+    """
+    Build the slides of a pickled presentation and save it.
+
+    Args:
+        presentation_file (str): The pickled `Presentation`.
+        output (str): The path of the pptx file.
+        layout_only (bool): Whether to save only the layout.
+    """
+
+    presentation_file: str
+    output: str
+    layout_only: bool = False
+
+    def run(self) -> str:
+        with open(self.presentation_file, "rb") as f:
+            prs: Presentation = pickle.load(f)
+        prs.save(self.output, self.layout_only)
+        return self.output
+
+
+@dataclass
+class ParsePresentation(OffloadTask):
+    """
+    Parse a pptx file and pickle the `Presentation` to `output`.
+
+    Args:
+        pptx (str): The path of the pptx file.
+        config_dir (str): The run directory of the presentation, where its images are saved.
+        output (str): The path of the pickled `Presentation`.
+    """
+
+    pptx: str
+    config_dir: str
+    output: str
+
+    def run(self) -> str:
+        prs = Presentation.from_file(self.pptx, Config(self.config_dir))
+        with open(self.output, "wb") as f:
+            pickle.dump(prs, f, pickle.HIGHEST_PROTOCOL)
+        return self.output
+
+
+@dataclass
+class RasterizePdf(OffloadTask):
+    """
+    Render the pages of a PDF to images in `output_dir`, returns the number of pages.
+    """
+
+    pdf: str
+    output_dir: str
+    dpi: int = 100
+
+    def run(self) -> int:
+        os.makedirs(self.output_dir, exist_ok=True)
+        return rasterize_pdf(self.pdf, self.output_dir, self.dpi)
+
+
+def _run_task(task: OffloadTask) -> Any:
+    return task.run()
+
+
+class WorkerPool:
+    """
+    A pool of worker processes running `OffloadTask`s, with backpressure.
+
+    Args:
+        run_dir (str): The directory of the files handed off to the workers.
+        max_workers (int | None): The number of worker processes, defaults to the number of CPUs,
+            0 runs the tasks inline in the event loop, as a single process would.
+        max_pending (int | None): The maximum number of tasks in flight, defaults to twice `max_workers`.
+    """
+
+    def __init__(
+        self,
+        run_dir: str,
+        max_workers: int | None = None,
+        max_pending: int | None = None,
+    ):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        assert max_workers >= 0, "max_workers must not be negative"
+        self.run_dir = run_dir
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max(2 * max_workers, 1)
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.executor: Executor | None = None
+        if max_workers > 0:
+            # forking a process running an event loop and threads is unsafe
+            self.executor = ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def submit(self, task: OffloadTask) -> Any:
+        """
+        Run a task in a worker process, waiting for a slot if `max_pending` tasks are in flight.
+        """
+        async with self.pending:
+            return await self._run(task)
+
+    async def _run(self, task: OffloadTask) -> Any:
+        with tracing.span(f"offload.{type(task).__name__}", workers=self.max_workers):
+            if self.executor is None:
+                return task.run()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, _run_task, task)
+
+    def staging_file(self, suffix: str) -> str:
+        """
+        Get a fresh path in the run directory to hand a file off to a worker.
+        """
+        staging_dir = join(self.run_dir, "offload")
+        os.makedirs(staging_dir, exist_ok=True)
+        return join(staging_dir, f"{uuid.uuid4().hex}{suffix}")
+
+    async def save(
+        self, prs: Presentation, output: str, layout_only: bool = False
+    ) -> str:
+        """
+        Save a presentation in a worker process, equivalent to `prs.save(output, layout_only)`.
+        """
+        if self.executor is None:
+            async with self.pending:
+                prs.save(output, layout_only)
+            return output
+        async with self.pending:
+            staged = self.staging_file(".pkl")
+            try:
+                with open(staged, "wb") as f:
+                    pickle.dump(prs, f, pickle.HIGHEST_PROTOCOL)
+                return await self._run(SavePresentation(staged, output, layout_only))
+            finally:
+                os.remove(staged)
+
+    async def parse(self, pptx: str, config: Config) -> Presentation:
+        """
+        Parse a presentation in a worker process, equivalent to `Presentation.from_file(pptx, config)`.
+        """
+        if self.executor is None:
+            async with self.pending:
+                return Presentation.from_file(pptx, config)
+        async with self.pending:
+            staged = self.staging_file(".pkl")
+            try:
+                await self._run(ParsePresentation(pptx, config.RUN_DIR, staged))
+                with open(staged, "rb") as f:
+                    return pickle.load(f)
+            finally:
+                if os.path.exists(staged):
+                    os.remove(staged)
+
+    async def rasterize(self, pdf: str, output_dir: str, dpi: int = 100) -> int:
+        """
+        Render the pages of a PDF to images in a worker process.
+        """
+        return await self.submit(RasterizePdf(pdf, output_dir, dpi))
+
+    def shutdown(self, wait: bool = True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
+            self.executor = None
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -1,18 +1,30 @@
+"""
+PPTEval: judge presentations on their vision, content and logic.
+
+Slides are described by the vision model and scored by the language model, decks are scored on
+their logic from the extracted outline. `PPTEval` runs the judge calls of many decks concurrently
+under one limit and writes every description and every (deck, slide, dimension, judge) score to
+an `EvalStore` as soon as it completes, so a restarted evaluation skips the finished work.
+"""
+
+import asyncio
+import csv
 import json
-import os
-from collections import defaultdict
+import sqlite3
+import time
+from dataclasses import dataclass
 from glob import glob
-from os.path import dirname, exists, join
+from os.path import basename, dirname, join
 
 from jinja2 import Template
 from tqdm.asyncio import tqdm
 
+from .llms import AsyncLLM
 from .model_utils import ModelManager
 from .presentation import Presentation
-from .utils import Config, package_join, ppt_to_images
+from .utils import Config, get_logger, package_join, ppt_to_images
 
-language_model = None
-vision_model = None
+logger = get_logger(__name__)
 
 text_scorer = Template(
     open(
@@ -41,133 +53,320 @@ logic_scorer = Template(
     ).read()
 )
 
+DIMENSIONS = ("vision", "content", "logic")
+# the slide of the deck level results
+DECK = ""
+
 
-def get_eval(prs_source: str):
-    evals = defaultdict(dict)
-    eval_file = join(dirname(prs_source), "evals.json")
-    if exists(eval_file):
-        with open(eval_file, encoding="utf-8") as f:
-            evals |= json.load(f)
-    return evals, eval_file
+class EvalStore:
+    """
+    A SQLite store of the descriptions and the scores of an evaluation.
+
+    Every result is committed once written, in WAL mode a crash loses at most the calls in flight.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS descriptions (
+                deck TEXT NOT NULL,
+                slide TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                model TEXT NOT NULL,
+                description TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (deck, slide, kind, model)
+            );
+            CREATE TABLE IF NOT EXISTS scores (
+                deck TEXT NOT NULL,
+                slide TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                judge TEXT NOT NULL,
+                score REAL,
+                result TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (deck, slide, dimension, judge)
+            );
+            """
+        )
 
+    def get_description(
+        self, deck: str, slide: str, kind: str, model: str
+    ) -> str | None:
+        row = self.conn.execute(
+            "SELECT description FROM descriptions"
+            " WHERE deck = ? AND slide = ? AND kind = ? AND model = ?",
+            (deck, slide, kind, model),
+        ).fetchone()
+        return row[0] if row is not None else None
 
-async def eval_slide(prs_source: str, slide_folder: str):
-    evals, eval_file = get_eval(prs_source)
-    for slide_image in glob(join(slide_folder, "slide_*.jpg")) + glob(
-        join(slide_folder, "slide_images", "slide_*.jpg")
+    def put_description(
+        self, deck: str, slide: str, kind: str, model: str, description: str
     ):
-        slide_descr = slide_image.replace(".jpg", ".json")
-        if not os.path.exists(slide_descr):
-            style_descr = await vision_model(style_descriptor, slide_image)
-            content_descr = await vision_model(content_descriptor, slide_image)
-            with open(slide_descr, "w", encoding="utf-8") as f:
-                json.dump(
-                    {"content": content_descr, "style": style_descr},
-                    f,
-                    indent=2,
-                )
-        else:
-            descr = json.load(open(slide_descr, encoding="utf-8"))
-            style_descr = descr["style"]
-            content_descr = descr["content"]
-        if slide_image not in evals["vision"]:
-            evals["vision"][slide_image] = await language_model(
-                vision_scorer.render(descr=style_descr), return_json=True
-            )
-        if slide_image not in evals["content"]:
-            evals["content"][slide_image] = await language_model(
-                text_scorer.render(descr=content_descr), return_json=True
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?, ?)",
+                (deck, slide, kind, model, description, time.time()),
             )
-    with open(eval_file, "w", encoding="utf-8") as f:
-        json.dump(evals, f, indent=2)
-
-
-async def eval_coherence(prs_source: str):
-    tmp_config = Config(dirname(prs_source))
-    evals, eval_file = get_eval(prs_source)
-    if "logic" in evals:
-        return
-    slide_descr = join(prs_source.replace(".pptx", ""), "extracted.json")
-    if not exists(slide_descr):
-        presentation = Presentation.from_file(prs_source, tmp_config).to_text()
-        extracted = language_model(
-            ppt_extractor.render(presentation=presentation),
-            return_json=True,
+
+    def has_score(self, deck: str, slide: str, dimension: str, judge: str) -> bool:
+        return (
+            self.conn.execute(
+                "SELECT 1 FROM scores"
+                " WHERE deck = ? AND slide = ? AND dimension = ? AND judge = ?",
+                (deck, slide, dimension, judge),
+            ).fetchone()
+            is not None
         )
-        with open(slide_descr, "w", encoding="utf-8") as f:
-            json.dump(extracted, f, indent=2)
-    else:
-        extracted = json.load(open(slide_descr, encoding="utf-8"))
-    evals["logic"] = await language_model(
-        logic_scorer.render(
-            presentation=extracted,
-        ),
-        return_json=True,
-    )
-    with open(eval_file, "w", encoding="utf-8") as f:
-        json.dump(evals, f, indent=2)
-
-
-async def eval_ppt(prs_source: str):
-    slide_folder = prs_source.replace(".pptx", "")
-    if not exists(slide_folder):
-        await ppt_to_images(prs_source, slide_folder)
-    await eval_coherence(prs_source)
-    await eval_slide(prs_source, slide_folder)
-    return get_eval(prs_source)[0]
-
-
-async def eval_parsed_ppts(prs_files: list[str], slide_folders: list[str]):
-    await tqdm.gather(*[eval_coherence(prs_file) for prs_file in prs_files])
-    await tqdm.gather(
-        *[
-            eval_slide(prs_file, slide_folder)
-            for prs_file, slide_folder in zip(prs_files, slide_folders)
-        ]
-    )
 
-    # Calculate average scores directly in this function
-    all_scores = {"vision": [], "content": [], "logic": []}
+    def put_score(self, deck: str, slide: str, dimension: str, judge: str, result):
+        score = result.get("score") if isinstance(result, dict) else None
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    deck,
+                    slide,
+                    dimension,
+                    judge,
+                    float(score) if isinstance(score, int | float) else None,
+                    json.dumps(result, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+
+    def report(self, judge: str) -> dict:
+        """
+        Aggregate the scores of a judge, by dimension and by deck.
+        A result without a numeric score counts as 0, as an unparseable judgement.
+        """
+        report = {"judge": judge, "dimensions": {}, "decks": {}}
+        for dimension, mean, count in self.conn.execute(
+            "SELECT dimension, AVG(COALESCE(score, 0)), COUNT(*) FROM scores"
+            " WHERE judge = ? GROUP BY dimension ORDER BY dimension",
+            (judge,),
+        ):
+            report["dimensions"][dimension] = {"mean": mean, "count": count}
+        for deck, dimension, mean in self.conn.execute(
+            "SELECT deck, dimension, AVG(COALESCE(score, 0)) FROM scores"
+            " WHERE judge = ? GROUP BY deck, dimension ORDER BY deck",
+            (judge,),
+        ):
+            report["decks"].setdefault(deck, {})[dimension] = mean
+        means = [d["mean"] for d in report["dimensions"].values()]
+        report["overall"] = sum(means) / len(means) if means else 0
+        return report
+
+    def export_report(self, path: str, judge: str) -> dict:
+        """
+        Export the report of a judge, the scores by deck as CSV if `path` ends with .csv, else JSON.
+        """
+        report = self.report(judge)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            if path.endswith(".csv"):
+                writer = csv.writer(f)
+                writer.writerow(["deck", *DIMENSIONS])
+                for deck, scores in report["decks"].items():
+                    writer.writerow([deck, *[scores.get(d, "") for d in DIMENSIONS]])
+            else:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        return report
+
+    def close(self):
+        self.conn.close()
+
+
+@dataclass
+class PPTEval:
+    """
+    Evaluate presentations with a language and a vision judge.
+
+    Args:
+        language_model (AsyncLLM): The judge scoring the descriptions, named by its model.
+        vision_model (AsyncLLM): The model describing the slide images.
+        store (EvalStore): The store of the results.
+        max_at_once (int): The maximum number of judge calls at once.
+        max_renders (int): The maximum number of decks rendered or parsed at once.
+        use_batch (bool): Whether to submit the judge calls through the Batch API.
+    """
+
+    language_model: AsyncLLM
+    vision_model: AsyncLLM
+    store: EvalStore
+    max_at_once: int = 16
+    use_batch: bool = False
+    max_renders: int = 4
+
+    def __post_init__(self):
+        if self.use_batch:
+            self.language_model = self.language_model.batched()
+            self.vision_model = self.vision_model.batched()
+        self.semaphore = asyncio.Semaphore(self.max_at_once)
+        # rendering spawns an office process and parsing blocks, bound both off the loop
+        self.render_semaphore = asyncio.Semaphore(self.max_renders)
+        self.failed = 0
 
-    for prs_file in prs_files:
-        evals, _ = get_eval(prs_file)
+    @property
+    def judge(self) -> str:
+        return self.language_model.model
 
-        # Vision scores
-        vision_scores = [score.get("score", 0) for score in evals["vision"].values()]
-        if vision_scores:
-            all_scores["vision"].extend(vision_scores)
+    async def eval_decks(
+        self, prs_files: list[str], slide_folders: list[str] | None = None
+    ) -> dict:
+        """
+        Evaluate the decks, each with its slide images in `slide_folders` or rendered next to it.
 
-        # Content scores
-        content_scores = [score.get("score", 0) for score in evals["content"].values()]
-        if content_scores:
-            all_scores["content"].extend(content_scores)
+        Returns:
+            dict: The report of the judge over the store.
+        """
+        slide_folders = slide_folders or [None] * len(prs_files)
+        await tqdm.gather(
+            *[
+                self.eval_deck(prs_file, slide_folder)
+                for prs_file, slide_folder in zip(prs_files, slide_folders)
+            ]
+        )
+        report = self.store.report(self.judge)
+        if self.failed:
+            logger.warning("%d judgements failed, rerun to retry them", self.failed)
+        return report
+
+    async def eval_deck(self, prs_source: str, slide_folder: str | None = None):
+        slide_folder = slide_folder or prs_source.replace(".pptx", "")
+        slide_images = self._slide_images(slide_folder)
+        # rendered slides are kept across runs, a resumed run does not render again
+        if not slide_images:
+            try:
+                async with self.render_semaphore:
+                    await ppt_to_images(prs_source, slide_folder)
+            except Exception as e:
+                logger.warning("Failed to render %s: %s", prs_source, e)
+                self.failed += 1
+            slide_images = self._slide_images(slide_folder)
+        await asyncio.gather(
+            self._guard(self.eval_coherence(prs_source)),
+            *[
+                self._guard(self.eval_slide(prs_source, slide_image, dimension))
+                for slide_image in sorted(slide_images)
+                for dimension in ("vision", "content")
+            ],
+        )
 
-        # Logic score
-        if "logic" in evals and "score" in evals["logic"]:
-            all_scores["logic"].append(evals["logic"]["score"])
+    @staticmethod
+    def _slide_images(slide_folder: str) -> list[str]:
+        return glob(join(slide_folder, "slide_*.jpg")) + glob(
+            join(slide_folder, "slide_images", "slide_*.jpg")
+        )
 
-    # Calculate averages
-    avg_scores = {}
-    for category, scores in all_scores.items():
-        if scores:
-            avg_scores[category] = sum(scores) / len(scores)
+    async def eval_slide(self, prs_source: str, slide_image: str, dimension: str):
+        """
+        Score a slide on vision or content from its description.
+        """
+        slide = basename(slide_image)
+        if self.store.has_score(prs_source, slide, dimension, self.judge):
+            return
+        if dimension == "vision":
+            kind, descriptor, scorer = "style", style_descriptor, vision_scorer
         else:
-            avg_scores[category] = 0
+            kind, descriptor, scorer = "content", content_descriptor, text_scorer
+        descr = self.store.get_description(
+            prs_source, slide, kind, self.vision_model.model
+        )
+        if descr is None:
+            descr = await self._call(self.vision_model, descriptor, slide_image)
+            self.store.put_description(
+                prs_source, slide, kind, self.vision_model.model, descr
+            )
+        result = await self._call(
+            self.language_model, scorer.render(descr=descr), return_json=True
+        )
+        self.store.put_score(prs_source, slide, dimension, self.judge, result)
+
+    async def eval_coherence(self, prs_source: str):
+        """
+        Score the logic of a deck from its extracted outline.
+        """
+        if self.store.has_score(prs_source, DECK, "logic", self.judge):
+            return
+        extracted = self.store.get_description(
+            prs_source, DECK, "extracted", self.judge
+        )
+        if extracted is None:
+            async with self.render_semaphore:
+                presentation = await asyncio.to_thread(
+                    lambda: Presentation.from_file(
+                        prs_source, Config(dirname(prs_source))
+                    ).to_text()
+                )
+            extracted = await self._call(
+                self.language_model,
+                ppt_extractor.render(presentation=presentation),
+                return_json=True,
+            )
+            extracted = json.dumps(extracted, ensure_ascii=False)
+            self.store.put_description(
+                prs_source, DECK, "extracted", self.judge, extracted
+            )
+        result = await self._call(
+            self.language_model,
+            logic_scorer.render(presentation=json.loads(extracted)),
+            return_json=True,
+        )
+        self.store.put_score(prs_source, DECK, "logic", self.judge, result)
 
-    # Display results
-    print("\n=== Average Scores by Dimension ===")
-    for category, score in avg_scores.items():
-        print(f"{category.capitalize()}: {score:.2f}")
+    async def _call(self, model: AsyncLLM, *args, **kwargs):
+        async with self.semaphore:
+            return await model(*args, **kwargs)
 
-    # Calculate overall average
-    if avg_scores:
-        overall_avg = sum(avg_scores.values()) / len(avg_scores)
-        print(f"Overall: {overall_avg:.2f}")
+    async def _guard(self, judgement):
+        # a failed judgement is left out of the store, to be retried by the next run
+        try:
+            await judgement
+        except Exception as e:
+            logger.warning("Judgement failed: %s", e)
+            self.failed += 1
 
-    return avg_scores
 
+def print_report(report: dict):
+    print(f"\n=== Average Scores by Dimension ({report['judge']}) ===")
+    for dimension, stats in report["dimensions"].items():
+        print(
+            f"{dimension.capitalize()}: {stats['mean']:.2f} ({stats['count']} scores)"
+        )
+    print(f"Overall: {report['overall']:.2f}")
 
-if __name__ == "__main__":
+
+def main(
+    decks: str,
+    db_path: str = "ppteval.sqlite",
+    max_at_once: int = 16,
+    max_renders: int = 4,
+    report: str = "",
+):
+    """
+    Evaluate the decks matching a glob pattern, resuming the evaluation stored in `db_path`,
+    and export the report to `report` if given.
+    """
     manager = ModelManager()
-    language_model = manager.language_model
-    vision_model = manager.vision_model
+    store = EvalStore(db_path)
+    evaluator = PPTEval(
+        manager.language_model,
+        manager.vision_model,
+        store,
+        max_at_once,
+        use_batch=manager.use_batch,
+        max_renders=max_renders,
+    )
+    print_report(asyncio.run(evaluator.eval_decks(sorted(glob(decks)))))
+    if report:
+        store.export_report(report, evaluator.judge)
+    store.close()
+
+
+if __name__ == "__main__":
+    from func_argparse import single_main
+
+    single_main(main)
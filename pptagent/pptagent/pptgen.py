@@ -1,18 +1,22 @@
 import asyncio
+import hashlib
 import json
 import os
 import traceback
 from abc import ABC, abstractmethod
-from contextlib import AsyncExitStack
-from copy import deepcopy
-from dataclasses import dataclass
+from collections import OrderedDict
+from contextlib import AbstractAsyncContextManager, AsyncExitStack
+from copy import copy, deepcopy
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from enum import Enum
 from random import shuffle
 
-from pptagent.agent import Agent
-from pptagent.apis import API_TYPES, CodeExecutor
+from pptagent.agent import HISTORY_SCOPE, Agent
+from pptagent.apis import API_TYPES, CodeExecutor, SlideEditError, synthesize_actions
 from pptagent.document import Document
+from pptagent.journal import Journal, journal_key
+from pptagent.layout_scorer import LayoutScorer
 from pptagent.llms import AsyncLLM
 from pptagent.presentation import (
     GroupShape,
@@ -21,9 +25,11 @@ from pptagent.presentation import (
     Presentation,
     SlidePage,
     StyleArg,
+    TextFitter,
 )
 from pptagent.response import EditorOutput, LayoutChoice, Outline, OutlineItem
 from pptagent.utils import (
+    JsonArrayStream,
     Language,
     edit_distance,
     get_logger,
@@ -45,6 +51,59 @@ def get_length_factor(src_lan: Language, dst_lang: Language):
         return 2.0
 
 
+@dataclass
+class PreparedReference:
+    """
+    The reference state prepared by `PPTGen.set_reference`, shared read-only by the generators
+    of a template, with the text fitter profiles of the fitter configs it has been prepared for.
+    """
+
+    presentation: Presentation
+    reference_lang: Language
+    functional_layouts: list[str]
+    layouts: dict[str, Layout]
+    text_layouts: list[str]
+    multimodal_layouts: list[str]
+    fit_profiles: dict[str, tuple[dict, float]] = field(default_factory=dict)
+
+
+REFERENCE_CACHE_SIZE = int(os.getenv("PPTAGENT_REFERENCE_CACHE_SIZE", "16"))
+_reference_cache: OrderedDict[str, PreparedReference] = OrderedDict()
+
+
+def reference_key(
+    slide_induction: dict,
+    presentation: Presentation,
+    hide_small_pic_ratio: float | None,
+    keep_in_background: bool,
+) -> str:
+    """
+    Key a prepared reference by the content of the template file, the run directories
+    its images were extracted to, its image captions, the slide induction and the
+    preparation config.
+    The presentation is assumed unchanged since it has been loaded and labelled.
+    """
+    with open(presentation.source_file, "rb") as f:
+        source = hashlib.sha1(f.read()).hexdigest()
+    return journal_key(
+        source=source,
+        run_dirs=sorted(
+            {
+                shape.config.RUN_DIR
+                for slide in presentation.slides
+                for shape in slide.shapes
+            }
+        ),
+        captions=[
+            [pic.caption for pic in slide.shape_filter(Picture)]
+            for slide in presentation.slides
+        ],
+        slide_induction=slide_induction,
+        hide_small_pic_ratio=hide_small_pic_ratio,
+        keep_in_background=keep_in_background,
+    )
+
+
 class FunctionalLayouts(Enum):
     OPENING = "opening"
     TOC = "table of contents"
@@ -82,10 +141,36 @@ class PPTGen(ABC):
     force_pages: bool = False
     error_exit: bool = False
     record_cost: bool = False
+    compact_outline: bool = False
+    stream_outline: bool = False
+    layout_scorer: LayoutScorer | None = None
+    synthesize_edits: bool = True
+    text_fitter: TextFitter | None = field(default_factory=TextFitter)
     _initialized: bool = False
 
     def __post_init__(self):
         self._hire_staffs(self.record_cost, self.language_model, self.vision_model)
+        self._prepared: dict[int, asyncio.Task] = {}
+        self._streamed: dict[int, asyncio.Task] = {}
+        self.edit_stats = {"synthesized": 0, "coder": 0}
+        self.fit_stats = {"fitted": 0, "overflowed": 0, "scaled": 0}
+        self.layout_stats = {"speculated": 0, "selected": 0, "agreed": 0}
+        self.journal: Journal | None = None
+        self._empty_prs: Presentation | None = None
+
+    @property
+    def empty_prs(self) -> Presentation:
+        """
+        The presentation the slides are built into, loaded from the reference on first use.
+        """
+        if self._empty_prs is None:
+            # reloads the pptx from the source file, as `validate` adds slides to it
+            self._empty_prs = replace(self.presentation, slides=[])
+        return self._empty_prs
+
+    @empty_prs.setter
+    def empty_prs(self, presentation: Presentation | None):
+        self._empty_prs = presentation
 
     def set_reference(
         self,
@@ -93,17 +178,81 @@ class PPTGen(ABC):
         presentation: Presentation,
         hide_small_pic_ratio: float | None = 0.2,
         keep_in_background: bool = True,
+        use_cache: bool = True,
     ):
         """
         Set the reference presentation and extracted presentation information.
 
+        The prepared reference is cached by `reference_key`, setting an already prepared
+        reference again shares its state rather than preparing it anew.
+        The reference is prepared on a copy, leaving the given presentation untouched.
+
         Args:
             presentation (Presentation): The presentation object.
             slide_induction (dict): The slide induction data.
+            use_cache (bool): Whether to use the cache of prepared references.
 
         Returns:
             PPTGen: The updated PPTGen object.
         """
+        assert hide_small_pic_ratio is None or hide_small_pic_ratio > 0, (
+            "hide_small_pic_ratio must be positive or None"
+        )
+        key = None
+        if use_cache:
+            key = reference_key(
+                slide_induction, presentation, hide_small_pic_ratio, keep_in_background
+            )
+        reference = _reference_cache.get(key)
+        if reference is None:
+            reference = self._prepare_reference(
+                dict(slide_induction),
+                deepcopy(presentation),
+                hide_small_pic_ratio,
+                keep_in_background,
+            )
+            if key is not None:
+                _reference_cache[key] = reference
+                while len(_reference_cache) > REFERENCE_CACHE_SIZE:
+                    _reference_cache.popitem(last=False)
+        else:
+            _reference_cache.move_to_end(key)
+            logger.debug("Reusing the prepared reference %s", key)
+
+        self.presentation = reference.presentation
+        self.reference_lang = reference.reference_lang
+        self.functional_layouts = reference.functional_layouts
+        self.layouts = reference.layouts
+        self.text_layouts = reference.text_layouts
+        self.multimodal_layouts = reference.multimodal_layouts
+        self.empty_prs = None
+        if self.layout_scorer is not None:
+            self.layout_scorer.profile_layouts(self.layouts, self.presentation.slides)
+        if self.text_fitter is not None:
+            fitter_key = repr(self.text_fitter)
+            if fitter_key not in reference.fit_profiles:
+                self.text_fitter.profile(self.presentation)
+                reference.fit_profiles[fitter_key] = (
+                    self.text_fitter.areas,
+                    self.text_fitter.min_size,
+                )
+            self.text_fitter.areas, self.text_fitter.min_size = reference.fit_profiles[
+                fitter_key
+            ]
+
+        self._initialized = True
+        return self
+
+    def _prepare_reference(
+        self,
+        slide_induction: dict,
+        presentation: Presentation,
+        hide_small_pic_ratio: float | None,
+        keep_in_background: bool,
+    ) -> PreparedReference:
+        """
+        Prepare the reference state of a template, hiding its small pictures.
+        """
         self.presentation = presentation
 
         self.reference_lang = Language(**slide_induction.pop("language"))
@@ -112,10 +261,6 @@ class PPTGen(ABC):
         self.layouts: dict[str, Layout] = {
             k: Layout(title=k, **v) for k, v in slide_induction.items()
         }
-        self.empty_prs = deepcopy(self.presentation)
-        assert hide_small_pic_ratio is None or hide_small_pic_ratio > 0, (
-            "hide_small_pic_ratio must be positive or None"
-        )
         if hide_small_pic_ratio is not None:
             self._hide_small_pics(hide_small_pic_ratio, keep_in_background)
 
@@ -133,9 +278,34 @@ class PPTGen(ABC):
             self.text_layouts = self.multimodal_layouts
         if len(self.multimodal_layouts) == 0:
             self.multimodal_layouts = self.text_layouts
+        # shuffle once rather than per slide, keeping the layout options of
+        # the layout selector byte-identical across slides for prompt caching
+        shuffle(self.text_layouts)
+        shuffle(self.multimodal_layouts)
+        return PreparedReference(
+            self.presentation,
+            self.reference_lang,
+            self.functional_layouts,
+            self.layouts,
+            self.text_layouts,
+            self.multimodal_layouts,
+        )
 
-        self._initialized = True
-        return self
+    def fork(self):
+        """
+        Get a generator sharing the reference state set by `set_reference` read-only,
+        with its own agents and its own presentation to generate into.
+        """
+        generator = copy(self)
+        generator.empty_prs = None
+        generator._hire_staffs(self.record_cost, self.language_model, self.vision_model)
+        generator._prepared = {}
+        generator._streamed = {}
+        generator.edit_stats = dict.fromkeys(self.edit_stats, 0)
+        generator.fit_stats = dict.fromkeys(self.fit_stats, 0)
+        generator.layout_stats = dict.fromkeys(self.layout_stats, 0)
+        generator.journal = None
+        return generator
 
     async def generate_pres(
         self,
@@ -147,6 +317,8 @@ class PPTGen(ABC):
         length_factor: float | None = None,
         auto_length_factor: bool = True,
         max_at_once: int | None = None,
+        journal_dir: str | None = None,
+        semaphore: AbstractAsyncContextManager | None = None,
     ):
         """
         Generate a PowerPoint presentation.
@@ -160,6 +332,8 @@ class PPTGen(ABC):
             length_factor (float | None): The length factor.
             auto_length_factor (bool): Whether to automatically calculate the length factor.
             max_at_once (int | None): The maximum number of slides to generate at once.
+            journal_dir (str | None): The directory of the generation journal, a rerun with the same inputs replays the completed stages.
+            semaphore (AbstractAsyncContextManager | None): A limiter of the slides generated at once shared with other presentations, overrides max_at_once.
 
         Returns:
             tuple[Presentation, dict]: A tuple containing the generated presentation and the history of the agents.
@@ -177,64 +351,159 @@ class PPTGen(ABC):
             self.length_factor = get_length_factor(self.reference_lang, self.dst_lang)
         else:
             self.length_factor = length_factor
-        succ_flag = True
-        if outline is None:
-            self.outline = await self.generate_outline(num_slides, source_doc)
-        else:
-            self.outline = outline
-        pre_section = None
-        section_idx = 0
-        self.simple_outline = ""
-        for slide_idx, item in enumerate(self.outline):
-            if item.topic != pre_section and item.topic != "Functional":
-                section_idx += 1
-                self.simple_outline += f"Section {section_idx}: {item.topic}\n"
-                pre_section = item.topic
-            if item.purpose == FunctionalLayouts.SECTION_OUTLINE.value:
-                item.indexes.append(section_idx)
-            self.simple_outline += f"Slide {slide_idx + 1}: {item.purpose}\n"
-        logger.debug(f"==========Outline Generated==========\n{self.simple_outline}")
+        if journal_dir is not None:
+            self.journal = Journal(
+                journal_dir,
+                self._journal_key(source_doc, num_slides, outline, dst_language),
+            )
+        try:
+            if semaphore is None and max_at_once:
+                semaphore = asyncio.Semaphore(max_at_once)
+            elif semaphore is None:
+                semaphore = AsyncExitStack()
+            succ_flag = True
+            recorded = self._replay("outline")
+            if outline is not None:
+                self.outline = outline
+            elif recorded is not None:
+                OutlineItem.set_document(source_doc)
+                self.outline = [OutlineItem(**item) for item in recorded["outline"]]
+                self.toc = recorded["toc"]
+            else:
+                if self.stream_outline:
+                    self.outline = await self._stream_outline(
+                        num_slides, source_doc, max_at_once, semaphore
+                    )
+                else:
+                    self.outline = await self.generate_outline(num_slides, source_doc)
+                self._record(
+                    "outline",
+                    {
+                        "outline": [item.model_dump() for item in self.outline],
+                        "toc": self.toc,
+                    },
+                )
+            # only the images referenced by the outline need vision captions,
+            # except those of slides whose editor output has been recorded
+            await source_doc.caption_medias(
+                self.vision_model,
+                paths={
+                    path
+                    for slide_idx, item in enumerate(self.outline)
+                    if self.journal is None
+                    or not self.journal.completed("editor", slide_idx)
+                    for path in item.images
+                },
+                max_at_once=max_at_once,
+            )
+            section_idx = 0
+            pre_section = None
+            for item in self.outline:
+                if item.topic != pre_section and item.topic != "Functional":
+                    section_idx += 1
+                    pre_section = item.topic
+                if item.purpose == FunctionalLayouts.SECTION_OUTLINE.value:
+                    item.indexes.append(section_idx)
+            self.simple_outline = self._simple_outline(self.outline)
+            logger.debug(
+                f"==========Outline Generated==========\n{self.simple_outline}"
+            )
 
-        if max_at_once:
-            semaphore = asyncio.Semaphore(max_at_once)
-        else:
-            semaphore = AsyncExitStack()
+            slide_tasks = []
+            for slide_idx, outline_item in enumerate(self.outline):
+                if self.force_pages and slide_idx == num_slides:
+                    break
+                # the slides of a streamed outline are already being generated
+                task = self._streamed.pop(id(outline_item), None)
+                if task is None:
+                    task = self.generate_slide(slide_idx, outline_item, semaphore)
+                slide_tasks.append(task)
 
-        slide_tasks = []
-        for slide_idx, outline_item in enumerate(self.outline):
-            if self.force_pages and slide_idx == num_slides:
-                break
-            slide_tasks.append(
-                self.generate_slide(slide_idx, outline_item, semaphore=semaphore)
+            slide_results = await asyncio.gather(*slide_tasks, return_exceptions=True)
+            self._cancel_streamed()
+
+            generated_slides = []
+            code_executors = []
+            for result in slide_results:
+                if isinstance(result, Exception):
+                    if self.error_exit:
+                        succ_flag = False
+                        break
+                    continue
+                if result is not None:
+                    slide, code_executor = result
+                    generated_slides.append(slide)
+                    code_executors.append(code_executor)
+
+            history = self._collect_history(
+                sum(code_executors, start=CodeExecutor(self.retry_times))
             )
 
-        slide_results = await asyncio.gather(*slide_tasks, return_exceptions=True)
+            if succ_flag:
+                self.empty_prs.slides = generated_slides
+                prs = self.empty_prs
+            else:
+                prs = None
 
-        generated_slides = []
-        code_executors = []
-        for result in slide_results:
-            if isinstance(result, Exception):
-                if self.error_exit:
-                    succ_flag = False
-                    break
-                continue
-            if result is not None:
-                slide, code_executor = result
-                generated_slides.append(slide)
-                code_executors.append(code_executor)
+            return prs, history
+        finally:
+            self._cancel_streamed()
+            self.empty_prs = None
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
 
-        history = self._collect_history(
-            sum(code_executors, start=CodeExecutor(self.retry_times))
+    def _journal_key(
+        self,
+        source_doc: Document,
+        num_slides: int | None,
+        outline: list[OutlineItem] | None,
+        dst_language: Language | None,
+    ) -> str:
+        """
+        Key the journal by the document, the template and the config affecting the generation.
+        """
+        document = source_doc.model_dump(
+            exclude={
+                "sections": {
+                    "__all__": {"content": {"__all__": {"caption", "provisional"}}}
+                }
+            }
+        )
+        document["metadata"].pop("presentation-date", None)
+        with open(self.presentation.source_file, "rb") as f:
+            template = hashlib.sha1(f.read()).hexdigest()
+        return journal_key(
+            document=document,
+            template=template,
+            layouts={k: v.model_dump() for k, v in self.layouts.items()},
+            num_slides=num_slides,
+            outline=[item.model_dump() for item in outline] if outline else None,
+            models=[self.language_model.model, self.vision_model.model],
+            dst_language=(dst_language or source_doc.language).lid,
+            length_factor=self.length_factor,
+            retry_times=self.retry_times,
+            force_pages=self.force_pages,
+            compact_outline=self.compact_outline,
+            synthesize_edits=self.synthesize_edits,
+            layout_scorer=self.layout_scorer is not None,
+            text_fitter=self.text_fitter is not None,
         )
 
-        if succ_flag:
-            self.empty_prs.slides = generated_slides
-            prs = self.empty_prs
-        else:
-            prs = None
+    def _replay(self, stage: str, slide_idx: int | None = None):
+        """
+        Get the recorded result of a stage, None without a journal or a record.
+        """
+        if self.journal is None:
+            return None
+        return self.journal.get(stage, slide_idx)
 
-        self.empty_prs = deepcopy(self.presentation)
-        return prs, history
+    def _record(self, stage: str, data, slide_idx: int | None = None):
+        """
+        Record the result of a stage in the journal if any.
+        """
+        if self.journal is not None:
+            self.journal.record(stage, data, slide_idx)
 
     async def generate_outline(
         self,
@@ -249,12 +518,117 @@ class PPTGen(ABC):
         )
         _, outline = await self.staffs["planner"](
             num_slides=num_slides,
-            document_overview=source_doc.get_overview(),
-            response_format=Outline.response_model(source_doc),
+            document_overview=source_doc.get_overview(compact=self.compact_outline),
+            response_format=Outline.response_model(
+                source_doc, compact=self.compact_outline
+            ),
         )
+        if self.compact_outline:
+            outline = {"outline": Outline.from_compact(source_doc, outline)}
         outline = [OutlineItem(**o) for o in outline["outline"]]
         return self._add_functional_layouts(outline)
 
+    @tenacity_decorator
+    async def _stream_outline(
+        self,
+        num_slides: int,
+        source_doc: Document,
+        max_at_once: int | None = None,
+        semaphore: AbstractAsyncContextManager | None = None,
+    ) -> list[OutlineItem]:
+        """
+        Stream the outline from the planner, generating the slide of each content item as soon
+        as the item is complete. Its layout selector and editor see the outline streamed so far.
+        The functional slides are left to `generate_pres`, as the table of contents needs the
+        whole outline. A failed attempt cancels its slides before the outline is streamed again.
+        """
+        assert self._initialized, (
+            "AsyncPPTAgent not initialized, call `set_reference` first"
+        )
+        response_format = Outline.response_model(
+            source_doc, compact=self.compact_outline
+        )
+        parser = JsonArrayStream("outline")
+        outline = []
+        try:
+            async for delta in self.staffs["planner"].stream(
+                num_slides=num_slides,
+                document_overview=source_doc.get_overview(compact=self.compact_outline),
+                response_format=response_format,
+            ):
+                for item in parser.feed(delta):
+                    response_format(outline=[item])
+                    if self.compact_outline:
+                        (item,) = Outline.from_compact(source_doc, {"outline": [item]})
+                    outline_item = OutlineItem(**item)
+                    outline.append(outline_item)
+                    self._dispatch_streamed(outline, num_slides, max_at_once, semaphore)
+        except BaseException:
+            self._cancel_streamed()
+            raise
+        return self._add_functional_layouts(outline)
+
+    def _dispatch_streamed(
+        self,
+        outline: list[OutlineItem],
+        num_slides: int,
+        max_at_once: int | None,
+        semaphore: AbstractAsyncContextManager,
+    ):
+        """
+        Start generating the slide of the last streamed item. Functional slides are only
+        inserted before the items they precede, so its index in the full outline is final.
+        """
+        outline_item = outline[-1]
+        full_outline = self._add_functional_layouts(list(outline))
+        slide_idx = next(
+            idx for idx, item in enumerate(full_outline) if item is outline_item
+        )
+        self.simple_outline = self._simple_outline(full_outline)
+        if self.force_pages and num_slides is not None and slide_idx >= num_slides:
+            return
+        self._prepared[id(outline_item)] = asyncio.create_task(
+            self._prepare_slide(outline_item, max_at_once)
+        )
+        self._streamed[id(outline_item)] = asyncio.create_task(
+            self.generate_slide(slide_idx, outline_item, semaphore)
+        )
+
+    def _cancel_streamed(self):
+        for task in [*self._prepared.values(), *self._streamed.values()]:
+            task.cancel()
+        self._prepared.clear()
+        self._streamed.clear()
+
+    @staticmethod
+    def _simple_outline(outline: list[OutlineItem]) -> str:
+        """
+        The outline as the layout selector and the editor are prompted with it.
+        """
+        simple_outline = ""
+        section_idx = 0
+        pre_section = None
+        for slide_idx, item in enumerate(outline):
+            if item.topic != pre_section and item.topic != "Functional":
+                section_idx += 1
+                simple_outline += f"Section {section_idx}: {item.topic}\n"
+                pre_section = item.topic
+            simple_outline += f"Slide {slide_idx + 1}: {item.purpose}\n"
+        return simple_outline
+
+    async def _prepare_slide(
+        self, outline_item: OutlineItem, max_at_once: int | None = None
+    ):
+        """
+        Prepare the slide of an outline item independently of the rest of the outline,
+        by default captioning its images.
+        """
+        await self.source_doc.caption_medias(
+            self.vision_model,
+            paths=set(outline_item.images),
+            max_at_once=max_at_once,
+        )
+
     @abstractmethod
     def generate_slide(
         self, slide_idx: int, outline_item: OutlineItem, semaphore: AsyncExitStack
@@ -350,6 +724,7 @@ class PPTGen(ABC):
         """
         history = {
             "agents": {},
+            "usage": {},
             "command_history": code_executor.command_history,
             "code_history": code_executor.code_history,
             "api_history": code_executor.api_history,
@@ -357,7 +732,39 @@ class PPTGen(ABC):
 
         for role_name, role in self.staffs.items():
             history["agents"][role_name] = role.history
-            role._history = []
+            history["usage"][role_name] = role.usage.to_dict()
+            if role.usage.requests:
+                logger.info(
+                    "Role %s: %d requests, cached prompt tokens %d/%d (%.1f%%)",
+                    role_name,
+                    role.usage.requests,
+                    role.usage.cached_tokens,
+                    role.usage.prompt_tokens,
+                    role.usage.cached_ratio * 100,
+                )
+            role.reset()
+
+        history["edit_stats"] = dict(self.edit_stats)
+        self.edit_stats.update(dict.fromkeys(self.edit_stats, 0))
+        history["fit_stats"] = dict(self.fit_stats)
+        self.fit_stats.update(dict.fromkeys(self.fit_stats, 0))
+
+        if self.layout_scorer is not None:
+            stats = self.layout_stats
+            history["layout_scorer"] = dict(stats)
+            logger.info(
+                "Layout scorer: skipped %d layout selections, agreed with %d/%d of the others",
+                stats["speculated"],
+                stats["agreed"],
+                stats["selected"],
+            )
+            stats.update(dict.fromkeys(stats, 0))
+
+        if self.journal is not None:
+            history["journal"] = {
+                "path": self.journal.path,
+                "replayed": self.journal.replayed,
+            }
 
         return history
 
@@ -395,8 +802,13 @@ class PPTAgent(PPTGen):
         """
         Asynchronously generate a slide from the outline item.
         """
+        HISTORY_SCOPE.set(slide_idx)
         async with semaphore:
-            if outline_item.topic == "Functional":
+            recorded = self._replay("layout", slide_idx)
+            if recorded is not None:
+                layout = self.layouts[recorded["layout"]]
+                header, slide_content = recorded["header"], recorded["slide_content"]
+            elif outline_item.topic == "Functional":
                 layout = self.layouts[outline_item.purpose]
                 slide_desc = FunctionalContent[outline_item.purpose]
                 if outline_item.purpose == FunctionalLayouts.SECTION_OUTLINE.value:
@@ -420,15 +832,46 @@ class PPTAgent(PPTGen):
                 layout, header, slide_content = await self._select_layout(
                     slide_idx, outline_item
                 )
+            if recorded is None:
+                self._record(
+                    "layout",
+                    {
+                        "layout": next(
+                            k for k, v in self.layouts.items() if v is layout
+                        ),
+                        "header": header,
+                        "slide_content": slide_content,
+                    },
+                    slide_idx,
+                )
             try:
-                command_list, template_id = await self._generate_content(
-                    layout, slide_content, header
+                recorded = self._replay("editor", slide_idx)
+                if recorded is not None:
+                    editor_output = EditorOutput(**recorded)
+                else:
+                    editor_output = await self._generate_content(
+                        layout, slide_content, header
+                    )
+                    self._record("editor", editor_output.model_dump(), slide_idx)
+                command_list, template_id = self._generate_commands(
+                    editor_output, layout
                 )
-                slide, code_executor = await self._edit_slide(command_list, template_id)
+                result = None
+                recorded = self._replay("actions", slide_idx)
+                if recorded is not None:
+                    result = self._execute_edit(recorded, command_list, template_id)
+                if result is None:
+                    result = await self._edit_slide(command_list, template_id)
+                    if result[1].api_history:
+                        actions = result[1].api_history[-1][2]
+                        self._record("actions", actions, slide_idx)
+                slide, code_executor = result
             except Exception as e:
                 logger.error(f"Failed to generate slide {slide_idx}, error: {e}")
                 traceback.print_exc()
+                self._record("validation", {"valid": False, "error": str(e)}, slide_idx)
                 raise e
+            self._record("validation", {"valid": True}, slide_idx)
             return slide, code_executor
 
     @tenacity_decorator
@@ -438,42 +881,84 @@ class PPTAgent(PPTGen):
         """
         Asynchronously select a layout for the slide.
         """
-        header, content_source, images = outline_item.retrieve(
-            slide_idx, self.source_doc
-        )
-        if len(content_source) == 0:
-            key_points = []
+        header, _, images = outline_item.retrieve(slide_idx, self.source_doc)
+        prepared = self._prepared.pop(id(outline_item), None)
+        if prepared is not None:
+            key_points = await prepared
         else:
-            _, key_points = await self.staffs["content_organizer"](
-                content_source=content_source
-            )
+            key_points = await self._organize_content(outline_item)
         slide_content = json.dumps(key_points, indent=2, ensure_ascii=False)
         layouts = self.text_layouts
         if len(images) > 0:
             slide_content += "\nImages:\n" + "\n".join(images)
             layouts = self.multimodal_layouts
 
-        shuffle(layouts)
-        _, layout_selection = await self.staffs["layout_selector"](
-            outline=self.simple_outline,
-            slide_description=header,
-            slide_content=slide_content,
-            available_layouts=layouts,
-            response_format=LayoutChoice.response_model(layouts),
-        )
-        layout = layout_selection["layout"]
+        layout, speculation = None, None
+        if self.layout_scorer is not None:
+            slide_profile = self.layout_scorer.profile_slide(
+                outline_item.purpose,
+                key_points,
+                [
+                    self.source_doc.find_media(path=path).size
+                    for path in outline_item.images
+                ],
+            )
+            speculation, confidence = self.layout_scorer.select(slide_profile, layouts)
+            if confidence >= self.layout_scorer.threshold:
+                self.layout_scorer.stats["speculated"] += 1
+                self.layout_stats["speculated"] += 1
+                layout = speculation
+
+        if layout is None:
+            _, layout_selection = await self.staffs["layout_selector"](
+                outline=self.simple_outline,
+                slide_description=header,
+                slide_content=slide_content,
+                available_layouts=layouts,
+                response_format=LayoutChoice.response_model(layouts),
+            )
+            layout = layout_selection["layout"]
+            if self.layout_scorer is not None:
+                self.layout_scorer.record(
+                    slide_profile, layouts, layout, speculation, self.layout_stats
+                )
         if "image" not in layout and len(images) > 0:
             slide_content = slide_content[: slide_content.rfind("\nImages:\n")]
         return self.layouts[layout], header, slide_content
 
+    async def _prepare_slide(
+        self, outline_item: OutlineItem, max_at_once: int | None = None
+    ) -> list:
+        """
+        Caption the images and organize the content of a streamed outline item,
+        returning the key points for `_select_layout`.
+        """
+        _, key_points = await asyncio.gather(
+            super()._prepare_slide(outline_item, max_at_once),
+            self._organize_content(outline_item),
+        )
+        return key_points
+
+    async def _organize_content(self, outline_item: OutlineItem) -> list:
+        """
+        Asynchronously extract the key points of the content of the outline item.
+        """
+        _, content_source, _ = outline_item.retrieve(0, self.source_doc)
+        if len(content_source) == 0:
+            return []
+        _, key_points = await self.staffs["content_organizer"](
+            content_source=content_source
+        )
+        return key_points
+
     async def _generate_content(
         self,
         layout: Layout,
         slide_content: str,
         slide_description: str,
-    ) -> tuple[list, int]:
+    ) -> EditorOutput:
         """
-        Asynchronously generate content for the slide.
+        Asynchronously generate the validated content for the slide.
         """
         elements = [el.name for el in layout.elements]
         turn_id, editor_output = await self.staffs["editor"](
@@ -486,16 +971,20 @@ class PPTAgent(PPTGen):
             response_format=EditorOutput.response_model(elements),
         )
         editor_output = EditorOutput(**editor_output)
-        await self._validate_content(editor_output, layout, turn_id)
-        command_list, template_id = self._generate_commands(editor_output, layout)
-        return command_list, template_id
+        return await self._validate_content(editor_output, layout, turn_id)
 
     async def _edit_slide(
         self, command_list: list, template_id: int
     ) -> tuple[SlidePage, CodeExecutor]:
         """
-        Asynchronously edit the slide.
+        Asynchronously edit the slide, with the coder unless the edit can be synthesized.
         """
+        if self.synthesize_edits:
+            synthesized = self._synthesize_edit(command_list, template_id)
+            if synthesized is not None:
+                self.edit_stats["synthesized"] += 1
+                return synthesized
+        self.edit_stats["coder"] += 1
         code_executor = CodeExecutor(self.retry_times)
         code_executor.command_history.append(command_list)
         turn_id, edit_actions = await self.staffs["coder"](
@@ -525,14 +1014,62 @@ class PPTAgent(PPTGen):
             edit_actions = await self.staffs["coder"].retry(
                 feedback[0], feedback[1], turn_id, error_idx + 1
             )
+        self._fit_slide(edit_slide)
+        self.empty_prs.validate(edit_slide)
+        return edit_slide, code_executor
+
+    def _fit_slide(self, edit_slide: SlidePage):
+        """
+        Step down the font size of the edited shapes that overflow.
+        """
+        if self.text_fitter is not None:
+            self.fit_stats["scaled"] += self.text_fitter.fit_slide(edit_slide)
+
+    def _synthesize_edit(
+        self, command_list: list, template_id: int
+    ) -> tuple[SlidePage, CodeExecutor] | None:
+        """
+        Edit the slide with API calls synthesized from the command list,
+        returns None if they cannot be synthesized or fail to execute.
+        """
+        try:
+            edit_actions = synthesize_actions(
+                self.presentation.slides[template_id - 1], command_list
+            )
+        except SlideEditError as e:
+            logger.debug("Edit of slide %d left to the coder: %s", template_id, e)
+            return None
+        return self._execute_edit(edit_actions, command_list, template_id)
+
+    def _execute_edit(
+        self, edit_actions: str, command_list: list, template_id: int
+    ) -> tuple[SlidePage, CodeExecutor] | None:
+        """
+        Edit a copy of the template slide with known-good actions, synthesized or replayed,
+        returns None if they fail to execute.
+        """
+        code_executor = CodeExecutor(self.retry_times)
+        code_executor.command_history.append(command_list)
+        edit_slide: SlidePage = deepcopy(self.presentation.slides[template_id - 1])
+        feedback = code_executor.execute_actions(
+            edit_actions, edit_slide, self.source_doc, found_code=True
+        )
+        if feedback is not None:
+            logger.debug(
+                "Edit of slide %d failed, left to the coder: %s",
+                template_id,
+                feedback[1],
+            )
+            return None
+        self._fit_slide(edit_slide)
         self.empty_prs.validate(edit_slide)
         return edit_slide, code_executor
 
     async def _validate_content(
         self, editor_output: EditorOutput, layout: Layout, turn_id: int, retry: int = 0
-    ):
+    ) -> EditorOutput:
         """
-        Asynchronously generate commands for editing the slide content.
+        Asynchronously validate the editor output and fit its length to the layout.
 
         Args:
             editor_output (dict): The editor output.
@@ -541,7 +1078,7 @@ class PPTAgent(PPTGen):
             retry (int, optional): The number of retries. Defaults to 0.
 
         Returns:
-            list: A list of commands.
+            EditorOutput: The validated editor output, retried by the editor if invalid.
 
         Raises:
             Exception: If command generation fails.
@@ -550,9 +1087,20 @@ class PPTAgent(PPTGen):
             allowed_images = [m.path for m in self.source_doc.iter_medias()]
             layout.validate(editor_output, allowed_images)
             if self.length_factor is not None:
+                fit_results = None
+                if self.text_fitter is not None:
+                    fit_results = self.text_fitter.fit_layout(
+                        layout, editor_output, self.presentation.slides
+                    )
+                    for fit in fit_results.values():
+                        self.fit_stats["fitted" if fit.fits else "overflowed"] += 1
                 await layout.length_rewrite(
-                    editor_output, self.length_factor, self.language_model
+                    editor_output,
+                    self.length_factor,
+                    self.language_model,
+                    fit_results,
                 )
+            return editor_output
         except Exception as e:
             if retry < self.retry_times:
                 new_output = await self.staffs["editor"].retry(
@@ -20,6 +20,7 @@ from .shapes import (
     TextFrame,
     UnsupportedShape,
 )
+from .text_fit import FitResult, TextFitter
 
 __all__ = [
     "Presentation",
@@ -30,6 +31,7 @@ __all__ = [
     "ClosureType",
     "Element",
     "Fill",
+    "FitResult",
     "Font",
     "FreeShape",
     "GroupShape",
@@ -42,6 +44,7 @@ __all__ = [
     "ShapeElement",
     "StyleArg",
     "TextBox",
+    "TextFitter",
     "TextFrame",
     "UnsupportedShape",
 ]
@@ -103,28 +103,42 @@ class Layout(BaseModel):
         editor_output: EditorOutput,
         length_factor: float,
         language_model: AsyncLLM,
+        fit_results: dict | None = None,
     ):
+        """
+        Rewrite the text elements too long for the layout with the language model.
+        An element with a fit result from `TextFitter.fit_layout` is rewritten only if it overflows,
+        the others if they exceed their suggested characters.
+        """
+        fit_results = fit_results or {}
         async with asyncio.TaskGroup() as tg:
             tasks = []
             for el in editor_output.elements:
                 if self[el.name].type != "text":
                     continue
                 charater_counts = max([len(i) for i in el.data])
-                expected_length = ceil(
-                    self[el.name].suggested_characters * length_factor
-                )
-                if charater_counts - expected_length > 5:
-                    task = tg.create_task(
-                        language_model(
-                            LENGTHY_REWRITE_PROMPT.render(
-                                el_name=el.name,
-                                content=el.data,
-                                suggested_characters=f"{self[el.name].suggested_characters} characters",
-                            ),
-                            return_json=True,
-                        )
+                suggested_characters = self[el.name].suggested_characters
+                fit = fit_results.get(el.name)
+                if fit is not None:
+                    if fit.fits:
+                        continue
+                    # the longest item shortened as much as the element overflows
+                    suggested_characters = max(int(charater_counts / fit.overflow), 1)
+                else:
+                    expected_length = ceil(suggested_characters * length_factor)
+                    if charater_counts - expected_length <= 5:
+                        continue
+                task = tg.create_task(
+                    language_model(
+                        LENGTHY_REWRITE_PROMPT.render(
+                            el_name=el.name,
+                            content=el.data,
+                            suggested_characters=f"{suggested_characters} characters",
+                        ),
+                        return_json=True,
                     )
-                    tasks.append([el.name, task])
+                )
+                tasks.append([el.name, task])
 
             for el_name, task in tasks:
                 editor_output[el_name].data = await task
@@ -5,12 +5,14 @@ from dataclasses import dataclass
 from functools import partial
 from typing import Literal
 
+import numpy as np
 from pptagent_pptx import Presentation as load_prs
 from pptagent_pptx.enum.shapes import MSO_SHAPE_TYPE
 from pptagent_pptx.shapes.base import BaseShape
 from pptagent_pptx.shapes.group import GroupShape as PPTXGroupShape
 from pptagent_pptx.slide import Slide as PPTXSlide
 
+from pptagent import tracing
 from pptagent.utils import Config, get_logger, package_join
 
 from .shapes import (
@@ -190,6 +192,42 @@ class SlidePage:
             return "text"
         return "image"
 
+    def layout_signature(self, grid: int = 12) -> np.ndarray:
+        """
+        Get the layout of the slide as the coverage of a `grid` x `grid` grid by the bounding boxes
+        of its pictures, of its text and of its other shapes, flattened to a vector of unit norm.
+
+        Args:
+            grid (int): The number of cells per side of the grid.
+
+        Returns:
+            np.ndarray: The layout signature.
+        """
+        signature = np.zeros((3, grid, grid), dtype=np.float32)
+        width, height = self.slide_width, self.slide_height
+        cells = np.linspace(0, 1, grid + 1)
+        for shape in self:
+            if isinstance(shape, Picture):
+                channel = 0
+            elif shape.text_frame.is_textframe:
+                channel = 1
+            else:
+                channel = 2
+            # the overlap of the shape with each row and column, as a fraction of the cell
+            left, right = np.clip(
+                [shape.left / width, (shape.left + shape.width) / width], 0, 1
+            )
+            top, bottom = np.clip(
+                [shape.top / height, (shape.top + shape.height) / height], 0, 1
+            )
+            cols = np.minimum(cells[1:], right) - np.maximum(cells[:-1], left)
+            rows = np.minimum(cells[1:], bottom) - np.maximum(cells[:-1], top)
+            cols, rows = np.clip(cols, 0, None), np.clip(rows, 0, None)
+            signature[channel] += np.outer(rows, cols) * grid * grid
+        signature = signature.flatten()
+        norm = np.linalg.norm(signature)
+        return signature / norm if norm > 0 else signature
+
     def to_html(self, style_args: StyleArg | None = None, **kwargs) -> str:
         """
         Represent the slide page in HTML.
@@ -283,6 +321,7 @@ class Presentation:
         self.prs.core_properties.last_modified_by = "PPTAgent"
 
     @classmethod
+    @tracing.traced("parse.presentation")
     def from_file(
         cls,
         file_path: str,
@@ -12,6 +12,7 @@ from pptagent_pptx.dml.fill import FillFormat
 from pptagent_pptx.dml.line import LineFormat
 from pptagent_pptx.enum.dml import MSO_FILL_TYPE
 from pptagent_pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptagent_pptx.oxml import parse_xml
 from pptagent_pptx.oxml.shapes import ShapeElement as PPTXShapeElement
 from pptagent_pptx.oxml.shapes.connector import CT_Connector
 from pptagent_pptx.parts.slide import SlidePart
@@ -607,8 +608,15 @@ class ShapeElement:
     def __getstate__(self) -> object:
         state = self.__dict__.copy()
         state["shape"] = None
+        # lxml elements are not picklable, e.g. for building slides in a worker process
+        state["sp"] = etree.tostring(self.sp)
         return state
 
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if isinstance(self.sp, bytes):
+            self.sp = parse_xml(self.sp)
+
     def __repr__(self) -> str:
         """
         Get a string representation of the shape element.
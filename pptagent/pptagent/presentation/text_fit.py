@@ -0,0 +1,672 @@
+import os
+import re
+import sys
+import unicodedata
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from glob import glob
+
+from fontTools.ttLib import TTFont, TTLibError
+from lxml import etree
+from pptagent_pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptagent_pptx.oxml.ns import qn
+from pptagent_pptx.shapes.base import BaseShape
+from pptagent_pptx.util import Pt
+
+from pptagent.presentation.layout import Layout
+from pptagent.presentation.presentation import Presentation, SlidePage
+from pptagent.presentation.shapes import (
+    Closure,
+    ClosureType,
+    ShapeElement,
+)
+from pptagent.response import EditorOutput
+from pptagent.utils import get_logger
+
+logger = get_logger(__name__)
+
+EMU_PER_PT = 12700
+DEFAULT_FONT_SIZE = 18.0
+# used for the characters a font has no glyph for, and when no font is found at all
+FALLBACK_ADVANCE = 0.55
+FALLBACK_LINE_HEIGHT = 1.2
+FALLBACK_FONTS = (
+    "Arial",
+    "Liberation Sans",
+    "Helvetica",
+    "DejaVu Sans",
+    "Microsoft YaHei",
+    "PingFang SC",
+    "Noto Sans CJK SC",
+)
+TITLE_PLACEHOLDERS = {"title", "ctrTitle"}
+AUTOFIT = {"normAutofit": "shrink", "spAutoFit": "resize", "noAutofit": "none"}
+WIDE_CHARS = "\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef"
+TOKEN_REGEX = re.compile(rf"\s+|[{WIDE_CHARS}]|[^\s{WIDE_CHARS}]+")
+MARKDOWN_REGEX = re.compile(r"\*\*|__|`|^#+\s+|^[-*+]\s+", re.MULTILINE)
+SENTENCE_END = ".!?;:。！？；："
+
+
+def font_dirs() -> list[str]:
+    """
+    The directories searched for fonts: `PPTAGENT_FONT_DIRS` (separated by `os.pathsep`)
+    followed by the system font directories.
+    """
+    dirs = [d for d in os.getenv("PPTAGENT_FONT_DIRS", "").split(os.pathsep) if d]
+    if sys.platform == "win32":
+        dirs.append(os.path.join(os.getenv("WINDIR", "C:\\Windows"), "Fonts"))
+    elif sys.platform == "darwin":
+        dirs += ["/System/Library/Fonts", "/Library/Fonts", "~/Library/Fonts"]
+    else:
+        dirs += ["/usr/share/fonts", "/usr/local/share/fonts", "~/.fonts"]
+    return [os.path.expanduser(d) for d in dirs]
+
+
+@lru_cache
+def index_fonts(dirs: tuple[str, ...]) -> dict[str, dict[tuple[bool, bool], str]]:
+    """
+    Index the fonts of the directories by lowercased family name, then by (bold, italic).
+    """
+    index = {}
+    for font_dir in dirs:
+        for path in sorted(glob(os.path.join(font_dir, "**", "*"), recursive=True)):
+            if not path.lower().endswith((".ttf", ".otf", ".ttc")):
+                continue
+            try:
+                font = TTFont(path, lazy=True, fontNumber=0)
+                family = font["name"].getBestFamilyName()
+                subfamily = (font["name"].getBestSubFamilyName() or "").lower()
+            except (TTLibError, OSError, KeyError, ValueError) as e:
+                logger.debug("Skipping font %s: %s", path, e)
+                continue
+            if not family:
+                continue
+            style = (
+                "bold" in subfamily,
+                "italic" in subfamily or "oblique" in subfamily,
+            )
+            index.setdefault(family.lower(), {}).setdefault(style, path)
+    return index
+
+
+@dataclass
+class FontMetrics:
+    """
+    The horizontal advances of the characters of a font and its line height, in em.
+    """
+
+    advances: dict[int, float]
+    line_height: float
+
+    @classmethod
+    @lru_cache
+    def from_file(cls, path: str) -> "FontMetrics":
+        font = TTFont(path, lazy=True, fontNumber=0)
+        units = font["head"].unitsPerEm
+        hmtx = font["hmtx"].metrics
+        advances = {
+            code: hmtx[glyph][0] / units
+            for code, glyph in font.getBestCmap().items()
+            if glyph in hmtx
+        }
+        os2 = font.get("OS/2")
+        if os2 is not None and os2.usWinAscent:
+            line_height = (os2.usWinAscent + os2.usWinDescent) / units
+        else:
+            hhea = font["hhea"]
+            line_height = (hhea.ascent - hhea.descent + hhea.lineGap) / units
+        return cls(advances, line_height)
+
+    def width(self, text: str, size: float) -> float:
+        return size * sum(self.advance(char) for char in text)
+
+    def advance(self, char: str) -> float:
+        advance = self.advances.get(ord(char))
+        if advance is not None:
+            return advance
+        return 1.0 if unicodedata.east_asian_width(char) in "WF" else FALLBACK_ADVANCE
+
+
+FALLBACK_METRICS = FontMetrics({}, FALLBACK_LINE_HEIGHT)
+
+
+@dataclass
+class ParagraphStyle:
+    """
+    The resolved style of a paragraph, sizes in points, line spacing as a multiple of the font line height.
+    """
+
+    size: float = DEFAULT_FONT_SIZE
+    font: str | None = None
+    bold: bool = False
+    italic: bool = False
+    line_spacing: float = 1.0
+    line_spacing_pts: float | None = None
+    space_before: float = 0.0
+    space_after: float = 0.0
+    margin_left: float = 0.0
+
+
+@dataclass
+class TextArea:
+    """
+    The text area of a shape: its size without insets in points, autofit and wrapping,
+    and the style of each of its paragraphs, indexed by `Paragraph.real_idx`.
+    The height is at least the measured height of the template text, which fits by design.
+    """
+
+    width: float
+    height: float
+    max_height: float
+    autofit: str = "none"
+    wrap: bool = True
+    font_scale: float = 1.0
+    spacing_reduction: float = 0.0
+    styles: list[ParagraphStyle] = field(default_factory=list)
+
+    @property
+    def available_height(self) -> float:
+        return self.max_height if self.autofit == "resize" else self.height
+
+    def style(self, real_idx: int) -> ParagraphStyle:
+        if not self.styles:
+            return ParagraphStyle()
+        return self.styles[min(real_idx, len(self.styles) - 1)]
+
+
+@dataclass
+class FitResult:
+    """
+    Whether an element fits its shapes, with the font scale and the (possibly merged) data it fits
+    with, and the ratio of the height the data needs to the available height, at the template font size.
+    """
+
+    fits: bool
+    data: list[str]
+    scale: float = 1.0
+    overflow: float = 1.0
+
+
+def _pct(el: etree._Element | None, default: float) -> float:
+    return int(el.get("val")) / 100000 if el is not None else default
+
+
+def _spacing(el: etree._Element | None, size: float) -> float | None:
+    """
+    Convert a spcBef/spcAft element to points.
+    """
+    if el is None:
+        return None
+    pts = el.find(qn("a:spcPts"))
+    if pts is not None:
+        return int(pts.get("val")) / 100
+    return _pct(el.find(qn("a:spcPct")), 0.0) * size * FALLBACK_LINE_HEIGHT
+
+
+def _first(elements: Iterable[etree._Element | None], path: str, attr: str | None):
+    for el in elements:
+        if el is None:
+            continue
+        found = el if path == "." else el.find(path)
+        if found is None:
+            continue
+        if attr is None:
+            return found
+        if found.get(attr) is not None:
+            return found.get(attr)
+    return None
+
+
+def merge_bullets(data: list[str]) -> list[str]:
+    """
+    Merge the shortest pair of adjacent items.
+    """
+    idx = min(range(len(data) - 1), key=lambda i: len(data[i]) + len(data[i + 1]))
+    first, second = data[idx].rstrip(), data[idx + 1].strip()
+    wide = bool(first) and unicodedata.east_asian_width(first[-1]) in "WF"
+    if first[-1:] in SENTENCE_END:
+        separator = "" if wide else " "
+    else:
+        separator = "；" if wide else "; "
+    return data[:idx] + [first + separator + second] + data[idx + 2 :]
+
+
+def scale_fonts(sizes: list[float], scale: float, shape: BaseShape):
+    """
+    Set the font size of the runs of a built shape, the closure of a fitted shape.
+    """
+    for idx, para in enumerate(shape.text_frame.paragraphs):
+        size = Pt(round(sizes[min(idx, len(sizes) - 1)] * scale, 1))
+        para.font.size = size
+        for run in para.runs:
+            run.font.size = size
+
+
+@dataclass
+class TextFitter:
+    """
+    Fit text into the shapes of a template with font metrics, rather than character counts.
+
+    The shapes are measured with the fonts of `font_dirs`, sizes, spacing, insets and autofit resolved
+    through the placeholders, the slide master and the theme of the template.
+    An overflowing element is first fitted by stepping down its font size by `step` points, no lower
+    than `min_scale` of its template size nor the smallest font size of the template,
+    then by merging its bullets while it has more items than the template.
+    """
+
+    font_dirs: list[str] = field(default_factory=font_dirs)
+    fallback_fonts: tuple[str, ...] = FALLBACK_FONTS
+    min_scale: float = 0.75
+    step: float = 1.0
+    tolerance: float = 0.02
+
+    def __post_init__(self):
+        self.areas: dict[tuple[int, int], TextArea] = {}
+        self.min_size = 0.0
+
+    @property
+    def fonts(self) -> dict[str, dict[tuple[bool, bool], str]]:
+        return index_fonts(tuple(self.font_dirs))
+
+    def metrics(self, style: ParagraphStyle) -> FontMetrics:
+        for name in (style.font, *self.fallback_fonts):
+            variants = self.fonts.get((name or "").lower())
+            if not variants:
+                continue
+            path = variants.get((style.bold, style.italic)) or variants.get(
+                (False, False), next(iter(variants.values()))
+            )
+            return FontMetrics.from_file(path)
+        if self.fonts:
+            return FontMetrics.from_file(next(iter(self.fonts.values()))[False, False])
+        return FALLBACK_METRICS
+
+    def profile(self, presentation: Presentation):
+        """
+        Resolve the text areas of every text shape of a presentation, once per `set_reference`.
+        """
+        self.areas = {}
+        sizes = []
+        default_style = presentation.prs.part._element.find(qn("p:defaultTextStyle"))
+        for slide in presentation.slides:
+            layout = (presentation.layout_mapping or {}).get(slide.slide_layout_name)
+            for shape in slide:
+                if not shape.text_frame.is_textframe:
+                    continue
+                area = self._resolve_area(shape, slide, layout, default_style)
+                template_height, _ = self.measure(
+                    area,
+                    [
+                        (para.text, para.real_idx)
+                        for para in shape.text_frame.paragraphs
+                        if para.idx != -1
+                    ],
+                )
+                area.height = max(area.height, template_height)
+                area.max_height = max(area.max_height, template_height)
+                self.areas[slide.slide_idx, shape.shape_idx] = area
+                sizes.extend(style.size for style in area.styles)
+        self.min_size = min(sizes, default=0.0)
+
+    def _resolve_area(
+        self, shape: ShapeElement, slide: SlidePage, layout, default_style
+    ) -> TextArea:
+        ph = shape.sp.find(f".//{qn('p:nvPr')}/{qn('p:ph')}")
+        # the layout and master placeholders the shape inherits from
+        bases = []
+        if ph is not None and layout is not None:
+            base = layout.placeholders.get(int(ph.get("idx", 0)))
+            while base is not None:
+                bases.append(base._element)
+                base = getattr(base, "_base_placeholder", None)
+        master = layout.slide_master if layout is not None else None
+        tx_styles = master._element.find(qn("p:txStyles")) if master else None
+        if ph is None:
+            master_style = default_style
+        elif tx_styles is not None:
+            style_name = (
+                "titleStyle" if ph.get("type") in TITLE_PLACEHOLDERS else "bodyStyle"
+            )
+            master_style = tx_styles.find(qn(f"p:{style_name}"))
+        else:
+            master_style = None
+
+        body_prs = [
+            sp.find(f"{qn('p:txBody')}/{qn('a:bodyPr')}") for sp in [shape.sp, *bases]
+        ]
+        autofit = next(
+            (
+                child
+                for body_pr in body_prs
+                if body_pr is not None
+                for child in body_pr
+                if etree.QName(child).localname in AUTOFIT
+            ),
+            None,
+        )
+        if autofit is not None:
+            autofit_name = AUTOFIT[etree.QName(autofit).localname]
+        else:
+            autofit_name = "none"
+
+        def inset(attr: str, default: int) -> float:
+            return int(_first(body_prs, ".", attr) or default) / EMU_PER_PT
+
+        horizontal = inset("lIns", 91440) + inset("rIns", 91440)
+        vertical = inset("tIns", 45720) + inset("bIns", 45720)
+        height = max(shape.height - vertical, 1.0)
+        area = TextArea(
+            width=max(shape.width - horizontal, 1.0),
+            height=height,
+            # a shape resized to fit its text can grow to the bottom of the slide
+            max_height=max(slide.slide_height - shape.top - vertical, height),
+            autofit=autofit_name,
+            wrap=_first(body_prs, ".", "wrap") != "none",
+        )
+        if autofit_name == "shrink":
+            area.font_scale = int(autofit.get("fontScale", 100000)) / 100000
+            area.spacing_reduction = int(autofit.get("lnSpcReduction", 0)) / 100000
+        theme_fonts = self._theme_fonts(master)
+        list_styles = [
+            sp.find(f"{qn('p:txBody')}/{qn('a:lstStyle')}") for sp in [shape.sp, *bases]
+        ] + [master_style]
+        for para in shape.sp.iterfind(f"{qn('p:txBody')}/{qn('a:p')}"):
+            area.styles.append(self._resolve_style(para, list_styles, theme_fonts))
+        return area
+
+    def _resolve_style(
+        self,
+        para: etree._Element,
+        list_styles: list[etree._Element | None],
+        theme_fonts: dict[str, str],
+    ) -> ParagraphStyle:
+        ppr = para.find(qn("a:pPr"))
+        level = int(ppr.get("lvl", 0)) if ppr is not None else 0
+        levels = [ppr] + [
+            style.find(qn(f"a:lvl{level + 1}pPr")) if style is not None else None
+            for style in list_styles
+        ]
+        run_props = [
+            para.find(f"{qn('a:r')}/{qn('a:rPr')}"),
+            ppr.find(qn("a:defRPr")) if ppr is not None else None,
+        ] + [lvl.find(qn("a:defRPr")) if lvl is not None else None for lvl in levels]
+
+        size = _first(run_props, ".", "sz")
+        size = int(size) / 100 if size is not None else DEFAULT_FONT_SIZE
+        font = _first(run_props, qn("a:latin"), "typeface")
+        if font is not None and font.startswith("+"):
+            font = theme_fonts.get(font[1:3])
+        style = ParagraphStyle(
+            size=size,
+            font=font,
+            bold=_first(run_props, ".", "b") in ("1", "true"),
+            italic=_first(run_props, ".", "i") in ("1", "true"),
+            margin_left=int(_first(levels, ".", "marL") or 0) / EMU_PER_PT,
+        )
+        line_spacing = _first(levels, qn("a:lnSpc"), None)
+        if line_spacing is not None and line_spacing.find(qn("a:spcPts")) is not None:
+            style.line_spacing_pts = _spacing(line_spacing, size)
+        else:
+            style.line_spacing = _pct(
+                line_spacing.find(qn("a:spcPct")) if line_spacing is not None else None,
+                1.0,
+            )
+        style.space_before = _spacing(_first(levels, qn("a:spcBef"), None), size) or 0
+        style.space_after = _spacing(_first(levels, qn("a:spcAft"), None), size) or 0
+        return style
+
+    @staticmethod
+    def _theme_fonts(master) -> dict[str, str]:
+        if master is None:
+            return {}
+        try:
+            theme = etree.fromstring(master.part.part_related_by(RT.THEME).blob)
+        except KeyError:
+            return {}
+        fonts = {}
+        for key, tag in (("mj", "a:majorFont"), ("mn", "a:minorFont")):
+            latin = theme.find(f".//{qn(tag)}/{qn('a:latin')}")
+            if latin is not None:
+                fonts[key] = latin.get("typeface")
+        return fonts
+
+    def count_lines(self, text: str, width: float, style: ParagraphStyle, size: float):
+        metrics = self.metrics(style)
+        lines, line = 0, 0.0
+        for text_line in MARKDOWN_REGEX.sub("", text).split("\n"):
+            lines, line = lines + 1, 0.0
+            for token in TOKEN_REGEX.findall(text_line):
+                token_width = metrics.width(token, size)
+                if token.isspace() or line + token_width <= width:
+                    line += token_width
+                    continue
+                if line > 0:
+                    lines, line = lines + 1, 0.0
+                if token_width <= width:
+                    line = token_width
+                    continue
+                # break the words longer than a line
+                for char in token:
+                    char_width = metrics.width(char, size)
+                    if line + char_width > width and line > 0:
+                        lines, line = lines + 1, 0.0
+                    line += char_width
+        return lines
+
+    def measure(
+        self, area: TextArea, paragraphs: list[tuple[str, int]], scale: float = 1.0
+    ) -> tuple[float, bool]:
+        """
+        Measure the height of paragraphs of (text, `real_idx` of their style) in a text area.
+
+        Returns:
+            tuple[float, bool]: The height in points, and whether every line fits the width of the area.
+        """
+        height, fits_width = 0.0, True
+        for text, real_idx in paragraphs:
+            style = area.style(real_idx)
+            size = style.size * area.font_scale * scale
+            metrics = self.metrics(style)
+            width = area.width - style.margin_left
+            if area.wrap:
+                lines = self.count_lines(text, width, style, size)
+            else:
+                lines = text.count("\n") + 1
+                fits_width &= all(
+                    metrics.width(line, size) <= width for line in text.split("\n")
+                )
+            if style.line_spacing_pts is not None:
+                line_height = style.line_spacing_pts
+            else:
+                line_height = style.line_spacing * metrics.line_height * size
+            line_height *= 1 - area.spacing_reduction
+            height += lines * line_height + style.space_before + style.space_after
+        return height, fits_width
+
+    def fit_paragraphs(
+        self, area: TextArea, paragraphs: list[tuple[str, int]]
+    ) -> tuple[bool, float, float]:
+        """
+        Fit paragraphs into a text area, stepping down the font size if they overflow.
+
+        Returns:
+            tuple[bool, float, float]: Whether they fit, the font scale and the overflow at the template size.
+        """
+        available = area.available_height * (1 + self.tolerance)
+        height, fits_width = self.measure(area, paragraphs)
+        overflow = height / area.available_height
+        if height <= available and fits_width:
+            return True, 1.0, overflow
+        base = max(area.style(idx).size for _, idx in paragraphs)
+        lower = max(base * self.min_scale, self.min_size)
+        size = base - self.step
+        while size >= lower:
+            height, fits_width = self.measure(area, paragraphs, size / base)
+            if height <= available and fits_width:
+                return True, size / base, overflow
+            size -= self.step
+        return False, 1.0, overflow
+
+    def place(
+        self, slide: SlidePage, old_content: list[str], new_content: list[str]
+    ) -> list[tuple[ShapeElement, list[tuple[str, int]]]] | None:
+        """
+        Place the new content of an element in the shapes of its old content, the way the
+        synthesized edit would: extra items are cloned after the last paragraph of the element.
+
+        Returns:
+            The shapes with their paragraphs (text, `real_idx` of their style), or None if the
+            old content cannot be located.
+        """
+        paragraphs = [
+            (shape, para)
+            for shape in slide
+            if shape.text_frame.is_textframe
+            for para in shape.text_frame.paragraphs
+            if para.idx != -1
+        ]
+        targets, used = [], set()
+        for old in old_content:
+            candidate = next(
+                (
+                    (shape, para)
+                    for shape, para in paragraphs
+                    if id(para) not in used
+                    and " ".join(para.text.split()) == " ".join(old.split())
+                ),
+                None,
+            )
+            if candidate is None:
+                return None
+            used.add(id(candidate[1]))
+            targets.append(candidate)
+        shapes = list({id(shape): shape for shape, _ in targets}.values())
+        if not targets or (len(shapes) > 1 and len(new_content) != len(targets)):
+            return None
+
+        placement = []
+        for shape in shapes:
+            own = [id(para) for s, para in targets if s is shape]
+            if len(shapes) == 1:
+                content = iter(new_content)
+            else:
+                content = iter(
+                    text for (s, _), text in zip(targets, new_content) if s is shape
+                )
+            texts = []
+            for para in shape.text_frame.paragraphs:
+                if para.idx == -1:
+                    continue
+                if id(para) not in own:
+                    texts.append((para.text, para.real_idx))
+                    continue
+                text = next(content, None)
+                if text is not None:
+                    texts.append((text, para.real_idx))
+                if id(para) == own[-1]:
+                    texts.extend((text, para.real_idx) for text in content)
+            placement.append((shape, texts))
+        return placement
+
+    def fit_element(
+        self,
+        slide: SlidePage,
+        old_content: list[str],
+        new_content: list[str],
+        mergeable: bool = True,
+    ) -> FitResult | None:
+        """
+        Fit the new content of an element into its shapes on the template slide,
+        merging bullets while it has more items than the old content if `mergeable`.
+
+        Returns:
+            FitResult | None: The fit, or None if the element cannot be located on the slide.
+        """
+        data = list(new_content)
+        overflow = None
+        while True:
+            placement = self.place(slide, old_content, data)
+            if placement is None:
+                return None
+            fits, scale, shape_overflow = True, 1.0, 0.0
+            for shape, paragraphs in placement:
+                area = self.areas.get((slide.slide_idx, shape.shape_idx))
+                if area is None:
+                    return None
+                shape_fits, shape_scale, shape_overflow_ = self.fit_paragraphs(
+                    area, paragraphs
+                )
+                fits &= shape_fits
+                scale = min(scale, shape_scale)
+                shape_overflow = max(shape_overflow, shape_overflow_)
+            overflow = shape_overflow if overflow is None else overflow
+            if fits:
+                return FitResult(True, data, scale, overflow)
+            if not mergeable or len(data) <= max(len(old_content), 1):
+                return FitResult(False, list(new_content), 1.0, overflow)
+            data = merge_bullets(data)
+
+    def fit_layout(
+        self, layout: Layout, editor_output: EditorOutput, slides: list[SlidePage]
+    ) -> dict[str, FitResult]:
+        """
+        Fit the text elements of an editor output into the template slide of a layout,
+        replacing the data of the elements fitted by merging bullets.
+
+        Returns:
+            dict[str, FitResult]: The fit of each text element that could be located on the slide.
+        """
+        try:
+            template_id, old_data = layout.index_template_slide(editor_output)
+        except ValueError:
+            return {}
+        results = {}
+        for el in layout.elements:
+            if el.type != "text" or el.name not in editor_output:
+                continue
+            result = self.fit_element(
+                slides[template_id - 1],
+                old_data[el.name],
+                editor_output[el.name].data,
+                mergeable=el.variable_length is None,
+            )
+            if result is None:
+                continue
+            if result.fits and result.data != editor_output[el.name].data:
+                logger.debug("Merged the bullets of %s to fit its shape", el.name)
+                editor_output[el.name].data = result.data
+            results[el.name] = result
+        return results
+
+    def fit_slide(self, slide: SlidePage) -> int:
+        """
+        Step down the font size of the edited shapes of a slide that overflow,
+        the scale is applied when the slide is built.
+
+        Returns:
+            int: The number of shapes scaled.
+        """
+        scaled = 0
+        for shape in slide:
+            area = self.areas.get((slide.slide_idx, shape.shape_idx))
+            if area is None or not any(
+                shape._closures[key]
+                for key in (ClosureType.REPLACE, ClosureType.CLONE, ClosureType.DELETE)
+            ):
+                continue
+            paragraphs = [
+                (para.text, para.real_idx)
+                for para in shape.text_frame.paragraphs
+                if para.idx != -1
+            ]
+            fits, scale, _ = self.fit_paragraphs(area, paragraphs)
+            if not fits or scale == 1.0:
+                continue
+            shape._closures[ClosureType.STYLE].append(
+                Closure(
+                    partial(scale_fonts, [style.size for style in area.styles], scale)
+                )
+            )
+            scaled += 1
+        return scaled
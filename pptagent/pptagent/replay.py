@@ -0,0 +1,556 @@
+"""
+An OpenAI-compatible stand-in server replaying recorded chat completions.
+
+Every request is attributed to a role, recognized by the start of its system prompt (or
+of its first user prompt) among the bundled roles and prompt templates. The reply is
+replayed from a recording: the response recorded for the same request if any, otherwise
+the recorded responses of its role in turn, otherwise synthesized from the requested
+JSON schema. Latency and errors are injected from per-role distributions, so the
+overhead of the pipelines around the LLM calls can be measured offline and reproducibly.
+
+Given an upstream endpoint, requests are forwarded and their responses recorded instead.
+"""
+
+import asyncio
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass, field
+from os.path import basename, exists, join, splitext
+from typing import Any, Literal
+
+import yaml
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from openai import AsyncOpenAI
+
+from pptagent.batch import get_custom_id
+from pptagent.utils import get_logger, package_join
+
+logger = get_logger(__name__)
+
+UNKNOWN_ROLE = "unknown"
+
+
+@dataclass
+class LatencyProfile:
+    """
+    The latency and error distribution of the replies of a role.
+
+    Attributes:
+        distribution: `fixed` waits `mean` seconds, `uniform` waits `mean` ± `spread`,
+            `lognormal` waits a lognormal sample of mean `mean` and shape `spread`.
+        mean (float): The mean latency in seconds.
+        spread (float): The half width or the shape of the distribution.
+        error_rate (float): The probability of answering with an error.
+        error_status (list[int]): The HTTP statuses of injected errors, chosen uniformly.
+    """
+
+    distribution: Literal["fixed", "uniform", "lognormal"] = "fixed"
+    mean: float = 0.0
+    spread: float = 0.0
+    error_rate: float = 0.0
+    error_status: list[int] = field(default_factory=lambda: [429, 500])
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return max(
+                0.0, rng.uniform(self.mean - self.spread, self.mean + self.spread)
+            )
+        if self.distribution == "lognormal":
+            mu = math.log(self.mean) - self.spread**2 / 2
+            return rng.lognormvariate(mu, self.spread)
+        return self.mean
+
+    def sample_error(self, rng: random.Random) -> int | None:
+        if self.error_rate > 0 and rng.random() < self.error_rate:
+            return rng.choice(self.error_status)
+        return None
+
+
+def load_profiles(path: str | None) -> dict[str, LatencyProfile]:
+    """
+    Load latency profiles from a JSON or YAML file mapping role names to profiles,
+    the `default` profile applies to the roles not listed.
+    """
+    if not path:
+        return {"default": LatencyProfile()}
+    with open(path, encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    profiles = {role: LatencyProfile(**profile) for role, profile in data.items()}
+    profiles.setdefault("default", LatencyProfile())
+    return profiles
+
+
+def load_role_prompts(*folders: str) -> dict[str, list[str]]:
+    """
+    Collect the leading line of the system prompts of role files and of prompt templates.
+
+    Role files are YAML with a `system_prompt` string or a `system` mapping of languages
+    to strings; prompt templates are `.txt` files named after their role.
+
+    Returns:
+        dict[str, list[str]]: The role names with the texts their prompts start with.
+    """
+    roles = defaultdict(list)
+    for folder in folders:
+        for path in sorted(glob.glob(join(folder, "**", "*.*"), recursive=True)):
+            name, ext = splitext(basename(path))
+            with open(path, encoding="utf-8") as f:
+                if ext in (".yaml", ".yml"):
+                    config = yaml.safe_load(f) or {}
+                    system = config.get("system_prompt", config.get("system"))
+                    prompts = system.values() if isinstance(system, dict) else [system]
+                elif ext == ".txt":
+                    prompts = [f.read()]
+                else:
+                    continue
+            for prompt in prompts:
+                if isinstance(prompt, str) and prompt.strip():
+                    roles[name].append(prompt.strip().splitlines()[0].strip())
+    return dict(roles)
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = "\n".join(
+            part.get("text", "") for part in content if part.get("type") == "text"
+        )
+    return content
+
+
+class RoleMatcher:
+    """
+    Attribute a request to a role by the start of its system prompt, or of its first
+    user prompt when the system prompt is not one of a role (e.g. the default one).
+    """
+
+    def __init__(self, roles: dict[str, list[str]]):
+        # longer prefixes first, so a specific prompt wins over a generic one
+        self.prefixes = sorted(
+            ((prefix, name) for name, prefixes in roles.items() for prefix in prefixes),
+            key=lambda item: -len(item[0]),
+        )
+
+    @classmethod
+    def default(cls, *folders: str) -> "RoleMatcher":
+        """The roles and prompts of pptagent, and those in `folders`."""
+        return cls(
+            load_role_prompts(package_join("roles"), package_join("prompts"), *folders)
+        )
+
+    def __call__(self, body: dict) -> str:
+        messages = body.get("messages", [])
+        texts = [
+            message_text(
+                next((m for m in messages if m.get("role") in roles), {})
+            ).strip()
+            for roles in (("system", "developer"), ("user",))
+        ]
+        for text in texts:
+            if not text:
+                continue
+            for prefix, name in self.prefixes:
+                if text.startswith(prefix):
+                    return name
+        text = texts[1] or texts[0]
+        if not text:
+            return UNKNOWN_ROLE
+        first_line = text.splitlines()[0]
+        return "prompt-" + hashlib.sha1(first_line.encode("utf-8")).hexdigest()[:8]
+
+
+def request_key(body: dict) -> str:
+    """The identifier of a request by its content, ignoring transport options."""
+    return get_custom_id(
+        {
+            k: body.get(k)
+            for k in ("model", "messages", "response_format", "tools")
+            if body.get(k) is not None
+        }
+    )
+
+
+class Recording:
+    """
+    Recorded responses in a JSONL file, one per line:
+    `{"role": ..., "key": ... | null, "message": {"content": ..., "tool_calls": ...}}`.
+
+    A line without `key` answers any request of its role, a line may also give the
+    reply as a plain `content` string instead of a `message`.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.exact: dict[str, dict] = {}
+        self.by_role: dict[str, list[dict]] = defaultdict(list)
+        self.cursor = Counter()
+        if path is not None and exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+            logger.info(
+                "Loaded %d recorded responses of %d roles from %s",
+                sum(len(v) for v in self.by_role.values()),
+                len(self.by_role),
+                path,
+            )
+
+    def _index(self, record: dict):
+        message = record.get("message") or {"content": record.get("content", "")}
+        if record.get("key") is not None:
+            self.exact[record["key"]] = message
+        self.by_role[record["role"]].append(message)
+
+    def lookup(self, role: str, key: str) -> dict | None:
+        """The response recorded for the request, or the next one recorded for its role."""
+        if key in self.exact:
+            return self.exact[key]
+        responses = self.by_role.get(role)
+        if not responses:
+            return None
+        message = responses[self.cursor[role] % len(responses)]
+        self.cursor[role] += 1
+        return message
+
+    def add(self, role: str, key: str, message: dict):
+        record = {"role": role, "key": key, "message": message}
+        self._index(record)
+        if self.path is not None:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def synthesize_from_schema(
+    schema: dict, rng: random.Random, defs: dict | None = None
+) -> Any:
+    """
+    Build an instance of a JSON schema, with one item per enumerated name for arrays
+    of named objects (e.g. the elements of a layout) and random enumerated choices.
+    """
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return synthesize_from_schema(defs[schema["$ref"].split("/")[-1]], rng, defs)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            return synthesize_from_schema(options[0], rng, defs)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    schema_type = schema.get("type", "object")
+    if isinstance(schema_type, list):
+        schema_type = next(t for t in schema_type if t != "null")
+    if schema_type == "object":
+        return {
+            name: synthesize_from_schema(prop, rng, defs)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        items = schema.get("items", {})
+        resolved = items
+        while "$ref" in resolved:
+            resolved = defs[resolved["$ref"].split("/")[-1]]
+        enumerated = next(
+            (
+                (name, prop["enum"])
+                for name, prop in resolved.get("properties", {}).items()
+                if "enum" in prop
+            ),
+            None,
+        )
+        if enumerated is not None:
+            name, values = enumerated
+            return [
+                {**synthesize_from_schema(resolved, rng, defs), name: value}
+                for value in values
+            ]
+        return [
+            synthesize_from_schema(items, rng, defs)
+            for _ in range(max(1, schema.get("minItems", 1)))
+        ]
+    if schema_type == "integer":
+        return schema.get("minimum", 0)
+    if schema_type == "number":
+        return float(schema.get("minimum", 0))
+    if schema_type == "boolean":
+        return False
+    return "text"
+
+
+def synthesize_message(body: dict, rng: random.Random) -> dict | None:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") != "json_schema":
+        return None
+    schema = response_format["json_schema"]["schema"]
+    return {"content": json.dumps(synthesize_from_schema(schema, rng))}
+
+
+@dataclass
+class RoleStats:
+    calls: int = 0
+    recorded: int = 0
+    replayed: int = 0
+    synthesized: int = 0
+    missing: int = 0
+    errors: int = 0
+    latency: float = 0.0
+
+
+def create_replay_app(
+    recording: Recording,
+    profiles: dict[str, LatencyProfile] | None = None,
+    matcher: RoleMatcher | None = None,
+    upstream: AsyncOpenAI | None = None,
+    seed: int = 0,
+    chunk_size: int = 64,
+) -> FastAPI:
+    """
+    Create the OpenAI-compatible replay server.
+
+    Args:
+        recording (Recording): The recorded responses, extended when recording.
+        profiles (dict[str, LatencyProfile]): Latency profiles by role, with a `default`.
+        matcher (RoleMatcher): Attributes requests to roles, pptagent roles by default.
+        upstream (AsyncOpenAI): Forward requests to it and record the responses.
+        seed (int): The seed of the injected latencies, errors and synthesized choices.
+        chunk_size (int): The number of characters of a streamed chunk.
+
+    Returns:
+        FastAPI: The application, `app.state.stats` holds the `RoleStats` by role,
+            also served at `/stats` and cleared by `POST /stats/reset`.
+    """
+    app = FastAPI()
+    profiles = profiles or {"default": LatencyProfile()}
+    matcher = matcher or RoleMatcher.default()
+    rng = random.Random(seed)
+    app.state.stats = defaultdict(RoleStats)
+
+    def completion(body: dict, message: dict) -> dict:
+        message = {"role": "assistant", "content": None, **message}
+        prompt_chars = sum(len(message_text(m)) for m in body.get("messages", []))
+        completion_chars = len(message["content"] or "") + len(
+            json.dumps(message.get("tool_calls") or "")
+        )
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "replay"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls"
+                    if message.get("tool_calls")
+                    else "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": completion_chars // 4,
+                "total_tokens": (prompt_chars + completion_chars) // 4,
+            },
+        }
+
+    def chunks(body: dict, reply: dict):
+        def chunk(choices: list, **extra) -> str:
+            data = {
+                "id": reply["id"],
+                "object": "chat.completion.chunk",
+                "created": reply["created"],
+                "model": reply["model"],
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        def delta(delta: dict, finish_reason: str | None = None) -> str:
+            return chunk([{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+
+        message = reply["choices"][0]["message"]
+        content = message["content"] or ""
+        yield delta({"role": "assistant", "content": ""})
+        for start in range(0, len(content), chunk_size):
+            yield delta({"content": content[start : start + chunk_size]})
+        if message.get("tool_calls"):
+            yield delta(
+                {
+                    "tool_calls": [
+                        {"index": idx, **call}
+                        for idx, call in enumerate(message["tool_calls"])
+                    ]
+                }
+            )
+        yield delta({}, reply["choices"][0]["finish_reason"])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk([], usage=reply["usage"])
+        yield "data: [DONE]\n\n"
+
+    async def answer(body: dict, role: str, stats: RoleStats) -> dict | None:
+        if upstream is not None:
+            forwarded = {
+                k: v for k, v in body.items() if k not in ("stream", "stream_options")
+            }
+            result = await upstream.chat.completions.create(**forwarded)
+            message = result.choices[0].message.model_dump(
+                include={"content", "tool_calls"}, exclude_none=True
+            )
+            recording.add(role, request_key(body), message)
+            stats.recorded += 1
+            return message
+        message = recording.lookup(role, request_key(body))
+        if message is not None:
+            stats.replayed += 1
+            return message
+        message = synthesize_message(body, rng)
+        if message is not None:
+            stats.synthesized += 1
+        return message
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        role = matcher(body)
+        stats = app.state.stats[role]
+        stats.calls += 1
+        profile = profiles.get(role, profiles["default"])
+        latency = profile.sample_latency(rng)
+        status = profile.sample_error(rng)
+        stats.latency += latency
+        await asyncio.sleep(latency)
+        if status is not None:
+            stats.errors += 1
+            return JSONResponse(
+                {
+                    "error": {
+                        "message": f"Injected error for role {role}",
+                        "type": "injected_error",
+                        "code": status,
+                    }
+                },
+                status_code=status,
+            )
+        message = await answer(body, role, stats)
+        if message is None:
+            stats.missing += 1
+            return JSONResponse(
+                {
+                    "error": {
+                        "message": f"No recorded response for role {role}",
+                        "type": "invalid_request_error",
+                        "code": "no_recording",
+                    }
+                },
+                status_code=404,
+            )
+        reply = completion(body, message)
+        if body.get("stream"):
+            return StreamingResponse(
+                chunks(body, reply), media_type="text/event-stream"
+            )
+        return reply
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {
+            "object": "list",
+            "data": [{"id": "replay", "object": "model", "owned_by": "replay"}],
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return {role: asdict(stats) for role, stats in app.state.stats.items()}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        app.state.stats.clear()
+        return {}
+
+    return app
+
+
+class BackgroundServer:
+    """
+    Serve an application with uvicorn in a background thread, on a free port by default.
+
+    Usage:
+        with BackgroundServer(app) as server:
+            client = AsyncOpenAI(base_url=server.base_url, api_key="replay")
+    """
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int | None = None):
+        import uvicorn
+
+        if port is None:
+            with socket.socket() as sock:
+                sock.bind((host, 0))
+                port = sock.getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, host=host, port=port, log_level="warning")
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "BackgroundServer":
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Replay server failed to start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def serve(
+    recording: str = "runs/replay/recording.jsonl",
+    profiles: str = "",
+    role_dirs: str = "",
+    host: str = "127.0.0.1",
+    port: int = 8003,
+    upstream_base_url: str = "",
+    upstream_api_key: str = "",
+    seed: int = 0,
+):
+    """
+    Serve the replay server, requests are recorded instead when an upstream
+    endpoint is given. `role_dirs` are comma separated folders of extra role files.
+    """
+    import uvicorn
+
+    os.makedirs(os.path.dirname(recording) or ".", exist_ok=True)
+    upstream = None
+    if upstream_base_url:
+        upstream = AsyncOpenAI(
+            base_url=upstream_base_url, api_key=upstream_api_key or None
+        )
+    app = create_replay_app(
+        Recording(recording),
+        load_profiles(profiles),
+        RoleMatcher.default(*filter(None, role_dirs.split(","))),
+        upstream,
+        seed,
+    )
+    uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    from func_argparse import single_main
+
+    single_main(serve)
@@ -1,4 +1,5 @@
 from contextvars import ContextVar
+from functools import lru_cache
 from typing import Literal
 
 from pydantic import BaseModel, Field, create_model
@@ -13,6 +14,13 @@ _empty_images = ContextVar(
 logger = get_logger(__name__)
 
 
+def _literal(values, fallback: type):
+    """
+    A literal of the values, or the fallback type without values, as `Literal` cannot be empty.
+    """
+    return Literal[*values] if values else fallback  # type: ignore
+
+
 class DocumentIndex(BaseModel):
     section: str
     subsections: list[str]
@@ -21,8 +29,8 @@ class DocumentIndex(BaseModel):
     def response_model(cls, section_fields: list[str], subsection_fields: list[str]):
         return create_model(
             cls.__name__,
-            section=(Literal[*section_fields], Field(...)),  # type: ignore
-            subsections=(list[Literal[*subsection_fields]], Field(...)),  # type: ignore
+            section=(_literal(section_fields, str), Field(...)),
+            subsections=(list[_literal(subsection_fields, str)], Field(...)),
             __base__=BaseModel,
         )
 
@@ -53,46 +61,130 @@ class OutlineItem(BaseModel):
         ]
         return header, content, images
 
-    @classmethod
-    def response_model(cls, document: Document):
-        sections = []
-        subsections = []
-        for sec in document.sections:
-            sections.append(sec.title)
-            for subsec in sec.content:
-                if isinstance(subsec, SubSection):
-                    subsections.append(subsec.title)
-        allowed_images = [m.path for m in document.iter_medias()]
-        if allowed_images:
-            literal_image = Literal[*allowed_images]  # type: ignore
-            _empty_images.set(True)
-        else:
-            _empty_images.set(False)
-            literal_image = str
+    @staticmethod
+    def set_document(document: Document):
+        """
+        Set the document of the outline items built in the current context,
+        they keep their images only if the document has images.
+        """
+        _empty_images.set(bool(outline_fields(document)[2]))
 
-        return create_model(
-            cls.__name__,
-            purpose=(str, Field(...)),
-            topic=(str, Field(...)),
-            indexes=(
-                list[DocumentIndex.response_model(sections, subsections)],
-                Field(...),
-            ),
-            images=(list[literal_image], Field(default_factory=list)),
-            __base__=BaseModel,
-        )
+    @classmethod
+    def response_model(cls, document: Document, compact: bool = False):
+        """
+        Build the response model constraining indexes and images to those of the document.
+
+        Args:
+            document (Document): The source document.
+            compact (bool): Refer to sections, subsections and images by their ids in
+                `Document.get_overview(compact=True)` rather than by titles and paths.
+        """
+        sections, subsections, images = outline_fields(document)
+        _empty_images.set(bool(images))
+        if compact:
+            return _compact_item_model(len(sections), len(subsections), len(images))
+        return _item_model(sections, subsections, images)
+
+
+def outline_fields(document: Document) -> tuple[tuple[str, ...], ...]:
+    """
+    Collect the section titles, subsection titles and image paths of a document,
+    in the order of their ids in the compact overview.
+    """
+    sections = []
+    subsections = []
+    for sec in document.sections:
+        sections.append(sec.title)
+        for subsec in sec.content:
+            if isinstance(subsec, SubSection):
+                subsections.append(subsec.title)
+    images = [m.path for m in document.iter_medias()]
+    return tuple(sections), tuple(subsections), tuple(images)
+
+
+# the models are keyed by the document fields, so an edited document gets a new one
+@lru_cache(maxsize=64)
+def _item_model(
+    sections: tuple[str, ...], subsections: tuple[str, ...], images: tuple[str, ...]
+) -> type[BaseModel]:
+    literal_image = _literal(images, str)
+    return create_model(
+        OutlineItem.__name__,
+        purpose=(str, Field(...)),
+        topic=(str, Field(...)),
+        indexes=(
+            list[DocumentIndex.response_model(list(sections), list(subsections))],
+            Field(...),
+        ),
+        images=(list[literal_image], Field(default_factory=list)),
+        __base__=BaseModel,
+    )
+
+
+@lru_cache(maxsize=64)
+def _compact_item_model(
+    num_sections: int, num_subsections: int, num_images: int
+) -> type[BaseModel]:
+    index_model = create_model(
+        DocumentIndex.__name__,
+        section=(_literal(range(num_sections), int), Field(...)),
+        subsections=(list[_literal(range(num_subsections), int)], Field(...)),
+        __base__=BaseModel,
+    )
+    literal_image = _literal(range(num_images), int)
+    return create_model(
+        OutlineItem.__name__,
+        purpose=(str, Field(...)),
+        topic=(str, Field(...)),
+        indexes=(list[index_model], Field(...)),
+        images=(list[literal_image], Field(default_factory=list)),
+        __base__=BaseModel,
+    )
+
+
+@lru_cache(maxsize=64)
+def _outline_model(item_model: type[BaseModel]) -> type[BaseModel]:
+    return create_model(
+        Outline.__name__,
+        outline=(list[item_model], Field(...)),
+        __base__=BaseModel,
+    )
 
 
 class Outline(BaseModel):
     outline: list[OutlineItem]
 
     @classmethod
-    def response_model(cls, document: Document):
-        return create_model(
-            cls.__name__,
-            outline=(
-                list[OutlineItem.response_model(document)],
-                Field(...),
-            ),
-            __base__=BaseModel,
-        )
+    def response_model(cls, document: Document, compact: bool = False):
+        return _outline_model(OutlineItem.response_model(document, compact))
+
+    @staticmethod
+    def from_compact(document: Document, outline: dict) -> list[dict]:
+        """
+        Map the ids of a compact outline back to section titles, subsection titles and image paths.
+
+        Args:
+            document (Document): The source document.
+            outline (dict): The parsed response of the compact response model.
+
+        Returns:
+            list[dict]: The outline items, ready to build `OutlineItem`s.
+        """
+        sections, subsections, images = outline_fields(document)
+        items = []
+        for item in outline["outline"]:
+            indexes = [
+                {
+                    "section": sections[index["section"]],
+                    "subsections": [subsections[i] for i in index["subsections"]],
+                }
+                for index in item["indexes"]
+            ]
+            items.append(
+                {
+                    **item,
+                    "indexes": indexes,
+                    "images": [images[i] for i in item.get("images", [])],
+                }
+            )
+        return items
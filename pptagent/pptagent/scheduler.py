@@ -0,0 +1,245 @@
+"""
+Batch generation of presentations for many documents.
+
+`BatchScheduler` prepares the reference of each template once and forks a generator from it
+for every document, the slides of all documents are generated under one concurrency limit
+granted round-robin across documents, so a batch runs as fast as its concurrency allows
+however many documents it holds.
+"""
+
+import asyncio
+import json
+import os
+import time
+import traceback
+from collections import deque
+from collections.abc import Hashable, Iterable
+from dataclasses import asdict, dataclass, field
+from os.path import exists, isdir, join
+
+from pptagent.document import Document
+from pptagent.llms import AsyncLLM
+from pptagent.multimodal import ImageLabler
+from pptagent.offload import WorkerPool
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Presentation
+from pptagent.utils import Config, get_logger, package_join
+
+logger = get_logger(__name__)
+
+
+class FairLimiter:
+    """
+    Grants at most `limit` slots at once, round-robin across the keys waiting for one,
+    so a key holding many waiters cannot starve the others.
+    """
+
+    def __init__(self, limit: int):
+        assert limit > 0, "limit must be positive"
+        self.limit = limit
+        self.active = 0
+        # insertion ordered, the key granted last moves to the end
+        self.waiters: dict[Hashable, deque[asyncio.Future]] = {}
+
+    def slot(self, key: Hashable) -> "_Slot":
+        """
+        Get an async context manager holding a slot for `key`.
+        """
+        return _Slot(self, key)
+
+    async def acquire(self, key: Hashable):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # granted right before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.active -= 1
+        while self.waiters and self.active < self.limit:
+            key = next(iter(self.waiters))
+            queue = self.waiters.pop(key)
+            waiter = queue.popleft()
+            if queue:
+                self.waiters[key] = queue
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+
+@dataclass
+class _Slot:
+    limiter: FairLimiter
+    key: Hashable
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.key)
+
+    async def __aexit__(self, *exc_info):
+        self.limiter.release()
+
+
+@dataclass
+class BatchJob:
+    """
+    A document to generate a presentation for.
+
+    Args:
+        name (str): The unique name of the job, the presentation is saved as `<name>.pptx`.
+        document (Document): The source document.
+        template (str): The template directory, or the name of a bundled template.
+        num_slides (int | None): The number of slides to generate.
+        kwargs (dict): Other arguments of `PPTAgent.generate_pres`.
+    """
+
+    name: str
+    document: Document
+    template: str
+    num_slides: int | None = None
+    kwargs: dict = field(default_factory=dict)
+
+
+@dataclass
+class BatchResult:
+    name: str
+    template: str
+    path: str | None
+    num_slides: int
+    elapsed: float
+    error: str | None = None
+
+
+@dataclass
+class BatchScheduler:
+    """
+    Generate presentations for many documents with warm, shared template references.
+
+    Args:
+        language_model (AsyncLLM): The language model.
+        vision_model (AsyncLLM): The vision model.
+        output_dir (str): The directory of the presentations and of `results.jsonl`.
+        max_at_once (int): The maximum number of slides generated at once across documents.
+        max_documents (int | None): The maximum number of documents in progress, defaults to `max_at_once`.
+        journal (bool): Whether to journal the generation in `<output_dir>/journal`, a rerun resumes the batch.
+        agent_kwargs (dict): Other arguments of `PPTAgent`.
+        workers (int): The number of worker processes saving the presentations, 0 saves them in the event loop.
+    """
+
+    language_model: AsyncLLM
+    vision_model: AsyncLLM
+    output_dir: str
+    max_at_once: int = 8
+    max_documents: int | None = None
+    journal: bool = False
+    agent_kwargs: dict = field(default_factory=dict)
+    workers: int = 0
+
+    def __post_init__(self):
+        self.references: dict[str, PPTAgent | Exception] = {}
+        self.limiter = FairLimiter(self.max_at_once)
+        self.pool: WorkerPool | None = None
+
+    def reference(self, template: str) -> PPTAgent:
+        """
+        Get the prepared reference of a template, loaded on first use.
+        """
+        if template not in self.references:
+            try:
+                self.references[template] = self._load_template(template)
+            except Exception as e:
+                self.references[template] = e
+        reference = self.references[template]
+        if isinstance(reference, Exception):
+            raise reference
+        return reference
+
+    def _load_template(self, template: str) -> PPTAgent:
+        template_dir = (
+            template if isdir(template) else package_join("templates", template)
+        )
+        config = Config(template_dir)
+        prs = Presentation.from_file(join(template_dir, "source.pptx"), config)
+        image_stats = join(template_dir, "image_stats.json")
+        if exists(image_stats):
+            with open(image_stats, encoding="utf-8") as f:
+                ImageLabler(prs, config).apply_stats(json.load(f))
+        with open(join(template_dir, "slide_induction.json"), encoding="utf-8") as f:
+            slide_induction = json.load(f)
+        logger.info("Prepared the reference of template %s", template)
+        return PPTAgent(
+            self.language_model, self.vision_model, **self.agent_kwargs
+        ).set_reference(slide_induction, prs)
+
+    async def run(self, jobs: Iterable[BatchJob]) -> list[BatchResult]:
+        """
+        Run the jobs, saving each presentation and appending its result to `results.jsonl`
+        as soon as it completes, a failed job does not abort the batch.
+
+        Returns:
+            list[BatchResult]: The results in order of completion.
+        """
+        jobs = list(jobs)
+        assert len({job.name for job in jobs}) == len(jobs), "job names must be unique"
+        os.makedirs(self.output_dir, exist_ok=True)
+        documents = asyncio.Semaphore(self.max_documents or self.max_at_once)
+        results = []
+        self.pool = WorkerPool(self.output_dir, self.workers)
+        with (
+            self.pool,
+            open(join(self.output_dir, "results.jsonl"), "a", encoding="utf-8") as f,
+        ):
+            for task in asyncio.as_completed(
+                [self._run_job(job, documents) for job in jobs]
+            ):
+                result = await task
+                results.append(result)
+                f.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+                f.flush()
+        failed = sum(result.error is not None for result in results)
+        logger.info(
+            "Batch finished: %d succeeded, %d failed", len(jobs) - failed, failed
+        )
+        return results
+
+    async def _run_job(
+        self, job: BatchJob, documents: asyncio.Semaphore
+    ) -> BatchResult:
+        async with documents:
+            start = time.perf_counter()
+            try:
+                generator = self.reference(job.template).fork()
+                kwargs = {"semaphore": self.limiter.slot(job.name)}
+                if self.journal:
+                    kwargs["journal_dir"] = join(self.output_dir, "journal")
+                prs, _ = await generator.generate_pres(
+                    job.document, num_slides=job.num_slides, **(kwargs | job.kwargs)
+                )
+                if prs is None:
+                    raise RuntimeError("Failed to generate a slide")
+                path = join(self.output_dir, f"{job.name}.pptx")
+                await self.pool.save(prs, path)
+            except Exception as e:
+                logger.error("Job %s failed: %s", job.name, e)
+                logger.debug(traceback.format_exc())
+                return BatchResult(
+                    job.name,
+                    job.template,
+                    None,
+                    0,
+                    time.perf_counter() - start,
+                    f"{type(e).__name__}: {e}",
+                )
+            return BatchResult(
+                job.name,
+                job.template,
+                path,
+                len(prs.slides),
+                time.perf_counter() - start,
+            )
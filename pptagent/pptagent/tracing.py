@@ -0,0 +1,350 @@
+"""
+Span-based tracing of agent turns, LLM requests, tool calls, rendering and parsing.
+
+Spans follow the OpenTelemetry data model: a span has a 128-bit trace id, a 64-bit span id,
+the id of its parent span, start and end times and attributes, and the trace context crosses
+process boundaries as a W3C `traceparent` header. The current span is kept in a context
+variable, so spans opened in concurrent tasks nest under the span of the task that created them.
+
+Tracing is a no-op by default. Setting `PPTAGENT_TRACE_FILE` (or calling `set_exporter`) appends
+every finished span as an OTLP-style JSON line to that file. Subprocesses such as the MCP
+servers inherit the file through `trace_env` and join the trace of the calling span through
+the `traceparent` carried in the MCP request metadata, so one run yields one trace tree.
+"""
+
+import functools
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+TRACE_FILE_ENV = "PPTAGENT_TRACE_FILE"
+TRACE_SERVICE_ENV = "PPTAGENT_TRACE_SERVICE"
+TRACEPARENT_KEY = "traceparent"
+
+_random = random.SystemRandom()
+
+
+@dataclass
+class SpanContext:
+    trace_id: str
+    span_id: str
+    remote: bool = False
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @classmethod
+    def from_traceparent(cls, traceparent: str | None) -> "SpanContext | None":
+        """
+        Parse a W3C `traceparent` header, returning None when it is missing or malformed.
+        """
+        if not traceparent:
+            return None
+        parts = traceparent.strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        if set(parts[1]) == {"0"} or set(parts[2]) == {"0"}:
+            return None
+        return cls(parts[1], parts[2], remote=True)
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    start_time: int = field(default_factory=time.time_ns)
+    end_time: int | None = None
+    status: str = "UNSET"
+    status_message: str | None = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time_ns()
+        if self.status == "UNSET":
+            self.status = "OK"
+        _exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "parentSpanId": self.parent_id,
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message},
+            "resource": _resource,
+        }
+
+
+class NoopSpan(Span):
+    """
+    The span handed out while tracing is disabled, it records nothing.
+    """
+
+    def __init__(self):
+        super().__init__("noop", SpanContext("0" * 32, "0" * 16))
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: dict[str, Any]):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class SpanExporter:
+    """
+    The no-op exporter, subclasses export each finished span.
+    """
+
+    enabled = False
+
+    def export(self, span: Span):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class JsonFileExporter(SpanExporter):
+    """
+    Append finished spans as JSON lines to a file shared by all processes of a run,
+    each span is written with a single append so concurrent writers do not interleave.
+    """
+
+    enabled = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def __repr__(self) -> str:
+        return f"JsonFileExporter({self.path})"
+
+
+def _default_exporter() -> SpanExporter:
+    path = os.getenv(TRACE_FILE_ENV)
+    if path:
+        return JsonFileExporter(path)
+    return SpanExporter()
+
+
+_exporter: SpanExporter = _default_exporter()
+_resource = {
+    "service.name": os.getenv(TRACE_SERVICE_ENV)
+    or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0],
+    "process.pid": os.getpid(),
+}
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def set_exporter(exporter: SpanExporter | None) -> SpanExporter:
+    """
+    Set the exporter of finished spans, None disables tracing.
+
+    Returns:
+        SpanExporter: The previous exporter.
+    """
+    global _exporter
+    previous = _exporter
+    _exporter = exporter or SpanExporter()
+    return previous
+
+
+def get_exporter() -> SpanExporter:
+    return _exporter
+
+
+def is_enabled() -> bool:
+    return _exporter.enabled
+
+
+def set_service_name(name: str):
+    _resource["service.name"] = name
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: SpanContext | None = None, **attributes: Any) -> Span:
+    """
+    Start a span without making it current, the caller ends it with `Span.end`.
+    This is the form for async generators, whose context is shared with the consumer.
+
+    Args:
+        name (str): The span name.
+        parent (SpanContext): The parent, the current span by default.
+        **attributes: The span attributes.
+    """
+    if not _exporter.enabled:
+        return NOOP_SPAN
+    if parent is None and (current := _current_span.get()) is not None:
+        parent = current.context
+    trace_id = (
+        parent.trace_id if parent is not None else f"{_random.getrandbits(128):032x}"
+    )
+    return Span(
+        name,
+        SpanContext(trace_id, f"{_random.getrandbits(64):016x}"),
+        parent.span_id if parent is not None else None,
+        attributes,
+    )
+
+
+@contextmanager
+def span(name: str, parent: SpanContext | None = None, **attributes: Any):
+    """
+    Trace the enclosed block as a span made current, exceptions mark it as failed.
+
+    Example:
+        with span("llm.request", model=model) as s:
+            s.set_attribute("tokens", n)
+    """
+    s = start_span(name, parent, **attributes)
+    if s is NOOP_SPAN:
+        yield s
+        return
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.record_exception(e)
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # exited from another context, e.g. an async generator closed by the event loop
+            _current_span.set(None)
+        s.end()
+
+
+def traced(name: str | None = None, **attributes: Any):
+    """
+    Decorate a function or coroutine function to run inside a span named after it.
+    """
+
+    def decorator(func: Callable):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def inject(carrier: dict | None = None) -> dict:
+    """
+    Add the `traceparent` of the current span to a carrier, e.g. MCP request metadata.
+    """
+    if carrier is None:
+        carrier = {}
+    current = _current_span.get()
+    if current is not None and current is not NOOP_SPAN:
+        carrier[TRACEPARENT_KEY] = current.context.traceparent
+    return carrier
+
+
+def extract(carrier: Any) -> SpanContext | None:
+    """
+    Read the remote parent from a carrier, a mapping or an object with a `traceparent` field.
+    """
+    if carrier is None:
+        return None
+    if isinstance(carrier, dict):
+        traceparent = carrier.get(TRACEPARENT_KEY)
+    else:
+        traceparent = getattr(carrier, TRACEPARENT_KEY, None)
+        if traceparent is None:
+            traceparent = (getattr(carrier, "model_extra", None) or {}).get(
+                TRACEPARENT_KEY
+            )
+    return SpanContext.from_traceparent(traceparent)
+
+
+def trace_env(service_name: str | None = None) -> dict[str, str]:
+    """
+    The environment variables a subprocess needs to export to the same trace file.
+    """
+    if not isinstance(_exporter, JsonFileExporter):
+        return {}
+    env = {TRACE_FILE_ENV: os.path.abspath(_exporter.path)}
+    if service_name is not None:
+        env[TRACE_SERVICE_ENV] = service_name
+    return env
+
+
+def trace_tools(mcp):
+    """
+    Trace every tool call of a FastMCP server, as a child of the `traceparent` sent by the client.
+    """
+    from fastmcp.server.middleware import Middleware
+
+    class TraceMiddleware(Middleware):
+        async def on_call_tool(self, context, call_next):
+            meta = None
+            try:
+                meta = context.fastmcp_context.request_context.meta
+            except (AttributeError, LookupError, ValueError):
+                pass
+            if meta is None:
+                meta = getattr(context.message, "meta", None)
+            with span(
+                f"mcp.tool {context.message.name}",
+                extract(meta),
+                **{"mcp.server": mcp.name, "mcp.tool": context.message.name},
+            ):
+                return await call_next(context)
+
+    mcp.add_middleware(TraceMiddleware())
+    return mcp
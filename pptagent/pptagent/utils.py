@@ -3,6 +3,7 @@ import io
 import json
 import logging
 import os
+import re
 import shutil
 import subprocess
 import tempfile
@@ -28,6 +29,8 @@ from pptagent_pptx.util import Length, Pt
 from pydantic import BaseModel
 from tenacity import RetryCallState, retry, stop_after_attempt, wait_fixed
 
+from pptagent import tracing
+
 
 class Language(BaseModel):
     lid: str
@@ -270,6 +273,72 @@ def get_json_from_response(response: str) -> dict[str, Any]:
     raise Exception("JSON not found in the given output", response)
 
 
+class JsonArrayStream:
+    """
+    Incrementally parse the items of a JSON array from a streamed response,
+    e.g. `{"outline": [{...}, {...}, ...]}`, yielding each object or array item once complete.
+    """
+
+    def __init__(self, key: str | None = None):
+        """
+        Args:
+            key (str | None): The key of the array in the enclosing object, the first array if None.
+        """
+        if key is None:
+            self.start_pattern = re.compile(r"\[")
+        else:
+            self.start_pattern = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+
+    def feed(self, chunk: str) -> list[Any]:
+        """
+        Feed a chunk of the response.
+
+        Returns:
+            list[Any]: The items completed by this chunk.
+        """
+        self.buffer += chunk
+        items = []
+        if not self.started:
+            match = self.start_pattern.search(self.buffer)
+            if match is None:
+                return items
+            self.started = True
+            self.pos = match.end()
+        while self.pos < len(self.buffer) and not self.finished:
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    items.append(
+                        json.loads(self.buffer[self.item_start : self.pos + 1])
+                    )
+                elif self.depth < 0:
+                    self.finished = True
+            self.pos += 1
+        return items
+
+
 # Create a tenacity decorator with custom settings
 def tenacity_decorator(_func=None, *, wait: int = 3, stop: int = 5):
     def decorator(func):
@@ -379,6 +448,7 @@ async def _is_unoserver_running(host: str, port: int) -> bool:
         return False
 
 
+@tracing.traced("render.pptx")
 async def ppt_to_images(file: str, output_dir: str, dpi: int = 100):
     assert exists(file), f"File {file} does not exist"
     if exists(output_dir) and len(os.listdir(output_dir)) > 0:
@@ -445,9 +515,20 @@ async def ppt_to_images(file: str, output_dir: str, dpi: int = 100):
                 )
             pdf_path = join(out_dir, pdf_files[0])
 
-        images = convert_from_path(pdf_path, dpi=dpi)
-        for i, img in enumerate(images):
-            img.save(join(output_dir, f"slide_{i + 1:04d}.jpg"))
+        rasterize_pdf(pdf_path, output_dir, dpi)
+
+
+def rasterize_pdf(pdf_path: str, output_dir: str, dpi: int = 100) -> int:
+    """
+    Render the pages of a PDF to `slide_0001.jpg`, ... in `output_dir`.
+
+    Returns:
+        int: The number of pages.
+    """
+    images = convert_from_path(pdf_path, dpi=dpi)
+    for i, img in enumerate(images):
+        img.save(join(output_dir, f"slide_{i + 1:04d}.jpg"))
+    return len(images)
 
 
 def parsing_image(image: Image, image_path: str) -> str:
@@ -459,9 +540,8 @@ def parsing_image(image: Image, image_path: str) -> str:
     # Check for supported image types
     elif image.ext in ["webp", "tiff"]:
         image_path = image_path.replace(".webp", ".png").replace(".tiff", ".png")
-        pil_image = PILImage.open(io.BytesIO(image.blob))
         if not exists(image_path):
-            pil_image.save(image_path, "PNG")
+            PILImage.open(io.BytesIO(image.blob)).save(image_path, "PNG")
         return image_path
     elif image.ext not in IMAGE_EXTENSIONS:
         raise ValueError(f"Unsupported image type {image.ext}")
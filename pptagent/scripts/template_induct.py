@@ -52,6 +52,7 @@ async def test_induct(pr_folder: str, sem: asyncio.Semaphore):
                 model_manager.image_model,
                 model_manager.language_model,
                 model_manager.vision_model,
+                use_batch=model_manager.use_batch,
             )
             reference = await inducter.content_induct(await inducter.layout_induct())
             with open(
@@ -0,0 +1,180 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from pptagent.apis import APICall, CodeExecutor, Comment, HistoryMark, parse_actions
+
+CALLS = []
+
+
+def replace_paragraph(slide, div_id: int, paragraph_id: int, text: str):
+    CALLS.append(("replace_paragraph", div_id, paragraph_id, text))
+
+
+def clone_paragraph(slide, div_id: int, paragraph_id: int):
+    CALLS.append(("clone_paragraph", div_id, paragraph_id))
+
+
+def del_image(slide, figure_id: int):
+    CALLS.append(("del_image", figure_id))
+
+
+FUNCTIONS = {
+    func.__name__: func for func in (replace_paragraph, clone_paragraph, del_image)
+}
+
+ADVERSARIAL = [
+    "__import__('os').system('touch {marker}')",
+    "replace_paragraph(0, 0, __import__('os').system('touch {marker}'))",
+    "replace_paragraph(0, 0, open('{marker}', 'w').write('x'))",
+    "import os; os.system('touch {marker}')",
+    "eval(\"open('{marker}', 'w')\")",
+    "exec('x = 1')",
+    "os.system('touch {marker}')",
+    "replace_paragraph.__globals__['CALLS'].clear()",
+    "(lambda: open('{marker}', 'w'))()",
+    "[open('{marker}', 'w') for _ in range(1)]",
+    'replace_paragraph(0, 0, f\'{{open("{marker}", "w")}}\')',
+    "replace_paragraph(*[0, 0, 'x'])",
+    "replace_paragraph(**{{'div_id': 0, 'paragraph_id': 0, 'text': 'x'}})",
+    "x = replace_paragraph(0, 0, 'x')",
+    "replace_paragraph(0, 0, 'x') if True else None",
+    "del_image(figure_id=(1).__class__)",
+    "del_image(1, 2)",
+    "del_image(missing=1)",
+    "replace_paragraph(0, 0, 'x'",
+    "def del_image(figure_id): pass",
+    "@del_image\ndef f(): pass",
+    "with open('{marker}', 'w'): pass",
+    "del_image(" * 200 + ")" * 200,
+    "replace_paragraph(0, 0, " + "[" * 500 + "]" * 500 + ")",
+    "replace_paragraph(0, 0, 'x')\x00",
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    CALLS.clear()
+
+
+def execute(actions: str) -> tuple[CodeExecutor, tuple | None]:
+    executor = CodeExecutor(3)
+    executor.registered_functions = FUNCTIONS
+    feedback = executor.execute_actions(actions, SimpleNamespace(slide_idx=1), None)
+    return executor, feedback
+
+
+def test_valid_block_executed_in_order():
+    actions = (
+        "Here are the edits:\n"
+        "```python\n"
+        "# title: quantity_change: 1\n"
+        "clone_paragraph(0, 0)\n"
+        "replace_paragraph(\n"
+        "    0, 1, 'multi-line (call)'\n"
+        ")  # trailing comment\n"
+        "# figure: quantity_change: -1\n"
+        "del_image(figure_id=2)\n"
+        "```"
+    )
+    executor, feedback = execute(actions)
+    assert feedback is None
+    assert CALLS == [
+        ("clone_paragraph", 0, 0),
+        ("replace_paragraph", 0, 1, "multi-line (call)"),
+        ("del_image", 2),
+    ]
+    assert [mark for mark, *_ in executor.command_history] == [
+        HistoryMark.COMMENT_CORRECT,
+        HistoryMark.COMMENT_CORRECT,
+    ]
+    assert executor.api_history[-1][0] == HistoryMark.API_CALL_CORRECT
+
+
+@pytest.mark.parametrize("template", ADVERSARIAL)
+def test_adversarial_rejected_without_execution(template, tmp_path):
+    marker = tmp_path / "pwned"
+    actions = f"```python\nreplace_paragraph(0, 0, 'before')\n{template.format(marker=marker)}\n```"
+    executor, feedback = execute(actions)
+    assert feedback is not None and executor.errors
+    assert CALLS == [] and not marker.exists()
+    assert "--> Error Line:" in feedback[0]
+
+
+def test_errors_located():
+    actions = "```python\nreplace_paragraph(0, 0, 'ok')\ndel_image(x)\nfoo(1)\n```"
+    _, errors = parse_actions(actions, tuple(FUNCTIONS.items()))
+    assert [(e.line, e.col) for e in errors] == [(3, 11), (4, 1)]
+    assert "Argument 1 of del_image must be a literal" in errors[0].message
+    assert "foo is not defined" in errors[1].message
+
+    _, errors = parse_actions("```\ndel_image(1\ndel_image(2)\n```", ())
+    assert errors[0].line == 2 and errors[0].message.startswith("SyntaxError")
+
+
+def test_prose_without_code_block():
+    _, feedback = execute("I cannot edit this slide.")
+    assert feedback is not None and "No code block found" in feedback[1]
+    executor, feedback = execute("Sure:\ndel_image(3)")
+    assert feedback is None and CALLS == [("del_image", 3)]
+
+
+FRAGMENTS = [
+    "replace_paragraph(0, 0, 'a')",
+    "clone_paragraph(1, 2)",
+    "del_image(3)",
+    "# comment",
+    "```",
+    "```python",
+    "import os",
+    "open('x')",
+    "x = 1",
+    "del_image(",
+    ")",
+    "'''",
+    '"',
+    "\\",
+    "lambda: 0",
+    "del_image(-1)",
+    "del_image(1e309)",
+    "replace_paragraph(0, 0, b'bytes')",
+    "\t",
+    "",
+    "del_image(figure_id=4)",
+    "__builtins__",
+    "del_image(True)",
+]
+
+
+def random_actions(rng: random.Random) -> str:
+    lines = [rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 8))]
+    if lines and rng.random() < 0.5:
+        # mutate a line character-wise
+        idx = rng.randrange(len(lines))
+        chars = list(lines[idx])
+        for _ in range(rng.randint(1, 4)):
+            pos = rng.randint(0, len(chars))
+            if chars and rng.random() < 0.5:
+                del chars[min(pos, len(chars) - 1)]
+            else:
+                chars.insert(pos, rng.choice("()[]{}'\",:#=.*\\\n 0a_"))
+        lines[idx] = "".join(chars)
+    return "\n".join(lines)
+
+
+def test_fuzz_parser_never_executes_invalid_programs():
+    rng = random.Random(0)
+    for _ in range(3000):
+        actions = random_actions(rng)
+        program, errors = parse_actions(actions, tuple(FUNCTIONS.items()))
+        CALLS.clear()
+        executor, feedback = execute(actions)
+        if errors:
+            assert feedback is not None and CALLS == []
+            continue
+        for item in program:
+            assert isinstance(item, APICall | Comment)
+            if isinstance(item, APICall):
+                assert item.func in FUNCTIONS
+        assert len(CALLS) <= sum(isinstance(item, APICall) for item in program)
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from pptagent.agent import HISTORY_SCOPE, Agent
+
+
+class EchoLLM:
+    model = "echo"
+
+    async def __call__(self, content, **kwargs):
+        history = kwargs.get("history") or []
+        message = [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": content[-8:]},
+        ]
+        return content[-8:], history + message
+
+
+def make_agent(**kwargs) -> Agent:
+    llm = EchoLLM()
+    return Agent("coder", {"language": llm}, **kwargs)
+
+
+async def run_session(agent: Agent) -> list[dict]:
+    turn_ids = []
+    for slide_idx in range(4):
+        turn_id, _ = await agent(
+            api_docs="docs", edit_target=f"slide {slide_idx}", command_list="[]"
+        )
+        turn_ids.append(turn_id)
+    # a retry of an early turn is appended after later turns
+    await agent.retry("feedback", "traceback", turn_ids[0], 1)
+    await agent.retry("feedback", "traceback", turn_ids[0], 2)
+    return [turn.to_dict() for turn in agent.history]
+
+
+@pytest.mark.asyncio
+async def test_history_ordered_by_turn_and_retry():
+    agent = make_agent()
+    history = await run_session(agent)
+    assert [(t["id"], t["retry"]) for t in history] == [
+        (0, -1),
+        (0, 1),
+        (0, 2),
+        (1, -1),
+        (2, -1),
+        (3, -1),
+    ]
+    assert agent.next_turn_id == 4
+    agent.reset()
+    assert agent.history == [] and agent.next_turn_id == 0
+
+
+@pytest.mark.asyncio
+async def test_spilled_history_identical(tmp_path):
+    expected = await run_session(make_agent())
+    agent = make_agent(max_turns=1, spill_dir=str(tmp_path))
+    assert await run_session(agent) == expected
+    # only the retries of turn 0 are kept in memory
+    assert len(agent._history) == 2
+
+    dropping = make_agent(max_turns=2)
+    with pytest.raises(KeyError, match="evicted"):
+        await run_session(dropping)
+    assert [turn.id for turn in dropping.history] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_recent_history_scoped_per_slide():
+    agent = make_agent()
+
+    async def slide(slide_idx: int):
+        HISTORY_SCOPE.set(slide_idx)
+        for step in range(2):
+            await agent(
+                api_docs="docs",
+                edit_target=f"slide {slide_idx} step {step}",
+                command_list="[]",
+            )
+            await asyncio.sleep(0)
+        return await agent.get_history(recent=10)
+
+    histories = await asyncio.gather(*[slide(i) for i in range(3)])
+    for slide_idx, history in enumerate(histories):
+        assert len(history) == 2
+        assert all(f"slide {slide_idx}" in turn.prompt for turn in history)
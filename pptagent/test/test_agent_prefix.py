@@ -0,0 +1,113 @@
+import glob
+from os.path import basename
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from pptagent.agent import Agent
+from pptagent.llms import LLM, TokenUsage
+from pptagent.utils import package_join
+
+ROLES = sorted(
+    basename(path)[:-5] for path in glob.glob(package_join("roles", "*.yaml"))
+)
+
+
+class RecordingLLM:
+    model = "recording"
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, content, **kwargs):
+        self.calls.append({"content": content, **kwargs})
+        history = kwargs.get("history") or []
+        message = [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": "{}"},
+        ]
+        return "{}", history + message
+
+
+def make_agent(role: str) -> tuple[Agent, RecordingLLM]:
+    llm = RecordingLLM()
+    return Agent(role, {"language": llm, "vision": llm}), llm
+
+
+def slide_args(agent: Agent, slide_idx: int) -> dict:
+    return {
+        arg: "static " + arg
+        if arg in agent.prefix_args
+        else f"<dynamic {slide_idx}> {arg}"
+        for arg in agent.prompt_args
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("role", ROLES)
+async def test_prefix_identical_across_calls(role):
+    agent, llm = make_agent(role)
+    for slide_idx in range(3):
+        await agent(**slide_args(agent, slide_idx))
+
+    system_messages = {call["system_message"] for call in llm.calls}
+    assert len(system_messages) == 1
+    system_message = system_messages.pop()
+    assert system_message.startswith(agent.system_message.rstrip("\n"))
+    assert "<dynamic" not in system_message
+    for call in llm.calls:
+        assert call["usage"] is agent.usage
+    assert agent.prefix_stable
+
+
+@pytest.mark.asyncio
+async def test_prefix_variation_flagged():
+    agent, _ = make_agent("coder")
+    assert agent.prefix_args == {"api_docs"}
+    for slide_idx in range(2):
+        await agent(
+            api_docs=f"docs {slide_idx}", edit_target="<div/>", command_list="[]"
+        )
+    assert not agent.prefix_stable
+    agent.usage.add(None)
+    agent.reset()
+    assert agent.prefix_stable and agent.history == []
+    assert agent.usage.requests == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_reuses_system_message():
+    agent, llm = make_agent("coder")
+    turn_id, _ = await agent(**slide_args(agent, 0))
+    await agent.retry("feedback", "traceback", turn_id, 1)
+    assert llm.calls[1]["system_message"] == llm.calls[0]["system_message"]
+    assert llm.calls[1]["history"][0]["content"] == llm.calls[0]["content"]
+
+
+def test_token_usage_cached_ratio():
+    completion = ChatCompletion(
+        id="chatcmpl-0",
+        object="chat.completion",
+        created=0,
+        model="gpt-4.1",
+        choices=[
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "ok"},
+                "finish_reason": "stop",
+            }
+        ],
+        usage={
+            "prompt_tokens": 2000,
+            "completion_tokens": 10,
+            "total_tokens": 2010,
+            "prompt_tokens_details": {"cached_tokens": 1536},
+        },
+    )
+    llm = LLM("gpt-4.1", api_key="offline")
+    role_usage = TokenUsage()
+    llm.record_usage(completion, role_usage)
+    llm.record_usage(completion.model_copy(update={"usage": None}), role_usage)
+    assert llm.usage.requests == role_usage.requests == 2
+    assert role_usage.cached_tokens == 1536
+    assert role_usage.to_dict()["cached_ratio"] == 0.768
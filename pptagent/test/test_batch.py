@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+from os.path import join
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+from pptagent.batch import BatchExecutor, create_local_batch_app, echo_responder
+from pptagent.llms import AsyncLLM
+from pptagent.model_utils import ModelManager
+
+
+def local_client(root: str, **kwargs) -> AsyncOpenAI:
+    app = create_local_batch_app(root, **kwargs)
+    return AsyncOpenAI(
+        base_url="http://local-batch/v1",
+        api_key="offline",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)),
+    )
+
+
+def num_batches(root: str) -> int:
+    return len(os.listdir(join(root, "batches")))
+
+
+def executor(client: AsyncOpenAI, batch_dir: str, **kwargs) -> BatchExecutor:
+    return BatchExecutor(
+        client, batch_dir, flush_interval=0.05, poll_interval=0.05, **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_llm_offline(tmp_path):
+    server_root = str(tmp_path / "server")
+    llm = AsyncLLM("offline-model", api_key="offline")
+    llm.use_batch = True
+    llm.batch = executor(local_client(server_root), str(tmp_path / "batch"))
+
+    prompts = [f"You are a parrot\nRepeat {i}" for i in range(5)]
+    responses = await asyncio.gather(*[llm(prompt) for prompt in prompts])
+    assert responses == [f"Repeat {i}" for i in range(5)]
+    assert num_batches(server_root) == 1
+
+    class Echo(BaseModel):
+        text: str
+
+    async def json_responder(body: dict) -> str:
+        assert body["response_format"]["type"] == "json_schema"
+        return json.dumps({"text": await echo_responder(body)})
+
+    llm.batch = executor(
+        local_client(server_root, responder=json_responder), str(tmp_path / "json")
+    )
+    response = await llm("Say hi", response_format=Echo, return_json=True)
+    assert response == {"text": "Say hi"}
+
+
+@pytest.mark.asyncio
+async def test_batch_resume_after_restart(tmp_path):
+    server_root = str(tmp_path / "server")
+    batch_dir = str(tmp_path / "batch")
+    body = {"model": "offline-model", "messages": [{"role": "user", "content": "hi"}]}
+
+    # the first process submits the batch but exits before it completes
+    client = local_client(server_root, completion_delay=3600)
+    first = executor(client, batch_dir)
+    task = asyncio.create_task(first.create(**body))
+    while not first.batches:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    assert num_batches(server_root) == 1
+
+    # the second process attaches to the submitted batch instead of resubmitting
+    second = executor(local_client(server_root), batch_dir)
+    assert list(second.batches.values()) == list(first.batches.values())
+    completion = await second.create(**body)
+    assert completion.choices[0].message.content == "hi"
+    assert num_batches(server_root) == 1
+    assert second.batches == {}
+
+    # completed results are served from disk without reaching the server
+    third = executor(local_client(str(tmp_path / "unused")), batch_dir)
+    completion = await third.create(**body)
+    assert completion.choices[0].message.content == "hi"
+    assert num_batches(str(tmp_path / "unused")) == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_request_error(tmp_path):
+    async def failing_responder(body: dict) -> str:
+        raise RuntimeError("rate limited")
+
+    batch = executor(
+        local_client(str(tmp_path / "server"), responder=failing_responder),
+        str(tmp_path / "batch"),
+    )
+    with pytest.raises(Exception, match="rate limited"):
+        await batch.create(model="offline-model", messages=[])
+    assert batch.results == {}
+
+
+@pytest.mark.asyncio
+async def test_batch_results_retention(tmp_path):
+    batch_dir = str(tmp_path / "batch")
+    batch = executor(local_client(str(tmp_path / "server")), batch_dir, max_results=2)
+    bodies = [
+        {"model": "offline-model", "messages": [{"role": "user", "content": str(i)}]}
+        for i in range(5)
+    ]
+    completions = await asyncio.gather(*[batch.create(**body) for body in bodies])
+    assert [c.choices[0].message.content for c in completions] == list("01234")
+    assert len(batch.results) == 2
+    # the results file is compacted once it holds twice the results kept
+    with open(join(batch_dir, "results.jsonl"), encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+    restarted = executor(local_client(str(tmp_path / "unused")), batch_dir)
+    assert restarted.results == batch.results
+
+
+def test_batch_per_call_site(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "offline")
+    models = ModelManager("http://localhost", "model", "model", use_batch=True)
+    # interactive generation stays real-time, offline stages batch their own calls
+    assert models.use_batch and not models.language_model.use_batch
+    batched = models.language_model.batched()
+    assert batched.use_batch and batched.usage is models.language_model.usage
+    assert batched.batched() is batched
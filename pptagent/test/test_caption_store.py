@@ -0,0 +1,103 @@
+import asyncio
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os.path import join
+
+import pytest
+from PIL import Image
+
+from pptagent.caption_store import TEMPLATE_PROMPT, CaptionStore, prompt_version
+from pptagent.document import Media
+from pptagent.document.element import CaptionCache
+from pptagent.image_index import file_digest
+from pptagent.llms import AsyncLLM
+from pptagent.multimodal import ImageLabler
+from pptagent.presentation import Picture, Presentation
+from pptagent.utils import Config, package_join
+
+
+class CountingVisionModel(AsyncLLM):
+    async def __call__(self, prompt: str, image: str, **kwargs):
+        self.calls = getattr(self, "calls", 0) + 1
+        await asyncio.sleep(0)
+        return f"Picture:caption of {image}"
+
+
+def write_captions(path: str, worker: int, count: int = 50):
+    store = CaptionStore(path)
+    for idx in range(count):
+        store.put(f"{worker}-{idx}", "prompt", "model", f"caption {worker} {idx}")
+    store.close()
+
+
+def test_concurrent_writes_and_batch_lookup(tmp_path):
+    path = str(tmp_path / "captions.sqlite")
+    with ProcessPoolExecutor(2) as processes, ThreadPoolExecutor(2) as threads:
+        futures = [processes.submit(write_captions, path, w) for w in range(2)]
+        futures += [threads.submit(write_captions, path, w) for w in range(2, 4)]
+        for future in futures:
+            future.result()
+    store = CaptionStore(path)
+    assert len(store) == 200
+    digests = [f"{w}-{idx}" for w in range(4) for idx in range(50)] + ["unknown"]
+    captions = store.get_many(digests * 5, "prompt")
+    assert len(captions) == 200 and captions["3-49"] == "caption 3 49"
+    assert store.get_many(digests, "prompt", "other-model") == {}
+    assert store.get_many(digests, "other-prompt") == {}
+
+
+@pytest.mark.asyncio
+async def test_shared_across_labler_and_documents(tmp_path):
+    store = CaptionStore(str(tmp_path / "captions.sqlite"))
+    template_dir = tmp_path / "template"
+    shutil.copytree(package_join("templates", "default"), template_dir)
+    vision_model = CountingVisionModel("vision", api_key="offline")
+
+    config = Config(str(template_dir))
+    prs = Presentation.from_file(str(template_dir / "source.pptx"), config)
+    labler = ImageLabler(prs, config, store)
+    await labler.caption_images_async(vision_model)
+    assert vision_model.calls == len(labler.image_stats)
+
+    # the same template parsed in another run is captioned from the store
+    run_config = Config(str(tmp_path / "run"))
+    prs = Presentation.from_file(str(template_dir / "source.pptx"), run_config)
+    stats = await ImageLabler(prs, run_config, store).caption_images_async(vision_model)
+    assert vision_model.calls == len(stats)
+    assert all(
+        stats[image]["caption"] == labler.image_stats[image]["caption"]
+        for image in stats
+    )
+
+    # a document media is keyed by its own prompt and context
+    image = join(str(tmp_path), "figure.png")
+    Image.new("RGB", (64, 64), "red").save(image)
+    media = Media(markdown_content="![](figure.png)", near_chunks=("", ""), path=image)
+    await media.get_caption(vision_model, CaptionCache(str(tmp_path), store))
+    other = Media(markdown_content="![](figure.png)", near_chunks=("", ""), path=image)
+    await other.get_caption(vision_model, CaptionCache(str(tmp_path), store))
+    assert vision_model.calls == len(stats) + 1
+    assert other.caption == media.caption
+
+
+def test_import_image_stats(tmp_path):
+    template_dir = tmp_path / "template"
+    shutil.copytree(package_join("templates", "default"), template_dir)
+    shutil.rmtree(template_dir / "images", ignore_errors=True)
+    store = CaptionStore(str(tmp_path / "captions.sqlite"))
+    imported = store.import_image_stats(str(template_dir / "image_stats.json"), "gpt")
+    with open(template_dir / "image_stats.json", encoding="utf-8") as f:
+        image_stats = json.load(f)
+    assert imported == len(image_stats) > 0
+    image, stats = next(iter(image_stats.items()))
+    digest = file_digest(str(template_dir / "images" / image))
+    assert store.get(digest, prompt_version(TEMPLATE_PROMPT)) == stats["caption"]
+
+    # a template without image_stats.json takes its captions from the store
+    (template_dir / "image_stats.json").unlink()
+    config = Config(str(template_dir))
+    prs = Presentation.from_file(str(template_dir / "source.pptx"), config)
+    ImageLabler(prs, config, store).apply_stats({})
+    pictures = [shape for slide in prs.slides for shape in slide.shape_filter(Picture)]
+    assert pictures and all(picture.caption for picture in pictures)
@@ -0,0 +1,101 @@
+import json
+from copy import deepcopy
+
+import pytest
+
+from pptagent.apis import synthesize_actions
+from pptagent.multimodal import ImageLabler
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Presentation
+from pptagent.response import EditorOutput
+from pptagent.utils import Config, package_join
+
+TEXT_LAYOUT = "Title Text Header with Multi-level Bulleted Explanatory Points:text"
+# the template slide of this layout does not contain the text of its elements
+UNMATCHED_LAYOUT = "Single Full-Slide Text Block over Decorative Background:text"
+
+
+class CoderLLM:
+    model = "coder"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, content, **kwargs):
+        self.calls += 1
+        code = '```python\n# body\nreplace_paragraph(0, 0, "from the coder")\n```'
+        return code, [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": code},
+        ]
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    template_dir = package_join("templates", "default")
+    config = Config(str(tmp_path_factory.mktemp("template")))
+    prs = Presentation.from_file(f"{template_dir}/source.pptx", config)
+    with open(f"{template_dir}/image_stats.json") as f:
+        ImageLabler(prs, config).apply_stats(json.load(f))
+    with open(f"{template_dir}/slide_induction.json") as f:
+        return prs, json.load(f)
+
+
+def make_agent(reference) -> tuple[PPTAgent, CoderLLM]:
+    prs, slide_induction = reference
+    llm = CoderLLM()
+    agent = PPTAgent(llm, llm)
+    agent.set_reference(deepcopy(slide_induction), deepcopy(prs))
+    agent.source_doc = None
+    return agent, llm
+
+
+def texts(slide) -> list[list[str]]:
+    return [
+        [para.text for para in shape.text_frame.paragraphs]
+        for shape in slide
+        if shape.text_frame.is_textframe
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("num_points", [1, 5, 8])
+async def test_text_edit_synthesized(reference, num_points):
+    agent, llm = make_agent(reference)
+    layout = agent.layouts[TEXT_LAYOUT]
+    points = [f"point {i}" for i in range(num_points)]
+    editor_output = EditorOutput(
+        elements=[
+            {"name": "main title", "data": ["New title"]},
+            {"name": "quote and explanation", "data": points},
+        ]
+    )
+    command_list, template_id = agent._generate_commands(editor_output, layout)
+    slide, code_executor = await agent._edit_slide(command_list, template_id)
+
+    assert llm.calls == 0 and agent.edit_stats == {"synthesized": 1, "coder": 0}
+    assert texts(slide) == [["New title"], points]
+    assert code_executor.api_history[-1][0] == "api_call_correct"
+
+
+@pytest.mark.asyncio
+async def test_unlocatable_edit_left_to_coder(reference):
+    agent, llm = make_agent(reference)
+    layout = agent.layouts[UNMATCHED_LAYOUT]
+    editor_output = EditorOutput(
+        elements=[{"name": el.name, "data": ["text"]} for el in layout.elements]
+    )
+    command_list, template_id = agent._generate_commands(editor_output, layout)
+    slide, _ = await agent._edit_slide(command_list, template_id)
+    assert llm.calls == 1 and agent.edit_stats == {"synthesized": 0, "coder": 1}
+    assert texts(slide)[0][0] == "from the coder"
+
+
+def test_synthesized_actions_format(reference):
+    prs, _ = reference
+    command_list = [
+        ("main title", "text", "quantity_change: 0", ["What is culture?"], ['a "b"']),
+    ]
+    assert synthesize_actions(prs.slides[1], command_list) == (
+        "# main title: quantity_change: 0\nreplace_paragraph(0, 0, 'a \"b\"')"
+    )
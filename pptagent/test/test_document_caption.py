@@ -0,0 +1,109 @@
+import asyncio
+import json
+from os.path import join
+
+import pytest
+from PIL import Image
+
+from pptagent.document import Document, Media, Section, SubSection
+from pptagent.document.element import CAPTION_CACHE_FILE, CaptionCache
+from pptagent.utils import Language
+
+
+@pytest.fixture(autouse=True)
+def caption_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("CAPTION_STORE", str(tmp_path / "captions.sqlite"))
+
+
+class CountingVisionModel:
+    model = "counting-vision"
+
+    def __init__(self):
+        self.captioned = []
+
+    async def __call__(self, prompt: str, image: str):
+        self.captioned.append(image)
+        await asyncio.sleep(0)
+        return f"Picture: vision caption of {image}"
+
+
+def build_document(image_dir: str) -> Document:
+    medias = []
+    for idx, size in enumerate([(800, 600), (32, 32), (640, 480)]):
+        path = join(image_dir, f"fig_{idx}.png")
+        Image.new("RGB", size).save(path)
+        media = Media(
+            markdown_content=f"![](fig_{idx}.png)",
+            near_chunks=(f"As shown in Figure {idx + 1}, it works.", ""),
+            path=path,
+        )
+        media.load_caption(CaptionCache(image_dir))
+        medias.append(media)
+    section = Section(
+        title="Results",
+        summary="",
+        content=[SubSection(title="Overview", content="text")] + medias,
+        markdown_content="Figure 3 and Figure 3 again, then Figure 1.",
+    )
+    return Document(
+        image_dir=image_dir,
+        language=Language.english(),
+        metadata={},
+        sections=[section],
+    )
+
+
+def test_provisional_caption(tmp_path):
+    document = build_document(str(tmp_path))
+    for media in document.iter_medias():
+        assert media.provisional
+        assert media.caption.startswith("Picture: As shown in Figure")
+    priority = [m.path for m in document.iter_medias_by_priority()]
+    assert priority == [join(str(tmp_path), f"fig_{i}.png") for i in (2, 0, 1)]
+
+
+@pytest.mark.asyncio
+async def test_caption_on_demand_and_persisted(tmp_path):
+    document = build_document(str(tmp_path))
+    vision_model = CountingVisionModel()
+    target = join(str(tmp_path), "fig_0.png")
+
+    await document.caption_medias(vision_model, paths={target})
+    assert vision_model.captioned == [target]
+    assert not document.find_media(path=target).provisional
+
+    # a document parsed again reads the persisted caption
+    reread = build_document(str(tmp_path))
+    media = reread.find_media(path=target)
+    assert not media.provisional
+    await reread.caption_medias(vision_model, paths={target})
+    assert vision_model.captioned == [target]
+
+
+@pytest.mark.asyncio
+async def test_prefetch_shares_requests(tmp_path):
+    document = build_document(str(tmp_path))
+    vision_model = CountingVisionModel()
+    prefetch = document.prefetch_captions(vision_model, max_at_once=1)
+    await document.caption_medias(
+        vision_model, paths={join(str(tmp_path), "fig_1.png")}
+    )
+    await prefetch
+    assert sorted(vision_model.captioned) == sorted(
+        m.path for m in document.iter_medias()
+    )
+
+
+@pytest.mark.asyncio
+async def test_persisted_without_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("CAPTION_STORE", "")
+    document = build_document(str(tmp_path))
+    vision_model = CountingVisionModel()
+    # the prefetch and the request on demand persist through separate caches
+    prefetch = document.prefetch_captions(vision_model, max_at_once=1)
+    await document.caption_medias(
+        vision_model, paths={join(str(tmp_path), "fig_1.png")}
+    )
+    await prefetch
+    with open(join(str(tmp_path), CAPTION_CACHE_FILE), encoding="utf-8") as f:
+        assert sorted(json.load(f)) == ["fig_0.png", "fig_1.png", "fig_2.png"]
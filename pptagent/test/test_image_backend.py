@@ -0,0 +1,56 @@
+from collections import defaultdict
+from os.path import basename, join
+from shutil import which
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+if which("soffice") is None:
+    pytest.skip("rendering slides needs LibreOffice", allow_module_level=True)
+
+from pptagent.induct import SlideInducter
+from pptagent.llms import AsyncLLM
+from pptagent.model_utils import get_image_model, get_onnx_image_model
+from pptagent.presentation import Presentation
+from pptagent.utils import Config, package_join, ppt_to_images
+
+TEMPLATES = ["beamer", "cip", "default", "hit", "thu", "ucas"]
+
+
+async def name_by_image(prompt: str, image: str) -> str:
+    """Names every cluster after its template slide, instead of asking a vision model."""
+    return basename(image)
+
+
+@pytest.fixture(scope="module")
+def backends():
+    return {"torch": get_image_model("cpu"), "onnx": get_onnx_image_model()}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("template", TEMPLATES)
+async def test_onnx_clusters_match_torch(template, backends, tmp_path):
+    config = Config(str(tmp_path))
+    prs = Presentation.from_file(
+        package_join("templates", template, "source.pptx"), config
+    )
+    prs.save(join(tmp_path, "template.pptx"), layout_only=True)
+    await ppt_to_images(join(tmp_path, "template.pptx"), join(tmp_path, "images"))
+
+    clusters = {}
+    for backend, image_models in backends.items():
+        inducter = SlideInducter(
+            prs,
+            join(tmp_path, "images"),
+            join(tmp_path, "images"),
+            config,
+            image_models,
+            AsyncLLM("unused", api_key="offline"),
+            name_by_image,
+            use_assert=False,
+        )
+        layout_induction = defaultdict(dict)
+        await inducter.layout_split(set(range(1, len(prs) + 1)), layout_induction)
+        clusters[backend] = layout_induction
+    assert clusters["onnx"] == clusters["torch"]
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+from PIL import Image
+
+from pptagent.image_index import ImageIndex
+
+
+def write_image(path, size, fmt="PNG", color="red"):
+    Image.new("RGB", size, color).save(path, fmt)
+    return str(path)
+
+
+def test_metadata(tmp_path):
+    index = ImageIndex()
+    meta = index.get(write_image(tmp_path / "a.jpg", (400, 200), "JPEG"))
+    assert meta.size == (400, 200)
+    assert meta.aspect_ratio == 2
+    assert (meta.format, meta.mime) == ("JPEG", "image/jpeg")
+    with pytest.raises(OSError):
+        index.get(tmp_path / "missing.png")
+    (tmp_path / "text.png").write_text("not an image")
+    with pytest.raises(OSError):
+        index.get(tmp_path / "text.png")
+
+
+def test_hits_and_invalidation(tmp_path):
+    index = ImageIndex()
+    path = write_image(tmp_path / "a.png", (10, 20))
+    assert index.get(path) is index.get(path)
+    assert index.report() == {"entries": 1, "hits": 1, "opens": 1, "hashes": 0}
+
+    digest = index.digest(path)
+    assert index.digest(path) == digest
+    assert index.stats["hashes"] == 1
+
+    write_image(path, (30, 20), color="blue")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert index.get(path).size == (30, 20)
+    assert index.digest(path) != digest
+    assert index.stats["opens"] == 2
+
+
+def test_bounded(tmp_path):
+    paths = [write_image(tmp_path / f"{i}.png", (i + 1, 1)) for i in range(3)]
+    index = ImageIndex(max_entries=2)
+    for path in paths:
+        index.get(path)
+    index.get(paths[0])
+    assert index.report()["entries"] == 2
+    assert index.stats["opens"] == 4
+
+    uncached = ImageIndex(max_entries=0)
+    for _ in range(3):
+        uncached.get(paths[0])
+    assert uncached.report() == {"entries": 0, "hits": 0, "opens": 3, "hashes": 0}
@@ -0,0 +1,209 @@
+import json
+import zipfile
+from collections import Counter
+from copy import deepcopy
+from typing import get_args
+
+import pytest
+
+from pptagent.agent import HISTORY_SCOPE
+from pptagent.document import Document, Section, SubSection
+from pptagent.journal import Journal
+from pptagent.llms import AsyncLLM
+from pptagent.multimodal import ImageLabler
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Presentation
+from pptagent.utils import Config, Language, package_join
+
+NUM_SLIDES = 3
+ROLES = {
+    "presentation outlines": "planner",
+    "extracting": "content_organizer",
+    "selecting the most suitable layout": "layout_selector",
+    "generating slide content": "editor",
+    "Code Generator": "coder",
+}
+
+
+class MockLLM(AsyncLLM):
+    """Answers every role offline, failing the editor for the slides in `fail_slides`."""
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.calls = Counter()
+        self.layouts = {}
+        self.fail_slides = set()
+
+    async def __call__(self, content, system_message=None, **kwargs):
+        role = next(v for k, v in ROLES.items() if k in system_message)
+        self.calls[role] += 1
+        response_format = kwargs.get("response_format")
+        if role == "planner":
+            response = {
+                "outline": [
+                    {
+                        "purpose": f"slide {idx}",
+                        "topic": f"Topic {idx}",
+                        "indexes": [
+                            {
+                                "section": f"Section {idx}",
+                                "subsections": [f"Part {idx}"],
+                            }
+                        ],
+                        "images": [],
+                    }
+                    for idx in range(NUM_SLIDES)
+                ]
+            }
+        elif role == "content_organizer":
+            response = [{"paragraph": content[-20:]}]
+        elif role == "layout_selector":
+            layouts = response_format.model_fields["layout"].annotation
+            response = {"reasoning": "", "layout": sorted(get_args(layouts))[-1]}
+        elif role == "editor":
+            if HISTORY_SCOPE.get() in self.fail_slides:
+                raise RuntimeError("editor is down")
+            response = {"elements": self.edit(response_format)}
+        else:
+            raise RuntimeError("edits are synthesized")
+        response = response if isinstance(response, str) else json.dumps(response)
+        return response, [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": response},
+        ]
+
+    def edit(self, response_format) -> list[dict]:
+        element = response_format.model_fields["elements"].annotation.__args__[0]
+        names = set(get_args(element.model_fields["name"].annotation))
+        layout = next(
+            layout
+            for layout in self.layouts.values()
+            if {el.name for el in layout.elements} == names
+        )
+        elements = []
+        for el in layout.elements:
+            if el.type == "image":
+                data = []
+            elif el.variable_length is not None:
+                data = el.variable_data[str(el.variable_length[0])]
+            else:
+                data = el.data
+            elements.append({"name": el.name, "data": [f"new {d}" for d in data]})
+        return elements
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    template_dir = package_join("templates", "default")
+    config = Config(str(tmp_path_factory.mktemp("template")))
+    prs = Presentation.from_file(f"{template_dir}/source.pptx", config)
+    with open(f"{template_dir}/image_stats.json") as f:
+        ImageLabler(prs, config).apply_stats(json.load(f))
+    with open(f"{template_dir}/slide_induction.json") as f:
+        return prs, json.load(f)
+
+
+def build_document(image_dir: str) -> Document:
+    return Document(
+        image_dir=image_dir,
+        language=Language.english(),
+        metadata={"title": "Journal"},
+        sections=[
+            Section(
+                title=f"Section {idx}",
+                summary="summary",
+                content=[SubSection(title=f"Part {idx}", content=f"content {idx}")],
+            )
+            for idx in range(NUM_SLIDES)
+        ],
+    )
+
+
+async def generate(reference, tmp_path, fail_slides=()):
+    prs, slide_induction = reference
+    llm = MockLLM("mock", api_key="offline")
+    agent = PPTAgent(llm, llm)
+    agent.set_reference(deepcopy(slide_induction), deepcopy(prs))
+    llm.layouts = agent.layouts
+    llm.fail_slides = set(fail_slides)
+    generated, history = await agent.generate_pres(
+        build_document(str(tmp_path)),
+        num_slides=NUM_SLIDES,
+        journal_dir=str(tmp_path / "journal"),
+    )
+    return generated, history, llm
+
+
+def slide_parts(prs: Presentation, path: str) -> dict[str, bytes]:
+    prs.save(path)
+    with zipfile.ZipFile(path) as z:
+        return {
+            name: z.read(name)
+            for name in z.namelist()
+            if name.startswith("ppt/slides/")
+        }
+
+
+@pytest.mark.asyncio
+async def test_replay_without_llm_calls(reference, tmp_path):
+    generated, history, llm = await generate(reference, tmp_path)
+    assert llm.calls["editor"] == len(generated.slides) > NUM_SLIDES
+    assert history["journal"]["replayed"] == 0
+    first = slide_parts(generated, str(tmp_path / "first.pptx"))
+
+    replayed, history, llm = await generate(reference, tmp_path)
+    assert sum(llm.calls.values()) == 0
+    # the outline, then layout, editor output and actions per slide
+    assert history["journal"]["replayed"] == 1 + 3 * len(replayed.slides)
+    assert slide_parts(replayed, str(tmp_path / "replayed.pptx")) == first
+
+
+@pytest.mark.asyncio
+async def test_resume_failed_slide(reference, tmp_path):
+    generated, _, _ = await generate(reference, tmp_path, fail_slides={1})
+    num_slides = len(generated.slides)
+
+    resumed, history, llm = await generate(reference, tmp_path)
+    assert len(resumed.slides) == num_slides + 1
+    assert llm.calls == {"editor": 1}
+    with open(history["journal"]["path"]) as f:
+        records = [json.loads(line) for line in f]
+    validations = [r for r in records if r["stage"] == "validation"]
+    # the failure of slide 1 stays in the journal, followed by its completion
+    assert [r["data"]["valid"] for r in validations if r["slide"] == 1] == [False, True]
+    assert len(validations) == num_slides + 2
+
+
+def test_torn_tail_dropped(tmp_path):
+    journal = Journal(str(tmp_path), "key")
+    journal.record("outline", {"outline": []})
+    journal.record("layout", {"layout": "a"}, slide=0)
+    journal.close()
+    with open(journal.path, "a") as f:
+        f.write('{"slide": 0, "stage": "editor", "da')
+
+    journal = Journal(str(tmp_path), "key")
+    assert journal.get("layout", 0) == {"layout": "a"} and journal.replayed == 1
+    assert journal.get("editor", 0) is None
+    journal.record("editor", {"elements": []}, slide=0)
+    journal.close()
+    assert Journal(str(tmp_path), "key").records[0, "editor"] == {"elements": []}
+
+
+@pytest.mark.asyncio
+async def test_journal_closed_on_failure(reference, tmp_path, monkeypatch):
+    journals = []
+
+    class TrackedJournal(Journal):
+        def __init__(self, *args):
+            super().__init__(*args)
+            journals.append(self)
+
+    async def caption_medias(*args, **kwargs):
+        raise RuntimeError("vision model is down")
+
+    monkeypatch.setattr("pptagent.pptgen.Journal", TrackedJournal)
+    monkeypatch.setattr(Document, "caption_medias", caption_medias)
+    with pytest.raises(RuntimeError, match="vision model is down"):
+        await generate(reference, tmp_path)
+    assert len(journals) == 1 and journals[0]._file.closed
@@ -0,0 +1,147 @@
+import asyncio
+import json
+from copy import deepcopy
+
+import pytest
+from PIL import Image
+
+from pptagent.apis import CodeExecutor
+from pptagent.document import Document, Media, Section, SubSection
+from pptagent.layout_scorer import LayoutScorer
+from pptagent.multimodal import ImageLabler
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Presentation
+from pptagent.response import OutlineItem
+from pptagent.utils import Config, Language, package_join
+
+
+class SelectorLLM:
+    model = "selector"
+
+    def __init__(self):
+        self.selections = 0
+
+    async def __call__(self, content, system_message=None, **kwargs):
+        if "extracting" in system_message:
+            response = json.dumps(
+                [{"pointName": "Results", "bulletForm": ["Accuracy improves."] * 4}]
+            )
+        else:
+            self.selections += 1
+            layouts = kwargs["response_format"].model_fields["layout"].annotation
+            response = json.dumps({"reasoning": "", "layout": layouts.__args__[-1]})
+        return response, [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": response},
+        ]
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    template_dir = package_join("templates", "default")
+    config = Config(str(tmp_path_factory.mktemp("template")))
+    prs = Presentation.from_file(f"{template_dir}/source.pptx", config)
+    with open(f"{template_dir}/image_stats.json") as f:
+        ImageLabler(prs, config).apply_stats(json.load(f))
+    with open(f"{template_dir}/slide_induction.json") as f:
+        return prs, json.load(f)
+
+
+def make_agent(
+    reference, tmp_path, scorer: LayoutScorer
+) -> tuple[PPTAgent, SelectorLLM]:
+    prs, slide_induction = reference
+    llm = SelectorLLM()
+    agent = PPTAgent(llm, llm, layout_scorer=scorer)
+    agent.set_reference(deepcopy(slide_induction), deepcopy(prs))
+    Image.new("RGB", (800, 600)).save(tmp_path / "figure.png")
+    agent.source_doc = Document(
+        image_dir=str(tmp_path),
+        language=Language.english(),
+        metadata={},
+        sections=[
+            Section(
+                title="Results",
+                summary="summary",
+                content=[
+                    SubSection(title="Accuracy", content="Accuracy improves."),
+                    Media(
+                        markdown_content="",
+                        near_chunks=("", ""),
+                        path=str(tmp_path / "figure.png"),
+                        caption="Picture: accuracy curve",
+                    ),
+                ],
+            )
+        ],
+    )
+    agent.simple_outline = "Slide 1: results"
+    OutlineItem.set_document(agent.source_doc)
+    return agent, llm
+
+
+def outline_item(images: list[str]) -> OutlineItem:
+    return OutlineItem(
+        purpose="Present the results",
+        topic="Results",
+        indexes=[{"section": "Results", "subsections": ["Accuracy"]}],
+        images=images,
+    )
+
+
+@pytest.mark.asyncio
+async def test_confident_selection_skips_llm(reference, tmp_path):
+    agent, llm = make_agent(reference, tmp_path, LayoutScorer(threshold=0.0))
+    figure = str(tmp_path / "figure.png")
+    layout, _, _ = await agent._select_layout(0, outline_item([figure]))
+    assert llm.selections == 0
+    assert layout.title in agent.multimodal_layouts
+    # the slide has one landscape image, the scorer prefers a layout with one picture
+    assert agent.layout_scorer.profiles[layout.title].num_images == 1
+    history = agent._collect_history(CodeExecutor(agent.retry_times))
+    assert history["layout_scorer"] == {"speculated": 1, "selected": 0, "agreed": 0}
+
+
+@pytest.mark.asyncio
+async def test_forks_count_their_own_selections(reference, tmp_path):
+    scorer = LayoutScorer(threshold=1.01)
+    agent, _ = make_agent(reference, tmp_path, scorer)
+    first, second = agent.fork(), agent.fork()
+
+    async def generate(generator: PPTAgent, num_slides: int):
+        for slide_idx in range(num_slides):
+            await generator._select_layout(slide_idx, outline_item([]))
+            await asyncio.sleep(0)
+        return generator._collect_history(CodeExecutor(generator.retry_times))
+
+    first_history, second_history = await asyncio.gather(
+        generate(first, 3), generate(second, 1)
+    )
+    assert first_history["layout_scorer"]["selected"] == 3
+    assert second_history["layout_scorer"]["selected"] == 1
+    assert scorer.stats["selected"] == 4
+
+
+@pytest.mark.asyncio
+async def test_ambiguous_selection_recorded_and_fitted(reference, tmp_path):
+    corpus = tmp_path / "corpus.jsonl"
+    scorer = LayoutScorer(threshold=1.01, corpus_path=str(corpus))
+    agent, llm = make_agent(reference, tmp_path, scorer)
+    for slide_idx in range(4):
+        layout, _, _ = await agent._select_layout(slide_idx, outline_item([]))
+        assert layout.title == agent.text_layouts[-1]
+    assert llm.selections == 4 and scorer.stats["selected"] == 4
+
+    records = LayoutScorer.read_corpus(str(corpus))
+    assert len(records) == 4
+    assert records[0]["candidates"] == agent.text_layouts
+    fitted = LayoutScorer(threshold=0.5).fit(records)
+    assert fitted.evaluate(records) == {
+        "skip_rate": 1.0,
+        "agreement": 1.0,
+        "accuracy": 1.0,
+    }
+
+    fitted.save(str(tmp_path / "scorer.json"))
+    loaded = LayoutScorer.load(str(tmp_path / "scorer.json"))
+    assert loaded.weights == fitted.weights and loaded.threshold == 0.5
@@ -0,0 +1,136 @@
+import asyncio
+import re
+
+import pytest
+from fastmcp import Client
+from fastmcp.exceptions import ToolError
+from pptagent_pptx import Presentation as load_prs
+
+from pptagent.mcp_server import PPTAgentServer
+
+LAYOUT = "Title Text Header with Multi-level Bulleted Explanatory Points:text"
+NUM_SESSIONS = 8
+
+
+class CoderLLM:
+    """Replaces the title paragraph with the session marker found in the commands."""
+
+    model = "coder"
+
+    async def __call__(self, content, **kwargs):
+        marker = re.search(r"Session \d+ slide \d+", content).group(0)
+        code = f'```python\nreplace_paragraph(0, 0, "{marker}")\n```'
+        history = kwargs.get("history") or []
+        message = [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": code},
+        ]
+        return code, history + message
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    server = PPTAgentServer(
+        model=CoderLLM(),
+        templates=["default"],
+        session_dir=str(tmp_path_factory.mktemp("sessions")),
+    )
+    server.register_tools()
+    return server
+
+
+async def run_session(client: Client, session_idx: int, num_slides: int) -> str:
+    session_id = f"session-{session_idx}"
+    await client.call_tool(
+        "set_template", {"template_name": "default", "session_id": session_id}
+    )
+    for slide_idx in range(num_slides):
+        await client.call_tool(
+            "create_slide", {"layout": LAYOUT, "session_id": session_id}
+        )
+        await client.call_tool(
+            "write_slide",
+            {
+                "structured_slide_elements": [
+                    {
+                        "name": "main title",
+                        "data": [f"Session {session_idx} slide {slide_idx}"],
+                    },
+                    {"name": "quote and explanation", "data": ["point"]},
+                ],
+                "session_id": session_id,
+            },
+        )
+        await client.call_tool("generate_slide", {"session_id": session_id})
+        await asyncio.sleep(0)
+    result = await client.call_tool(
+        "save_generated_slides",
+        {"pptx_path": "final.pptx", "session_id": session_id},
+    )
+    return result.content[0].text
+
+
+def slide_titles(pptx_path) -> list[str]:
+    return [
+        slide.shapes[0].text_frame.text for slide in load_prs(str(pptx_path)).slides
+    ]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sessions_isolated(server):
+    async with Client(server.mcp) as client:
+        messages = await asyncio.gather(
+            *[run_session(client, idx, idx % 3 + 1) for idx in range(NUM_SESSIONS)]
+        )
+
+    for idx, message in enumerate(messages):
+        pptx_path = server.sessions[f"session-{idx}"].resolve("final.pptx")
+        assert message == f"total {idx % 3 + 1} slides saved to {pptx_path}"
+        assert slide_titles(pptx_path) == [
+            f"Session {idx} slide {i}" for i in range(idx % 3 + 1)
+        ]
+
+    # the shared template was not touched by any session
+    reference = server.templates["default"]["reference"]
+    assert len(reference.empty_prs.prs.slides) == reference.presentation.num_pages
+    assert "opening" in server.templates["default"]["slide_induction"]
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_expire(server):
+    async with Client(server.mcp) as client:
+        await client.call_tool("set_template", {"session_id": "idle"})
+        server.sessions["idle"].last_active -= server.session_ttl + 1
+        await client.call_tool("set_template", {})
+    assert "idle" not in server.sessions
+    # calls without an explicit id are keyed by the MCP session
+    assert any(session.generator is not None for session in server.sessions.values())
+
+
+@pytest.mark.asyncio
+async def test_session_id_validated(server):
+    async with Client(server.mcp) as client:
+        for session_id in ("../escaped", "a/b", ".."):
+            with pytest.raises(ToolError, match="Invalid session id"):
+                await client.call_tool("set_template", {"session_id": session_id})
+    assert not any(".." in session_id for session_id in server.sessions)
+
+
+@pytest.mark.asyncio
+async def test_session_paths_confined(server):
+    session = server.get_session("confined")
+    assert session.resolve("slides/final.pptx") == (
+        session.output_dir.resolve() / "slides" / "final.pptx"
+    )
+    async with Client(server.mcp) as client:
+        for path in ("../escaped.png", "/tmp/escaped.png", "a/../../escaped.png"):
+            with pytest.raises(ToolError, match="outside the output directory"):
+                await client.call_tool(
+                    "markdown_table_to_image",
+                    {
+                        "markdown_table": "|a|\n|-|\n|1|",
+                        "path": path,
+                        "css": "",
+                        "session_id": "confined",
+                    },
+                )
@@ -0,0 +1,113 @@
+import asyncio
+import gc
+import tracemalloc
+
+import pytest
+from fastmcp import Client
+from lxml import etree
+
+from pptagent.agent import Turn, TurnHistory
+from pptagent.mcp_server import PPTAgentServer
+from pptagent.memory import deep_sizeof, shared_ids, size_breakdown
+from test.test_mcp_sessions import CoderLLM, run_session
+
+NUM_SESSIONS = 40
+BATCH = 8
+
+
+def test_deep_sizeof():
+    shared = ["x" * 10_000]
+    owned = ["y" * 10_000]
+    state = {"shared": shared, "owned": owned}
+    exclude = shared_ids(shared)
+    assert 10_000 < deep_sizeof(state, set(exclude)) < 20_000
+    assert deep_sizeof(state) > 20_000
+    # an object reachable twice is charged once, to the first attribute
+    holder = type("Holder", (), {})()
+    holder.first, holder.second = owned, owned
+    breakdown = size_breakdown(holder)
+    assert breakdown["first"] > 10_000 and breakdown["second"] == 0
+
+
+def test_xml_trees_counted_once():
+    # only the children are held, a freed root proxy must not hide another tree
+    children = [
+        etree.fromstring(f"<a><b>{'x' * 1000}{i}</b></a>")[0] for i in range(50)
+    ]
+    seen = set()
+    assert all(deep_sizeof(child, seen) > 1000 for child in children)
+    exclude = shared_ids(*children[:25])
+    assert all(deep_sizeof(child, set(exclude)) > 1000 for child in children[25:])
+    assert all(deep_sizeof(child, set(exclude)) == 0 for child in children[:25])
+    tree = etree.fromstring(f"<a><b>{'x' * 1000}</b><c/></a>")
+    assert deep_sizeof([tree[0], tree[1]]) < deep_sizeof([tree[0]]) + 1000
+
+
+def test_history_spill(tmp_path):
+    history = TurnHistory(spill_file=str(tmp_path / "spill.jsonl"))
+    for _ in range(4):
+        history.append(Turn(history.allocate(), "prompt", "response", []))
+    assert history.spill(keep=1) == 3
+    assert len(history) == 1
+    assert [turn.id for turn in history.all()] == [0, 1, 2, 3]
+    assert history.turns_of(0)[0].response == "response"
+
+
+@pytest.mark.asyncio
+async def test_sessions_soak(tmp_path):
+    """
+    Many short sessions within a memory budget leave the memory where it started.
+    """
+    server = PPTAgentServer(
+        model=CoderLLM(),
+        templates=["default"],
+        session_dir=str(tmp_path),
+        session_memory_budget=0.01,
+        memory_budget=8,
+    )
+    server.register_tools()
+    # edit with the coder, to have agent histories to spill
+    server.templates["default"]["reference"].synthesize_edits = False
+    tracemalloc.start()
+    try:
+        async with Client(server.mcp) as client:
+            # warm up the caches filled by the first session
+            await run_session(client, NUM_SESSIONS, 2)
+            server.sessions.clear()
+            gc.collect()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+            for start in range(0, NUM_SESSIONS, BATCH):
+                await asyncio.gather(
+                    *[
+                        run_session(client, idx, idx % 3 + 1)
+                        for idx in range(start, start + BATCH)
+                    ]
+                )
+            report = server.memory_report()
+            # saved sessions keep nothing, the agent histories were spilled
+            assert all(s["memory"] < 2**16 for s in report["sessions"].values())
+            assert (tmp_path / "session-0" / ".history" / "coder.jsonl").exists()
+
+            server.sessions.clear()
+            gc.collect()
+            growth = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    assert growth < 2**20, f"{growth} bytes retained after {NUM_SESSIONS} sessions"
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_evicts_idle_sessions(tmp_path):
+    server = PPTAgentServer(
+        model=CoderLLM(), templates=["default"], session_dir=str(tmp_path)
+    )
+    server.register_tools()
+    async with Client(server.mcp) as client:
+        for idx in range(3):
+            await client.call_tool("set_template", {"session_id": f"idle-{idx}"})
+        idle_memory = server.memory_report()["sessions"]["idle-0"]["memory"]
+        server.memory_budget = idle_memory * 2.5
+        await client.call_tool("set_template", {"session_id": "active"})
+    # the least recently active sessions are evicted first
+    assert sorted(server.sessions) == ["active", "idle-2"]
@@ -0,0 +1,59 @@
+import asyncio
+import zipfile
+
+import pytest
+
+from pptagent.offload import OffloadTask, WorkerPool
+from pptagent.utils import Config, package_join
+
+
+def slide_parts(path) -> dict[str, bytes]:
+    with zipfile.ZipFile(path) as archive:
+        return {
+            name: archive.read(name)
+            for name in archive.namelist()
+            if name.startswith("ppt/slides/")
+        }
+
+
+@pytest.mark.asyncio
+async def test_save_in_worker(tmp_path):
+    template_dir = package_join("templates", "default")
+    with WorkerPool(str(tmp_path), max_workers=1) as pool:
+        prs = await pool.parse(
+            f"{template_dir}/source.pptx", Config(str(tmp_path / "run"))
+        )
+        await pool.save(prs, str(tmp_path / "pooled.pptx"))
+    prs.save(str(tmp_path / "inline.pptx"))
+    # the staged pickles are removed once handed off
+    assert not list((tmp_path / "offload").iterdir())
+    pooled = slide_parts(tmp_path / "pooled.pptx")
+    assert pooled and pooled == slide_parts(tmp_path / "inline.pptx")
+
+
+def test_incomplete_task_rejected():
+    class Incomplete(OffloadTask):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.asyncio
+async def test_backpressure(tmp_path):
+    pool = WorkerPool(str(tmp_path), max_workers=0, max_pending=2)
+    running = peak = 0
+
+    async def run(task):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return task
+
+    pool._run = run
+    assert await asyncio.gather(*(pool.submit(idx) for idx in range(6))) == list(
+        range(6)
+    )
+    assert peak == 2
@@ -0,0 +1,81 @@
+import json
+
+from openai.lib._parsing._completions import type_to_response_format_param
+
+from pptagent.document import Document, Media, Section, SubSection
+from pptagent.response import Outline, OutlineItem
+from pptagent.utils import Language
+
+
+def build_document(num_sections: int = 3, num_images: int = 2) -> Document:
+    sections = []
+    for sec_idx in range(num_sections):
+        content = [
+            SubSection(title=f"Part {sec_idx}.{i}", content="text") for i in range(3)
+        ]
+        content += [
+            Media(
+                markdown_content=f"![](figures/sec{sec_idx}_fig{i}.png)",
+                near_chunks=("", ""),
+                path=f"figures/sec{sec_idx}_fig{i}.png",
+                caption=f"Picture: figure {i} of section {sec_idx}",
+            )
+            for i in range(num_images)
+        ]
+        sections.append(
+            Section(title=f"Section {sec_idx}", summary="summary", content=content)
+        )
+    return Document(
+        image_dir="figures",
+        language=Language.english(),
+        metadata={},
+        sections=sections,
+    )
+
+
+def schema_bytes(model) -> int:
+    return len(json.dumps(type_to_response_format_param(model)))
+
+
+def test_response_model_memoized():
+    document = build_document()
+    model = Outline.response_model(document)
+    assert Outline.response_model(build_document()) is model
+
+    document.sections[0].content.append(SubSection(title="New part", content="text"))
+    assert Outline.response_model(document) is not model
+
+
+def test_compact_outline_roundtrip():
+    document = build_document(num_sections=6, num_images=8)
+    compact_model = Outline.response_model(document, compact=True)
+    assert schema_bytes(compact_model) < schema_bytes(Outline.response_model(document))
+
+    overview = document.get_overview(compact=True)
+    assert "<section id=1>Section 1</section>" in overview
+    assert "<subsection id=4>Part 1.1</subsection>" in overview
+    assert "<image id=9>figures/sec1_fig1.png</image>" in overview
+
+    response = {
+        "outline": [
+            {
+                "purpose": "introduce",
+                "topic": "Introduction",
+                "indexes": [{"section": 1, "subsections": [3, 4]}],
+                "images": [9],
+            }
+        ]
+    }
+    compact_model(**response)
+    (item,) = [OutlineItem(**o) for o in Outline.from_compact(document, response)]
+    assert item.indexes[0].section == "Section 1"
+    assert item.indexes[0].subsections == ["Part 1.0", "Part 1.1"]
+    assert item.images == ["figures/sec1_fig1.png"]
+    header, content, images = item.retrieve(0, document)
+    assert "Part 1.1" in content and "figure 1 of section 1" in images[0]
+
+
+def test_empty_document():
+    document = build_document(num_sections=0, num_images=0)
+    for compact in (True, False):
+        assert schema_bytes(Outline.response_model(document, compact=compact)) > 0
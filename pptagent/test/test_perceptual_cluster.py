@@ -0,0 +1,82 @@
+import importlib.util
+import json
+from collections import defaultdict
+from os.path import basename, join
+
+import pytest
+from PIL import Image, ImageDraw
+
+from pptagent.induct import SlideInducter
+from pptagent.llms import AsyncLLM
+from pptagent.model_utils import ModelManager, PerceptualImageModel
+from pptagent.presentation import Picture, Presentation
+from pptagent.utils import Config, package_join
+
+
+async def name_by_image(prompt: str, image: str) -> str:
+    return basename(image)
+
+
+def sketch_slides(prs: Presentation, image_dir: str):
+    """Stand-ins for the renderings of the slides, their shapes drawn as boxes."""
+    for slide in prs.slides:
+        scale = 320 / slide.slide_width
+        image = Image.new("RGB", (320, round(slide.slide_height * scale)), "white")
+        draw = ImageDraw.Draw(image)
+        for shape in slide:
+            box = [
+                shape.left * scale,
+                shape.top * scale,
+                (shape.left + shape.width) * scale,
+                (shape.top + shape.height) * scale,
+            ]
+            if box[2] <= box[0] or box[3] <= box[1]:
+                continue
+            if isinstance(shape, Picture):
+                draw.rectangle(box, fill="steelblue")
+            else:
+                draw.rectangle(box, outline="black", width=2)
+        image.save(join(image_dir, f"slide_{slide.slide_idx:04d}.jpg"))
+
+
+def test_selected_without_torch(monkeypatch):
+    monkeypatch.delenv("IMAGE_BACKEND", raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "offline")
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    models = ModelManager("http://localhost", "model", "model", use_batch=False)
+    assert models.image_backend == "perceptual"
+    assert isinstance(models.image_model[1], PerceptualImageModel)
+
+
+@pytest.mark.asyncio
+async def test_layout_split(tmp_path):
+    template_dir = package_join("templates", "default")
+    config = Config(str(tmp_path))
+    prs = Presentation.from_file(join(template_dir, "source.pptx"), config)
+    sketch_slides(prs, str(tmp_path))
+    inducter = SlideInducter(
+        prs,
+        str(tmp_path),
+        str(tmp_path),
+        config,
+        (None, PerceptualImageModel()),
+        AsyncLLM("unused", api_key="offline"),
+        name_by_image,
+        use_assert=False,
+    )
+    with open(join(template_dir, "slide_induction.json"), encoding="utf-8") as f:
+        reference = json.load(f)
+    content_slides = {
+        idx
+        for name, layout in reference.items()
+        if name not in reference["functional_keys"] and "slides" in layout
+        for idx in layout["slides"]
+    }
+    layout_induction = defaultdict(dict)
+    await inducter.layout_split(content_slides, layout_induction)
+    clusters = sorted(sorted(layout["slides"]) for layout in layout_induction.values())
+    assert sorted(idx for cluster in clusters for idx in cluster) == sorted(
+        content_slides
+    )
+    # the layouts the image model groups are grouped alike
+    assert [8, 9] in clusters and [11, 12] in clusters
@@ -0,0 +1,175 @@
+import asyncio
+import csv
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from collections import Counter
+from os.path import basename, dirname, join
+
+import pytest
+from PIL import Image
+
+from pptagent.ppteval import EvalStore, PPTEval
+from pptagent.presentation import Presentation
+from pptagent.utils import package_join
+
+NUM_DECKS = 3
+NUM_SLIDES = 4
+# per deck: extraction and logic, per slide: two descriptions and two scores
+NUM_CALLS = NUM_DECKS * (2 + 4 * NUM_SLIDES)
+
+
+class MockJudge:
+    """Judges deterministically, exiting the process abruptly after `crash_after` calls."""
+
+    def __init__(self, model: str, crash_after: int | None = None):
+        self.model = model
+        self.crash_after = crash_after
+        self.calls = Counter()
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, content, images=None, return_json=False, **kwargs):
+        if self.crash_after is not None and self.calls.total() == self.crash_after:
+            os._exit(3)
+        self.calls["vision" if images else "text"] += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.005)
+        self.running -= 1
+        digest = int(hashlib.sha1(content.encode()).hexdigest(), 16)
+        if images:
+            return f"a slide of {basename(images)} ({digest % 97})"
+        if "content extractor" in content:
+            return {"slide_descriptions": [], "background": {}}
+        return {"reason": "", "score": digest % 5 + 1}
+
+
+def render_slides(slide_folder: str, deck_idx: int = 0):
+    os.makedirs(slide_folder)
+    for slide_idx in range(NUM_SLIDES):
+        Image.new("RGB", (64, 36), (deck_idx * 60, slide_idx * 60, 90)).save(
+            join(slide_folder, f"slide_{slide_idx + 1:04d}.jpg")
+        )
+
+
+def build_decks(root: str, rendered: bool = True) -> list[str]:
+    decks = []
+    for deck_idx in range(NUM_DECKS):
+        deck = join(root, f"deck_{deck_idx}.pptx")
+        shutil.copy(package_join("templates", "default", "source.pptx"), deck)
+        if rendered:
+            render_slides(deck.replace(".pptx", ""), deck_idx)
+        decks.append(deck)
+    return decks
+
+
+def evaluate(db_path: str, decks: list[str], crash_after: int | None = None):
+    language_model = MockJudge("judge", crash_after)
+    vision_model = MockJudge("describer", crash_after)
+    # both judges count towards the crash, as one process
+    vision_model.calls = language_model.calls
+    store = EvalStore(db_path)
+    evaluator = PPTEval(language_model, vision_model, store, max_at_once=4)
+    report = asyncio.run(evaluator.eval_decks(decks))
+    store.close()
+    return report, language_model
+
+
+def test_concurrent_evaluation_report(tmp_path):
+    decks = build_decks(str(tmp_path))
+    report, judge = evaluate(str(tmp_path / "eval.sqlite"), decks)
+    assert judge.calls.total() == NUM_CALLS
+    assert 1 < judge.max_running <= 4
+    assert report["dimensions"]["vision"]["count"] == NUM_DECKS * NUM_SLIDES
+    assert report["dimensions"]["logic"]["count"] == NUM_DECKS
+    assert set(report["decks"]) == set(decks)
+
+    store = EvalStore(str(tmp_path / "eval.sqlite"))
+    store.export_report(str(tmp_path / "report.csv"), "judge")
+    with open(tmp_path / "report.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["deck"] for row in rows] == sorted(decks)
+    assert float(rows[0]["logic"]) == report["decks"][decks[0]]["logic"]
+    # another judge is scored on its own
+    assert store.report("another judge")["dimensions"] == {}
+
+
+def test_resume_after_crash(tmp_path):
+    decks = build_decks(str(tmp_path))
+    db_path = str(tmp_path / "eval.sqlite")
+    crash_after = NUM_CALLS // 2
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from test.test_ppteval import evaluate;"
+            f"evaluate({db_path!r}, sys.argv[1:], {crash_after})",
+            *decks,
+        ],
+        cwd=dirname(dirname(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 3, process.stderr
+
+    store = EvalStore(db_path)
+    (scored,) = store.conn.execute("SELECT COUNT(*) FROM scores").fetchone()
+    (described,) = store.conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()
+    store.close()
+    assert 0 < scored + described <= crash_after
+
+    report, judge = evaluate(db_path, decks)
+    # only the calls whose results were not stored are made again
+    assert judge.calls.total() == NUM_CALLS - scored - described
+    expected, _ = evaluate(str(tmp_path / "clean.sqlite"), decks)
+    assert report == expected
+
+
+def test_rendering_bounded(tmp_path, monkeypatch):
+    decks = build_decks(str(tmp_path), rendered=False)
+    running = Counter()
+    parse_threads = set()
+    from_file = Presentation.from_file
+
+    async def render(prs_file, slide_folder):
+        running["calls"] += 1
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.01)
+        render_slides(slide_folder)
+        running["now"] -= 1
+
+    def parse(prs_file, config):
+        parse_threads.add(threading.get_ident())
+        return from_file(prs_file, config)
+
+    monkeypatch.setattr("pptagent.ppteval.ppt_to_images", render)
+    monkeypatch.setattr("pptagent.ppteval.Presentation.from_file", parse)
+    judge = MockJudge("judge")
+    store = EvalStore(str(tmp_path / "eval.sqlite"))
+    evaluator = PPTEval(judge, judge, store, max_renders=1)
+    asyncio.run(evaluator.eval_decks(decks))
+    store.close()
+    assert evaluator.failed == 0
+    assert running["calls"] == NUM_DECKS and running["peak"] == 1
+    assert parse_threads and threading.get_ident() not in parse_threads
+
+    # a resumed run neither renders nor judges the decks again
+    running.clear()
+    store = EvalStore(str(tmp_path / "eval.sqlite"))
+    judge = MockJudge("judge")
+    asyncio.run(PPTEval(judge, judge, store).eval_decks(decks))
+    store.close()
+    assert running["calls"] == 0 and judge.calls.total() == 0
+
+
+@pytest.mark.parametrize("result", [{"reason": "no score"}, "not json"])
+def test_unscored_result_counts_zero(tmp_path, result):
+    store = EvalStore(str(tmp_path / "eval.sqlite"))
+    store.put_score("deck", "slide_0001.jpg", "vision", "judge", result)
+    store.put_score("deck", "slide_0002.jpg", "vision", "judge", {"score": 4})
+    assert store.report("judge")["dimensions"]["vision"] == {"mean": 2, "count": 2}
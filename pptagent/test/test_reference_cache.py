@@ -0,0 +1,91 @@
+import json
+from copy import deepcopy
+
+import pytest
+
+from pptagent.llms import AsyncLLM
+from pptagent.multimodal import ImageLabler
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Picture, Presentation
+from pptagent.utils import Config, package_join
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    template_dir = package_join("templates", "default")
+    config = Config(str(tmp_path_factory.mktemp("template")))
+    prs = Presentation.from_file(f"{template_dir}/source.pptx", config)
+    with open(f"{template_dir}/image_stats.json") as f:
+        ImageLabler(prs, config).apply_stats(json.load(f))
+    with open(f"{template_dir}/slide_induction.json") as f:
+        return prs, json.load(f)
+
+
+def make_agent(reference, slide_induction=None, **kwargs) -> PPTAgent:
+    prs, default_induction = reference
+    llm = AsyncLLM("mock", api_key="offline")
+    return PPTAgent(llm, llm).set_reference(
+        deepcopy(slide_induction or default_induction), deepcopy(prs), **kwargs
+    )
+
+
+def test_prepared_reference_shared(reference, tmp_path):
+    first, second = make_agent(reference), make_agent(reference)
+    assert first.presentation is second.presentation
+    assert first.layouts is second.layouts
+    assert first.text_layouts == second.text_layouts
+    assert first.text_fitter.areas is second.text_fitter.areas
+
+    # each generator builds slides into its own presentation
+    assert first.empty_prs is not second.empty_prs
+    first.empty_prs.slides = [first.presentation.slides[0]]
+    first.empty_prs.save(str(tmp_path / "first.pptx"))
+    assert second.empty_prs.slides == []
+
+
+def test_reference_prepared_again_on_change(reference):
+    prs, slide_induction = reference
+    cached = make_agent(reference)
+    assert make_agent(reference, use_cache=False).layouts is not cached.layouts
+    assert (
+        make_agent(reference, hide_small_pic_ratio=None).layouts is not cached.layouts
+    )
+
+    functional = set(slide_induction["functional_keys"])
+    layout = next(k for k in slide_induction if k not in functional | {"language"})
+    changed = {k: v for k, v in slide_induction.items() if k != layout}
+    agent = make_agent(reference, changed)
+    assert agent.layouts is not cached.layouts and layout not in agent.layouts
+
+
+def test_reference_keyed_by_run_dir(reference, tmp_path):
+    prs, slide_induction = reference
+    cached = make_agent(reference)
+    config = Config(str(tmp_path))
+    other = Presentation.from_file(prs.source_file, config)
+    with open(package_join("templates", "default", "image_stats.json")) as f:
+        ImageLabler(other, config).apply_stats(json.load(f))
+    agent = make_agent((other, slide_induction))
+    assert agent.layouts is not cached.layouts
+    pic = next(
+        pic
+        for slide in agent.presentation.slides
+        for pic in slide.shape_filter(Picture)
+    )
+    assert pic.img_path.startswith(str(tmp_path))
+
+
+def test_reference_prepared_on_copy(reference):
+    prs, slide_induction = reference
+    pictures = [len(list(slide.shape_filter(Picture))) for slide in prs.slides]
+    llm = AsyncLLM("mock", api_key="offline")
+    # a ratio hiding every picture, which must not leak into the given presentation
+    first, second = [
+        PPTAgent(llm, llm).set_reference(
+            deepcopy(slide_induction), prs, hide_small_pic_ratio=1
+        )
+        for _ in range(2)
+    ]
+    assert first.presentation is not prs
+    assert first.layouts is second.layouts
+    assert [len(list(slide.shape_filter(Picture))) for slide in prs.slides] == pictures
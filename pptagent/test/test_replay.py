@@ -0,0 +1,144 @@
+import json
+import random
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+from pptagent.agent import load_role
+from pptagent.llms import AsyncLLM
+from pptagent.replay import (
+    LatencyProfile,
+    Recording,
+    RoleMatcher,
+    create_replay_app,
+    request_key,
+    synthesize_from_schema,
+)
+
+
+def replay_client(app) -> AsyncOpenAI:
+    return AsyncOpenAI(
+        base_url="http://replay/v1",
+        api_key="replay",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)),
+    )
+
+
+def replay_llm(app) -> AsyncLLM:
+    llm = AsyncLLM("replay", api_key="replay")
+    llm.client = replay_client(app)
+    return llm
+
+
+def test_role_matcher():
+    matcher = RoleMatcher.default()
+    editor = load_role("editor")
+    body = {
+        "messages": [
+            {"role": "system", "content": editor.system_message + "\n\nprefix"},
+            {"role": "user", "content": "slide"},
+        ]
+    }
+    assert matcher(body) == "editor"
+    caption = {"messages": [{"role": "user", "content": "Describe the main content"}]}
+    assert matcher(caption).startswith("prompt-")
+    assert matcher({"messages": []}) == "unknown"
+
+
+@pytest.mark.asyncio
+async def test_replay_recorded_and_synthesized(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    llm = AsyncLLM("replay", api_key="replay")
+    system, message = llm.format_message("hi")
+    recorded = {"model": "replay", "messages": system + message}
+    with open(path, "w") as f:
+        f.write(
+            json.dumps(
+                {
+                    "role": "x",
+                    "key": request_key(recorded),
+                    "message": {"content": "exact"},
+                }
+            )
+            + "\n"
+        )
+        f.write(json.dumps({"role": "x", "content": "fallback"}) + "\n")
+    app = create_replay_app(Recording(path), matcher=RoleMatcher({"x": ["h"]}))
+    llm.client = replay_client(app)
+
+    assert await llm("hi") == "exact"
+    assert await llm("hello") == "exact"  # the role's responses are replayed in turn
+    assert await llm("hello") == "fallback"
+
+    class Choice(BaseModel):
+        layout: str
+        count: int
+
+    response = await llm("other", response_format=Choice, return_json=True)
+    assert Choice(**response)
+    stats = app.state.stats
+    assert stats["x"].replayed == 3 and stats["x"].calls == 3
+    assert sum(s.synthesized for s in stats.values()) == 1
+
+    chunks = [chunk async for chunk in llm.stream("hi")]
+    assert "".join(chunks) == "exact"
+    assert llm.usage.requests == 5
+
+    with pytest.raises(Exception):
+        await replay_client(app).chat.completions.create(
+            model="replay", messages=[{"role": "user", "content": "missing"}]
+        )
+
+
+@pytest.mark.asyncio
+async def test_injected_errors_and_recording(tmp_path):
+    failing = create_replay_app(
+        Recording(), {"default": LatencyProfile(error_rate=1.0, error_status=[429])}
+    )
+    with pytest.raises(Exception, match="429"):
+        await replay_client(failing).chat.completions.create(
+            model="replay", messages=[{"role": "user", "content": "hi"}]
+        )
+    assert sum(s.errors for s in failing.state.stats.values()) == 1
+
+    upstream = Recording(str(tmp_path / "upstream.jsonl"))
+    upstream.add("any", None, {"content": "from upstream"})
+    matcher = RoleMatcher({"any": [""]})
+    path = str(tmp_path / "recording.jsonl")
+    recorder = create_replay_app(
+        Recording(path),
+        matcher=matcher,
+        upstream=replay_client(create_replay_app(upstream, matcher=matcher)),
+    )
+    assert await replay_llm(recorder)("hi") == "from upstream"
+    replayer = create_replay_app(Recording(path), matcher=matcher)
+    assert await replay_llm(replayer)("hi") == "from upstream"
+    assert replayer.state.stats["any"].replayed == 1
+
+
+def test_synthesize_from_schema():
+    schema = {
+        "type": "object",
+        "properties": {
+            "elements": {
+                "type": "array",
+                "items": {"$ref": "#/$defs/Element"},
+            },
+            "layout": {"enum": ["a", "b"]},
+        },
+        "$defs": {
+            "Element": {
+                "type": "object",
+                "properties": {
+                    "name": {"enum": ["title", "body"]},
+                    "data": {"type": "array", "items": {"type": "string"}},
+                },
+            }
+        },
+    }
+    instance = synthesize_from_schema(schema, random.Random(0))
+    assert [e["name"] for e in instance["elements"]] == ["title", "body"]
+    assert instance["layout"] in ("a", "b")
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+import yaml
+
+from pptagent.agent import Agent, Role, load_role
+
+ROLE_CONFIG = {
+    "system_prompt": "You are a tester.",
+    "prefix": "Docs: {{ docs }}",
+    "template": "Input: {{ text }}",
+    "jinja_args": ["docs", "text"],
+    "use_model": "language",
+}
+
+
+def write_role(path, **updates):
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(ROLE_CONFIG | updates, f)
+
+
+class DummyLLM:
+    model = "dummy"
+
+
+def test_agents_share_compiled_role():
+    llm_mapping = {"language": DummyLLM()}
+    first = Agent("coder", llm_mapping)
+    second = Agent("coder", llm_mapping)
+    assert first.role is second.role is load_role("coder")
+    assert first.template is second.template
+    with pytest.raises(TypeError):
+        first.config["template"] = "changed"
+
+
+def test_role_reloaded_on_modification(tmp_path):
+    path = tmp_path / "tester.yaml"
+    write_role(path)
+    role = load_role("tester", str(path))
+    assert load_role("tester", str(path)) is role
+
+    write_role(path, template="Input: {{ text }}!")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    reloaded = load_role("tester", str(path))
+    assert reloaded is not role
+    assert reloaded.template.render(text="hi") == "Input: hi!"
+
+
+@pytest.mark.parametrize(
+    "jinja_args, message",
+    [(["docs"], "undeclared: {'text'}"), (["docs", "text", "extra"], "unused")],
+)
+def test_jinja_args_checked(jinja_args, message):
+    with pytest.raises(ValueError, match=message):
+        Role.from_config("tester", ROLE_CONFIG | {"jinja_args": jinja_args})
@@ -0,0 +1,152 @@
+import asyncio
+import json
+from collections import Counter
+from typing import get_args
+
+import pytest
+
+from pptagent.document import Document, Section, SubSection
+from pptagent.llms import AsyncLLM
+from pptagent.scheduler import BatchJob, BatchScheduler, FairLimiter
+from pptagent.utils import Language
+
+DELAY = 0.05
+NUM_SLIDES = 2
+ROLES = {
+    "presentation outlines": "planner",
+    "extracting": "content_organizer",
+    "selecting the most suitable layout": "layout_selector",
+    "generating slide content": "editor",
+}
+
+
+class MockLLM(AsyncLLM):
+    """Answers every role after a delay, counting the peak of calls in flight."""
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.calls = Counter()
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, content, system_message=None, **kwargs):
+        role = next(v for k, v in ROLES.items() if k in system_message)
+        self.calls[role] += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(DELAY)
+        finally:
+            self.in_flight -= 1
+        response_format = kwargs.get("response_format")
+        if role == "planner":
+            response = {
+                "outline": [
+                    {
+                        "purpose": f"slide {idx}",
+                        "topic": f"Topic {idx}",
+                        "indexes": [
+                            {
+                                "section": f"Section {idx}",
+                                "subsections": [f"Part {idx}"],
+                            }
+                        ],
+                        "images": [],
+                    }
+                    for idx in range(NUM_SLIDES)
+                ]
+            }
+        elif role == "content_organizer":
+            response = [{"paragraph": "a key point"}]
+        elif role == "layout_selector":
+            layouts = response_format.model_fields["layout"].annotation
+            response = {"reasoning": "", "layout": sorted(get_args(layouts))[-1]}
+        else:
+            element = response_format.model_fields["elements"].annotation.__args__[0]
+            names = get_args(element.model_fields["name"].annotation)
+            response = {"elements": [{"name": name, "data": [name]} for name in names]}
+        response = json.dumps(response)
+        return response, [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": response},
+        ]
+
+
+def build_document(image_dir: str) -> Document:
+    return Document(
+        image_dir=image_dir,
+        language=Language.english(),
+        metadata={},
+        sections=[
+            Section(
+                title=f"Section {idx}",
+                summary="summary",
+                content=[SubSection(title=f"Part {idx}", content=f"content {idx}")],
+            )
+            for idx in range(NUM_SLIDES)
+        ],
+    )
+
+
+async def run_batch(tmp_path, num_documents: int, max_at_once: int, broken=()):
+    llm = MockLLM("mock", api_key="offline")
+    scheduler = BatchScheduler(
+        llm, llm, str(tmp_path / f"out-{num_documents}-{max_at_once}"), max_at_once
+    )
+    jobs = [
+        BatchJob(
+            f"doc-{idx}",
+            build_document(str(tmp_path / "missing" if idx in broken else tmp_path)),
+            "default",
+            NUM_SLIDES,
+        )
+        for idx in range(num_documents)
+    ]
+    results = await scheduler.run(jobs)
+    return scheduler, results
+
+
+@pytest.mark.asyncio
+async def test_batch_scales_with_concurrency(tmp_path):
+    serial, _ = await run_batch(tmp_path, 4, 1)
+    concurrent, _ = await run_batch(tmp_path, 4, 8)
+    few, _ = await run_batch(tmp_path, 2, 32)
+    scheduler, results = await run_batch(tmp_path, 8, 32)
+    # the calls in flight are bounded by max_at_once
+    assert serial.language_model.peak == 1
+    assert 1 < concurrent.language_model.peak <= 8
+    # four times the documents are generated together, not one after another
+    assert scheduler.language_model.peak > 2 * few.language_model.peak
+
+    assert len(scheduler.references) == 1
+    assert all(result.error is None for result in results)
+    with open(f"{scheduler.output_dir}/results.jsonl") as f:
+        written = [json.loads(line) for line in f]
+    assert sorted(r["name"] for r in written) == [f"doc-{idx}" for idx in range(8)]
+    # the opening slide is added to the outline
+    assert {r["num_slides"] for r in written} == {NUM_SLIDES + 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_documents_collected(tmp_path):
+    scheduler, results = await run_batch(tmp_path, 3, 4, broken={1})
+    errors = {result.name: result.error for result in results}
+    assert errors["doc-0"] is None and errors["doc-2"] is None
+    assert "image directory is not found" in errors["doc-1"]
+    assert (tmp_path / "out-3-4" / "doc-2.pptx").exists()
+    assert not (tmp_path / "out-3-4" / "doc-1.pptx").exists()
+
+
+@pytest.mark.asyncio
+async def test_fair_limiter_round_robin():
+    limiter = FairLimiter(1)
+    order = []
+
+    async def work(key):
+        async with limiter.slot(key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*[work("a") for _ in range(3)], *[work("b") for _ in range(3)])
+    assert order == ["a", "a", "b", "a", "b", "b"]
+    assert limiter.active == 0 and not limiter.waiters
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import time
+from copy import deepcopy
+
+import pytest
+from tenacity import wait_none
+
+from pptagent.apis import CodeExecutor
+from pptagent.document import Document, Section, SubSection
+from pptagent.llms import AsyncLLM
+from pptagent.multimodal import ImageLabler
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Presentation
+from pptagent.response import EditorOutput
+from pptagent.utils import Config, JsonArrayStream, Language, package_join
+
+NUM_SLIDES = 6
+PLANNER_DELAY = 0.05
+ORGANIZER_DELAY = 0.2
+STEP_DELAY = 0.02
+
+
+class MockLLM(AsyncLLM):
+    """
+    Streams the outline item by item and answers the other roles after a delay.
+    The last item of the outline waits for a layout to be selected, up to a timeout.
+    """
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.calls = {"content_organizer": 0, "layout_selector": 0}
+        self.selected = asyncio.Event()
+        self.selected_while_streaming = False
+        self.invalid_attempts = 0
+
+    async def __call__(self, content, system_message=None, **kwargs):
+        if "presentation outlines" in system_message:
+            response = "".join([delta async for delta in self.stream(content)])
+        elif "extracting" in system_message:
+            self.calls["content_organizer"] += 1
+            await asyncio.sleep(ORGANIZER_DELAY)
+            response = json.dumps([{"paragraph": content[-20:]}])
+        else:
+            self.calls["layout_selector"] += 1
+            self.selected.set()
+            await asyncio.sleep(STEP_DELAY)
+            layouts = kwargs["response_format"].model_fields["layout"].annotation
+            response = json.dumps({"reasoning": "", "layout": layouts.__args__[0]})
+        message = [
+            {"role": "user", "content": content},
+            {"role": "assistant", "content": response},
+        ]
+        return response, message
+
+    async def stream(self, content, **kwargs):
+        outline = {
+            "outline": [
+                {
+                    "purpose": f"slide {idx}",
+                    "topic": f"Topic {idx // 2}",
+                    "indexes": [
+                        {"section": f"Section {idx}", "subsections": [f"Part {idx}"]}
+                    ],
+                    "images": [],
+                }
+                for idx in range(NUM_SLIDES)
+            ]
+        }
+        if self.invalid_attempts:
+            self.invalid_attempts -= 1
+            del outline["outline"][1]["topic"]
+        text = json.dumps(outline, indent=2)
+        step = len(text) // NUM_SLIDES + 1
+        for start in range(0, len(text), step):
+            await asyncio.sleep(PLANNER_DELAY)
+            if start + step >= len(text):
+                try:
+                    await asyncio.wait_for(self.selected.wait(), 1)
+                    self.selected_while_streaming = True
+                except TimeoutError:
+                    pass
+            yield text[start : start + step]
+
+
+class TimedAgent(PPTAgent):
+    """Replaces editing with fixed delays and records when content slides are done."""
+
+    async def generate_slide(self, slide_idx, outline_item, semaphore):
+        result = await super().generate_slide(slide_idx, outline_item, semaphore)
+        if outline_item.topic != "Functional":
+            self.finished.append(time.perf_counter())
+        return result
+
+    async def _generate_content(self, layout, slide_content, slide_description):
+        await asyncio.sleep(STEP_DELAY)
+        return EditorOutput(elements=[])
+
+    def _generate_commands(self, editor_output, layout):
+        return [], layout.template_id
+
+    async def _edit_slide(self, command_list, template_id):
+        await asyncio.sleep(STEP_DELAY)
+        slide = deepcopy(self.presentation.slides[template_id - 1])
+        return slide, CodeExecutor(self.retry_times)
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    template_dir = package_join("templates", "default")
+    config = Config(str(tmp_path_factory.mktemp("template")))
+    prs = Presentation.from_file(f"{template_dir}/source.pptx", config)
+    with open(f"{template_dir}/image_stats.json") as f:
+        ImageLabler(prs, config).apply_stats(json.load(f))
+    with open(f"{template_dir}/slide_induction.json") as f:
+        return prs, json.load(f)
+
+
+def build_document(image_dir: str) -> Document:
+    return Document(
+        image_dir=image_dir,
+        language=Language.english(),
+        metadata={},
+        sections=[
+            Section(
+                title=f"Section {idx}",
+                summary="summary",
+                content=[SubSection(title=f"Part {idx}", content=f"content {idx}")],
+            )
+            for idx in range(NUM_SLIDES)
+        ],
+    )
+
+
+async def time_to_first_slide(
+    reference, tmp_path, stream_outline: bool, llm: MockLLM | None = None
+):
+    prs, slide_induction = reference
+    llm = llm or MockLLM("mock", api_key="offline")
+    agent = TimedAgent(llm, llm, stream_outline=stream_outline)
+    agent.set_reference(deepcopy(slide_induction), deepcopy(prs))
+    agent.finished = []
+    start = time.perf_counter()
+    generated, _ = await agent.generate_pres(
+        build_document(str(tmp_path)), num_slides=NUM_SLIDES
+    )
+    purposes = [item.purpose for item in agent.outline if item.topic != "Functional"]
+    assert purposes == [f"slide {idx}" for idx in range(NUM_SLIDES)]
+    assert len(generated.slides) == len(agent.outline)
+    if not llm.invalid_attempts:
+        assert llm.calls == {
+            "content_organizer": NUM_SLIDES,
+            "layout_selector": NUM_SLIDES,
+        }
+    # the layouts of the first slides are selected while the planner is streaming
+    assert llm.selected_while_streaming == stream_outline
+    return min(agent.finished) - start
+
+
+@pytest.mark.asyncio
+async def test_streamed_outline_starts_slides_early(reference, tmp_path):
+    streamed = await time_to_first_slide(reference, tmp_path, stream_outline=True)
+    blocking = await time_to_first_slide(reference, tmp_path, stream_outline=False)
+    assert blocking > streamed
+
+
+@pytest.mark.asyncio
+async def test_streamed_outline_retried(reference, tmp_path, monkeypatch):
+    monkeypatch.setattr(PPTAgent._stream_outline.retry, "wait", wait_none())
+    llm = MockLLM("mock", api_key="offline")
+    # the second item of the first attempt is invalid, its first slide is cancelled
+    llm.invalid_attempts = 1
+    await time_to_first_slide(reference, tmp_path, stream_outline=True, llm=llm)
+    assert llm.invalid_attempts == 0
+    assert llm.calls["layout_selector"] <= NUM_SLIDES + 1
+
+
+def test_json_array_stream():
+    items = [{"a": 'x]}"{', "b": [1, {"c": 2}]}, {"d": "\\"}]
+    text = json.dumps({"outline": items, "other": [0]})
+    parser = JsonArrayStream("outline")
+    parsed = []
+    for char in text:
+        parsed += parser.feed(char)
+    assert parsed == items and parser.finished
@@ -0,0 +1,149 @@
+import json
+from copy import deepcopy
+
+import pytest
+from pptagent_pptx import Presentation as load_prs
+
+from pptagent.pptgen import PPTAgent
+from pptagent.presentation import Layout, Presentation, TextFitter
+from pptagent.presentation.text_fit import ParagraphStyle, font_dirs, merge_bullets
+from pptagent.response import EditorOutput
+from pptagent.utils import Config, package_join
+
+TEXT_LAYOUT = "Title Text Header with Multi-level Bulleted Explanatory Points:text"
+POINT = "a point with quite a few words that wraps to two lines in the box, and more"
+
+
+class RewriteLLM:
+    model = "rewriter"
+
+    def __init__(self):
+        self.prompts = []
+
+    async def __call__(self, content, **kwargs):
+        self.prompts.append(content)
+        return ["rewritten"]
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    template_dir = package_join("templates", "default")
+    config = Config(str(tmp_path_factory.mktemp("template")))
+    prs = Presentation.from_file(f"{template_dir}/source.pptx", config)
+    with open(f"{template_dir}/slide_induction.json") as f:
+        slide_induction = json.load(f)
+    # without fonts, measured with the fallback metrics, independently of the system fonts
+    fitter = TextFitter(font_dirs=[])
+    fitter.profile(prs)
+    return prs, slide_induction, fitter
+
+
+def editor_output(title: str, points: list[str]) -> EditorOutput:
+    return EditorOutput(
+        elements=[
+            {"name": "main title", "data": [title]},
+            {"name": "quote and explanation", "data": points},
+        ]
+    )
+
+
+def test_template_text_fits(reference):
+    prs, _, fitter = reference
+    for slide in prs.slides:
+        for shape in slide:
+            if not shape.text_frame.is_textframe:
+                continue
+            area = fitter.areas[slide.slide_idx, shape.shape_idx]
+            paragraphs = [
+                (para.text, para.real_idx)
+                for para in shape.text_frame.paragraphs
+                if para.idx != -1
+            ]
+            assert fitter.fit_paragraphs(area, paragraphs)[:2] == (True, 1.0)
+
+
+@pytest.mark.parametrize(
+    "num_points, fits, scale, num_merged",
+    [(5, True, 1.0, 5), (10, True, 0.79, 7), (14, True, 0.75, 5), (20, False, 1.0, 20)],
+)
+def test_fit_layout_remedies(reference, num_points, fits, scale, num_merged):
+    prs, slide_induction, fitter = reference
+    layout = Layout(title=TEXT_LAYOUT, **slide_induction[TEXT_LAYOUT])
+    output = editor_output("A title", [POINT] * num_points)
+    results = fitter.fit_layout(layout, output, prs.slides)
+
+    assert results["main title"].fits and results["main title"].scale == 1.0
+    result = results["quote and explanation"]
+    assert (result.fits, round(result.scale, 2)) == (fits, scale)
+    assert len(output["quote and explanation"].data) == num_merged
+    assert result.overflow > 1 or num_points == 5
+
+
+def test_unlocated_element_not_fitted(reference):
+    prs, slide_induction, fitter = reference
+    layout = Layout(title=TEXT_LAYOUT, **slide_induction[TEXT_LAYOUT])
+    assert fitter.fit_element(prs.slides[0], ["not on the slide"], ["text"]) is None
+    assert fitter.fit_layout(layout, EditorOutput(elements=[]), prs.slides) == {}
+
+
+def test_font_metrics():
+    fitter = TextFitter()
+    if not fitter.fonts:
+        pytest.skip(f"No fonts found in {font_dirs()}")
+    metrics = fitter.metrics(ParagraphStyle(font="No Such Font"))
+    assert metrics.width("iiii", 10) < metrics.width("WWWW", 10)
+    assert metrics.width("中", 10) == 10 or ord("中") in metrics.advances
+    lines = fitter.count_lines("word " * 40, 200, ParagraphStyle(size=18), 18)
+    assert 6 <= lines <= 12
+
+
+def test_merge_bullets():
+    assert merge_bullets(["long first item", "a", "b"]) == ["long first item", "a; b"]
+    assert merge_bullets(["Done.", "Next"]) == ["Done. Next"]
+    assert merge_bullets(["第一点", "第二点"]) == ["第一点；第二点"]
+
+
+@pytest.mark.asyncio
+async def test_only_overflowing_elements_rewritten(reference):
+    prs, slide_induction, fitter = reference
+    layout = Layout(title=TEXT_LAYOUT, **slide_induction[TEXT_LAYOUT])
+    # the title is longer than its suggested characters but fits its shape
+    title, points = "Cultural tourism in the temple city", [POINT * 3] * 5
+    output = editor_output(title, points)
+    llm = RewriteLLM()
+    await layout.length_rewrite(
+        output, 1.0, llm, fitter.fit_layout(layout, output, prs.slides)
+    )
+    assert len(llm.prompts) == 1 and "quote and explanation" in llm.prompts[0]
+    assert output["main title"].data == [title]
+
+    # without fit results both elements exceed their suggested characters
+    llm = RewriteLLM()
+    await layout.length_rewrite(editor_output(title, points), 1.0, llm)
+    assert len(llm.prompts) == 2
+
+
+@pytest.mark.asyncio
+async def test_overflowing_slide_scaled(reference, tmp_path):
+    prs, slide_induction, _ = reference
+    agent = PPTAgent(RewriteLLM(), RewriteLLM(), text_fitter=TextFitter(font_dirs=[]))
+    agent.set_reference(deepcopy(slide_induction), deepcopy(prs))
+    agent.source_doc = None
+    layout = agent.layouts[TEXT_LAYOUT]
+    output = editor_output("A title", [POINT] * 10)
+    agent.text_fitter.fit_layout(layout, output, agent.presentation.slides)
+    command_list, template_id = agent._generate_commands(output, layout)
+    slide, _ = await agent._edit_slide(command_list, template_id)
+    assert agent.fit_stats["scaled"] == 1
+
+    agent.empty_prs.slides = [slide]
+    agent.empty_prs.save(str(tmp_path / "fitted.pptx"))
+    shape = next(
+        shape
+        for shape in load_prs(str(tmp_path / "fitted.pptx")).slides[0].shapes
+        if shape.has_text_frame and len(shape.text_frame.paragraphs) == 7
+    )
+    sizes = {
+        run.font.size.pt for para in shape.text_frame.paragraphs for run in para.runs
+    }
+    assert sizes == {19.0}
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+from fastmcp import Client, FastMCP
+
+from pptagent import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    previous = tracing.set_exporter(tracing.JsonFileExporter(str(path)))
+    yield path
+    tracing.set_exporter(previous)
+
+
+def load_spans(path) -> dict[str, dict]:
+    with open(path, encoding="utf-8") as f:
+        return {span["name"]: span for span in map(json.loads, f)}
+
+
+def test_noop_by_default():
+    previous = tracing.set_exporter(None)
+    try:
+        with tracing.span("ignored") as span:
+            span.set_attribute("key", "value")
+            assert tracing.inject() == {}
+        assert span is tracing.NOOP_SPAN and not span.attributes
+    finally:
+        tracing.set_exporter(previous)
+
+
+@pytest.mark.asyncio
+async def test_span_tree(trace_file):
+    async def child(idx: int):
+        with tracing.span(f"child {idx}", idx=idx):
+            await asyncio.sleep(0)
+
+    with tracing.span("root") as root:
+        await asyncio.gather(*(child(idx) for idx in range(2)))
+        with pytest.raises(ValueError), tracing.span("failed"):
+            raise ValueError("boom")
+    assert tracing.current_span() is None
+
+    spans = load_spans(trace_file)
+    trace_id = root.context.trace_id
+    assert spans["root"]["parentSpanId"] is None
+    for name in ["child 0", "child 1", "failed"]:
+        assert spans[name]["traceId"] == trace_id
+        assert spans[name]["parentSpanId"] == root.context.span_id
+    assert spans["child 1"]["attributes"] == {"idx": 1}
+    assert spans["failed"]["status"] == {"code": "ERROR", "message": "ValueError: boom"}
+    assert spans["root"]["endTimeUnixNano"] >= spans["root"]["startTimeUnixNano"]
+
+
+def test_traceparent():
+    context = tracing.SpanContext("a" * 32, "b" * 16)
+    parsed = tracing.SpanContext.from_traceparent(context.traceparent)
+    assert (parsed.trace_id, parsed.span_id, parsed.remote) == (
+        "a" * 32,
+        "b" * 16,
+        True,
+    )
+    assert (
+        tracing.SpanContext.from_traceparent("00-" + "0" * 32 + "-" + "b" * 16 + "-01")
+        is None
+    )
+    assert tracing.SpanContext.from_traceparent("malformed") is None
+    assert tracing.extract({"traceparent": context.traceparent}).span_id == "b" * 16
+
+
+@pytest.mark.asyncio
+async def test_mcp_propagation(trace_file):
+    mcp = tracing.trace_tools(FastMCP("Traced"))
+
+    @mcp.tool()
+    def echo(text: str) -> str:
+        with tracing.span("echo.work"):
+            return text
+
+    with tracing.span("client") as client_span:
+        async with Client(mcp) as client:
+            await client.call_tool("echo", {"text": "hi"}, meta=tracing.inject())
+
+    spans = load_spans(trace_file)
+    server_span = spans["mcp.tool echo"]
+    assert server_span["traceId"] == client_span.context.trace_id
+    assert server_span["parentSpanId"] == client_span.context.span_id
+    assert server_span["attributes"] == {"mcp.server": "Traced", "mcp.tool": "echo"}
+    assert spans["echo.work"]["parentSpanId"] == server_span["spanId"]
+    assert tracing.trace_env() == {tracing.TRACE_FILE_ENV: str(trace_file)}